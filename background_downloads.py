@@ -0,0 +1,170 @@
+"""
+background_downloads.py
+=======================
+Fila de downloads em background, por prioridade.
+
+O run_comfyui baixa so o conjunto critico (diffusion model, text encoder,
+VAE) antes de subir o ComfyUI; o resto do catalogo entra aqui e e baixado
+em threads enquanto a UI ja responde. Como o store liga o arquivo final com
+rename atomico, o ComfyUI passa a listar cada modelo assim que ele termina
+(a lista de arquivos do ComfyUI e recarregada quando a pasta muda).
+
+  - Prioridade menor sai primeiro (model_catalog.priority).
+  - Entradas com a mesma URL (aliases) sao um item so da fila.
+  - Progresso vai para o log a cada STATUS_INTERVAL e para STATUS_FILE (JSON),
+    que o comfy_metrics expoe em GET /downloads (porta/tunel de metricas) e o
+    comfy_proxy, quando ativo, em GET /kythours/downloads.
+
+USO:
+  bg = BackgroundDownloads(store, downloader, on_result=handle_result)
+  for model in rest: bg.put(model, priority(model))
+  bg.start()
+"""
+
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from model_downloader import MB
+
+STATUS_FILE = "/tmp/kythours_downloads.json"
+STATUS_INTERVAL = 30  # segundos entre logs de progresso
+
+
+def read_status(path=STATUS_FILE):
+    """Ultimo status gravado (usado pelo comfy_metrics e pelo comfy_proxy)."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"pending": [], "active": [], "done": 0, "failed": [], "finished": True}
+
+
+class BackgroundDownloads:
+    """
+    store:     ModelStore usado para baixar/ligar os arquivos.
+    downloader: ModelDownloader (o limite global de conexoes continua valendo).
+    on_result: callback(result) chamado (em serie) para cada arquivo terminado.
+    on_finished: callback(status) chamado quando a fila esvazia.
+    workers:   arquivos baixados ao mesmo tempo (padrao: downloader.max_files).
+    """
+
+    def __init__(self, store, downloader, on_result=None, workers=None, status_path=STATUS_FILE,
+                 on_finished=None):
+        self.store = store
+        self.downloader = downloader
+        self.on_result = on_result
+        self.on_finished = on_finished
+        self.workers = workers or downloader.max_files
+        self.status_path = status_path
+        self._heap = []
+        self._groups = {}  # url -> [models]
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._result_lock = threading.Lock()  # callbacks em serie (manifesto)
+        self._active = {}  # url -> nome
+        self._done = 0
+        self._failed = []
+        self._finished = threading.Event()
+        self._threads = []
+
+    def put(self, model, priority=0):
+        with self._lock:
+            group = self._groups.get(model["url"])
+            if group is not None:
+                group.append(model)  # alias: vai junto com o mesmo download
+                return
+            self._groups[model["url"]] = [model]
+            heapq.heappush(self._heap, (priority, next(self._counter), model["url"]))
+
+    def _next(self):
+        with self._lock:
+            if not self._heap:
+                return None, None
+            _, _, url = heapq.heappop(self._heap)
+            group = self._groups.pop(url)
+            self._active[url] = os.path.basename(group[0]["path"])
+            return url, group
+
+    def _worker(self):
+        while True:
+            url, group = self._next()
+            if url is None:
+                return
+            try:
+                results = self.store.download_all(self.downloader, group)
+            except OSError as e:
+                results = [{"name": os.path.basename(m["path"]), "path": m["path"], "status": "failed",
+                            "bytes": 0, "resumed": 0, "seconds": 0.0, "error": str(e)} for m in group]
+            with self._lock:
+                del self._active[url]
+                for result in results:
+                    if result["status"] == "ok":
+                        self._done += 1
+                    else:
+                        self._failed.append({"name": result["name"], "error": result.get("error")})
+            if self.on_result:
+                with self._result_lock:
+                    self._handle_results(results)
+
+    def _handle_results(self, results):
+        for result in results:
+            try:
+                self.on_result(result)
+            except Exception as e:  # callback nunca derruba a fila
+                print(f"[BG] Erro processando {result['name']}: {e}", flush=True)
+
+    def status(self):
+        progress = self.downloader.progress()
+        with self._lock:
+            active = []
+            for url, name in self._active.items():
+                got, total = progress.get(self.store.blob_path(url), (0, None))
+                active.append({"name": name, "bytes": got, "total": total})
+            pending = [os.path.basename(self._groups[url][0]["path"]) for _, _, url in sorted(self._heap)]
+            return {"pending": pending, "active": active, "done": self._done,
+                    "failed": list(self._failed), "finished": self._finished.is_set()}
+
+    def _write_status(self, status):
+        tmp = self.status_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp, self.status_path)
+
+    def _reporter(self, threads):
+        started = time.monotonic()
+        while any(t.is_alive() for t in threads):
+            status = self.status()
+            self._write_status(status)
+            active = ", ".join(
+                f"{a['name']} {a['bytes'] / MB:.0f}/{(a['total'] or 0) / MB:.0f}MB" for a in status["active"]
+            )
+            print(f"[BG] {len(status['pending'])} na fila, {status['done']} pronto(s)"
+                  + (f" | baixando: {active}" if active else ""), flush=True)
+            for t in threads:
+                t.join(STATUS_INTERVAL / len(threads))
+        status = dict(self.status(), finished=True)
+        self._write_status(status)
+        self._finished.set()
+        print(f"[BG] Downloads em background concluidos: {status['done']} ok, "
+              f"{len(status['failed'])} falha(s) em {time.monotonic() - started:.0f}s", flush=True)
+        if self.on_finished:
+            try:
+                self.on_finished(status)
+            except Exception as e:
+                print(f"[BG] Erro no callback final: {e}", flush=True)
+
+    def start(self):
+        """Sobe os workers e o reporter (threads daemon). Retorna o reporter."""
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        reporter = threading.Thread(target=self._reporter, args=(self._threads,), daemon=True)
+        reporter.start()
+        return reporter
+
+    def wait(self, timeout=None):
+        return self._finished.wait(timeout)
@@ -0,0 +1,591 @@
+"""
+bench_startup.py
+================
+Benchmark local do cold start (comfy_startup.ComfyStartup, o mesmo caminho do
+run_comfyui), sem Modal, sem GPU e sem internet.
+
+Stand-ins:
+  - Volume: pasta temporaria (<workdir>/<cenario>/models).
+  - Hosts do catalogo: servidor HTTP local (volume_sync.mirror_catalog) que
+    gera arquivos sinteticos validos para o model_verify (safetensors, GGUF,
+    zip do torch) com os tamanhos reais multiplicados por --scale. Responde
+    Range (206), ETag/If-None-Match (304) e injeta falhas por arquivo: 503
+    nas primeiras N requests, conexao cortada no meio do corpo, ETag novo.
+  - ComfyUI: main.py falso que espera --boot-seconds (imports dos nodes) e
+    responde na porta da UI (/, /queue, /history, /system_stats).
+
+Cenarios (cada start roda num subprocesso proprio, como um container novo):
+  empty:     volume vazio; core no boot, resto em background.
+  warm:      copia do volume do empty (hardlinks preservados), staging vazio.
+  corrupted: copia do volume com arquivos truncados/header estragado, um
+             .part abandonado e um arquivo que mudou no remoto (ETag); o
+             espelho corta a conexao no primeiro download de cada arquivo
+             estragado e responde 503 para o .part abandonado.
+
+Para cada cenario: segundos por fase do StartupReport, ready (HTTP 200) e
+fim do background, comparados com o baseline (padrao: bench_baseline.json,
+versionado ao lado deste arquivo): sai com 1 se algum passou de
+baseline * (1 + --tolerance) e de --min-delta segundos (ou se ha mais
+downloads falhos). --update-baseline grava os valores atuais; --baseline ""
+so mede.
+
+USO:
+  python -m bench_startup                                  # os 3 cenarios contra bench_baseline.json
+  python -m bench_startup --scenario warm
+  python -m bench_startup --update-baseline                # depois de uma mudanca esperada
+  python -m bench_startup --scale 0.01 --rate-mb 200 --keep
+"""
+
+import argparse
+import functools
+import hashlib
+import http.server
+import io
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from urllib.parse import urlsplit
+
+from model_downloader import MB
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "bench_baseline.json")
+SCENARIOS = ("empty", "warm", "corrupted")
+BENCH_SCALE = 0.001        # fracao do tamanho real de cada modelo
+MIN_FILE_BYTES = 2 * MB    # volume_sync trata <= 1 MB como pagina de erro
+BOOT_SECONDS = 1.0         # boot do main.py falso (imports dos custom nodes)
+TOLERANCE = 0.25
+MIN_DELTA = 0.5            # segundos: abaixo disso e ruido
+RUN_TIMEOUT = 15 * 60
+SAFETENSORS_HEADER = 256
+GGUF_ALIGNMENT = 32
+
+# Tamanhos reais aproximados (MB); o resto pelo tipo da pasta
+REAL_SIZES_MB = {
+    "z_image_turbo_bf16.safetensors": 12300,
+    "z-image-turbo_fp8_scaled_e4m3fn_KJ.safetensors": 6200,
+    "qwen_3_4b.safetensors": 8000,
+    "ae.safetensors": 320,
+    "Qwen_3_4b-imatrix-IQ4_XS.gguf": 2300,
+    "Qwen_3_4b-Q8_0.gguf": 4300,
+    "Qwen3-4b-Z-Image-Engineer-V4-F16.gguf": 8000,
+    "z_image_turbo-Q5_K_S.gguf": 5200,
+    "Qwen3-4B.i1-Q5_K_S.gguf": 2800,
+    "qwen_2.5_vl_7b_fp8_scaled.safetensors": 9400,
+    "qwen_image_vae.safetensors": 250,
+    "Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors": 700,
+    "Z-Image-Turbo-Fun-Controlnet-Union.safetensors": 3100,
+    "flux-2-klein-4b.safetensors": 7800,
+    "flux2-vae.safetensors": 330,
+    "qwen-image-edit-2511-Q5_K_M.gguf": 14900,
+    "SDXL_v2043971.safetensors": 6900,
+    "Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors": 810,
+}
+FOLDER_SIZES_MB = {"loras": 330, "upscale_models": 65, "ultralytics": 50, "workflows": 0.05}
+
+# Cenario corrupted: o que estragar no volume e as falhas do servidor
+CORRUPT_TRUNCATE = ("qwen_3_4b.safetensors", "Qwen_3_4b-Q8_0.gguf")
+CORRUPT_HEADER = ("ae.safetensors",)
+CORRUPT_PARTIAL = ("flux2-vae.safetensors",)
+REMOTE_CHANGED = ("qwen_image_vae.safetensors",)
+
+
+# ----------------------------------------------------------------------
+# Arquivos sinteticos
+# ----------------------------------------------------------------------
+class Synthetic:
+    """Conteudo = head + zeros + tail, com `size` bytes (sem materializar os zeros)."""
+
+    def __init__(self, head, size, tail=b""):
+        self.head, self.size, self.tail = head, size, tail
+
+    def read(self, start, end):
+        """Bytes [start, end] (inclusivo)."""
+        out = bytearray(end - start + 1)
+        if start < len(self.head):
+            chunk = self.head[start:end + 1]
+            out[:len(chunk)] = chunk
+        tail_at = self.size - len(self.tail)
+        if end >= tail_at and self.tail:
+            lo = max(start, tail_at)
+            out[lo - start:] = self.tail[lo - tail_at:end - tail_at + 1]
+        return bytes(out)
+
+
+def synthetic_file(kind, size):
+    """Arquivo que passa no model_verify (kind = extensao) com exatamente `size` bytes."""
+    if kind == ".safetensors":
+        n = size - 8 - SAFETENSORS_HEADER
+        header = json.dumps({"weight": {"dtype": "U8", "shape": [n], "data_offsets": [0, n]}})
+        return Synthetic(struct.pack("<Q", SAFETENSORS_HEADER) + header.ljust(SAFETENSORS_HEADER).encode(), size)
+    if kind == ".gguf":
+        name = b"weight"
+
+        def header(n):
+            return (b"GGUF" + struct.pack("<IQQ", 3, 1, 0) + struct.pack("<Q", len(name)) + name
+                    + struct.pack("<IQIQ", 1, n, 24, 0))  # 1 dim, tipo 24 (1 byte por elemento), offset 0
+        data_start = -(-len(header(0)) // GGUF_ALIGNMENT) * GGUF_ALIGNMENT
+        head = header(size - data_start)
+        return Synthetic(head + b"\0" * (data_start - len(head)), size)
+    if kind in (".pt", ".pth", ".ckpt"):
+        def build(n):
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+                zf.writestr("archive/data.pkl", b"\x80\x02}q\x00.")
+                zf.writestr("archive/data/0", b"\0" * n)
+            return buf.getvalue()
+        overhead = len(build(0))
+        data = build(size - overhead)
+        return Synthetic(data, len(data))
+    # JSON (workflows) e o resto: JSON valido com espacos ate o tamanho
+    return Synthetic(b'{"nodes": []}'.ljust(size), size)
+
+
+def bench_size(path, scale=BENCH_SCALE):
+    name = os.path.basename(path)
+    mb = REAL_SIZES_MB.get(name)
+    if mb is None:
+        folder = next((f for f in FOLDER_SIZES_MB if f"/{f}/" in path), None)
+        mb = FOLDER_SIZES_MB.get(folder, 100)
+    return max(int(mb * MB * scale), MIN_FILE_BYTES)
+
+
+# ----------------------------------------------------------------------
+# Servidor espelho
+# ----------------------------------------------------------------------
+class MirrorServer:
+    """
+    Espelho local dos hosts do catalogo: GET/HEAD em /<host>/<caminho>.
+    faults: {nome do arquivo: {"fail": N, "truncate": N, "etag": "v2"}}.
+    rate:   bytes/s por conexao (0 = sem limite).
+    """
+
+    def __init__(self, catalog, scale=BENCH_SCALE, rate=0):
+        self.files = {}
+        for model in catalog:
+            parts = urlsplit(model["url"])
+            key = f"/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+            self.files[key] = (os.path.basename(model["path"]), model["path"])
+        self.scale = scale
+        self.rate = rate
+        self.faults = {}
+        self.counters = {"requests": 0, "bytes": 0, "injected": 0}
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.server = None
+
+    def content(self, key):
+        with self._lock:
+            if key not in self._cache:
+                name, path = self.files[key]
+                self._cache[key] = synthetic_file(os.path.splitext(path)[1].lower(), bench_size(path, self.scale))
+            return self._cache[key]
+
+    def etag(self, key):
+        name, _ = self.files[key]
+        version = self.faults.get(name, {}).get("etag", "v1")
+        return hashlib.sha1(f"{key}:{self.content(key).size}:{version}".encode()).hexdigest()
+
+    def take_fault(self, key, kind):
+        """Consome uma falha do tipo `kind` do arquivo (True se ainda havia)."""
+        name, _ = self.files[key]
+        with self._lock:
+            fault = self.faults.get(name, {})
+            if fault.get(kind, 0) > 0:
+                fault[kind] -= 1
+                self.counters["injected"] += 1
+                return True
+        return False
+
+    def start(self):
+        mirror = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self, body):
+                key = self.path
+                with mirror._lock:
+                    mirror.counters["requests"] += 1
+                if key not in mirror.files:
+                    self.send_error(404)
+                    return
+                if mirror.take_fault(key, "fail"):
+                    self.send_error(503)
+                    return
+                content, etag = mirror.content(key), mirror.etag(key)
+                if self.headers.get("If-None-Match", "").strip('"') == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", f'"{etag}"')
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start, end, status = 0, content.size - 1, 200
+                rng = self.headers.get("Range", "")
+                if rng.startswith("bytes="):
+                    lo, _, hi = rng[6:].partition("-")
+                    start = int(lo or 0)
+                    end = min(int(hi), content.size - 1) if hi else content.size - 1
+                    status = 206
+                self.send_response(status)
+                self.send_header("ETag", f'"{etag}"')
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{content.size}")
+                self.end_headers()
+                if not body:
+                    return
+                # Corta a conexao no meio do corpo (so em requests de dados, nao no probe 0-0)
+                cut = end - start > 0 and mirror.take_fault(key, "truncate")
+                stop = start + (end - start + 1) // 2 if cut else end + 1
+                pos = start
+                while pos < stop:
+                    chunk = content.read(pos, min(pos + MB, stop) - 1)
+                    self.wfile.write(chunk)
+                    pos += len(chunk)
+                    with mirror._lock:
+                        mirror.counters["bytes"] += len(chunk)
+                    if mirror.rate:
+                        time.sleep(len(chunk) / mirror.rate)
+                if cut:
+                    self.close_connection = True
+
+            def do_GET(self):
+                self._serve(True)
+
+            def do_HEAD(self):
+                self._serve(False)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+# ----------------------------------------------------------------------
+# ComfyUI falso
+# ----------------------------------------------------------------------
+FAKE_MAIN = '''\
+import argparse, http.server, json, os, time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--listen", default="127.0.0.1")
+parser.add_argument("--port", type=int, default=8188)
+args, _ = parser.parse_known_args()
+time.sleep(float(os.environ.get("BENCH_BOOT_SECONDS", "0")))
+
+ROUTES = {
+    "/queue": {"queue_running": [], "queue_pending": []},
+    "/history": {},
+    "/system_stats": {"system": {"ram_total": 0, "ram_free": 0}, "devices": []},
+    "/object_info": {},
+}
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        path = path[4:] if path.startswith("/api/") else path
+        body = json.dumps(ROUTES.get(path, {})).encode() if path != "/" else b"<html>ComfyUI</html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *a):
+        pass
+
+
+http.server.ThreadingHTTPServer((args.listen, args.port), Handler).serve_forever()
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# O que model_staging.launch importa antes do main.py
+FAKE_MODULES = {
+    "comfy/__init__.py": "",
+    "comfy/options.py": "def enable_args_parsing():\n    pass\n",
+    "folder_paths.py": "def get_full_path(folder_name, filename):\n    return None\n",
+}
+
+
+def make_comfyui_dir(root):
+    os.makedirs(os.path.join(root, "models"), exist_ok=True)
+    for rel, source in {"main.py": FAKE_MAIN, **FAKE_MODULES}.items():
+        os.makedirs(os.path.dirname(os.path.join(root, rel)), exist_ok=True)
+        with open(os.path.join(root, rel), "w") as f:
+            f.write(source)
+    return root
+
+
+def copy_volume(src, dst):
+    """Copia a pasta do volume preservando hardlinks (store) e symlinks."""
+    inodes = {}
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        for name in files:
+            path, dest = os.path.join(root, name), os.path.join(target, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), dest)
+                continue
+            st = os.stat(path)
+            if (st.st_dev, st.st_ino) in inodes:
+                os.link(inodes[st.st_dev, st.st_ino], dest)
+            else:
+                shutil.copy2(path, dest)
+                inodes[st.st_dev, st.st_ino] = dest
+
+
+def _same_inode(models_dir, path):
+    st = os.stat(path)
+    found = []
+    for root, _, files in os.walk(models_dir):
+        for name in files:
+            candidate = os.path.join(root, name)
+            if not os.path.islink(candidate) and os.path.samestat(os.stat(candidate), st):
+                found.append(candidate)
+    return found
+
+
+def corrupt_volume(models_dir):
+    """Estraga o volume copiado como um container morto no meio do caminho."""
+    done = []
+    for root, _, files in os.walk(models_dir):
+        if os.path.basename(root).startswith("."):
+            continue
+        for name in files:
+            path = os.path.join(root, name)
+            if name in CORRUPT_TRUNCATE:
+                with open(path, "r+b") as f:
+                    f.truncate(os.path.getsize(path) // 2)
+                done.append(f"truncado: {name}")
+            elif name in CORRUPT_HEADER:
+                with open(path, "r+b") as f:
+                    f.write(b"<html>error</html>")
+                done.append(f"header: {name}")
+            elif name in CORRUPT_PARTIAL:
+                # Download interrompido: nem o link nem o blob existem, sobrou o inicio no .part
+                with open(path, "rb") as f:
+                    head = f.read(MB)
+                blobs = [p for p in _same_inode(models_dir, path) if p != path]
+                for linked in [path, *blobs]:
+                    os.remove(linked)
+                with open((blobs[0] if blobs else path) + ".part", "wb") as f:
+                    f.write(head)
+                done.append(f"parcial: {name}")
+    return done
+
+
+# ----------------------------------------------------------------------
+# Um start (subprocesso)
+# ----------------------------------------------------------------------
+def run_child(config):
+    """Roda o ComfyStartup uma vez (processo proprio) e grava o relatorio em config["out"]."""
+    from comfy_startup import ComfyStartup
+    from model_catalog import build_catalog
+    from model_downloader import ModelDownloader
+    from volume_sync import EXPECTED_MIN_SIZES_MB, VolumeSync, check_model_file, mirror_catalog
+
+    comfyui_dir, scale = config["comfyui_dir"], config["scale"]
+    catalog = mirror_catalog(build_catalog(comfyui_dir), config["mirror"])
+    # Minimos do volume_sync na mesma escala dos arquivos sinteticos
+    min_sizes = {k: max(v * scale, MIN_FILE_BYTES / MB) for k, v in EXPECTED_MIN_SIZES_MB.items()}
+    sync = VolumeSync(comfyui_dir, catalog=catalog, downloader=ModelDownloader(),
+                      check=functools.partial(check_model_file, expected_min_sizes_mb=min_sizes))
+    startup = ComfyStartup(comfyui_dir, "bench", ui_port=free_port(), internal_port=free_port(),
+                           metrics_port=free_port(), sync=sync,
+                           staging_dir=os.path.join(config["workdir"], "staging"))
+    try:
+        startup.run()
+        startup.background_done.wait(RUN_TIMEOUT)
+        # Sem fila de background o relatorio nao marca o fim: usa o fim do remote_check
+        background_seconds = round(startup.report.elapsed(), 3)
+        startup.ready.wait(RUN_TIMEOUT)
+        result = startup.report.to_dict()
+        result.setdefault("background_seconds", background_seconds)
+        result["missing"] = [os.path.basename(m["path"]) for m in sync.catalog if not os.path.exists(m["path"])]
+    finally:
+        startup.stop()
+    with open(config["out"], "w") as f:
+        json.dump(result, f, indent=1)
+
+
+def run_scenario(name, workdir, mirror_url, args, log):
+    """Start num subprocesso; retorna o relatorio do StartupReport."""
+    scenario_dir = os.path.join(workdir, name)
+    config = {"comfyui_dir": os.path.join(scenario_dir, "ComfyUI"), "workdir": scenario_dir,
+              "mirror": mirror_url, "scale": args.scale, "out": os.path.join(scenario_dir, "report.json")}
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [HERE, os.environ.get("PYTHONPATH")])),
+        "BENCH_BOOT_SECONDS": str(args.boot_seconds),
+        "HF_TOKEN": "",
+        "LAZY_MODELS": "0",
+        "BACKGROUND_DOWNLOADS": "1",
+        "REMOTE_CHECK": "1",
+        "NODE_PROFILING": "0",
+        "WARMUP": "0",
+        "METRICS": "0",
+        "RESULT_CACHE": "0",
+    }
+    with open(os.path.join(workdir, f"{name}.log"), "w") as out:
+        proc = subprocess.run([sys.executable, "-m", "bench_startup", "--child", json.dumps(config)],
+                              cwd=HERE, env=env, stdout=None if log else out, stderr=subprocess.STDOUT,
+                              timeout=RUN_TIMEOUT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"cenario {name} falhou (exit {proc.returncode}); log em {workdir}/{name}.log")
+    with open(config["out"]) as f:
+        return json.load(f)
+
+
+def metrics(report):
+    """Numeros comparados com o baseline: fases, ready, fim do background e falhas."""
+    values = {f"phase:{k}": v["seconds"] for k, v in report["phases"].items()}
+    values["ready_seconds"] = report.get("ready_seconds")
+    values["background_seconds"] = report.get("background_seconds")
+    values["failed_downloads"] = report["download_totals"]["failed"]
+    return {k: round(v, 3) if isinstance(v, float) else v for k, v in values.items() if v is not None}
+
+
+def compare(current, baseline, tolerance=TOLERANCE, min_delta=MIN_DELTA):
+    """Regressoes [(cenario, metrica, baseline, atual)]."""
+    regressions = []
+    for scenario, values in current.items():
+        for key, value in values.items():
+            base = baseline.get(scenario, {}).get(key)
+            if base is None:
+                continue
+            if key == "failed_downloads":
+                worse = value > base
+            else:
+                worse = value > base * (1 + tolerance) and value - base > min_delta
+            if worse:
+                regressions.append((scenario, key, base, value))
+    return regressions
+
+
+def format_table(current):
+    keys = sorted({k for values in current.values() for k in values},
+                  key=lambda k: (not k.startswith("phase:"), k))
+    width = max(len(k) for k in keys)
+    lines = [f"{'':{width}}  " + "  ".join(f"{s:>10}" for s in current)]
+    for key in keys:
+        cells = []
+        for values in current.values():
+            v = values.get(key)
+            cells.append(f"{'-':>10}" if v is None else f"{v:>10.2f}" if isinstance(v, float) else f"{v:>10}")
+        lines.append(f"{key:{width}}  " + "  ".join(cells))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark local do cold start do ComfyUI (comfy_startup).")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="padrao: todos")
+    parser.add_argument("--scale", type=float, default=BENCH_SCALE, help="fracao do tamanho real dos modelos")
+    parser.add_argument("--rate-mb", type=float, default=0, help="MB/s por conexao no espelho (0 = sem limite)")
+    parser.add_argument("--boot-seconds", type=float, default=BOOT_SECONDS, help="boot do main.py falso")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="JSON com os valores de referencia por cenario (\"\" = nao compara)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--min-delta", type=float, default=MIN_DELTA)
+    parser.add_argument("--workdir", help="padrao: pasta temporaria")
+    parser.add_argument("--keep", action="store_true", help="nao apaga a pasta de trabalho")
+    parser.add_argument("--log", action="store_true", help="mostra o log dos starts")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(json.loads(args.child))
+        return 0
+
+    selected = args.scenario or list(SCENARIOS)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="kythours-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    from model_catalog import build_catalog
+    mirror = MirrorServer(build_catalog(os.path.join(workdir, "catalog")), args.scale, int(args.rate_mb * MB))
+    mirror_url = mirror.start()
+    current = {}
+    try:
+        # empty sempre roda: o volume dele e a base do warm e do corrupted
+        make_comfyui_dir(os.path.join(workdir, "empty", "ComfyUI"))
+        report = run_scenario("empty", workdir, mirror_url, args, args.log)
+        if "empty" in selected:
+            current["empty"] = metrics(report)
+        template = os.path.join(workdir, "empty", "ComfyUI", "models")
+
+        if "warm" in selected:
+            copy_volume(template, os.path.join(make_comfyui_dir(os.path.join(workdir, "warm", "ComfyUI")), "models"))
+            current["warm"] = metrics(run_scenario("warm", workdir, mirror_url, args, args.log))
+
+        if "corrupted" in selected:
+            models = os.path.join(make_comfyui_dir(os.path.join(workdir, "corrupted", "ComfyUI")), "models")
+            copy_volume(template, models)
+            print(f"[BENCH] corrupted: {', '.join(corrupt_volume(models))}", flush=True)
+            for name in CORRUPT_TRUNCATE + CORRUPT_HEADER:
+                mirror.faults[name] = {"truncate": 1}   # segmento retomado no mesmo start
+            for name in CORRUPT_PARTIAL:
+                mirror.faults[name] = {"fail": 1}       # 503 no probe: falha, fica para o proximo start
+            for name in REMOTE_CHANGED:
+                mirror.faults[name] = {"etag": "v2"}
+            report = run_scenario("corrupted", workdir, mirror_url, args, args.log)
+            current["corrupted"] = metrics(report)
+            if report.get("missing"):
+                print(f"[BENCH] corrupted: ainda faltando {report['missing']}", flush=True)
+    finally:
+        mirror.stop()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(format_table(current))
+    print(f"[BENCH] Espelho: {mirror.counters['requests']} request(s), {mirror.counters['bytes'] / MB:.0f} MB, "
+          f"{mirror.counters['injected']} falha(s) injetada(s)")
+    if args.keep or args.workdir:
+        print(f"[BENCH] Pasta de trabalho: {workdir}")
+    if not args.baseline:
+        return 0
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(current)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print(f"[BENCH] Baseline atualizado: {args.baseline}")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance, args.min_delta)
+    for scenario, key, base, value in regressions:
+        print(f"[BENCH] REGRESSAO {scenario} {key}: {base} -> {value}")
+    if not regressions:
+        print(f"[BENCH] Sem regressao (tolerancia {args.tolerance:.0%}, minimo {args.min_delta}s)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
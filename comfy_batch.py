@@ -0,0 +1,272 @@
+"""
+comfy_batch.py
+==============
+Geracao em lote (headless) contra um ComfyUI rodando.
+
+Recebe workflows em formato API + overrides por job (seed, prompt, LoRA),
+mantem no maximo `max_in_flight` prompts na fila do ComfyUI (GPU sempre
+ocupada sem inundar a fila), acompanha a conclusao pelo websocket /ws (com
+fallback para polling em /history) e devolve cada resultado assim que ele
+termina, com as imagens ja baixadas.
+
+Formato do arquivo de jobs (JSON):
+  {
+    "workflows": {"zimage": {...workflow API...}},
+    "jobs": [
+      {"workflow": "zimage", "seed": 1, "prompt": "...",
+       "lora": {"name": "FERPHOTO/x.safetensors", "strength": 0.8}},
+      ...
+    ]
+  }
+Sem "jobs", cada workflow roda uma vez.
+
+USO:
+  runner = BatchRunner(ComfyClient("http://127.0.0.1:8188"), max_in_flight=4)
+  for result in runner.run(load_jobs("jobs.json")):
+      ...
+"""
+
+import copy
+import json
+import os
+import socket
+import time
+
+from comfy_client import ComfyClient, ComfyError, output_files
+
+MAX_IN_FLIGHT = 4
+JOB_TIMEOUT = 30 * 60
+WS_POLL = 5.0  # intervalo da conferencia em /history (rede de seguranca do ws)
+
+SEED_KEYS = ("seed", "noise_seed")
+LORA_CLASSES = ("LoraLoader", "LoraLoaderModelOnly")
+SAMPLER_POSITIVE_KEYS = ("positive", "conditioning")
+TEXT_KEYS = ("text", "prompt", "text_g")
+
+
+def _positive_text_nodes(workflow):
+    """Nodes de texto ligados ao input `positive` dos samplers (seguindo a cadeia)."""
+    found = []
+    for node in workflow.values():
+        link = node.get("inputs", {}).get("positive")
+        seen = set()
+        while isinstance(link, list) and link and link[0] in workflow and link[0] not in seen:
+            seen.add(link[0])
+            target = workflow[link[0]]
+            inputs = target.get("inputs", {})
+            if any(isinstance(inputs.get(k), str) for k in TEXT_KEYS):
+                found.append(link[0])
+                break
+            link = next((inputs[k] for k in SAMPLER_POSITIVE_KEYS if isinstance(inputs.get(k), list)), None)
+    return found
+
+
+def apply_overrides(workflow, overrides):
+    """
+    Copia do workflow com os overrides aplicados:
+      seed:   todos os inputs seed/noise_seed.
+      prompt: texto dos nodes ligados ao `positive` dos samplers
+              (ou do primeiro CLIPTextEncode, se nao achar).
+      lora:   {"name", "strength"} em todos os LoraLoader*.
+      set:    {"<node_id>.<input>": valor} para qualquer outro input.
+    """
+    workflow = copy.deepcopy(workflow)
+    if "seed" in overrides:
+        for node in workflow.values():
+            for key in SEED_KEYS:
+                if key in node.get("inputs", {}) and not isinstance(node["inputs"][key], list):
+                    node["inputs"][key] = overrides["seed"]
+    if "prompt" in overrides:
+        targets = _positive_text_nodes(workflow) or [
+            nid for nid, n in workflow.items() if n.get("class_type") == "CLIPTextEncode"][:1]
+        if not targets:
+            raise ValueError("workflow sem node de texto para aplicar 'prompt'")
+        for nid in targets:
+            inputs = workflow[nid]["inputs"]
+            key = next(k for k in TEXT_KEYS if isinstance(inputs.get(k), str))
+            inputs[key] = overrides["prompt"]
+    if "lora" in overrides:
+        lora = overrides["lora"]
+        lora = {"name": lora} if isinstance(lora, str) else lora
+        loaders = [n for n in workflow.values() if n.get("class_type") in LORA_CLASSES]
+        if not loaders:
+            raise ValueError("workflow sem LoraLoader para aplicar 'lora'")
+        for node in loaders:
+            node["inputs"]["lora_name"] = lora["name"]
+            if "strength" in lora:
+                node["inputs"]["strength_model"] = lora["strength"]
+                if "strength_clip" in node["inputs"]:
+                    node["inputs"]["strength_clip"] = lora["strength"]
+    for path, value in (overrides.get("set") or {}).items():
+        nid, key = path.split(".", 1)
+        workflow[nid]["inputs"][key] = value
+    return workflow
+
+
+def execution_stats(entry):
+    """Segundos de execucao (execution_start ate o fim) e nodes em cache de uma entrada do /history."""
+    events = {kind: data for kind, data in ((entry or {}).get("status") or {}).get("messages", [])}
+    started = (events.get("execution_start") or {}).get("timestamp")
+    ended = (events.get("execution_success") or events.get("execution_error") or {}).get("timestamp")
+    seconds = round((ended - started) / 1000, 3) if started is not None and ended is not None else None
+    return seconds, len((events.get("execution_cached") or {}).get("nodes", []))
+
+
+def build_jobs(spec):
+    """
+    Expande o spec ({"workflows", "jobs"}) em [{"id", "workflow", "overrides"}].
+    """
+    workflows = spec["workflows"]
+    if isinstance(workflows, list):
+        workflows = {str(i): wf for i, wf in enumerate(workflows)}
+    entries = spec.get("jobs") or [{"workflow": name} for name in workflows]
+    jobs = []
+    for i, entry in enumerate(entries):
+        entry = dict(entry)
+        name = str(entry.pop("workflow", next(iter(workflows))))
+        jobs.append({"id": entry.pop("id", i), "name": name,
+                     "workflow": apply_overrides(workflows[name], entry), "overrides": entry})
+    return jobs
+
+
+def load_jobs(path):
+    with open(path) as f:
+        return build_jobs(json.load(f))
+
+
+class BatchRunner:
+    """
+    client:        ComfyClient do ComfyUI alvo.
+    max_in_flight: quantos prompts ficam na fila do ComfyUI ao mesmo tempo.
+    fetch_images:  baixa os bytes das imagens de saida (GET /view).
+    """
+
+    def __init__(self, client, max_in_flight=MAX_IN_FLIGHT, fetch_images=True, job_timeout=JOB_TIMEOUT):
+        self.client = client
+        self.max_in_flight = max(1, max_in_flight)
+        self.fetch_images = fetch_images
+        self.job_timeout = job_timeout
+
+    def _open_ws(self):
+        try:
+            return self.client.websocket()
+        except (OSError, ComfyError) as e:
+            print(f"[BATCH] Websocket indisponivel ({e}); usando polling em /history", flush=True)
+            return None
+
+    def _result(self, job, prompt_id, started, entry=None, error=None):
+        result = {"id": job["id"], "name": job["name"], "overrides": job["overrides"],
+                  "prompt_id": prompt_id, "seconds": round(time.monotonic() - started, 3),
+                  "status": "failed" if error else "ok", "error": error, "images": []}
+        result["execution_seconds"], result["cached_nodes"] = execution_stats(entry)
+        if entry and not error:
+            for item in output_files(entry):
+                image = {k: item[k] for k in ("filename", "subfolder", "type", "node") if k in item}
+                if self.fetch_images and item.get("type") == "output":
+                    image["data"] = self.client.view(item["filename"], item.get("subfolder", ""), item["type"])
+                result["images"].append(image)
+        return result
+
+    def _check_history(self, inflight):
+        """Fallback/garantia: confere no /history quem ja terminou."""
+        done = []
+        for prompt_id in list(inflight):
+            entry = self.client.history(prompt_id).get(prompt_id)
+            status = (entry or {}).get("status") or {}
+            if entry and status.get("completed", True):
+                error = status.get("messages") if status.get("status_str") == "error" else None
+                done.append((prompt_id, entry, str(error) if error else None))
+        return done
+
+    def run(self, jobs):
+        """Gerador: submete os jobs e devolve cada resultado quando termina."""
+        queue = list(jobs)
+        inflight = {}  # prompt_id -> (job, started)
+        ws = self._open_ws()
+        last_check = time.monotonic()
+        try:
+            while queue or inflight:
+                while queue and len(inflight) < self.max_in_flight:
+                    job = queue.pop(0)
+                    started = time.monotonic()
+                    try:
+                        prompt_id = self.client.queue_prompt(job["workflow"])
+                    except (ComfyError, OSError) as e:
+                        yield self._result(job, None, started, error=str(e))
+                        continue
+                    inflight[prompt_id] = (job, started)
+
+                finished = []
+                if ws:
+                    try:
+                        msg = ws.recv_json(timeout=WS_POLL)
+                        data = msg.get("data") or {}
+                        prompt_id = data.get("prompt_id")
+                        kind = msg.get("type")
+                        if prompt_id in inflight and kind == "execution_error":
+                            finished.append((prompt_id, None, data.get("exception_message") or "execution_error"))
+                        elif prompt_id in inflight and (
+                            kind == "execution_success" or (kind == "executing" and data.get("node") is None)
+                        ):
+                            # O historico pode ainda nao estar gravado: a conferencia pega depois
+                            entry = self.client.history(prompt_id).get(prompt_id)
+                            if entry:
+                                finished.append((prompt_id, entry, None))
+                    except socket.timeout:
+                        pass
+                    except (OSError, ComfyError, ValueError):
+                        ws = None
+                else:
+                    time.sleep(0.5)
+                if not ws or time.monotonic() - last_check >= WS_POLL:
+                    finished += self._check_history(inflight)
+                    last_check = time.monotonic()
+
+                for prompt_id, entry, error in finished:
+                    if prompt_id not in inflight:
+                        continue
+                    job, started = inflight.pop(prompt_id)
+                    yield self._result(job, prompt_id, started, entry=entry, error=error)
+
+                now = time.monotonic()
+                for prompt_id, (job, started) in list(inflight.items()):
+                    if now - started > self.job_timeout:
+                        del inflight[prompt_id]
+                        yield self._result(job, prompt_id, started, error=f"timeout ({self.job_timeout}s)")
+        finally:
+            if ws:
+                ws.close()
+
+
+def save_result(result, out_dir):
+    """Grava as imagens de um resultado em out_dir. Retorna os caminhos."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for image in result["images"]:
+        if "data" not in image:
+            continue
+        path = os.path.join(out_dir, f"{result['id']}_{image['filename']}")
+        with open(path, "wb") as f:
+            f.write(image["data"])
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Roda um lote de workflows num ComfyUI")
+    parser.add_argument("jobs", help="arquivo JSON com workflows/jobs")
+    parser.add_argument("--url", default="http://127.0.0.1:8188")
+    parser.add_argument("--out", default="batch_outputs")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    args = parser.parse_args(argv)
+
+    runner = BatchRunner(ComfyClient(args.url), max_in_flight=args.max_in_flight)
+    for result in runner.run(load_jobs(args.jobs)):
+        paths = save_result(result, args.out)
+        print(f"[BATCH] job {result['id']}: {result['status']} em {result['seconds']:.1f}s {paths}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+comfy_client.py
+===============
+Cliente minimo (stdlib) para a API HTTP do ComfyUI.
+
+Usado pelo warm-up, pelas ferramentas headless e por quem mais precisar
+falar com um ComfyUI local ou remoto sem depender de `requests`.
+
+USO:
+  client = ComfyClient("http://127.0.0.1:8188")
+  client.wait_ready()
+  prompt_id = client.queue_prompt(workflow)
+  entry = client.wait_for(prompt_id)
+"""
+
+import base64
+import json
+import os
+import socket
+import struct
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+REQUEST_TIMEOUT = 30
+POLL_INTERVAL = 0.5
+
+
+class ComfyError(Exception):
+    """Erro da API do ComfyUI (prompt recusado, execucao com erro, timeout)."""
+
+
+class ComfyClient:
+    """
+    base_url:  ex "http://127.0.0.1:8188" (sem barra no final).
+    client_id: identifica as mensagens deste cliente no websocket /ws.
+    headers:   headers extras em todo request HTTP (ex: token do backend).
+    """
+
+    def __init__(self, base_url, client_id=None, timeout=REQUEST_TIMEOUT, headers=None):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id or uuid.uuid4().hex
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+
+    def _request(self, path, data=None, method=None):
+        body = json.dumps(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=self.headers)
+        if body is not None:
+            req.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                raw = resp.read()
+        except urllib.error.HTTPError as e:
+            raise ComfyError(f"{path}: HTTP {e.code} {e.read()[:500].decode(errors='replace')}") from e
+        return json.loads(raw) if raw else None
+
+    def get_json(self, path):
+        return self._request(path)
+
+    def post_json(self, path, data):
+        return self._request(path, data=data)
+
+    def is_ready(self):
+        try:
+            self._request("/system_stats")
+            return True
+        except (OSError, ComfyError, ValueError):
+            return False
+
+    def wait_ready(self, timeout=10 * 60):
+        """Espera a API responder. Retorna os segundos esperados."""
+        started = time.monotonic()
+        while not self.is_ready():
+            if time.monotonic() - started > timeout:
+                raise ComfyError(f"ComfyUI nao respondeu em {timeout}s")
+            time.sleep(POLL_INTERVAL)
+        return time.monotonic() - started
+
+    def queue_prompt(self, prompt, extra_data=None):
+        """Enfileira um workflow (formato API). Retorna o prompt_id."""
+        payload = {"prompt": prompt, "client_id": self.client_id}
+        if extra_data:
+            payload["extra_data"] = extra_data
+        result = self.post_json("/prompt", payload)
+        if not result or "prompt_id" not in result:
+            raise ComfyError(f"prompt recusado: {result}")
+        return result["prompt_id"]
+
+    def history(self, prompt_id=None):
+        path = f"/history/{prompt_id}" if prompt_id else "/history"
+        return self.get_json(path) or {}
+
+    def queue(self):
+        return self.get_json("/queue") or {}
+
+    def system_stats(self):
+        return self.get_json("/system_stats") or {}
+
+    def wait_for(self, prompt_id, timeout=10 * 60, poll=POLL_INTERVAL):
+        """Polling em /history ate o prompt terminar. Retorna a entrada do historico."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            entry = self.history(prompt_id).get(prompt_id)
+            if entry:
+                status = entry.get("status") or {}
+                if status.get("status_str") == "error":
+                    raise ComfyError(f"prompt {prompt_id} falhou: {status.get('messages')}")
+                if status.get("completed", True):
+                    return entry
+            time.sleep(poll)
+        raise ComfyError(f"prompt {prompt_id} nao terminou em {timeout}s")
+
+    def websocket(self):
+        """Abre o /ws deste client_id (eventos de progresso/conclusao)."""
+        return ComfyWebSocket(self.base_url, self.client_id, timeout=self.timeout)
+
+    def view(self, filename, subfolder="", folder_type="output"):
+        """Baixa um arquivo de saida (GET /view). Retorna os bytes."""
+        query = urllib.parse.urlencode({"filename": filename, "subfolder": subfolder, "type": folder_type})
+        req = urllib.request.Request(f"{self.base_url}/view?{query}", headers=self.headers)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return resp.read()
+
+
+class ComfyWebSocket:
+    """
+    Cliente websocket minimo (RFC 6455) para o /ws do ComfyUI: so recebe
+    mensagens; responde ping e ignora frames binarios (previews).
+    """
+
+    def __init__(self, base_url, client_id, timeout=REQUEST_TIMEOUT):
+        parts = urllib.parse.urlsplit(base_url)
+        host, port = parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+        if parts.scheme == "https":
+            raise ComfyError("websocket via https nao suportado; use a porta local do ComfyUI")
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        key = base64.b64encode(os.urandom(16)).decode()
+        path = f"{parts.path.rstrip('/')}/ws?clientId={client_id}"
+        self.sock.sendall((
+            f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n"
+            f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        self._buf = b""
+        head = self._read_until(b"\r\n\r\n")
+        if b" 101 " not in head.split(b"\r\n", 1)[0]:
+            raise ComfyError(f"handshake websocket recusado: {head[:200]!r}")
+
+    def _read_until(self, marker):
+        while marker not in self._buf:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ComfyError("websocket fechado")
+            self._buf += chunk
+        head, self._buf = self._buf.split(marker, 1)
+        return head
+
+    def _read(self, n):
+        while len(self._buf) < n:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ComfyError("websocket fechado")
+            self._buf += chunk
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+    def _send(self, opcode, payload=b""):
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        self.sock.sendall(bytes([0x80 | opcode, 0x80 | len(payload)]) + mask + masked)
+
+    def recv_json(self, timeout=None):
+        """Proxima mensagem de texto (dict). Levanta socket.timeout se nada chegar."""
+        self.sock.settimeout(timeout)
+        message = b""
+        while True:
+            b1, b2 = self._read(2)
+            opcode, length = b1 & 0x0F, b2 & 0x7F
+            if length == 126:
+                length = struct.unpack(">H", self._read(2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", self._read(8))[0]
+            mask = self._read(4) if b2 & 0x80 else None
+            payload = self._read(length)
+            if mask:
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+            if opcode == 0x8:
+                raise ComfyError("websocket fechado pelo servidor")
+            if opcode == 0x9:
+                self._send(0xA, payload[:125])
+                continue
+            if opcode in (0x1, 0x0):
+                message += payload
+                if b1 & 0x80 and message:
+                    return json.loads(message)
+            # 0x2 (binario: previews) e 0xA (pong) sao ignorados
+
+    def close(self):
+        try:
+            self._send(0x8)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def output_files(entry):
+    """Lista {"filename", "subfolder", "type", "node"} das saidas de uma entrada do /history."""
+    files = []
+    for node_id, output in (entry.get("outputs") or {}).items():
+        for key in ("images", "gifs", "videos"):
+            for item in output.get(key, []):
+                files.append(dict(item, node=node_id))
+    return files
@@ -0,0 +1,333 @@
+"""
+comfy_metrics.py
+================
+Sidecar de metricas (formato Prometheus) para o ComfyUI em execucao.
+
+Com max_containers=1 nao havia como saber se a A10G estava saturada. Este
+processo roda ao lado do ComfyUI e:
+  - Faz polling de /queue (fila), /system_stats (VRAM/RAM) e
+    /history?max_items=N (prompts terminados: latencia de execucao pelos
+    timestamps de execution_start/execution_success, espera na fila desde que
+    o prompt apareceu como pendente, nodes em cache).
+  - Assina o websocket /ws para a latencia por node (evento "executing" de um
+    node ate o proximo), rotulada pelo class_type do node; loaders
+    (*Loader*) tambem entram em comfyui_model_load_seconds. O ComfyUI so
+    manda esses eventos para o client_id que enfileirou o prompt e o
+    /history nao guarda tempo por node, entao essas duas series cobrem so os
+    prompts enfileirados sem client_id (scripts via API; a UI sempre manda
+    o seu) e ficam fora do /metrics enquanto nao houver amostra. A latencia
+    por prompt e a espera na fila (do /history) valem para todos.
+  - Serve GET /metrics (texto Prometheus), GET /recent (JSON dos ultimos
+    prompts) e GET /downloads (status da fila de downloads em background,
+    background_downloads.STATUS_FILE), sem proxy na frente da UI.
+
+Memoria limitada: histogramas com buckets fixos, ultimos prompts num ring
+buffer (deque com maxlen) e ids ja vistos / timings pendentes com teto.
+
+USO:
+  python -m comfy_metrics --comfyui-url http://127.0.0.1:8188 --port 9188
+  curl http://127.0.0.1:9188/metrics
+"""
+
+import argparse
+import http.server
+import json
+import socket
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from background_downloads import STATUS_FILE, read_status
+from comfy_client import ComfyClient, ComfyError
+
+METRICS_PORT = 9188
+POLL_INTERVAL = 5     # segundos entre polls de /queue, /system_stats e /history
+HISTORY_ITEMS = 64    # entradas do /history lidas por poll
+RING_SIZE = 256       # prompts recentes mantidos em memoria
+WS_RETRY = 10         # segundos antes de reconectar o websocket
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class _Bounded(OrderedDict):
+    """Dict com teto: ao passar de maxlen, descarta o item mais antigo."""
+
+    def __init__(self, maxlen):
+        super().__init__()
+        self.maxlen = maxlen
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxlen:
+            self.popitem(last=False)
+
+
+class Histogram:
+    """Histograma Prometheus (buckets fixos) com labels."""
+
+    def __init__(self, name, doc, buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.buckets = name, doc, buckets
+        self.series = {}  # labels (tupla) -> [contagens por bucket..., soma, total]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        if not self.series:
+            return []  # sem amostra: nada de serie vazia no /metrics
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(key)} {series[-1]}")
+        return lines
+
+
+class MetricsCollector:
+    """
+    client:    ComfyClient do ComfyUI observado.
+    ring_size: prompts recentes guardados (e teto dos ids ja vistos).
+    """
+
+    def __init__(self, client, ring_size=RING_SIZE):
+        self.client = client
+        self.recent = deque(maxlen=ring_size)
+        self._seen = _Bounded(ring_size * 4)         # prompt_ids do /history ja contabilizados
+        self._first_pending = _Bounded(ring_size)    # prompt_id -> time.time() visto na fila
+        self._node_times = _Bounded(ring_size)       # prompt_id -> {node_id: segundos} (websocket)
+        self._executing = {}                         # prompt_id -> (node_id, inicio)
+        self._lock = threading.Lock()
+        self.gauges = {}    # (nome, labels) -> valor
+        self.counters = {}  # (nome, labels) -> valor
+        self.prompt_seconds = Histogram("comfyui_prompt_execution_seconds",
+                                        "Tempo de execucao de cada prompt (execution_start ate o fim).")
+        self.wait_seconds = Histogram("comfyui_prompt_queue_wait_seconds",
+                                      "Espera na fila (primeira vez visto pendente ate execution_start).")
+        self.node_seconds = Histogram("comfyui_node_execution_seconds",
+                                      "Tempo de execucao por node, por class_type (websocket; so prompts "
+                                      "enfileirados sem client_id, a UI nao entra).")
+        self.load_seconds = Histogram("comfyui_model_load_seconds",
+                                      "Tempo dos nodes loader (*Loader*), por class_type (websocket; so "
+                                      "prompts enfileirados sem client_id, a UI nao entra).")
+
+    def _inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def _set(self, name, value, **labels):
+        self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    # ------------------------------------------------------------------
+    # Polling
+    # ------------------------------------------------------------------
+    def poll_once(self):
+        """Um ciclo de polling. Retorna False se o ComfyUI nao respondeu."""
+        try:
+            queue = self.client.queue()
+            stats = self.client.system_stats()
+            history = self.client.get_json(f"/history?max_items={HISTORY_ITEMS}") or {}
+        except (OSError, ComfyError, ValueError):
+            with self._lock:
+                self._set("comfyui_up", 0)
+            return False
+
+        now = time.time()
+        with self._lock:
+            self._set("comfyui_up", 1)
+            running, pending = queue.get("queue_running", []), queue.get("queue_pending", [])
+            self._set("comfyui_queue_running", len(running))
+            self._set("comfyui_queue_pending", len(pending))
+            for item in pending:
+                # Item da fila: [numero, prompt_id, prompt, extra_data, outputs]
+                if len(item) > 1 and item[1] not in self._first_pending:
+                    self._first_pending[item[1]] = now
+
+            system = stats.get("system", {})
+            for key in ("ram_total", "ram_free"):
+                if key in system:
+                    self._set(f"comfyui_{key}_bytes", system[key])
+            for device in stats.get("devices", []):
+                name = device.get("name", str(device.get("index", 0)))
+                for key in ("vram_total", "vram_free", "torch_vram_total", "torch_vram_free"):
+                    if key in device:
+                        self._set(f"comfyui_{key}_bytes", device[key], device=name)
+
+            for prompt_id, entry in history.items():
+                if prompt_id not in self._seen:
+                    self._record(prompt_id, entry)
+        return True
+
+    def _record(self, prompt_id, entry):
+        status = entry.get("status") or {}
+        if not status.get("completed", True) and status.get("status_str") != "error":
+            return  # ainda executando
+        self._seen[prompt_id] = True
+        events = {kind: data for kind, data in status.get("messages", [])}
+        started = (events.get("execution_start") or {}).get("timestamp")
+        ended = next((events[k].get("timestamp") for k in
+                      ("execution_success", "execution_error", "execution_interrupted") if k in events), None)
+        outcome = status.get("status_str") or "success"
+        record = {"prompt_id": prompt_id, "status": outcome, "seconds": None, "queue_wait": None,
+                  "cached_nodes": len((events.get("execution_cached") or {}).get("nodes", [])), "nodes": {}}
+        if started is not None and ended is not None:
+            record["seconds"] = round((ended - started) / 1000, 3)
+            self.prompt_seconds.observe(record["seconds"], status=outcome)
+        queued_at = self._first_pending.pop(prompt_id, None)
+        if queued_at is not None and started is not None:
+            record["queue_wait"] = round(max(0.0, started / 1000 - queued_at), 3)
+            self.wait_seconds.observe(record["queue_wait"])
+        self._inc("comfyui_prompts_total", status=outcome)
+        self._inc("comfyui_cached_nodes_total", record["cached_nodes"])
+
+        # Timings por node vindos do websocket: class_type sai do prompt do historico
+        prompt = (entry.get("prompt") or [None, None, {}])[2] or {}
+        for node_id, seconds in self._node_times.pop(prompt_id, {}).items():
+            class_type = (prompt.get(node_id) or {}).get("class_type", "unknown")
+            record["nodes"][node_id] = {"class_type": class_type, "seconds": round(seconds, 3)}
+            self.node_seconds.observe(seconds, class_type=class_type)
+            if "Loader" in class_type:
+                self.load_seconds.observe(seconds, class_type=class_type)
+        self.recent.append(record)
+
+    def run_poll(self, interval=POLL_INTERVAL):
+        while True:
+            self.poll_once()
+            time.sleep(interval)
+
+    # ------------------------------------------------------------------
+    # Websocket
+    # ------------------------------------------------------------------
+    def on_message(self, msg, now=None):
+        """Trata uma mensagem do /ws (executing / execution_*)."""
+        now = now if now is not None else time.monotonic()
+        kind, data = msg.get("type"), msg.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+        with self._lock:
+            if kind == "executing":
+                previous = self._executing.pop(prompt_id, None)
+                if previous:
+                    node_id, started = previous
+                    times = self._node_times.get(prompt_id) or {}
+                    times[node_id] = times.get(node_id, 0.0) + now - started
+                    self._node_times[prompt_id] = times
+                if data.get("node") is not None:
+                    self._executing[prompt_id] = (str(data["node"]), now)
+            elif kind in ("execution_success", "execution_error", "execution_interrupted"):
+                self._executing.pop(prompt_id, None)
+
+    def run_websocket(self, retry=WS_RETRY):
+        while True:
+            try:
+                ws = self.client.websocket()
+            except (OSError, ComfyError):
+                time.sleep(retry)
+                continue
+            try:
+                while True:
+                    try:
+                        self.on_message(ws.recv_json(timeout=60))
+                    except socket.timeout:
+                        continue
+            except (OSError, ComfyError, ValueError):
+                pass
+            finally:
+                ws.close()
+            time.sleep(retry)
+
+    # ------------------------------------------------------------------
+    # Exposicao
+    # ------------------------------------------------------------------
+    def render(self):
+        """Texto no formato de exposicao do Prometheus."""
+        with self._lock:
+            lines = []
+            for kind, values in (("gauge", self.gauges), ("counter", self.counters)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for (metric, labels), value in sorted(values.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_labels(labels)} {value}")
+            for histogram in (self.prompt_seconds, self.wait_seconds, self.node_seconds, self.load_seconds):
+                lines += histogram.render()
+            lines.append("# TYPE comfyui_metrics_recent_prompts gauge")
+            lines.append(f"comfyui_metrics_recent_prompts {len(self.recent)}")
+        return "\n".join(lines) + "\n"
+
+    def recent_json(self):
+        with self._lock:
+            return list(self.recent)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    collector = None  # MetricsCollector, definido em serve()
+    status_path = STATUS_FILE
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body, ctype = self.collector.render().encode(), "text/plain; version=0.0.4"
+        elif path == "/recent":
+            body, ctype = json.dumps(self.collector.recent_json()).encode(), "application/json"
+        elif path == "/downloads":
+            body, ctype = json.dumps(read_status(self.status_path)).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(collector, port=METRICS_PORT, host="0.0.0.0", status_path=STATUS_FILE):
+    """Cria o servidor HTTP de /metrics, /recent e /downloads (chame serve_forever)."""
+    handler = type("Handler", (_Handler,), {"collector": collector, "status_path": status_path})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Metricas Prometheus do ComfyUI (sidecar).")
+    parser.add_argument("--comfyui-url", default="http://127.0.0.1:8188")
+    parser.add_argument("--port", type=int, default=METRICS_PORT)
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--ring-size", type=int, default=RING_SIZE)
+    args = parser.parse_args(argv)
+
+    collector = MetricsCollector(ComfyClient(args.comfyui_url), ring_size=args.ring_size)
+    threading.Thread(target=collector.run_poll, args=(args.interval,), daemon=True).start()
+    threading.Thread(target=collector.run_websocket, daemon=True).start()
+    server = serve(collector, args.port)
+    print(f"[METRICS] :{server.server_address[1]}/metrics <- {args.comfyui_url}", flush=True)
+    server.serve_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
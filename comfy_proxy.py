@@ -0,0 +1,269 @@
+"""
+comfy_proxy.py
+==============
+Proxy HTTP (stdlib) na frente do ComfyUI.
+
+O ComfyUI passa a escutar numa porta interna (COMFYUI_INTERNAL_PORT) e este
+proxy ocupa a UI_PORT publica do Modal. Tudo e repassado sem alteracao
+(inclusive o path cru, para nao quebrar %2F em /api/userdata, e o websocket
+/ws via tunel TCP), exceto o POST /prompt: antes de enfileirar, o corpo passa
+pelos `prompt_hooks`, que podem preparar o ambiente (ex: baixar modelos) ou
+alterar o payload.
+
+Um hook e `hook(payload) -> payload` (dict do JSON do /prompt). Se levantar
+PromptRejected, o proxy responde 400 no mesmo formato de erro do ComfyUI; se
+levantar PromptAnswered(dict), responde 200 com o dict sem enfileirar nada.
+
+Rotas extras ficam em `routes` ({path: callable() -> (status, dict)}) e
+`intercepts` (callable(method, path) -> (status, dict) ou None, para paths
+com parametro, ex: /history/<id>).
+
+Com `token` (backends do comfy_router, expostos por tunel publico), todo
+request sem o header X-Kythours-Token certo recebe 403 antes de qualquer
+rota; o header nunca e repassado ao ComfyUI.
+
+USO:
+  python -m comfy_proxy --port 8188 --upstream-port 8189 [--lazy-models]
+  KYTHOURS_BACKEND_TOKEN=... python -m comfy_proxy --port 8188 --upstream-port 8189
+"""
+
+import argparse
+import hmac
+import http.client
+import http.server
+import json
+import os
+import select
+import socket
+import threading
+
+from background_downloads import read_status
+
+HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "content-length",
+}
+PROMPT_PATHS = ("/prompt", "/api/prompt")
+UPSTREAM_TIMEOUT = 600
+TUNNEL_CHUNK = 64 * 1024
+DOWNLOADS_PATH = "/kythours/downloads"  # status da fila de background
+TOKEN_HEADER = "X-Kythours-Token"       # segredo compartilhado roteador -> backend
+TOKEN_ENV = "KYTHOURS_BACKEND_TOKEN"
+
+
+class PromptRejected(Exception):
+    """Hook recusou o prompt; a mensagem vai para o cliente como erro 400."""
+
+
+class PromptAnswered(Exception):
+    """Hook ja tem a resposta do /prompt (ex: cache); `data` vai para o cliente."""
+
+    def __init__(self, data):
+        super().__init__("prompt respondido pelo proxy")
+        self.data = data
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    proxy = None  # ComfyProxy, definido em ComfyProxy.__init__
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _handle(self):
+        token = self.proxy.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode(), token.encode()):
+            self.close_connection = True
+            return self._send_json(403, {"error": "token do backend ausente ou invalido"})
+        route = self.proxy.routes.get(self.path.split("?", 1)[0])
+        if route and self.command == "GET":
+            status, data = route()
+            return self._send_json(status, data)
+        for intercept in self.proxy.intercepts:
+            answer = intercept(self.command, self.path)
+            if answer:
+                return self._send_json(*answer)
+
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            return self._tunnel()
+
+        body = self._read_body()
+        if self.command == "POST" and self.path.split("?", 1)[0] in PROMPT_PATHS:
+            try:
+                body = self.proxy.run_prompt_hooks(body)
+            except PromptRejected as e:
+                error = {"type": "prompt_rejected", "message": str(e), "details": "", "extra_info": {}}
+                return self._send_json(400, {"error": error, "node_errors": {}})
+            except PromptAnswered as e:
+                return self._send_json(200, e.data)
+        self._forward(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_HEAD = do_OPTIONS = _handle
+
+    def _upstream(self):
+        return self.proxy.upstream_host, self.proxy.upstream_port
+
+    def _upstream_headers(self, upstream):
+        """Headers extras para `upstream` (o roteador manda o token do backend)."""
+        return {}
+
+    def _request_headers(self, upstream):
+        # O token de quem chamou nunca segue adiante; so o de `upstream`, se houver
+        headers = {k: v for k, v in self.headers.items()
+                   if k.lower() not in HOP_BY_HOP and k.lower() != TOKEN_HEADER.lower()}
+        headers.update(self._upstream_headers(upstream))
+        return headers
+
+    def _exchange(self, body, upstream=None, path=None):
+        """(resposta, corpo) do request repassado a `upstream` ((host, port), padrao: o do proxy)."""
+        upstream = upstream or self._upstream()
+        conn = http.client.HTTPConnection(*upstream, timeout=UPSTREAM_TIMEOUT)
+        try:
+            headers = self._request_headers(upstream)
+            if body or self.command in ("POST", "PUT", "PATCH"):
+                headers["Content-Length"] = str(len(body))
+            conn.request(self.command, path or self.path, body=body or None, headers=headers)
+            resp = conn.getresponse()
+            return resp, resp.read()
+        finally:
+            conn.close()
+
+    def _reply(self, resp, data, extra_headers=()):
+        self.send_response(resp.status, resp.reason)
+        for key, value in [*resp.getheaders(), *extra_headers]:
+            if key.lower() not in HOP_BY_HOP:
+                self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def _forward(self, body, upstream=None, path=None, extra_headers=()):
+        """Repassa o request e devolve a resposta do ComfyUI (502 se ele nao responde)."""
+        try:
+            resp, data = self._exchange(body, upstream, path)
+        except OSError as e:
+            return self._send_json(502, {"error": f"ComfyUI indisponivel: {e}"})
+        self._reply(resp, data, extra_headers)
+
+    def _tunnel(self, upstream=None):
+        """Websocket: repassa o handshake e depois copia bytes nos dois sentidos."""
+        address = upstream or self._upstream()
+        try:
+            upstream = socket.create_connection(address)
+        except OSError as e:
+            return self._send_json(502, {"error": f"ComfyUI indisponivel: {e}"})
+        # Handshake com os headers originais (Upgrade/Connection inclusive), sem o token de quem chamou
+        headers = [(k, v) for k, v in self.headers.items() if k.lower() != TOKEN_HEADER.lower()]
+        headers += list(self._upstream_headers(address).items())
+        head = f"{self.command} {self.path} HTTP/1.1\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in headers) + "\r\n"
+        upstream.sendall(head.encode("latin-1"))
+        self.wfile.flush()
+        client = self.connection
+        sockets = [client, upstream]
+        try:
+            while True:
+                readable, _, _ = select.select(sockets, [], [])
+                for sock in readable:
+                    data = sock.recv(TUNNEL_CHUNK)
+                    if not data:
+                        return
+                    (upstream if sock is client else client).sendall(data)
+        except OSError:
+            pass
+        finally:
+            upstream.close()
+            self.close_connection = True
+
+
+class ComfyProxy:
+    """
+    Proxy de `port` -> `upstream_host:upstream_port`.
+
+    prompt_hooks: lista de hook(payload) -> payload aplicada ao POST /prompt.
+    routes:       {path: callable() -> (status, dict)} servidos pelo proxy.
+    intercepts:   lista de callable(method, path) -> (status, dict) ou None.
+    token:        exige X-Kythours-Token igual a ele (None = sem checagem).
+    """
+
+    def __init__(self, port, upstream_port, upstream_host="127.0.0.1", host="0.0.0.0", token=None):
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.token = token or None
+        self.prompt_hooks = []
+        self.routes = {}
+        self.intercepts = []
+        handler = type("Handler", (_Handler,), {"proxy": self})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def run_prompt_hooks(self, body):
+        if not self.prompt_hooks:
+            return body
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return body  # ComfyUI responde o erro de JSON invalido
+        for hook in self.prompt_hooks:
+            payload = hook(payload)
+        return json.dumps(payload).encode()
+
+    def start(self):
+        """Serve em thread daemon (testes / embutido)."""
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Proxy na frente do ComfyUI")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--upstream-port", type=int, default=8189)
+    parser.add_argument("--upstream-host", default="127.0.0.1")
+    parser.add_argument("--comfyui-dir", default="/root/ComfyUI")
+    parser.add_argument("--lazy-models", action="store_true",
+                        help="baixa sob demanda os modelos que o workflow usa")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="responde workflows identicos com as saidas ja geradas")
+    args = parser.parse_args(argv)
+
+    # Token pelo ambiente (nao aparece na linha de comando do processo)
+    proxy = ComfyProxy(args.port, args.upstream_port, upstream_host=args.upstream_host,
+                       token=os.environ.get(TOKEN_ENV))
+    proxy.routes[DOWNLOADS_PATH] = lambda: (200, read_status())
+    if args.lazy_models:
+        from lazy_models import LazyModelFetcher
+        LazyModelFetcher(args.comfyui_dir).install(proxy)
+    if args.result_cache:
+        # Depois do lazy: a chave usa a identidade dos modelos ja presentes no volume
+        from result_cache import ResultCache
+        ResultCache(args.comfyui_dir, upstream=f"http://{args.upstream_host}:{args.upstream_port}").install(proxy)
+
+    print(f"[PROXY] :{proxy.port} -> {args.upstream_host}:{args.upstream_port}"
+          + (" (com token)" if proxy.token else ""), flush=True)
+    proxy.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,678 @@
+"""
+comfy_router.py
+===============
+Roteador na frente de N ComfyUI (um por container A10G), ciente das filas.
+
+Com max_containers=1 todo usuario e todo script dividiam a fila de um unico
+ComfyUI, e um lote de jobs pela API travava quem estava na UI. O roteador:
+  - Sessoes da UI sao fixas num backend (cookie kythours_backend, dado no
+    GET /): websocket, /api/userdata (workflows salvos ficam no disco daquele
+    container), /view e /prompt da UI vao sempre para o mesmo ComfyUI. Se o
+    backend some, a sessao e reatribuida e o cookie trocado.
+  - /prompt sem sessao (scripts, comfy_batch) vai para o backend com a menor
+    fila: running + pending do /queue (polling a cada ROUTER_POLL) + o que o
+    roteador mandou desde a ultima leitura.
+  - Historico unificado: GET /history junta o de todos os backends;
+    /history/<id> e /view vao direto para quem executou (prompt_id e
+    arquivos de saida sao lembrados), ou perguntam a todos. GET /queue sem
+    sessao tambem e a soma das filas.
+  - /api/userdata/<arquivo>: o proxy do Modal decodifica %2F e o ComfyUI
+    responde 405; o roteador recodifica o nome do arquivo antes de repassar.
+
+Backends: lista fixa de URLs ou um registro (dict / modal.Dict) onde cada
+container se anuncia (serve_backend: URL do tunel + token + heartbeat; sai do
+registro quando fica ocioso). O tunel e publico: o ComfyUI do backend so ouve
+em 127.0.0.1 e o comfy_proxy na frente dele exige o token do registro
+(header X-Kythours-Token), que o roteador poe em todo request repassado. Autoscaler pede mais um container quando todas as filas
+passam de ROUTER_SCALE_DEPTH (ou quando chega request sem nenhum backend).
+
+Para testar sem GPU, FakeComfyUI imita o ComfyUI (fila com um worker,
+/history, /view, /api/userdata com o mesmo 405 para "/" no nome).
+
+USO:
+  python -m comfy_router --port 8188 --backend http://127.0.0.1:8189 --backend http://127.0.0.1:8190
+  python -m comfy_router --port 8188 --fake-backends 3 --fake-seconds 2
+  GET /kythours/router   -> backends, filas, sessoes e contadores
+"""
+
+import argparse
+import http.cookies
+import http.server
+import json
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from comfy_client import ComfyClient, output_files
+from comfy_proxy import PROMPT_PATHS, TOKEN_HEADER, _Handler
+
+ROUTER_POLL = 1.0           # segundos entre leituras do /queue de cada backend
+REGISTRY_REFRESH = 5.0      # segundos entre leituras do registro de backends
+HEARTBEAT = 15              # segundos entre anuncios de um backend no registro
+STALE_AFTER = 60            # heartbeat mais velho que isso = backend fora
+ROUTER_SCALE_DEPTH = 2      # fila minima em todos os backends para pedir mais um
+BACKEND_BOOT_GRACE = 10 * 60  # segundos esperando um container pedido se registrar
+DEMAND_WINDOW = 10 * 60     # request recente sem backend = subir um
+BACKEND_TIMEOUT = 10
+COOKIE = "kythours_backend"
+STATUS_PATH = "/kythours/router"
+HISTORY_PATHS = ("/history", "/api/history")
+QUEUE_PATHS = ("/queue", "/api/queue")
+VIEW_PATHS = ("/view", "/api/view")
+INTERRUPT_PATHS = ("/interrupt", "/api/interrupt")
+USERDATA_PREFIXES = ("/api/userdata/", "/userdata/")
+MAX_REMEMBERED = 10000      # prompt_ids / arquivos de saida lembrados
+
+
+def fix_userdata_path(path):
+    """/api/userdata/workflows/a.json -> /api/userdata/workflows%2Fa.json (idempotente)."""
+    prefix = next((p for p in USERDATA_PREFIXES if path.startswith(p)), None)
+    if not prefix:
+        return path
+    rest, sep, query = path[len(prefix):].partition("?")
+    quote = lambda part: urllib.parse.quote(urllib.parse.unquote(part), safe="")  # noqa: E731
+    # POST /userdata/{file}/move/{dest}
+    name, move, dest = rest.partition("/move/")
+    fixed = quote(name) + (move + quote(dest) if move else "")
+    return prefix + fixed + sep + query
+
+
+def _entry_time(entry):
+    """Timestamp (ms) do primeiro status de uma entrada do /history (0 se nao tem)."""
+    messages = ((entry or {}).get("status") or {}).get("messages") or []
+    return next((data.get("timestamp", 0) for _, data in messages if isinstance(data, dict)), 0)
+
+
+class _Bounded(OrderedDict):
+    def remember(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > MAX_REMEMBERED:
+            self.popitem(last=False)
+
+
+class Backend:
+    """Um ComfyUI atras do roteador; `load` = fila lida + prompts mandados desde a leitura."""
+
+    def __init__(self, name, url, token=None):
+        self.name = name
+        self.url = url.rstrip("/")
+        self.token = token or None
+        self.headers = {TOKEN_HEADER: self.token} if self.token else {}
+        parts = urllib.parse.urlsplit(self.url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.depth = None
+        self.inflight = 0
+        self.healthy = False
+        self.error = None
+        self.dispatched = 0
+        self.polled_at = None
+
+    @property
+    def load(self):
+        return (self.depth or 0) + self.inflight
+
+    def client(self):
+        return ComfyClient(self.url, timeout=BACKEND_TIMEOUT, headers=self.headers)
+
+    def to_dict(self):
+        return {"url": self.url, "healthy": self.healthy, "depth": self.depth, "inflight": self.inflight,
+                "dispatched": self.dispatched, "error": self.error}
+
+
+# ----------------------------------------------------------------------
+# Registro de backends (dict local ou modal.Dict)
+# ----------------------------------------------------------------------
+def registry_backends(registry, stale_after=STALE_AFTER, now=None):
+    """{nome: {"url", "token"}} dos backends com heartbeat recente."""
+    now = time.time() if now is None else now
+    return {name: {"url": entry["url"], "token": entry.get("token")} for name, entry in list(registry.items())
+            if now - entry.get("heartbeat", 0) <= stale_after}
+
+
+def serve_backend(registry, name, url, local_url, idle_seconds=0, heartbeat=HEARTBEAT, token=None):
+    """
+    Anuncia `url` (e o `token` que o proxy do backend exige) no registro a cada
+    heartbeat ate o ComfyUI local ficar ocioso (fila vazia) por idle_seconds
+    (0 = nunca). Sai do registro ao terminar.
+    """
+    client = ComfyClient(local_url, timeout=BACKEND_TIMEOUT)
+    idle_since = time.monotonic()
+    print(f"[ROUTER] Backend {name} registrado: {url}", flush=True)
+    try:
+        while True:
+            registry[name] = {"url": url, "heartbeat": time.time(), "token": token}
+            try:
+                queue = client.queue()
+                busy = bool(queue.get("queue_running") or queue.get("queue_pending"))
+            except Exception:
+                busy = False
+            if busy:
+                idle_since = time.monotonic()
+            elif idle_seconds and time.monotonic() - idle_since > idle_seconds:
+                print(f"[ROUTER] Backend {name} ocioso ha {idle_seconds}s; saindo", flush=True)
+                return
+            time.sleep(heartbeat)
+    finally:
+        registry.pop(name, None)
+
+
+# ----------------------------------------------------------------------
+# Roteador
+# ----------------------------------------------------------------------
+class _RouterHandler(_Handler):
+    router = None  # ComfyRouter, definido em ComfyRouter.__init__
+
+    def _backend_upstream(self, backend):
+        return backend.host, backend.port
+
+    def _upstream_headers(self, upstream):
+        backend = next((b for b in list(self.router.backends.values()) if (b.host, b.port) == upstream), None)
+        return backend.headers if backend else {}
+
+    def _session(self):
+        """(backend da sessao da UI ou None, header Set-Cookie a mandar)."""
+        cookies = http.cookies.SimpleCookie(self.headers.get("Cookie", ""))
+        name = cookies[COOKIE].value if COOKIE in cookies else None
+        path = self.path.split("?", 1)[0]
+        if name is None and not (self.command == "GET" and path == "/"):
+            return None, ()
+        backend = self.router.backends.get(name) if name else None
+        if backend and backend.healthy:
+            return backend, ()
+        backend = self.router.pick()
+        if backend is None:
+            return None, ()
+        self.router.counters["sessions"] += 1
+        return backend, (("Set-Cookie", f"{COOKIE}={backend.name}; Path=/; SameSite=Lax"),)
+
+    def _query(self):
+        return dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+
+    def _handle(self):
+        router = self.router
+        path = self.path.split("?", 1)[0]
+        if self.command == "GET" and path == STATUS_PATH:
+            return self._send_json(200, router.status())
+        router.last_request = time.time()
+
+        backend, cookie = self._session()
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            backend = backend or router.pick()
+            if backend is None:
+                return self._no_backend()
+            return self._tunnel(self._backend_upstream(backend))
+
+        body = self._read_body()
+        if backend:
+            # Sessao da UI: tudo no mesmo ComfyUI
+            if self.command == "POST" and path in PROMPT_PATHS:
+                return self._dispatch(body, backend, cookie)
+            return self._forward(body, self._backend_upstream(backend), fix_userdata_path(self.path), cookie)
+
+        # Sem sessao: scripts / API
+        if self.command == "POST" and path in PROMPT_PATHS:
+            return self._dispatch(body)
+        if self.command == "GET" and path in HISTORY_PATHS:
+            return self._send_json(200, router.merged_history(self.path))
+        if self.command == "GET" and path.startswith(tuple(p + "/" for p in HISTORY_PATHS)):
+            return self._history_entry(path.rsplit("/", 1)[1])
+        if self.command == "GET" and path in QUEUE_PATHS:
+            return self._send_json(200, router.merged_queue())
+        if self.command == "GET" and path in VIEW_PATHS:
+            return self._view(body)
+        if self.command == "POST" and path in INTERRUPT_PATHS + QUEUE_PATHS:
+            target = router.backend_for_body(body)
+            if target:
+                return self._forward(body, self._backend_upstream(target))
+        backend = router.pick()
+        if backend is None:
+            return self._no_backend()
+        self._forward(body, self._backend_upstream(backend), fix_userdata_path(self.path))
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = do_HEAD = do_OPTIONS = _handle
+
+    def _no_backend(self):
+        self._send_json(503, {"error": "nenhum backend ComfyUI no ar; subindo um, tente de novo em alguns minutos"})
+
+    def _dispatch(self, body, backend=None, cookie=()):
+        """POST /prompt: backend da sessao ou o de menor fila; lembra o prompt_id."""
+        router = self.router
+        tried = set()
+        while True:
+            target = backend or router.pick(exclude=tried)
+            if target is None:
+                return self._no_backend()
+            try:
+                resp, data = self._exchange(body, self._backend_upstream(target))
+                break
+            except ConnectionError as e:
+                # Nada foi enfileirado (conexao recusada/caiu antes): tenta o proximo
+                target.healthy, target.error = False, str(e)
+                tried.add(target.name)
+                if backend:
+                    return self._send_json(502, {"error": f"ComfyUI indisponivel: {e}"})
+            except OSError as e:
+                return self._send_json(502, {"error": f"ComfyUI indisponivel: {e}"})
+        if resp.status == 200:
+            try:
+                prompt_id = json.loads(data).get("prompt_id")
+            except (ValueError, AttributeError):
+                prompt_id = None
+            router.dispatched(target, prompt_id)
+        self._reply(resp, data, cookie)
+
+    def _history_entry(self, prompt_id):
+        backend = self.router.backend_for_prompt(prompt_id)
+        if backend:
+            return self._forward(b"", self._backend_upstream(backend))
+        # Desconhecido (roteador reiniciado): pergunta a todos
+        self._send_json(200, self.router.merged_history(self.path))
+
+    def _view(self, body):
+        """GET /view: quem gerou o arquivo; sem registro, o primeiro que tiver."""
+        router = self.router
+        q = self._query()
+        known = router.backend_for_file(q.get("type", "output"), q.get("subfolder", ""), q.get("filename", ""))
+        candidates = [known] if known else router.healthy()
+        for backend in candidates:
+            try:
+                resp, data = self._exchange(body, self._backend_upstream(backend))
+            except OSError:
+                continue
+            if resp.status == 200 or backend is candidates[-1]:
+                return self._reply(resp, data)
+        self._send_json(404, {"error": "arquivo nao encontrado em nenhum backend"})
+
+
+class ComfyRouter:
+    """
+    port:     porta publica do roteador.
+    backends: lista de URLs (fixa) ou callable() -> {nome: url ou {"url", "token"}} (registro).
+    """
+
+    def __init__(self, port, backends, host="0.0.0.0", poll=ROUTER_POLL):
+        if callable(backends):
+            self.provider = backends
+        else:
+            urls = list(backends)
+            self.provider = lambda: {urllib.parse.urlsplit(u).netloc: u for u in urls}
+        self.poll = poll
+        self.backends = {}
+        self.last_request = None
+        self.counters = {"dispatched": 0, "sessions": 0, "history_merges": 0}
+        self._prompts = _Bounded()  # prompt_id -> nome do backend
+        self._files = _Bounded()    # (type, subfolder, filename) -> nome do backend
+        self._lock = threading.Lock()
+        self._refreshed = None
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=8)
+        handler = type("RouterHandler", (_RouterHandler,), {"router": self})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    # -- backends ------------------------------------------------------
+    def refresh(self):
+        """Sincroniza self.backends com o provider (novos entram, sumidos saem)."""
+        try:
+            current = self.provider()
+        except Exception as e:
+            print(f"[ROUTER] Registro de backends indisponivel: {e}", flush=True)
+            return
+        with self._lock:
+            for name, entry in current.items():
+                url, token = (entry["url"], entry.get("token")) if isinstance(entry, dict) else (entry, None)
+                known = self.backends.get(name)
+                if not known or known.url != url.rstrip("/") or known.token != (token or None):
+                    self.backends[name] = Backend(name, url, token)
+                    print(f"[ROUTER] Backend {name} entrou: {url}", flush=True)
+            for name in set(self.backends) - set(current):
+                print(f"[ROUTER] Backend {name} saiu", flush=True)
+                del self.backends[name]
+        self._refreshed = time.monotonic()
+
+    def _poll_backend(self, backend):
+        try:
+            queue = backend.client().queue()
+            depth = len(queue.get("queue_running") or []) + len(queue.get("queue_pending") or [])
+        except Exception as e:
+            backend.healthy, backend.error = False, str(e)
+            return
+        # A fila lida ja inclui o que foi mandado antes da leitura
+        backend.depth, backend.inflight = depth, 0
+        backend.healthy, backend.error = True, None
+        backend.polled_at = time.time()
+
+    def poll_once(self):
+        if self._refreshed is None or time.monotonic() - self._refreshed >= REGISTRY_REFRESH:
+            self.refresh()
+        list(self._pool.map(self._poll_backend, list(self.backends.values())))
+
+    def healthy(self):
+        return [b for b in list(self.backends.values()) if b.healthy]
+
+    def pick(self, exclude=()):
+        """Backend saudavel com a menor fila (empate: quem recebeu menos prompts)."""
+        candidates = [b for b in self.healthy() if b.name not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda b: (b.load, b.dispatched, b.name))
+
+    def dispatched(self, backend, prompt_id):
+        with self._lock:
+            backend.inflight += 1
+            backend.dispatched += 1
+            self.counters["dispatched"] += 1
+            if prompt_id:
+                self._prompts.remember(prompt_id, backend.name)
+
+    def backend_for_prompt(self, prompt_id):
+        backend = self.backends.get(self._prompts.get(prompt_id))
+        return backend if backend and backend.healthy else None
+
+    def backend_for_file(self, folder_type, subfolder, filename):
+        backend = self.backends.get(self._files.get((folder_type, subfolder, filename)))
+        return backend if backend and backend.healthy else None
+
+    def backend_for_body(self, body):
+        """POST /interrupt ou /queue (delete) com prompt_id(s): o backend que os executa."""
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return None
+        ids = (payload.get("delete") or [payload.get("prompt_id")]) if isinstance(payload, dict) else []
+        return next((b for b in map(self.backend_for_prompt, filter(None, ids)) if b), None)
+
+    # -- fan-out -------------------------------------------------------
+    def _fan_out(self, path):
+        """[(backend, json)] do GET `path` em todos os backends saudaveis."""
+        def get(backend):
+            try:
+                return backend, backend.client().get_json(path)
+            except Exception:
+                return backend, None
+        return [(b, data) for b, data in self._pool.map(get, self.healthy()) if data is not None]
+
+    def merged_history(self, path):
+        """/history (ou /history/<id>) de todos os backends, do mais antigo ao mais novo."""
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(path).query))
+        entries = []
+        for backend, history in self._fan_out(path):
+            for prompt_id, entry in history.items():
+                entries.append((prompt_id, entry))
+                with self._lock:
+                    self._prompts.remember(prompt_id, backend.name)
+                    for f in output_files(entry):
+                        self._files.remember((f.get("type", "output"), f.get("subfolder", ""), f["filename"]),
+                                             backend.name)
+        self.counters["history_merges"] += 1
+        entries.sort(key=lambda item: _entry_time(item[1]))
+        if query.get("max_items", "").isdigit():
+            entries = entries[-int(query["max_items"]):]
+        return dict(entries)
+
+    def merged_queue(self):
+        merged = {"queue_running": [], "queue_pending": []}
+        for _, queue in self._fan_out("/queue"):
+            for key in merged:
+                merged[key].extend(queue.get(key) or [])
+        return merged
+
+    # -- autoscaling ---------------------------------------------------
+    def wanted_backends(self, min_backends=0, max_backends=1, scale_depth=ROUTER_SCALE_DEPTH,
+                        demand_window=DEMAND_WINDOW):
+        """
+        Quantos backends deveriam estar no ar: ao menos um se houve request
+        recente, mais um quando todos tem fila >= scale_depth.
+        """
+        healthy = self.healthy()
+        want = len(healthy)
+        recent = self.last_request is not None and time.time() - self.last_request < demand_window
+        if not healthy and recent:
+            want = 1
+        elif healthy and all(b.load >= scale_depth for b in healthy):
+            want += 1
+        return max(min_backends, min(max_backends, want))
+
+    def status(self):
+        return {"backends": {name: b.to_dict() for name, b in list(self.backends.items())},
+                "counters": dict(self.counters), "prompts_known": len(self._prompts),
+                "files_known": len(self._files), "last_request": self.last_request}
+
+    # -- ciclo de vida -------------------------------------------------
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[ROUTER] Falha no polling: {e}", flush=True)
+            self._stop.wait(self.poll)
+
+    def start(self):
+        """Polling + servidor em threads daemon."""
+        self.poll_once()
+        threading.Thread(target=self._loop, daemon=True).start()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def serve_forever(self):
+        self.poll_once()
+        threading.Thread(target=self._loop, daemon=True).start()
+        self.server.serve_forever()
+
+    def shutdown(self):
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self._pool.shutdown(wait=False)
+
+
+class Autoscaler:
+    """
+    Pede containers (spawn()) ate router.wanted_backends(); conta os pedidos
+    ainda nao registrados por ate `grace` segundos para nao pedir em dobro.
+    Quem desce e o proprio backend (serve_backend com idle_seconds).
+    """
+
+    def __init__(self, router, spawn, min_backends=0, max_backends=1, scale_depth=ROUTER_SCALE_DEPTH,
+                 grace=BACKEND_BOOT_GRACE, interval=10.0):
+        self.router = router
+        self.spawn = spawn
+        self.min_backends = min_backends
+        self.max_backends = max_backends
+        self.scale_depth = scale_depth
+        self.grace = grace
+        self.interval = interval
+        self.pending = []  # time.time() de cada spawn ainda nao registrado
+        self._known = set(router.backends)
+        self._stop = threading.Event()
+
+    def step(self, now=None):
+        """Um ciclo: retorna quantos containers foram pedidos."""
+        now = time.time() if now is None else now
+        joined = set(self.router.backends) - self._known
+        self._known = set(self.router.backends)
+        self.pending = [t for t in self.pending[len(joined):] if now - t < self.grace]
+        want = self.router.wanted_backends(self.min_backends, self.max_backends, self.scale_depth)
+        missing = want - len(self.router.healthy()) - len(self.pending)
+        for _ in range(max(0, missing)):
+            try:
+                self.spawn()
+            except Exception as e:
+                print(f"[ROUTER] Falha ao pedir backend: {e}", flush=True)
+                break
+            self.pending.append(now)
+            print(f"[ROUTER] Pedindo mais um backend ({want} desejado(s))", flush=True)
+        return max(0, missing)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.step()
+
+    def start(self):
+        thread = threading.Thread(target=self._loop, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+
+# ----------------------------------------------------------------------
+# ComfyUI falso (teste local do roteador)
+# ----------------------------------------------------------------------
+class _FakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, data, content_type="application/json"):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        fake = self.fake
+        raw_path, _, query = self.path.partition("?")
+        path = raw_path[4:] if raw_path.startswith("/api/") else raw_path
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if path.startswith("/userdata/"):
+            # Como a rota do aiohttp /userdata/{file}: um segmento so
+            name = path[len("/userdata/"):]
+            if "/" in name:
+                return self._send(405, b"405: Method Not Allowed", "text/plain")
+            name = urllib.parse.unquote(name)
+            if self.command == "POST":
+                fake.userdata[name] = body
+                return self._send(200, {"path": name})
+            if name not in fake.userdata:
+                return self._send(404, b"404: Not Found", "text/plain")
+            return self._send(200, fake.userdata[name], "application/octet-stream")
+        if self.command == "GET" and path == "/":
+            return self._send(200, f"<html>fake ComfyUI {fake.name}</html>".encode(), "text/html")
+        if self.command == "POST" and path == "/prompt":
+            return self._send(200, fake.enqueue(json.loads(body or b"{}")))
+        if self.command == "GET" and path == "/queue":
+            return self._send(200, fake.queue())
+        if self.command == "GET" and path == "/history":
+            q = dict(urllib.parse.parse_qsl(query))
+            items = list(fake.history.items())
+            if q.get("max_items", "").isdigit():
+                items = items[-int(q["max_items"]):]
+            return self._send(200, dict(items))
+        if self.command == "GET" and path.startswith("/history/"):
+            prompt_id = path.rsplit("/", 1)[1]
+            return self._send(200, {prompt_id: fake.history[prompt_id]} if prompt_id in fake.history else {})
+        if self.command == "GET" and path == "/view":
+            filename = dict(urllib.parse.parse_qsl(query)).get("filename")
+            if filename not in fake.files:
+                return self._send(404, b"404: Not Found", "text/plain")
+            return self._send(200, fake.files[filename], "image/png")
+        if self.command == "POST" and path in ("/interrupt", "/queue"):
+            return self._send(200, {})
+        if self.command == "GET" and path in ("/system_stats", "/object_info"):
+            return self._send(200, {"system": {"name": fake.name}})
+        self._send(404, b"404: Not Found", "text/plain")
+
+    do_GET = do_POST = _handle
+
+
+class FakeComfyUI:
+    """Fila com um worker que leva `seconds` por prompt; sem websocket (clientes caem no /history)."""
+
+    def __init__(self, port=0, seconds=1.0, name=None, host="127.0.0.1"):
+        self.seconds = seconds
+        self.pending = []
+        self.running = []
+        self.history = OrderedDict()
+        self.files = {}
+        self.userdata = {}
+        self._number = 0
+        self._cond = threading.Condition()
+        handler = type("FakeHandler", (_FakeHandler,), {"fake": self})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.name = name or f"fake-{self.port}"
+        self.url = f"http://{host}:{self.port}"
+
+    def enqueue(self, payload):
+        with self._cond:
+            prompt_id = uuid.uuid4().hex
+            self.pending.append([self._number, prompt_id, payload.get("prompt", {}), {}, []])
+            self._number += 1
+            self._cond.notify()
+            return {"prompt_id": prompt_id, "number": self._number - 1, "node_errors": {}}
+
+    def queue(self):
+        with self._cond:
+            return {"queue_running": list(self.running), "queue_pending": list(self.pending)}
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self.pending:
+                    self._cond.wait()
+                item = self.pending.pop(0)
+                self.running.append(item)
+            started = int(time.time() * 1000)
+            time.sleep(self.seconds)
+            filename = f"ComfyUI_{item[0]:05d}_.png"
+            with self._cond:
+                self.files[filename] = f"{self.name}:{filename}".encode()
+                self.history[item[1]] = {
+                    "prompt": item,
+                    "outputs": {"9": {"images": [{"filename": filename, "subfolder": "", "type": "output"}]}},
+                    "status": {"status_str": "success", "completed": True, "messages": [
+                        ["execution_start", {"prompt_id": item[1], "timestamp": started}],
+                        ["execution_success", {"prompt_id": item[1], "timestamp": int(time.time() * 1000)}]]},
+                }
+                self.running.remove(item)
+
+    def start(self):
+        threading.Thread(target=self._worker, daemon=True).start()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Roteador de jobs na frente de varios ComfyUI")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--backend", action="append", default=[], help="URL de um ComfyUI (repetivel)")
+    parser.add_argument("--fake-backends", type=int, default=0, help="sobe N ComfyUI falsos locais")
+    parser.add_argument("--fake-seconds", type=float, default=2.0, help="tempo por prompt dos falsos")
+    args = parser.parse_args(argv)
+
+    backends = list(args.backend)
+    for _ in range(args.fake_backends):
+        fake = FakeComfyUI(seconds=args.fake_seconds).start()
+        backends.append(fake.url)
+        print(f"[ROUTER] ComfyUI falso em {fake.url}", flush=True)
+    if not backends:
+        parser.error("informe --backend ou --fake-backends")
+    router = ComfyRouter(args.port, backends)
+    print(f"[ROUTER] Ouvindo em :{router.port} -> {len(backends)} backend(s)", flush=True)
+    try:
+        router.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
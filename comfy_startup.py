@@ -0,0 +1,347 @@
+"""
+comfy_startup.py
+================
+Caminho de start do ComfyUI (o corpo do run_comfyui), sem depender do Modal.
+
+O run_comfyui so monta um ComfyStartup com os ganchos do Modal (commit do
+volume, modal.forward para o tunel de metricas) e chama run(). Assim o mesmo
+codigo roda localmente contra uma pasta qualquer, um catalogo espelhado e um
+main.py falso (ver bench_startup.py).
+
+Fases (StartupReport): discover, validate, plan, download_critical,
+node_profiling, comfyui_boot, warmup, remote_check. Flags lidas do ambiente,
+como no Modal: LAZY_MODELS, BACKGROUND_DOWNLOADS, REMOTE_CHECK, NODE_PROFILE,
+NODE_PROFILING, COMPILE_CACHE, STAGING, METRICS, RESULT_CACHE, OFFLOAD*,
+WARMUP*.
+
+USO:
+  startup = ComfyStartup(COMFYUI_DIR, BUILD_ID, commit=model_volume.commit, forward=modal.forward)
+  startup.run()                       # retorna com o ComfyUI subindo
+  startup.ready.wait()                # comfyui_boot/warmup medidos e relatorio gravado
+  startup.background_done.wait()      # downloads em background terminados
+
+Com read_only=True (backends do comfy_router, varios containers no mesmo
+volume) o start so le o volume: sem discover/validate/downloads, sem manifesto,
+uso do staging, cache de compilacao, relatorio ou saidas gravados nele e sem
+commit. O volume e sincronizado antes, uma vez, pelo prefetch_models. Com
+`token` o ComfyUI so ouve em 127.0.0.1 e o proxy na UI_PORT recusa quem nao
+mandar o token (a porta publica do backend sai por um tunel aberto); o
+proprio container fala com o ComfyUI por `local_url`.
+"""
+
+import os
+import subprocess
+import threading
+
+from background_downloads import BackgroundDownloads
+from comfy_client import ComfyClient
+from comfy_proxy import TOKEN_ENV
+from comfy_warmup import load_workflows, run_warmup
+from compile_cache import CompileCache
+from image_spec import MANIFEST_PATH, load_manifest, profile_nodes
+from model_catalog import COMFYUI_DIR, core_models, priority
+from model_staging import STAGING_DIR, ModelStaging
+from node_profile import comfyui_args, profile_packs, write_report
+from output_offload import OUTPUTS_DIRNAME, OutputOffload, sink_for
+from startup_report import REPORTS_DIRNAME, StartupReport
+from volume_sync import VolumeSync
+
+UI_PORT = 8188
+COMFYUI_INTERNAL_PORT = 8189  # Porta do ComfyUI quando ha proxy na frente (lazy / result cache / warmup)
+METRICS_PORT = 9188           # Sidecar de metricas Prometheus (comfy_metrics.py)
+LOCAL_REPORTS_DIR = "/tmp/kythours_reports"  # relatorios no modo read_only (fora do volume)
+
+
+class ComfyStartup:
+    """
+    comfyui_dir: raiz do ComfyUI (volume em <comfyui_dir>/models, main.py na raiz).
+    build_id:    BUILD_ID (relatorio, chave do cache de compilacao).
+    sync:        VolumeSync (padrao: catalogo do model_catalog, token HF do ambiente).
+    commit:      chamado a cada lote de saidas gravado no volume (model_volume.commit).
+    forward:     modal.forward (tunel do /metrics); None = so na porta local.
+    manifest_path: custom_nodes.json (perfis de nodes).
+    read_only:   nao grava nada no volume (ver docstring do modulo).
+    token:       exigido pelo proxy na UI_PORT (header X-Kythours-Token).
+    """
+
+    def __init__(self, comfyui_dir=COMFYUI_DIR, build_id="", ui_port=UI_PORT, internal_port=COMFYUI_INTERNAL_PORT,
+                 metrics_port=METRICS_PORT, sync=None, staging_dir=STAGING_DIR, commit=None, forward=None,
+                 manifest_path=MANIFEST_PATH, read_only=False, token=None):
+        self.comfyui_dir = comfyui_dir
+        self.models_dir = os.path.join(comfyui_dir, "models")
+        self.build_id = build_id
+        self.ui_port = ui_port
+        self.internal_port = internal_port
+        self.metrics_port = metrics_port
+        self.sync = sync or VolumeSync(comfyui_dir)
+        self.staging_dir = staging_dir
+        self.commit = commit
+        self.forward = forward
+        self.manifest_path = manifest_path
+        self.read_only = read_only
+        self.token = token or None
+        self.local_url = None  # ComfyUI direto, sem o proxy (definido em run)
+        # Tempos por fase/arquivo -> JSON em models/.kythours_reports (por BUILD_ID)
+        reports_dir = LOCAL_REPORTS_DIR if read_only else os.path.join(self.models_dir, REPORTS_DIRNAME)
+        self.report = StartupReport(build_id, reports_dir)
+        self.processes = []
+        self.ready = threading.Event()            # fim do measure_ready
+        self.background_done = threading.Event()  # fim dos downloads em background
+
+    def _popen(self, args, **kwargs):
+        proc = subprocess.Popen(args, **kwargs)
+        self.processes.append(proc)
+        return proc
+
+    def stop(self):
+        """Encerra o ComfyUI e os sidecars (uso local; no Modal o container morre junto)."""
+        for proc in self.processes:
+            proc.terminate()
+        for proc in self.processes:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def _sync(self, lazy, remote_check):
+        """Valida o volume e baixa o que segura o boot; retorna o que fica para o background."""
+        report, sync = self.report, self.sync
+        # Validacao + plano de download (mesmo codigo da funcao prefetch_models)
+        sync.ensure_dirs()
+        if remote_check:
+            # Checkpoints de LoRA pela listagem do HF (cache no volume)
+            with report.phase("discover"):
+                sync.discover()
+        with report.phase("validate"):
+            report.set("validation", sync.validate())
+
+        # --- Catalogo de Modelos (model_catalog.py) ---
+        models_to_download = sync.catalog
+        if lazy:
+            # Modo lazy: so o core no boot; o proxy baixa o resto sob demanda
+            print(f"[LAZY] Modo lazy ativo: baixando so o core ({len(core_models(models_to_download))} arquivos)")
+            models_to_download = core_models(models_to_download)
+
+        # Separar o que ja existe do que precisa ser baixado
+        with report.phase("plan"):
+            pending = sync.plan(models_to_download)
+
+        # Com downloads em background, so o conjunto critico (core) segura o boot;
+        # o resto e baixado depois que o ComfyUI ja esta no ar.
+        background = os.environ.get("BACKGROUND_DOWNLOADS", "1") == "1" and not lazy
+        critical = [m for m in pending if m.get("core")] if background else pending
+        deferred = [m for m in pending if not m.get("core")] if background else []
+
+        # Download paralelo (varios arquivos + Range multi-conexao nos grandes).
+        # Token HF e usado para repos privados.
+        with report.phase("download_critical"):
+            report.add_downloads(sync.download(critical))
+        report.set("deferred_downloads", len(deferred))
+        return deferred
+
+    def _check_read_only(self):
+        """Modo read_only: so confere se o core ja esta no volume (nada e baixado aqui)."""
+        missing = [os.path.basename(m["path"]) for m in core_models(self.sync.catalog)
+                   if not os.path.exists(m["path"])]
+        self.report.set("read_only", {"missing_core": missing})
+        if missing:
+            print(f"[WARN] Volume sem {len(missing)} arquivo(s) do core ({', '.join(missing)}); "
+                  "rode prefetch_models", flush=True)
+
+    def run(self):
+        report, sync, comfyui_dir = self.report, self.sync, self.comfyui_dir
+        read_only = self.read_only
+        lazy = os.environ.get("LAZY_MODELS", "0") == "1" and not read_only
+        remote_check = os.environ.get("REMOTE_CHECK", "1") == "1" and not read_only
+        if read_only:
+            self._check_read_only()
+            deferred = []
+        else:
+            deferred = self._sync(lazy, remote_check)
+
+        # Perfil de custom nodes: so os packs do perfil sao importados no boot
+        node_profile = os.environ.get("NODE_PROFILE", "full")
+        node_args = comfyui_args(node_profile, self.manifest_path)
+        packs = profile_nodes(load_manifest(self.manifest_path), node_profile)
+        report.set("node_profile", {"name": node_profile, "packs": len(packs)})
+        print(f"[NODES] Perfil {node_profile}: {len(packs)} pack(s)")
+        if os.environ.get("NODE_PROFILING", "0") == "1" and not read_only:
+            # Import de cada pack num subprocesso; atrasa o boot (diagnostico)
+            with report.phase("node_profiling"):
+                imports = profile_packs(comfyui_dir, packs)
+                write_report(imports, os.path.join(self.models_dir, REPORTS_DIRNAME), node_profile)
+            report.set("node_imports", imports["totals"])
+
+        # Kernels JIT (triton/inductor/CUDA) do container anterior, mesma chave
+        compile_cache = None
+        comfy_env = None
+        if os.environ.get("COMPILE_CACHE", "1") == "1" and not read_only:
+            compile_cache = CompileCache(self.models_dir, self.build_id)
+            comfy_env = {**os.environ, **compile_cache.prepare()}
+            report.set("compile_cache", {"key": compile_cache.key, "warm": compile_cache.warm})
+
+        # Copias locais dos modelos quentes: o ComfyUI procura primeiro no disco local
+        staging = None
+        if os.environ.get("STAGING", "1") == "1":
+            staging = ModelStaging(self.models_dir, self.staging_dir, persist_usage=not read_only)
+
+        # Iniciar ComfyUI (atras do proxy so no modo lazy e com o cache de
+        # resultados, que precisam do hook do /prompt; o status dos downloads em
+        # background sai pelo sidecar de metricas, GET /downloads). Com WARMUP o
+        # ComfyUI sobe na porta interna e a publica (proxy) so abre depois do
+        # aquecimento: o Modal nao roteia trafego antes dela escutar.
+        result_cache = os.environ.get("RESULT_CACHE", "0") == "1" and not read_only
+        warmup = os.environ.get("WARMUP", "0") == "1"
+        background = bool(deferred) or remote_check
+        proxied = lazy or result_cache or warmup or bool(self.token)
+        comfy_port = self.internal_port if proxied else self.ui_port
+        self.local_url = f"http://127.0.0.1:{comfy_port}"
+        comfy_args = [
+            "--listen", "127.0.0.1" if proxied else "0.0.0.0",
+            "--port", str(comfy_port),
+            "--preview-method", "auto",
+            *node_args,
+        ]
+        self._popen(
+            staging.launch_command(comfy_args) if staging else ["python", "main.py", *comfy_args],
+            cwd=comfyui_dir,
+            env=comfy_env,
+        )
+
+        def open_public_port():
+            self._popen([
+                "python", "-m", "comfy_proxy",
+                "--port", str(self.ui_port),
+                "--upstream-port", str(comfy_port),
+                "--comfyui-dir", comfyui_dir,
+                *(["--lazy-models"] if lazy else []),
+                *(["--result-cache"] if result_cache else []),
+            ], env={**os.environ, TOKEN_ENV: self.token} if self.token else None)
+
+        if proxied and not warmup:
+            open_public_port()
+        print(f"[OK] ComfyUI iniciando na porta {comfy_port}"
+              + (f" (publica {self.ui_port} apos o warmup)" if warmup else "") + "...")
+
+        if os.environ.get("METRICS", "1") == "1":
+            # Sidecar de metricas; o web_server so expoe a UI_PORT, entao /metrics sai por um tunel
+            self._popen([
+                "python", "-m", "comfy_metrics",
+                "--comfyui-url", f"http://127.0.0.1:{comfy_port}",
+                "--port", str(self.metrics_port),
+            ])
+
+            def expose_metrics():
+                try:
+                    with self.forward(self.metrics_port) as tunnel:
+                        print(f"[METRICS] Prometheus: {tunnel.url}/metrics (downloads: {tunnel.url}/downloads)", flush=True)
+                        threading.Event().wait()
+                except Exception as e:
+                    print(f"[METRICS] Tunel indisponivel ({e}); /metrics so na porta {self.metrics_port} local")
+
+            if self.forward:
+                threading.Thread(target=expose_metrics, daemon=True).start()
+
+        if staging:
+            def staging_idle(stats):
+                report.set("staging", stats)
+                report.write()
+
+            # Hot set pelo uso recente; sem historico, o core do catalogo
+            core = [os.path.relpath(m["path"], self.models_dir) for m in core_models(sync.catalog)]
+            staging.on_idle = staging_idle
+            staging.start(staging.hot_set(core))
+
+        # Saidas do disco efemero -> volume (ou object store), um commit por lote.
+        # read_only: so para um object store (OFFLOAD_DEST http)
+        dest = os.environ.get("OFFLOAD_DEST") or os.path.join(self.models_dir, OUTPUTS_DIRNAME)
+        remote_dest = dest.startswith(("http://", "https://"))
+        if os.environ.get("OFFLOAD", "1") == "1" and (remote_dest or not read_only):
+            OutputOffload(
+                os.path.join(comfyui_dir, "output"),
+                sink_for(dest),
+                fmt=os.environ.get("OFFLOAD_FORMAT", ""),
+                quality=int(os.environ.get("OFFLOAD_QUALITY", "90")),
+                on_commit=None if remote_dest else self.commit,
+            ).start()
+
+        def measure_ready():
+            try:
+                # Boot do ComfyUI (imports dos custom nodes) ate o primeiro HTTP 200
+                with report.phase("comfyui_boot"):
+                    report.wait_until_ready(f"http://127.0.0.1:{comfy_port}/")
+                if staging:
+                    # Uso real (prompts executados): hit/miss e novos arquivos para o disco local
+                    client = ComfyClient(f"http://127.0.0.1:{comfy_port}")
+                    threading.Thread(target=staging.watch_history, args=(client,), daemon=True).start()
+                if warmup:
+                    # Carrega diffusion model / text encoder / VAE na VRAM antes do 1o
+                    # prompt, direto na porta interna: nenhum usuario disputa a fila
+                    paths = [p for p in os.environ.get("WARMUP_WORKFLOWS", "").split(",") if p]
+                    try:
+                        with report.phase("warmup"):
+                            try:
+                                report.set("warmup", run_warmup(ComfyClient(f"http://127.0.0.1:{comfy_port}"),
+                                                                load_workflows(paths) or None))
+                            except Exception as e:
+                                print(f"[WARMUP] Falhou: {e}")
+                    finally:
+                        # Aquecido (ou falhou): a porta publica abre de qualquer jeito
+                        open_public_port()
+                if staging:
+                    report.set("staging", staging.stats())
+                report.write()
+                if compile_cache:
+                    # Teto de tamanho (LRU) fora do caminho critico do boot
+                    compile_cache.evict()
+            finally:
+                self.ready.set()
+
+        threading.Thread(target=measure_ready, daemon=True).start()
+
+        def handle_background_result(result):
+            sync.handle_result(result)
+            sync.manifest.save()
+            report.add_downloads([result], stage="background")
+
+        def background_finished(status):
+            try:
+                report.set("background_seconds", round(report.elapsed(), 3))
+                report.write()
+            finally:
+                self.background_done.set()
+
+        def run_background():
+            # Arquivos que mudaram no remoto (ETag) entram na mesma fila; o store
+            # troca o link de forma atomica, entao o ComfyUI segue usando o antigo
+            # ate o novo estar completo.
+            # Sem fila rodando (nada a baixar ou erro antes dela), quem libera
+            # background_done e o finally; com fila, e o background_finished.
+            started = False
+            try:
+                refresh = []
+                if remote_check:
+                    with report.phase("remote_check"):
+                        refresh = sync.check_remote()
+                    report.set("remote_refreshed", len(refresh))
+                models = deferred + refresh
+                if not models:
+                    return
+                print(f"[BG] {len(models)} arquivo(s) na fila de background (por prioridade)")
+                queue = BackgroundDownloads(sync.store, sync.downloader, on_result=handle_background_result,
+                                            on_finished=background_finished)
+                for model in models:
+                    queue.put(model, priority(model))
+                queue.start()
+                started = True
+            except Exception as e:
+                print(f"[BG] Falhou: {e}")
+            finally:
+                if not started:
+                    self.background_done.set()
+
+        if background:
+            threading.Thread(target=run_background, daemon=True).start()
+        else:
+            self.background_done.set()
+        return self
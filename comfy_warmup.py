@@ -0,0 +1,117 @@
+"""
+comfy_warmup.py
+===============
+Warm-up apos o boot: carrega os modelos padrao na VRAM antes do primeiro
+prompt de usuario.
+
+Espera a API do ComfyUI, envia um ou mais workflows minimos pelo /prompt
+(1 step, resolucao baixa) e espera o /history marcar cada um como concluido.
+So entao a instancia e considerada "quente".
+
+O example_workflow.json baixado do HF (z_image_turbo_workflow.json) esta no
+formato da UI (nodes/links), que o /prompt nao aceita; por isso o workflow
+padrao e DEFAULT_WORKFLOW, o equivalente em formato API com os mesmos
+modelos (z_image_turbo_bf16 + qwen_3_4b + ae). Outros workflows em formato
+API podem ser passados por arquivo (WARMUP_WORKFLOWS=a.json,b.json).
+
+USO:
+  results = run_warmup(ComfyClient("http://127.0.0.1:8188"))
+"""
+
+import copy
+import json
+import time
+
+from comfy_client import ComfyClient, ComfyError
+
+WARMUP_STEPS = 1
+WARMUP_SIZE = 256
+WARMUP_TIMEOUT = 10 * 60
+
+# Z-Image-Turbo em formato API (mesmos arquivos do conjunto core)
+DEFAULT_WORKFLOW = {
+    "1": {"class_type": "UNETLoader",
+          "inputs": {"unet_name": "z_image_turbo_bf16.safetensors", "weight_dtype": "default"}},
+    "2": {"class_type": "CLIPLoader",
+          "inputs": {"clip_name": "qwen_3_4b.safetensors", "type": "lumina2", "device": "default"}},
+    "3": {"class_type": "VAELoader", "inputs": {"vae_name": "ae.safetensors"}},
+    "4": {"class_type": "CLIPTextEncode", "inputs": {"text": "warm-up", "clip": ["2", 0]}},
+    "5": {"class_type": "ConditioningZeroOut", "inputs": {"conditioning": ["4", 0]}},
+    "6": {"class_type": "EmptySD3LatentImage",
+          "inputs": {"width": WARMUP_SIZE, "height": WARMUP_SIZE, "batch_size": 1}},
+    "7": {"class_type": "KSampler",
+          "inputs": {"model": ["1", 0], "positive": ["4", 0], "negative": ["5", 0], "latent_image": ["6", 0],
+                     "seed": 0, "steps": WARMUP_STEPS, "cfg": 1.0, "sampler_name": "res_multistep",
+                     "scheduler": "simple", "denoise": 1.0}},
+    "8": {"class_type": "VAEDecode", "inputs": {"samples": ["7", 0], "vae": ["3", 0]}},
+    "9": {"class_type": "PreviewImage", "inputs": {"images": ["8", 0]}},
+}
+
+# Inputs reduzidos em qualquer workflow de warm-up
+_STEP_KEYS = ("steps",)
+_SIZE_KEYS = ("width", "height")
+
+
+def load_workflows(paths):
+    """Le workflows em formato API ({id: {"class_type", "inputs"}}) de arquivos JSON."""
+    workflows = []
+    for path in paths:
+        with open(path) as f:
+            data = json.load(f)
+        if "nodes" in data and "links" in data:
+            raise ValueError(f"{path} esta no formato da UI; exporte com 'Save (API Format)'")
+        workflows.append(data.get("prompt", data))
+    return workflows
+
+
+def minimize(workflow, steps=WARMUP_STEPS, size=WARMUP_SIZE):
+    """Copia do workflow com steps e resolucao reduzidos (so o necessario para carregar)."""
+    workflow = copy.deepcopy(workflow)
+    for node in workflow.values():
+        inputs = node.get("inputs", {})
+        for key in _STEP_KEYS:
+            if isinstance(inputs.get(key), int):
+                inputs[key] = min(inputs[key], steps)
+        for key in _SIZE_KEYS:
+            if isinstance(inputs.get(key), int):
+                inputs[key] = min(inputs[key], size)
+    return workflow
+
+
+def run_warmup(client, workflows=None, timeout=WARMUP_TIMEOUT):
+    """
+    Roda cada workflow (minimizado) ate o fim. Retorna
+    {"ready_seconds", "seconds", "workflows": [{"seconds", "status", "error"}]}.
+    """
+    started = time.monotonic()
+    ready_seconds = client.wait_ready(timeout=timeout)
+    runs = []
+    for i, workflow in enumerate(workflows or [DEFAULT_WORKFLOW]):
+        t0 = time.monotonic()
+        try:
+            prompt_id = client.queue_prompt(minimize(workflow))
+            client.wait_for(prompt_id, timeout=timeout)
+            status, error = "ok", None
+        except (ComfyError, OSError) as e:
+            status, error = "failed", str(e)
+        seconds = time.monotonic() - t0
+        runs.append({"workflow": i, "seconds": round(seconds, 3), "status": status, "error": error})
+        print(f"[WARMUP] Workflow {i}: {status} em {seconds:.1f}s" + (f" ({error})" if error else ""),
+              flush=True)
+    total = time.monotonic() - started
+    print(f"[WARMUP] Instancia aquecida em {total:.1f}s", flush=True)
+    return {"ready_seconds": round(ready_seconds, 3), "seconds": round(total, 3), "workflows": runs}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aquece um ComfyUI rodando (carrega modelos na VRAM)")
+    parser.add_argument("--url", default="http://127.0.0.1:8188")
+    parser.add_argument("workflows", nargs="*", help="workflows em formato API (padrao: Z-Image-Turbo)")
+    args = parser.parse_args(argv)
+    print(json.dumps(run_warmup(ComfyClient(args.url), load_workflows(args.workflows) or None), indent=2))
+
+
+if __name__ == "__main__":
+    main()
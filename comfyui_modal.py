@@ -1,12 +1,64 @@
 import subprocess
 import modal
 import os
+import secrets
+import threading
+import uuid
+
+from comfy_batch import BatchRunner, load_jobs, save_result
+from comfy_client import ComfyClient
+from comfy_router import Autoscaler, ComfyRouter, registry_backends, serve_backend
+from comfy_startup import ComfyStartup
+from compile_cache import CompileCache
+from lazy_models import LazyModelFetcher
+from lora_sweep import (contact_sheet, describe, expand_loras, fetch_loras, load_spec, run_sweep, sweep_jobs,
+                        timings, write_sweep)
+from model_catalog import build_catalog, core_models
+from node_profile import comfyui_args
+from volume_sync import VolumeSync
 
 # --- Configuracao ---
 COMFYUI_DIR = "/root/ComfyUI"
 UI_PORT = 8188
+COMFYUI_INTERNAL_PORT = 8189  # Porta do ComfyUI quando ha proxy na frente (lazy / result cache / warmup)
+METRICS_PORT = 9188  # Sidecar de metricas Prometheus (comfy_metrics.py)
 BUILD_ID = "v36"  # Mudar quando adicionar novos nodes (invalida cache).
 HF_TOKEN = os.environ.get("HF_TOKEN", "")  # Defina HF_TOKEN nos Secrets do Modal
+# LAZY_MODELS=1: boot baixa so o core; o resto e baixado quando um workflow pede
+LAZY_MODELS = os.environ.get("LAZY_MODELS", "0")
+LAZY_WAIT = os.environ.get("LAZY_WAIT", "120")  # segundos que um /prompt espera modelos antes do "tente de novo"
+# BACKGROUND_DOWNLOADS=1: ComfyUI sobe apos o core; o resto baixa em background
+BACKGROUND_DOWNLOADS = os.environ.get("BACKGROUND_DOWNLOADS", "1")
+# WARMUP=1: apos o boot, roda um workflow minimo para carregar os modelos na VRAM
+# (na porta interna; a UI_PORT publica so abre depois, entao o startup_timeout cresce)
+WARMUP = os.environ.get("WARMUP", "0")
+WARMUP_WORKFLOWS = os.environ.get("WARMUP_WORKFLOWS", "")  # JSONs formato API (virgula)
+# REMOTE_CHECK=1: descobre checkpoints no HF e baixa de novo o que mudou (ETag)
+REMOTE_CHECK = os.environ.get("REMOTE_CHECK", "1")
+# NODE_PROFILE: perfil de custom nodes carregado (custom_nodes.json: zimage-minimal, edit, full)
+NODE_PROFILE = os.environ.get("NODE_PROFILE", "full")
+# NODE_PROFILING=1: mede import/RSS de cada pack do perfil antes do boot (relatorio no volume)
+NODE_PROFILING = os.environ.get("NODE_PROFILING", "0")
+# COMPILE_CACHE=1: caches triton/inductor/CUDA no volume (por torch/CUDA/BUILD_ID), ate COMPILE_CACHE_MAX_GB
+COMPILE_CACHE = os.environ.get("COMPILE_CACHE", "1")
+COMPILE_CACHE_MAX_GB = os.environ.get("COMPILE_CACHE_MAX_GB", "20")
+# STAGING=1: copia os modelos mais usados do volume para o disco local (load mais rapido)
+STAGING = os.environ.get("STAGING", "1")
+# METRICS=1: sidecar com /metrics (fila, latencia por prompt/node, VRAM/RAM) via tunel do Modal
+METRICS = os.environ.get("METRICS", "1")
+# RESULT_CACHE=1: proxy devolve do volume as saidas de workflows API identicos (sem GPU)
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "0")
+# OFFLOAD=1: copia as saidas (output/) para o volume em lotes, sem bloquear a geracao
+OFFLOAD = os.environ.get("OFFLOAD", "1")
+OFFLOAD_DEST = os.environ.get("OFFLOAD_DEST", "")      # "" = <volume>/.kythours_outputs; ou URL http(s)
+OFFLOAD_FORMAT = os.environ.get("OFFLOAD_FORMAT", "")  # "" = original; webp/jpeg/png re-encoda
+OFFLOAD_QUALITY = os.environ.get("OFFLOAD_QUALITY", "90")
+# Roteador (run_router): ate ROUTER_BACKENDS containers ComfyUI, um a mais quando
+# todas as filas passam de ROUTER_SCALE_DEPTH; backend ocioso por BACKEND_IDLE_MINUTES sai
+ROUTER_BACKENDS = os.environ.get("ROUTER_BACKENDS", "3")
+ROUTER_MIN_BACKENDS = os.environ.get("ROUTER_MIN_BACKENDS", "0")
+ROUTER_SCALE_DEPTH = os.environ.get("ROUTER_SCALE_DEPTH", "2")
+BACKEND_IDLE_MINUTES = os.environ.get("BACKEND_IDLE_MINUTES", "30")
 
 # =============================================================================
 # IMAGEM PRE-BUILDADA (GHCR via GitHub Actions)
@@ -24,12 +76,41 @@ HF_TOKEN = os.environ.get("HF_TOKEN", "")  # Defina HF_TOKEN nos Secrets do Moda
 # =============================================================================
 GHCR_IMAGE = "ghcr.io/franciscoalro/kythours-comfyui:latest"
 
+# Modulos auxiliares locais (download paralelo, manifesto, proxy, etc.)
+LOCAL_MODULES = (
+    "model_downloader", "volume_manifest", "model_catalog", "comfy_proxy", "lazy_models",
+    "model_store", "background_downloads", "volume_sync", "startup_report",
+    "comfy_client", "comfy_warmup", "comfy_batch", "model_verify", "remote_sync",
+    "image_spec", "node_profile", "compile_cache", "model_staging", "comfy_metrics",
+    "result_cache", "lora_sweep", "output_offload", "comfy_startup", "comfy_router",
+)
+
 comfyui_image = (
     modal.Image.from_registry(GHCR_IMAGE)
     .env({
         "FORCE_REBUILD_ID": BUILD_ID,
         "HF_TOKEN": HF_TOKEN,
+        "LAZY_MODELS": LAZY_MODELS,
+        "LAZY_WAIT": LAZY_WAIT,
+        "BACKGROUND_DOWNLOADS": BACKGROUND_DOWNLOADS,
+        "WARMUP": WARMUP,
+        "WARMUP_WORKFLOWS": WARMUP_WORKFLOWS,
+        "REMOTE_CHECK": REMOTE_CHECK,
+        "NODE_PROFILE": NODE_PROFILE,
+        "NODE_PROFILING": NODE_PROFILING,
+        "COMPILE_CACHE": COMPILE_CACHE,
+        "COMPILE_CACHE_MAX_GB": COMPILE_CACHE_MAX_GB,
+        "STAGING": STAGING,
+        "METRICS": METRICS,
+        "RESULT_CACHE": RESULT_CACHE,
+        "OFFLOAD": OFFLOAD,
+        "OFFLOAD_DEST": OFFLOAD_DEST,
+        "OFFLOAD_FORMAT": OFFLOAD_FORMAT,
+        "OFFLOAD_QUALITY": OFFLOAD_QUALITY,
+        "BACKEND_IDLE_MINUTES": BACKEND_IDLE_MINUTES,
     })
+    .add_local_python_source(*LOCAL_MODULES)
+    .add_local_file("custom_nodes.json", "/root/custom_nodes.json")  # perfis de nodes
 )
 
 
@@ -53,7 +134,7 @@ app = modal.App(name=f"comfyui-{BUILD_ID}")
 # NOTA: @modal.concurrent REMOVIDO — causa erro 405 ao salvar workflows.
 # O proxy do Modal decodifica %2F nos URLs, quebrando /api/userdata/workflows/.
 # ComfyUI ja e async (aiohttp) e lida com concorrencia internamente.
-@modal.web_server(port=UI_PORT, startup_timeout=5 * 60)
+@modal.web_server(port=UI_PORT, startup_timeout=(15 if WARMUP == "1" else 5) * 60)
 def run_comfyui():
     """
     Inicia o ComfyUI no Modal com GPU A10G.
@@ -61,315 +142,261 @@ def run_comfyui():
     print(f"[START] ComfyUI (Build: {BUILD_ID})")
     print(f"[INFO] GPU: A10G (24GB VRAM)")
 
-    # Garantir pastas existem
-    os.makedirs(f"{COMFYUI_DIR}/models/loras", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/loras/FERPHOTO", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/checkpoints", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/vae", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/diffusion_models", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/text_encoders", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/controlnet", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/model_patches", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/output", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/unet", exist_ok=True)
-    os.makedirs(f"{COMFYUI_DIR}/models/ultralytics/bbox", exist_ok=True)
-
-    # --- Validacao inteligente de arquivos no volume ---
-    # Tamanhos minimos esperados (em MB) para arquivos criticos grandes.
-    # Se o arquivo existe mas e menor que o esperado, foi download incompleto.
-    EXPECTED_MIN_SIZES_MB = {
-        "qwen_3_4b.safetensors": 6000,           # ~7GB text encoder
-        "Qwen_3_4b-Q8_0.gguf": 3000,             # ~3.6GB GGUF
-        "Qwen_3_4b-imatrix-IQ4_XS.gguf": 1500,   # ~2GB GGUF
-        "z_image_turbo_bf16.safetensors": 5000,   # ~6GB diffusion model
-        "z-image-turbo_fp8_scaled_e4m3fn_KJ.safetensors": 3000,  # ~3.5GB
-        "Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors": 500,  # ~700MB
-    }
-
-    print("[INFO] Verificando arquivos corrompidos no volume...")
-    cleaned = 0
-    for root, dirs, files in os.walk(f"{COMFYUI_DIR}/models"):
-        for fname in files:
-            fpath = os.path.join(root, fname)
-            if fname.endswith((".safetensors", ".pt", ".pth", ".ckpt", ".gguf")):
-                fsize = os.path.getsize(fpath)
-                fsize_mb = fsize / (1024 * 1024)
-
-                # Check 1: Tamanho minimo especifico para arquivos criticos
-                expected_min = EXPECTED_MIN_SIZES_MB.get(fname)
-                if expected_min and fsize_mb < expected_min:
-                    print(f"[CLEAN] {fname} incompleto ({fsize_mb:.0f}MB < {expected_min}MB esperado). Removendo...")
-                    os.remove(fpath)
-                    cleaned += 1
-                    continue
-
-                # Check 2: Arquivo muito pequeno (< 1MB = HTML de erro ou 404)
-                if fsize < 1 * 1024 * 1024:
-                    print(f"[CLEAN] Removendo corrompido: {fname} ({fsize} bytes)")
-                    os.remove(fpath)
-                    cleaned += 1
-                    continue
-
-                # Check 3: Validar header safetensors (detecta arquivos truncados)
-                if fname.endswith(".safetensors"):
-                    try:
-                        import safetensors
-                        with safetensors.safe_open(fpath, framework="pt", device="cpu") as f:
-                            _ = f.keys()  # Tenta ler o header
-                    except Exception as e:
-                        print(f"[CLEAN] {fname} corrompido (header invalido: {e}). Removendo...")
-                        os.remove(fpath)
-                        cleaned += 1
-                        continue
-
-    if cleaned:
-        print(f"[CLEAN] {cleaned} arquivo(s) corrompido(s) removido(s). Serao re-baixados.")
-    else:
-        print("[CLEAN] Todos os arquivos validos. ✅")
-
-
-    # --- Downloads de Modelos (Z-Image-Turbo Official) ---
-    models_to_download = [
-        # Z-Image-Turbo BF16 (High VRAM)
-        {
-            "url": "https://huggingface.co/Comfy-Org/z_image_turbo/resolve/main/split_files/diffusion_models/z_image_turbo_bf16.safetensors",
-            "path": f"{COMFYUI_DIR}/models/diffusion_models/z_image_turbo_bf16.safetensors"
-        },
-        # Z-Image-Turbo FP8 (Low VRAM) - Opcional, mas util para A10G se quiser economizar
-        {
-            "url": "https://huggingface.co/Kijai/Z-Image_comfy_fp8_scaled/resolve/main/z-image-turbo_fp8_scaled_e4m3fn_KJ.safetensors",
-            "path": f"{COMFYUI_DIR}/models/diffusion_models/z-image-turbo_fp8_scaled_e4m3fn_KJ.safetensors"
-        },
-        # Text Encoder (Required)
-        {
-            "url": "https://huggingface.co/Comfy-Org/z_image_turbo/resolve/main/split_files/text_encoders/qwen_3_4b.safetensors",
-            "path": f"{COMFYUI_DIR}/models/text_encoders/qwen_3_4b.safetensors"
-        },
-        # VAE (Required)
-        {
-            "url": "https://huggingface.co/Comfy-Org/z_image_turbo/resolve/main/split_files/vae/ae.safetensors",
-            "path": f"{COMFYUI_DIR}/models/vae/ae.safetensors"
-        },
-        # Qwen 3.4B GGUF Text Encoder (para uso com CLIPLoaderGGUF)
-        # IQ4_XS - Recomendado (qualidade/tamanho balanceados)
-        {
-            "url": "https://huggingface.co/worstplayer/Z-Image_Qwen_3_4b_text_encoder_GGUF/resolve/main/Qwen_3_4b-imatrix-IQ4_XS.gguf",
-            "path": f"{COMFYUI_DIR}/models/text_encoders/Qwen_3_4b-imatrix-IQ4_XS.gguf"
-        },
-        # Q8_0 - Maxima qualidade (quase identico ao FP16)
-        {
-            "url": "https://huggingface.co/worstplayer/Z-Image_Qwen_3_4b_text_encoder_GGUF/resolve/main/Qwen_3_4b-Q8_0.gguf",
-            "path": f"{COMFYUI_DIR}/models/text_encoders/Qwen_3_4b-Q8_0.gguf"
-        },
-        # Qwen3-4b-Z-Image-Engineer-V4-F16
-        {
-            "url": "https://huggingface.co/BennyDaBall/Qwen3-4b-Z-Image-Engineer-V4/resolve/main/Qwen3-4b-Z-Image-Engineer-V4-F16.gguf",
-            "path": f"{COMFYUI_DIR}/models/text_encoders/Qwen3-4b-Z-Image-Engineer-V4-F16.gguf"
-        },
-        # Upscale Model
-        {
-            "url": "https://huggingface.co/Thelocallab/2xLexicaRRDBNet_Sharp/resolve/main/2xLexicaRRDBNet_Sharp.pth",
-            "path": f"{COMFYUI_DIR}/models/upscale_models/2xLexicaRRDBNet_Sharp.pth"
-        },
-        # Upscale Model for Amazing Z-Image WF
-        {
-            "url": "https://huggingface.co/martin-rizzo/ESRGAN-4x/resolve/main/4x_foolhardy_Remacri.safetensors",
-            "path": f"{COMFYUI_DIR}/models/upscale_models/4x_foolhardy_Remacri.safetensors"
-        },
-        # Amazing Z-Image WF v4.0 Diffusion Model
-        {
-            "url": "https://huggingface.co/jayn7/Z-Image-Turbo-GGUF/resolve/main/z_image_turbo-Q5_K_S.gguf",
-            "path": f"{COMFYUI_DIR}/models/diffusion_models/z_image_turbo-Q5_K_S.gguf"
-        },
-        # Amazing Z-Image WF v4.0 Text Encoder
-        {
-            "url": "https://huggingface.co/mradermacher/Qwen3-4B-i1-GGUF/resolve/main/Qwen3-4B.i1-Q5_K_S.gguf",
-            "path": f"{COMFYUI_DIR}/models/text_encoders/Qwen3-4B.i1-Q5_K_S.gguf"
-        },
-        # Workflow JSON (Exemplo)
-        {
-            "url": "https://huggingface.co/jayn7/Z-Image-Turbo-GGUF/resolve/main/example_workflow.json",
-            "path": f"{COMFYUI_DIR}/user/default/workflows/z_image_turbo_workflow.json"
-        },
-        # Qwen-Image-Edit-2511-Lightning
-        {
-            "url": "https://huggingface.co/lightx2v/Qwen-Image-Edit-2511-Lightning/resolve/main/Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors",
-            "path": f"{COMFYUI_DIR}/models/loras/Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors"
-        },
-        # Qwen 2.5 Text Encoder FP8
-        {
-            "url": "https://huggingface.co/Comfy-Org/HunyuanVideo_1.5_repackaged/resolve/main/split_files/text_encoders/qwen_2.5_vl_7b_fp8_scaled.safetensors",
-            "path": f"{COMFYUI_DIR}/models/text_encoders/qwen_2.5_vl_7b_fp8_scaled.safetensors"
-        },
-        # Qwen Image VAE
-        {
-            "url": "https://huggingface.co/Comfy-Org/Qwen-Image_ComfyUI/resolve/main/split_files/vae/qwen_image_vae.safetensors",
-            "path": f"{COMFYUI_DIR}/models/vae/qwen_image_vae.safetensors"
-        },
-        # ControlNet Union 2.1 (in controlnet folder)
-        {
-            "url": "https://huggingface.co/alibaba-pai/Z-Image-Turbo-Fun-Controlnet-Union-2.0/resolve/main/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors",
-            "path": f"{COMFYUI_DIR}/models/controlnet/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors"
-        },
-        # ControlNet Union 2.1 (in model_patches folder)
-        {
-            "url": "https://huggingface.co/alibaba-pai/Z-Image-Turbo-Fun-Controlnet-Union-2.0/resolve/main/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors",
-            "path": f"{COMFYUI_DIR}/models/model_patches/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors"
-        },
-        # ControlNet Union Original (in model_patches folder) - Requested by User
-        {
-            "url": "https://huggingface.co/alibaba-pai/Z-Image-Turbo-Fun-Controlnet-Union/resolve/main/Z-Image-Turbo-Fun-Controlnet-Union.safetensors",
-            "path": f"{COMFYUI_DIR}/models/model_patches/Z-Image-Turbo-Fun-Controlnet-Union.safetensors"
-        },
-        # Flux Model
-        {
-            "url": "https://huggingface.co/Comfy-Org/vae-text-encorder-for-flux-klein-4b/resolve/main/split_files/diffusion_models/flux-2-klein-4b.safetensors",
-            "path": f"{COMFYUI_DIR}/models/diffusion_models/flux-2-klein-4b.safetensors"
-        },
-        # Flux VAE
-        {
-            "url": "https://huggingface.co/Comfy-Org/vae-text-encorder-for-flux-klein-4b/resolve/main/split_files/vae/flux2-vae.safetensors",
-            "path": f"{COMFYUI_DIR}/models/vae/flux2-vae.safetensors"
-        },
-        # Qwen-Image-Edit-2511-Q5_K_M GGUF
-        {
-            "url": "https://huggingface.co/unsloth/Qwen-Image-Edit-2511-GGUF/resolve/main/qwen-image-edit-2511-Q5_K_M.gguf",
-            "path": f"{COMFYUI_DIR}/models/unet/qwen-image-edit-2511-Q5_K_M.gguf"
-        },
-        # SDXL CivitAI Model
-        {
-            "url": "https://civitai.com/api/download/models/2043971",
-            "path": f"{COMFYUI_DIR}/models/checkpoints/SDXL_v2043971.safetensors"
-        },
-        # Ultralytics Female Breast Detection
-        {
-            "url": "https://huggingface.co/ashllay/YOLO_Models/resolve/e07b01219ff1807e1885015f439d788b038f49bd/bbox/female-breast-v4.0-fantasy.pt",
-            "path": f"{COMFYUI_DIR}/models/ultralytics/bbox/female-breast-v4.0-fantasy.pt"
-        },
-        # Ultralytics Female Body Detection
-        {
-            "url": "https://civitai.com/api/download/models/2056142",
-            "path": f"{COMFYUI_DIR}/models/ultralytics/bbox/female-body-v2056142.pt"
-        }
-    ]
-
-
-    # Adicionar todos os LoRAs do Kitoalro (Steps 100 a 900 + Final)
-    hf_repo = "kythours/kitoalro"
-    lora_prefix = "ohwxphoto"
-
-    # 1. LoRA Final
-    models_to_download.append({
-        "url": f"https://huggingface.co/{hf_repo}/resolve/main/{lora_prefix}.safetensors",
-        "path": f"{COMFYUI_DIR}/models/loras/{lora_prefix}.safetensors"
-    })
+    # Validacao, downloads, perfil de nodes, caches, sidecars e boot (comfy_startup.py);
+    # o mesmo caminho roda localmente no bench_startup.py
+    ComfyStartup(
+        COMFYUI_DIR,
+        BUILD_ID,
+        ui_port=UI_PORT,
+        internal_port=COMFYUI_INTERNAL_PORT,
+        metrics_port=METRICS_PORT,
+        commit=model_volume.commit,
+        forward=modal.forward,
+    ).run()
+    print("[INFO] Acesse pela URL publica gerada pelo Modal.")
 
-    # 2. Checkpoints Intermediarios (100, 200, ... 900)
-    for i in range(100, 1000, 100):
-        step_str = f"{i:09d}" # ex: 000000100
-        filename = f"{lora_prefix}_{step_str}.safetensors"
-        models_to_download.append({
-            "url": f"https://huggingface.co/{hf_repo}/resolve/main/{filename}",
-            "path": f"{COMFYUI_DIR}/models/loras/{filename}"
-        })
-
-    # --- LoRAs FERPHOTO Otimizadas (kythours/FERGIRL - Repo Privado) ---
-    fergirl_repo = "kythours/FERGIRL"
-    os.makedirs(f"{COMFYUI_DIR}/models/loras/FERPHOTO", exist_ok=True)
-
-    # 1. FERPHOTO v5 (HF Optimized) — Checkpoints intermediarios
-    v5_name = "FERPHOTO_zturbo_HF_OPTIMIZED_v5"
-    for step in [250, 500, 750, 1000, 1250, 1500, 1750, 2000, 2250, 2500, 2750, 3000]:
-        step_str = f"{step:09d}"  # ex: 000000250
-        filename = f"{v5_name}_000000{step:03d}.safetensors"
-        models_to_download.append({
-            "url": f"https://huggingface.co/{fergirl_repo}/resolve/main/{v5_name}/{v5_name}_000000{step:03d}.safetensors",
-            "path": f"{COMFYUI_DIR}/models/loras/FERPHOTO/{v5_name}_{step_str}.safetensors"
-        })
-
-    # 2. FERPHOTO v5 — Final checkpoint
-    models_to_download.append({
-        "url": f"https://huggingface.co/{fergirl_repo}/resolve/main/{v5_name}/{v5_name}.safetensors",
-        "path": f"{COMFYUI_DIR}/models/loras/FERPHOTO/{v5_name}.safetensors"
-    })
 
-    # 3. FERPHOTO v7 (H100 3000 Final) — Melhor checkpoint
-    v7_name = "FERPHOTO_zturbo_HF_OPTIMIZED_v7_H100_3000_copy"
-    models_to_download.append({
-        "url": f"https://huggingface.co/{fergirl_repo}/resolve/main/{v7_name}/{v7_name}.safetensors",
-        "path": f"{COMFYUI_DIR}/models/loras/FERPHOTO/{v7_name}.safetensors"
-    })
+# =============================================================================
+# PREFETCH CPU-ONLY
+# =============================================================================
+# Aquece o volume sem GPU: valida, baixa/repara o que falta e faz commit.
+# Rode apos mudar o catalogo (model_catalog.py), antes de abrir a UI:
+#   modal run comfyui_modal.py::prefetch_models
+# Localmente (pasta + servidor HTTP espelho):
+#   python -m volume_sync --comfyui-dir /tmp/comfy --mirror http://127.0.0.1:8000
+# =============================================================================
+prefetch_image = (
+    modal.Image.debian_slim(python_version="3.11")
+    .env({"FORCE_REBUILD_ID": BUILD_ID})
+    .add_local_python_source(*LOCAL_MODULES)
+)
+
+
+@app.function(
+    image=prefetch_image,
+    cpu=2.0,
+    memory=2048,
+    timeout=6 * 60 * 60,  # catalogo inteiro num volume vazio
+    volumes={f"{COMFYUI_DIR}/models": model_volume},
+    secrets=[modal.Secret.from_name("huggingface-secret-2")],
+)
+def prefetch_models(core_only: bool = False):
+    """Sincroniza o volume de modelos numa maquina so de CPU (core_only: so o core)."""
+    sync = VolumeSync(COMFYUI_DIR)
+    summary = sync.run(core_models(sync.catalog) if core_only else None)
+    model_volume.commit()
+    print("[OK] Volume sincronizado e commitado.")
+    return summary
+
 
-    # 4. FERPHOTO v7 — Checkpoints intermediarios
-    for step in [250, 500, 750, 1000, 1250, 1500, 1750, 2000, 2250, 2500, 2750]:
-        step_str = f"{step:09d}"
-        models_to_download.append({
-            "url": f"https://huggingface.co/{fergirl_repo}/resolve/main/{v7_name}/{v7_name}_{step_str}.safetensors",
-            "path": f"{COMFYUI_DIR}/models/loras/FERPHOTO/{v7_name}_{step_str}.safetensors"
-        })
-
-
-    for model in models_to_download:
-        # Garantir que a pasta existe
-        os.makedirs(os.path.dirname(model["path"]), exist_ok=True)
-
-        dest = model["path"]
-        name = os.path.basename(dest)
-
-        # Se ja existe e e valido (> 1MB), pula
-        if os.path.exists(dest) and os.path.getsize(dest) > 1 * 1024 * 1024:
-            print(f"[OK] {name} ja existe!")
-            continue
-
-        # Remover arquivo corrompido/incompleto se existir
-        if os.path.exists(dest):
-            os.remove(dest)
-
-        print(f"[INFO] Baixando {name}...")
-        # Usar token HF para repos privados
-        hf_token = os.environ.get("HF_TOKEN", "")
-        cmd = [
-            "wget", "-q", "--show-progress",
-            model["url"],
-            "-O", dest
-        ]
-        if hf_token and "huggingface.co" in model["url"]:
-            cmd = [
-                "wget", "-q", "--show-progress",
-                f"--header=Authorization: Bearer {hf_token}",
-                model["url"],
-                "-O", dest
-            ]
-        subprocess.run(cmd, check=False)
-
-        # Validar arquivo apos download (deve ter > 1MB para ser valido)
-        if os.path.exists(dest) and os.path.getsize(dest) > 1 * 1024 * 1024:
-            size_mb = os.path.getsize(dest) / 1024 / 1024
-            print(f"[OK] {name} baixado! ({size_mb:.1f} MB)")
-        else:
-            # Arquivo invalido (HTML de erro, 404, etc) — deletar
-            if os.path.exists(dest):
-                os.remove(dest)
-            print(f"[SKIP] {name} nao disponivel (ignorado)")
-
-
-
-    # Iniciar ComfyUI
+# =============================================================================
+# ROTEADOR + VARIOS COMFYUI
+# =============================================================================
+# run_comfyui e um container so (max_containers=1): UI e scripts dividem a mesma
+# fila. Com o roteador (comfy_router.py), a URL publica e um container de CPU
+# que distribui entre ate ROUTER_BACKENDS containers A10G:
+#   - sessoes da UI ficam fixas num backend (cookie), inclusive /api/userdata:
+#     workflows salvos ficam no disco daquele container, nao no volume;
+#   - /prompt sem sessao (comfy_batch, scripts) vai para a menor fila;
+#   - /history, /queue e /view sem sessao juntam todos os backends.
+# Cada backend sobe pelo mesmo ComfyStartup em modo read_only (varios
+# containers no mesmo volume: nada de downloads, manifesto ou commit), se
+# anuncia no modal.Dict "comfyui-backends" (tunel TCP, sem o proxy HTTP do
+# Modal no meio) e sai quando fica ocioso. Quem sincroniza o volume e o
+# prefetch_models, chamado pelo roteador ao subir: o core antes do primeiro
+# backend, o resto do catalogo em background. O roteador pede backends com
+# .spawn() conforme a fila.
+#   modal deploy comfyui_modal.py   -> URL de run_router
+# Localmente, com ComfyUI falsos:
+#   python -m comfy_router --port 8188 --fake-backends 3
+# =============================================================================
+backend_registry = modal.Dict.from_name("comfyui-backends", create_if_missing=True)
+
+
+@app.function(
+    image=comfyui_image,
+    max_containers=int(ROUTER_BACKENDS),
+    timeout=6 * 60 * 60,
+    gpu="a10g",
+    volumes={f"{COMFYUI_DIR}/models": model_volume},
+    secrets=[modal.Secret.from_name("huggingface-secret-2")],
+)
+def comfy_backend():
+    """Um ComfyUI atras do roteador: sobe (so lendo o volume), se registra e roda ate ficar ocioso."""
+    # O tunel e publico: so quem tem o token do registro (o roteador) passa pelo proxy
+    token = secrets.token_urlsafe(32)
+    startup = ComfyStartup(
+        COMFYUI_DIR,
+        BUILD_ID,
+        ui_port=UI_PORT,
+        internal_port=COMFYUI_INTERNAL_PORT,
+        metrics_port=METRICS_PORT,
+        forward=modal.forward,
+        read_only=True,
+        token=token,
+    ).run()
+    startup.ready.wait()
+    local_url = startup.local_url
+    if not ComfyClient(local_url).is_ready():
+        raise RuntimeError("ComfyUI nao subiu; backend nao registrado")
+    name = os.environ.get("MODAL_TASK_ID") or uuid.uuid4().hex[:12]
+    with modal.forward(UI_PORT, unencrypted=True) as tunnel:
+        host, port = tunnel.tcp_socket
+        serve_backend(backend_registry, name, f"http://{host}:{port}", local_url,
+                      idle_seconds=int(os.environ.get("BACKEND_IDLE_MINUTES", "30")) * 60, token=token)
+    startup.stop()
+
+
+router_image = prefetch_image.env({
+    "ROUTER_BACKENDS": ROUTER_BACKENDS,
+    "ROUTER_MIN_BACKENDS": ROUTER_MIN_BACKENDS,
+    "ROUTER_SCALE_DEPTH": ROUTER_SCALE_DEPTH,
+})
+
+
+@app.function(
+    image=router_image,
+    cpu=1.0,
+    memory=1024,
+    min_containers=0,
+    scaledown_window=30 * 60,
+    max_containers=1,  # um roteador so: sessoes e prompt_ids ficam em memoria
+    allow_concurrent_inputs=1000,
+    timeout=24 * 60 * 60,
+)
+@modal.web_server(port=UI_PORT, startup_timeout=60)
+def run_router():
+    """URL publica do modo multi-backend (ver comfy_router.py)."""
+    router = ComfyRouter(UI_PORT, backends=lambda: registry_backends(backend_registry))
+    router.start()
+    autoscaler = Autoscaler(
+        router,
+        spawn=comfy_backend.spawn,
+        min_backends=int(os.environ.get("ROUTER_MIN_BACKENDS", "0")),
+        max_backends=int(os.environ.get("ROUTER_BACKENDS", "3")),
+        scale_depth=int(os.environ.get("ROUTER_SCALE_DEPTH", "2")),
+    )
+
+    def sync_then_scale():
+        # Um sync so, antes dos backends (que so leem o volume)
+        try:
+            prefetch_models.remote(core_only=True)
+        except Exception as e:
+            print(f"[ROUTER] Sync do core falhou ({e}); backends sobem com o volume como esta")
+        autoscaler.start()
+        prefetch_models.spawn()
+
+    threading.Thread(target=sync_then_scale, daemon=True).start()
+    print(f"[ROUTER] Roteador no ar; backends em {sorted(router.backends) or 'nenhum (subindo sob demanda)'}")
+
+
+# =============================================================================
+# BATCH HEADLESS
+# =============================================================================
+# Lote de workflows (formato API) com overrides de seed/prompt/LoRA, num
+# ComfyUI headless proprio (nao disputa a fila da UI). As imagens voltam em
+# streaming, conforme cada job termina:
+#   modal run comfyui_modal.py --jobs jobs.json --out batch_outputs
+# Formato do jobs.json: ver comfy_batch.py.
+# =============================================================================
+BATCH_PORT = 8190
+
+
+def _headless_comfyui(workflows):
+    """Garante os modelos dos workflows e sobe um ComfyUI headless; devolve o client pronto."""
+    # Mesmo mecanismo do modo lazy
+    fetcher = LazyModelFetcher(COMFYUI_DIR)
+    missing = {m["path"]: m for workflow in workflows for m in fetcher.missing_for(workflow)}
+    if missing:
+        fetcher.ensure(list(missing.values()))
+
+    env = None
+    if os.environ.get("COMPILE_CACHE", "1") == "1":
+        env = {**os.environ, **CompileCache(f"{COMFYUI_DIR}/models", BUILD_ID).prepare()}
     subprocess.Popen(
-        [
-            "python", "main.py",
-            "--listen", "0.0.0.0",
-            "--port", str(UI_PORT),
-            "--preview-method", "auto",
-        ],
+        ["python", "main.py", "--listen", "127.0.0.1", "--port", str(BATCH_PORT),
+         *comfyui_args(os.environ.get("NODE_PROFILE", "full"))],
         cwd=COMFYUI_DIR,
+        env=env,
     )
-    print(f"[OK] ComfyUI iniciando na porta {UI_PORT}...")
-    print("[INFO] Acesse pela URL publica gerada pelo Modal.")
+    client = ComfyClient(f"http://127.0.0.1:{BATCH_PORT}")
+    print(f"[BATCH] ComfyUI pronto em {client.wait_ready():.1f}s")
+    return client
+
+
+@app.function(
+    image=comfyui_image,
+    gpu="a10g",
+    timeout=6 * 60 * 60,
+    volumes={f"{COMFYUI_DIR}/models": model_volume},
+    secrets=[modal.Secret.from_name("huggingface-secret-2")],
+)
+def batch_generate(jobs: list, max_in_flight: int = 4):
+    """Roda os jobs (comfy_batch.build_jobs) e devolve cada resultado ao terminar."""
+    client = _headless_comfyui([job["workflow"] for job in jobs])
+    print(f"[BATCH] {len(jobs)} job(s)")
+    yield from BatchRunner(client, max_in_flight=max_in_flight).run(jobs)
+
+
+# =============================================================================
+# SWEEP DE CHECKPOINTS DE LORA
+# =============================================================================
+# Mesma grade prompt x seed em cada checkpoint de um treino, com o modelo base
+# e o text encoder carregados uma vez (ver lora_sweep.py):
+#   modal run comfyui_modal.py --sweep sweep.json --out sweep_outputs
+# Volta cada run em streaming e, no fim, o contact sheet + tempos.
+# =============================================================================
+@app.function(
+    image=comfyui_image,
+    gpu="a10g",
+    timeout=6 * 60 * 60,
+    volumes={f"{COMFYUI_DIR}/models": model_volume},
+    secrets=[modal.Secret.from_name("huggingface-secret-2")],
+)
+def lora_sweep(spec: dict):
+    """Gerador: resultados de cada run e, por ultimo, {"sheet", "timings"}."""
+    catalog = build_catalog(COMFYUI_DIR)
+    loras = expand_loras(f"{COMFYUI_DIR}/models", spec["loras"], catalog)
+    if not loras:
+        raise ValueError(f"nenhum LoRA casa com {spec['loras']}")
+    # Checkpoints do treino que ainda nao estao no volume: baixa antes de enfileirar
+    loras = fetch_loras(f"{COMFYUI_DIR}/models", loras, catalog)
+    if not loras:
+        raise ValueError(f"nenhum checkpoint de {spec['loras']} disponivel")
+    print(f"[SWEEP] {len(loras)} checkpoint(s): {loras}")
+    client = _headless_comfyui([job["workflow"] for job in sweep_jobs(spec, loras)])
+    results = []
+    for result in run_sweep(client, spec, loras):
+        results.append(result)
+        yield result
+    yield {"sheet": contact_sheet(results), "timings": timings(results)}
 
 
 @app.local_entrypoint()
-def main():
+def main(jobs: str = "", sweep: str = "", out: str = "batch_outputs", max_in_flight: int = 4):
+    if sweep:
+        # Modo sweep: imagens de cada run em out/, contact sheet e tempos no fim
+        for result in lora_sweep.remote_gen(load_spec(sweep)):
+            if "timings" in result:
+                print(f"[SWEEP] Salvo: {write_sweep(result['sheet'], result['timings'], out)}")
+                continue
+            paths = save_result(result, out)
+            print(f"[SWEEP] {describe(result)}" + (f" {paths}" if paths else f" ({result['error']})"))
+        return
+
+    if jobs:
+        # Modo batch: envia o lote e salva as imagens conforme chegam
+        batch = load_jobs(jobs)
+        print(f"[BATCH] {len(batch)} job(s), ate {max_in_flight} em paralelo -> {out}/")
+        failed = 0
+        for result in batch_generate.remote_gen(batch, max_in_flight):
+            paths = save_result(result, out)
+            failed += result["status"] != "ok"
+            print(f"[BATCH] job {result['id']}: {result['status']} em {result['seconds']:.1f}s"
+                  + (f" {paths}" if paths else f" ({result['error']})"))
+        print(f"[BATCH] Concluido: {len(batch) - failed} ok, {failed} falha(s)")
+        return
+
     print("=" * 60)
     print("  ComfyUI on Modal")
     print(f"  Build: {BUILD_ID}")
@@ -0,0 +1,230 @@
+"""
+compile_cache.py
+================
+Caches de compilacao JIT (triton, torch inductor, CUDA, extensoes torch) no
+volume, para sobreviver ao scaledown do container.
+
+Cada container A10G novo recompilava tudo do zero: kernels triton do
+sageattention, grafos do inductor (torch.compile), kernels PTX -> SASS do
+driver CUDA e extensoes C++/CUDA compiladas por custom nodes. A unica pasta
+persistente e o volume em /root/ComfyUI/models, entao:
+  - `<volume>/.kythours_cache/<chave>/{triton,inductor,cuda,torch_extensions}`
+    e passado ao ComfyUI pelas variaveis de ambiente de cada cache
+    (TRITON_CACHE_DIR, TORCHINDUCTOR_CACHE_DIR, CUDA_CACHE_PATH,
+    TORCH_EXTENSIONS_DIR).
+  - A chave junta BUILD_ID, versao do torch (inclui o CUDA, ex: 2.5.1+cu121),
+    Python e GPU (nome + compute capability): build ou torch novo = pasta
+    nova, e a antiga nunca e lida.
+  - Tamanho limitado (COMPILE_CACHE_MAX_GB). Eviction LRU: primeiro as chaves
+    menos usadas recentemente (ultimo uso em `index.json`), depois os arquivos
+    mais antigos da chave atual. Triton e inductor tratam arquivo faltando
+    como miss e recompilam.
+
+Os .pyc do ComfyUI e dos custom nodes sao gerados no build da imagem
+(camada "Bytecode" do image_spec.py), nao aqui.
+
+USO:
+  cache = CompileCache(f"{COMFYUI_DIR}/models", BUILD_ID)
+  env = cache.prepare()                     # -> env do subprocess do ComfyUI
+  subprocess.Popen([...], env={**os.environ, **env})
+  cache.evict()                             # depois do boot (em thread)
+
+  python -m compile_cache --root /root/ComfyUI/models --build-id v36 [--evict]
+"""
+
+import argparse
+import importlib.metadata
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from model_downloader import MB
+
+CACHE_DIRNAME = ".kythours_cache"
+INDEX_NAME = "index.json"
+MAX_CACHE_GB = float(os.environ.get("COMPILE_CACHE_MAX_GB", "20"))
+
+# Variavel de ambiente -> subpasta da chave
+CACHE_DIRS = {
+    "TRITON_CACHE_DIR": "triton",
+    "TORCHINDUCTOR_CACHE_DIR": "inductor",
+    "CUDA_CACHE_PATH": "cuda",
+    "TORCH_EXTENSIONS_DIR": "torch_extensions",
+}
+# O cache do driver CUDA tem teto padrao pequeno (256 MB em drivers antigos)
+CACHE_SETTINGS = {
+    "CUDA_CACHE_MAXSIZE": str(4 * 1024 * MB),
+    "TORCHINDUCTOR_FX_GRAPH_CACHE": "1",
+}
+
+
+def _gpu():
+    """'NVIDIA A10G' + compute capability via nvidia-smi, ou 'cpu'."""
+    try:
+        out = subprocess.run(["nvidia-smi", "--query-gpu=name,compute_cap", "--format=csv,noheader"],
+                             capture_output=True, text=True, timeout=10, check=True).stdout
+    except (OSError, subprocess.SubprocessError):
+        return "cpu"
+    first = out.strip().splitlines()[0] if out.strip() else "cpu"
+    return "-sm".join(part.strip().replace(".", "") for part in first.split(",")) if "," in first else first
+
+
+def cache_key(build_id, gpu=None):
+    """Chave do cache: muda com build, torch/CUDA, Python ou GPU."""
+    try:
+        torch = importlib.metadata.version("torch")
+    except importlib.metadata.PackageNotFoundError:
+        torch = "none"
+    python = f"{sys.version_info.major}{sys.version_info.minor}"
+    key = f"{build_id}-torch{torch}-py{python}-{gpu or _gpu()}"
+    return re.sub(r"[^A-Za-z0-9.+_-]+", "_", key)
+
+
+def _tree(path):
+    """[(caminho, tamanho, ultimo acesso)] de todos os arquivos abaixo de path."""
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            full = os.path.join(root, name)
+            try:
+                st = os.stat(full)
+            except OSError:
+                continue
+            files.append((full, st.st_size, max(st.st_atime, st.st_mtime)))
+    return files
+
+
+def _prune_empty(path):
+    for root, dirs, files in os.walk(path, topdown=False):
+        if root != path and not dirs and not files:
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass
+
+
+class CompileCache:
+    """
+    root:      pasta do volume (o cache fica em `<root>/.kythours_cache`).
+    build_id:  BUILD_ID do app (entra na chave).
+    max_bytes: teto do cache inteiro (todas as chaves).
+    """
+
+    def __init__(self, root, build_id, max_bytes=int(MAX_CACHE_GB * 1024 * MB), key=None):
+        self.base = os.path.join(root, CACHE_DIRNAME)
+        self.key = key or cache_key(build_id)
+        self.path = os.path.join(self.base, self.key)
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(self.base, INDEX_NAME)
+        self.warm = None
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def env(self):
+        """Variaveis de ambiente que apontam os caches para a chave atual."""
+        return {var: os.path.join(self.path, sub) for var, sub in CACHE_DIRS.items()} | CACHE_SETTINGS
+
+    def prepare(self):
+        """Cria as pastas, marca o uso da chave e retorna o env para o ComfyUI."""
+        warm = os.path.isdir(self.path) and any(os.scandir(self.path))
+        for sub in CACHE_DIRS.values():
+            os.makedirs(os.path.join(self.path, sub), exist_ok=True)
+        with self._lock:
+            index = self._load_index()
+            index[self.key] = dict(index.get(self.key, {}), last_used=time.time())
+            self._save_index(index)
+        self.warm = warm
+        print(f"[CACHE] Caches de compilacao em {self.path} ({'quente' if warm else 'vazio'})", flush=True)
+        return self.env()
+
+    def usage(self):
+        """{chave: bytes} de todas as chaves no volume."""
+        if not os.path.isdir(self.base):
+            return {}
+        return {entry.name: sum(size for _, size, _ in _tree(entry.path))
+                for entry in os.scandir(self.base) if entry.is_dir()}
+
+    def evict(self):
+        """
+        Aplica o teto de tamanho (LRU). Retorna {"bytes", "freed", "keys_removed",
+        "files_removed"}.
+        """
+        with self._lock:
+            index = self._load_index()
+            usage = self.usage()
+            total = sum(usage.values())
+            freed, keys_removed, files_removed, current_freed = 0, [], 0, 0
+
+            # 1) Chaves antigas inteiras, da menos usada para a mais usada
+            stale = sorted((k for k in usage if k != self.key),
+                           key=lambda k: index.get(k, {}).get("last_used", 0))
+            for key in stale:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(os.path.join(self.base, key), ignore_errors=True)
+                total -= usage[key]
+                freed += usage[key]
+                keys_removed.append(key)
+                index.pop(key, None)
+
+            # 2) Arquivos da chave atual, do acesso mais antigo para o mais novo
+            if total > self.max_bytes and os.path.isdir(self.path):
+                for path, size, _ in sorted(_tree(self.path), key=lambda f: f[2]):
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    current_freed += size
+                    files_removed += 1
+                _prune_empty(self.path)
+
+            freed += current_freed
+            if self.key in index:
+                index[self.key]["bytes"] = usage.get(self.key, 0) - current_freed
+            self._save_index(index)
+
+        if freed:
+            print(f"[CACHE] Eviction: {freed / MB:.0f} MB liberados ({len(keys_removed)} chave(s) antiga(s), "
+                  f"{files_removed} arquivo(s)); cache em {total / MB:.0f} MB", flush=True)
+        return {"bytes": total, "freed": freed, "keys_removed": keys_removed, "files_removed": files_removed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Caches de compilacao JIT no volume.")
+    parser.add_argument("--root", default="/root/ComfyUI/models")
+    parser.add_argument("--build-id", required=True)
+    parser.add_argument("--max-gb", type=float, default=MAX_CACHE_GB)
+    parser.add_argument("--evict", action="store_true", help="aplica o teto de tamanho (LRU)")
+    args = parser.parse_args(argv)
+
+    cache = CompileCache(args.root, args.build_id, int(args.max_gb * 1024 * MB))
+    print(f"[CACHE] Chave atual: {cache.key}")
+    for key, size in sorted(cache.usage().items()):
+        print(f"  {'*' if key == cache.key else ' '} {key:<70} {size / MB:>9.1f} MB")
+    if args.evict:
+        cache.evict()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+"""
+image_spec.py
+=============
+Gera a imagem do ComfyUI (Dockerfile.comfyui e a modal.Image do
+build_and_push_image.py) a partir de um manifesto so: custom_nodes.json.
+
+  - custom_nodes.json:      apt, torch, pacotes extras, ComfyUI, custom nodes
+                            (repo + ref = commit fixo, "track" = branch/tag
+                            de onde o `pin` tira o commit) e perfis de nodes
+                            carregados no boot (NODE_PROFILE). Editado a mao.
+  - custom_nodes.lock.json: commit resolvido de cada repo + o conjunto unico de
+                            requirements resolvido pelo pip (todas as deps dos
+                            nodes juntas: conflito aparece aqui, nao some num
+                            `|| true`). Gerado por `lock`.
+  - Dockerfile.comfyui e requirements.lock.txt: gerados por `render`.
+
+Camadas da que menos muda para a que mais muda: sistema -> torch -> deps
+python travadas -> ComfyUI -> custom nodes -> patches. Atualizar um node so
+rebuilda as camadas do fim; o pull no Modal reaproveita o resto.
+
+Sem lock (ou com o manifesto mudado depois do lock), o render cai no modo
+sem trava, so para iterar localmente: os pacotes extras do manifesto antes
+do ComfyUI, os requirements do ComfyUI junto com ele, e cada node com o seu
+requirements.txt instalado de forma tolerante (`|| echo`). O `check` (CI)
+recusa esse modo: todo repo precisa de commit fixo no manifesto e o lock
+precisa estar commitado e em dia, senao a imagem nao e reprodutivel.
+
+USO:
+  python image_spec.py pin      # fixa ComfyUI e nodes no commit atual de "track" (rede)
+  python image_spec.py pin --update  # avanca os commits fixados (mesmo "track")
+  python image_spec.py lock     # resolve commits + requirements (rede + pip)
+  python image_spec.py render   # escreve Dockerfile.comfyui e requirements.lock.txt
+  python image_spec.py check    # falha se houver repo sem commit, lock ausente/velho ou arquivo desatualizado
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_PATH = os.path.join(HERE, "custom_nodes.json")
+LOCK_PATH = os.path.join(HERE, "custom_nodes.lock.json")
+DOCKERFILE_PATH = os.path.join(HERE, "Dockerfile.comfyui")
+REQUIREMENTS_LOCK_PATH = os.path.join(HERE, "requirements.lock.txt")
+
+COMFYUI_DIR = "/root/ComfyUI"
+REQUIREMENTS_IN_IMAGE = "/tmp/requirements.lock.txt"
+TORCH_CONSTRAINTS = "/tmp/torch-constraints.txt"
+LOCK_WORKERS = 8
+DEFAULT_PROFILE = "full"
+SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+def load_manifest(path=MANIFEST_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_lock(path=LOCK_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def manifest_hash(manifest):
+    """Hash do que influencia a resolucao (sem comentarios nem perfis)."""
+    data = {k: v for k, v in manifest.items() if not k.startswith("_") and k != "profiles"}
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def profile_nodes(manifest, name=DEFAULT_PROFILE):
+    """
+    Packs de um perfil ("profiles" do manifesto), com "extends" resolvido, na
+    ordem do manifesto. "*" = todos.
+    """
+    profiles = manifest.get("profiles", {})
+    if name not in profiles:
+        raise ValueError(f"perfil de nodes desconhecido: {name} (disponiveis: {', '.join(sorted(profiles))})")
+    selected, seen = set(), set()
+    while name and name not in seen:
+        seen.add(name)
+        profile = profiles[name]
+        if profile["nodes"] == "*":
+            return [n["name"] for n in manifest["nodes"]]
+        selected.update(profile["nodes"])
+        name = profile.get("extends")
+    known = {n["name"] for n in manifest["nodes"]}
+    unknown = selected - known
+    if unknown:
+        raise ValueError(f"packs fora do manifesto no perfil: {', '.join(sorted(unknown))}")
+    return [n["name"] for n in manifest["nodes"] if n["name"] in selected]
+
+
+def repo_entries(manifest):
+    """[(nome, entrada)] do ComfyUI e de cada node, na ordem do manifesto."""
+    return [("comfyui", manifest["comfyui"])] + [(n["name"], n) for n in manifest["nodes"]]
+
+
+def unpinned(manifest):
+    """Nomes dos repos cujo "ref" nao e um commit (sha de 40 caracteres)."""
+    return [name for name, entry in repo_entries(manifest) if not SHA_RE.match(entry.get("ref") or "")]
+
+
+def _package_name(requirement):
+    match = re.match(r"\s*([A-Za-z0-9][A-Za-z0-9._-]*)", requirement)
+    return re.sub(r"[-_.]+", "-", match.group(1)).lower() if match else None
+
+
+# --------------------------------------------------------------------------
+# pin / lock
+# --------------------------------------------------------------------------
+def ls_remote(repo, ref=None):
+    """Commit de `ref` (branch/tag; padrao HEAD) no repo remoto."""
+    if ref and SHA_RE.match(ref):
+        return ref
+    patterns = [ref, f"{ref}^{{}}"] if ref else ["HEAD"]
+    out = subprocess.run(["git", "ls-remote", repo, *patterns], check=True,
+                         capture_output=True, text=True, timeout=60).stdout
+    refs = dict(reversed(line.split("\t", 1)) for line in out.splitlines())
+    # Tag anotada: o commit e o ref "^{}"
+    candidates = [f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}", f"refs/heads/{ref}", ref] if ref else ["HEAD"]
+    for name in candidates:
+        if name in refs:
+            return refs[name]
+    raise RuntimeError(f"{repo}: ref {ref or 'HEAD'} nao encontrado")
+
+
+def pin(manifest, update=False, resolver=None):
+    """
+    Fixa "ref" de cada repo no commit atual do seu "track" (branch/tag; sem
+    track, o ref antigo se nao for sha, senao HEAD). Com update=False, quem ja
+    tem commit fica como esta. Altera e retorna o manifesto.
+    """
+    resolver = resolver or ls_remote
+    todo = []
+    for name, entry in repo_entries(manifest):
+        ref = entry.get("ref")
+        if SHA_RE.match(ref or "") and not update:
+            continue
+        track = entry.get("track") or (ref if ref and not SHA_RE.match(ref) else None)
+        todo.append((name, entry, track))
+    with ThreadPoolExecutor(max_workers=LOCK_WORKERS) as pool:
+        commits = list(pool.map(lambda item: resolver(item[1]["repo"], item[2]), todo))
+    for (name, entry, track), commit in zip(todo, commits):
+        if entry.get("ref") != commit:
+            print(f"[PIN] {name}: {entry.get('ref') or 'HEAD'} -> {commit[:12]}", flush=True)
+        entry["ref"] = commit
+        if track:
+            entry["track"] = track
+    return manifest
+
+
+def fetch_requirements(repo, commit):
+    """requirements.txt do repo no commit (GitHub raw). Retorna [] se nao existir."""
+    match = re.match(r"https://github\.com/([^/]+)/([^/]+?)(?:\.git)?$", repo)
+    if not match:
+        raise RuntimeError(f"{repo}: so repos do GitHub sao suportados no lock")
+    url = f"https://raw.githubusercontent.com/{match.group(1)}/{match.group(2)}/{commit}/requirements.txt"
+    try:
+        with urllib.request.urlopen(url, timeout=60) as resp:
+            text = resp.read().decode()
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            return []
+        raise
+    lines = []
+    for line in text.splitlines():
+        line = line.split(" #", 1)[0].strip()
+        if line and not line.startswith(("#", "-")):
+            lines.append(line)
+    return lines
+
+
+def resolve(requirements, manifest, pip=None):
+    """
+    Resolve o conjunto inteiro com `pip install --dry-run --report` (torch
+    fixado pelo manifesto). Retorna as linhas `nome==versao` sem o torch.
+    """
+    torch = manifest["torch"]
+    torch_names = {_package_name(p) for p in torch["packages"]}
+    with tempfile.TemporaryDirectory() as tmp:
+        req_path = os.path.join(tmp, "requirements.in")
+        report_path = os.path.join(tmp, "report.json")
+        with open(req_path, "w") as f:
+            f.write("\n".join(torch["packages"] + requirements) + "\n")
+        cmd = (pip or [sys.executable, "-m", "pip"]) + [
+            "install", "--dry-run", "--ignore-installed", "--quiet", "--report", report_path,
+            "--extra-index-url", torch["index_url"], "-r", req_path,
+        ]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"pip nao conseguiu resolver os requirements:\n{proc.stderr[-4000:]}")
+        with open(report_path) as f:
+            report = json.load(f)
+    pins = []
+    for item in report["install"]:
+        name, version = item["metadata"]["name"], item["metadata"]["version"]
+        if _package_name(name) in torch_names:
+            continue
+        direct = item.get("download_info", {})
+        if item.get("is_direct") and direct.get("url"):
+            vcs = direct.get("vcs_info")
+            url = f"git+{direct['url']}@{vcs['commit_id']}" if vcs else direct["url"]
+            pins.append(f"{name} @ {url}")
+        else:
+            pins.append(f"{name}=={version}")
+    return sorted(pins, key=str.lower)
+
+
+def lock(manifest, pip=None):
+    """Resolve commits e requirements. Retorna o dict do lockfile."""
+    repos = repo_entries(manifest)
+    with ThreadPoolExecutor(max_workers=LOCK_WORKERS) as pool:
+        commits = dict(zip([name for name, _ in repos],
+                           pool.map(lambda item: ls_remote(item[1]["repo"], item[1].get("ref")), repos)))
+        with_reqs = [("comfyui", manifest["comfyui"])] + [
+            (n["name"], n) for n in manifest["nodes"] if n.get("requirements", True)]
+        sources = dict(zip([name for name, _ in with_reqs],
+                           pool.map(lambda item: fetch_requirements(item[1]["repo"], commits[item[0]]), with_reqs)))
+
+    merged = []
+    for line in list(manifest.get("pip", [])) + [line for lines in sources.values() for line in lines]:
+        if line not in merged:
+            merged.append(line)
+    print(f"[LOCK] {len(merged)} requirement(s) de {len(sources)} fonte(s); resolvendo...", flush=True)
+    return {
+        "manifest": manifest_hash(manifest),
+        "comfyui": {"repo": manifest["comfyui"]["repo"], "ref": manifest["comfyui"].get("ref"),
+                    "commit": commits["comfyui"]},
+        "nodes": {n["name"]: {"repo": n["repo"], "ref": n.get("ref"), "commit": commits[n["name"]]}
+                  for n in manifest["nodes"]},
+        "requirements": resolve(merged, manifest, pip),
+    }
+
+
+# --------------------------------------------------------------------------
+# render
+# --------------------------------------------------------------------------
+def _locked_commit(entry, locked):
+    """Commit do lock, se ainda corresponde ao repo/ref do manifesto."""
+    if locked and locked.get("repo") == entry["repo"] and locked.get("ref") == entry.get("ref"):
+        return locked["commit"]
+    return None
+
+
+def _checkout(repo, dest, commit=None, ref=None, recursive=False):
+    if commit:
+        cmds = [f"git init -q {dest}", f"git -C {dest} remote add origin {repo}",
+                f"git -C {dest} fetch -q --depth 1 origin {commit}", f"git -C {dest} checkout -q FETCH_HEAD"]
+        if recursive:
+            cmds.append(f"git -C {dest} submodule update -q --init --recursive --depth 1")
+        return cmds
+    branch = f" --branch {ref}" if ref else ""
+    submodules = " --recursive --shallow-submodules" if recursive else ""
+    return [f"git clone -q --depth 1{branch}{submodules} {repo} {dest}"]
+
+
+def layers(manifest, lock=None):
+    """
+    Lista de camadas {"title", "run": [comandos], "copy": (origem, destino)|None}
+    compartilhada pelo Dockerfile e pela modal.Image.
+    """
+    lock = lock or {}
+    locked = bool(lock.get("requirements")) and lock.get("manifest") == manifest_hash(manifest)
+    torch = manifest["torch"]
+    nodes_dir = f"{COMFYUI_DIR}/custom_nodes"
+    result = [
+        {"title": "Sistema", "copy": None, "run": [
+            "apt-get update",
+            "apt-get install -y --no-install-recommends " + " ".join(manifest["apt"]),
+            "rm -rf /var/lib/apt/lists/*",
+        ]},
+        {"title": "PyTorch + CUDA", "copy": None, "run": [
+            "pip install --no-cache-dir --upgrade pip",
+            f"pip install --no-cache-dir --index-url {torch['index_url']} " + " ".join(torch["packages"]),
+            f"printf '%s\\n' {' '.join(torch['packages'])} > {TORCH_CONSTRAINTS}",
+        ]},
+    ]
+    pip = f"pip install --no-cache-dir -c {TORCH_CONSTRAINTS} --extra-index-url {torch['index_url']}"
+    if locked:
+        result.append({"title": "Deps python travadas (requirements.lock.txt)",
+                       "copy": ("requirements.lock.txt", REQUIREMENTS_IN_IMAGE),
+                       "run": [f"pip install --no-cache-dir --no-deps -r {REQUIREMENTS_IN_IMAGE}"]})
+    elif manifest.get("pip"):
+        result.append({"title": "Deps python extras (sem lock)", "copy": None,
+                       "run": [f"{pip} " + " ".join(manifest["pip"])]})
+
+    comfy = manifest["comfyui"]
+    comfy_run = _checkout(comfy["repo"], COMFYUI_DIR, _locked_commit(comfy, lock.get("comfyui")), comfy.get("ref"))
+    if not locked:
+        comfy_run.append(f"{pip} -r {COMFYUI_DIR}/requirements.txt")
+    result.append({"title": "ComfyUI", "copy": None,
+                   "run": comfy_run + [f"rm -rf {COMFYUI_DIR}/models", f"mkdir -p {COMFYUI_DIR}/models"]})
+
+    clone = []
+    for node in manifest["nodes"]:
+        dest = f"{nodes_dir}/{node['name']}"
+        commit = _locked_commit(node, lock.get("nodes", {}).get(node["name"]))
+        clone += _checkout(node["repo"], dest, commit, node.get("ref"), node.get("recursive", False))
+        if not locked and node.get("requirements", True):
+            # Sem lock: tolerante por pack, como no Dockerfile antigo
+            clone.append(f"{{ [ ! -f {dest}/requirements.txt ] || {pip} -r {dest}/requirements.txt "
+                         f"|| echo '[WARN] deps de {node['name']} falharam'; }}")
+    title = f"Custom nodes ({len(manifest['nodes'])})" + ("" if locked else " + deps de cada pack (sem lock)")
+    result.append({"title": title, "copy": None, "run": clone})
+
+    patches = [cmd.replace("{dir}", f"{nodes_dir}/{n['name']}")
+               for n in manifest["nodes"] for cmd in n.get("post_install", [])]
+    if patches:
+        result.append({"title": "Patches", "copy": None, "run": patches})
+    # .pyc na imagem: o container nao recompila ComfyUI + nodes a cada cold start.
+    # Scripts soltos com sintaxe antiga em alguns packs nao devem quebrar o build.
+    result.append({"title": "Bytecode (.pyc)", "copy": None, "run": [
+        f"python -m compileall -q -j 0 -x '/models/' {COMFYUI_DIR} > /dev/null || true",
+    ]})
+    return result
+
+
+def render_requirements(lock):
+    return "# Gerado por image_spec.py a partir de custom_nodes.lock.json. Nao edite.\n" + "".join(
+        f"{line}\n" for line in lock.get("requirements", []))
+
+
+def render_dockerfile(manifest, lock=None):
+    out = [
+        "# Dockerfile.comfyui",
+        "# ==================",
+        "# GERADO por image_spec.py a partir de custom_nodes.json (+ custom_nodes.lock.json).",
+        "# Nao edite a mao: edite o manifesto e rode `python image_spec.py render`.",
+        "#",
+        "# Camadas da que menos muda para a que mais muda, para reaproveitar cache",
+        "# entre builds e no pull do Modal.",
+        "",
+        f"FROM python:{manifest['python']}-slim",
+        "",
+        f"ENV COMFYUI_DIR={COMFYUI_DIR}",
+    ]
+    for layer in layers(manifest, lock):
+        out += ["", f"# === {layer['title']} ==="]
+        if layer["copy"]:
+            out.append(f"COPY {layer['copy'][0]} {layer['copy'][1]}")
+        out.append("RUN " + " && \\\n    ".join(layer["run"]))
+    out += ["", "EXPOSE 8188", "",
+            f'CMD ["python", "{COMFYUI_DIR}/main.py", "--listen", "0.0.0.0", "--port", "8188"]', ""]
+    return "\n".join(out)
+
+
+def modal_image(manifest=None, lock=None):
+    """A mesma imagem do Dockerfile como modal.Image (camada por camada)."""
+    import modal
+
+    manifest = manifest or load_manifest()
+    lock = load_lock() if lock is None else lock
+    image = modal.Image.from_registry(f"python:{manifest['python']}-slim").env({"COMFYUI_DIR": COMFYUI_DIR})
+    for layer in layers(manifest, lock):
+        if layer["copy"]:
+            # requirements.lock.txt e escrito pelo `render`
+            image = image.add_local_file(os.path.join(HERE, layer["copy"][0]), layer["copy"][1], copy=True)
+        image = image.run_commands(" && ".join(layer["run"]))
+    return image
+
+
+def _outputs(manifest, lock):
+    outputs = {DOCKERFILE_PATH: render_dockerfile(manifest, lock)}
+    if lock.get("requirements"):
+        outputs[REQUIREMENTS_LOCK_PATH] = render_requirements(lock)
+    return outputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manifesto de custom nodes -> lockfile, Dockerfile e modal.Image")
+    parser.add_argument("command", choices=["pin", "lock", "render", "check"])
+    parser.add_argument("--pip", help="interpretador usado para resolver (ex: python3.11); padrao: o atual")
+    parser.add_argument("--update", action="store_true", help="pin: avanca tambem os commits ja fixados")
+    args = parser.parse_args(argv)
+
+    manifest = load_manifest(MANIFEST_PATH)
+    if args.command == "pin":
+        pin(manifest, update=args.update)
+        with open(MANIFEST_PATH, "w") as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print("[PIN] custom_nodes.json atualizado; rode `python image_spec.py lock`")
+        return 0
+    if args.command == "lock":
+        data = lock(manifest, pip=[args.pip, "-m", "pip"] if args.pip else None)
+        with open(LOCK_PATH, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"[LOCK] {len(data['nodes'])} node(s) travado(s), {len(data['requirements'])} pacote(s) -> {LOCK_PATH}")
+        args.command = "render"
+
+    lock_data = load_lock(LOCK_PATH)
+    if lock_data and lock_data.get("manifest") != manifest_hash(manifest):
+        print("[WARN] custom_nodes.lock.json desatualizado: rode `python image_spec.py lock`")
+    outputs = _outputs(manifest, lock_data)
+    if args.command == "check":
+        for name in manifest.get("profiles", {}):
+            profile_nodes(manifest, name)  # ValueError se o perfil citar pack inexistente
+        failed = False
+        loose = unpinned(manifest)
+        if loose:
+            print(f"[CHECK] Sem commit fixo: {', '.join(loose)}. Rode `python image_spec.py pin`.")
+            failed = True
+        if not lock_data.get("requirements") or lock_data.get("manifest") != manifest_hash(manifest):
+            print("[CHECK] custom_nodes.lock.json ausente ou desatualizado: a imagem sairia sem trava "
+                  "(deps tolerantes por pack). Rode `python image_spec.py lock`.")
+            failed = True
+        stale = []
+        for path, content in outputs.items():
+            try:
+                with open(path) as f:
+                    current = f.read()
+            except OSError:
+                current = None
+            if current != content:
+                stale.append(os.path.basename(path))
+        if stale:
+            print(f"[CHECK] Desatualizado(s): {', '.join(stale)}. Rode `python image_spec.py render`.")
+            failed = True
+        if failed:
+            return 1
+        print("[CHECK] Commits fixos, lock em dia e arquivos gerados em dia com o manifesto.")
+        return 0
+    for path, content in outputs.items():
+        with open(path, "w") as f:
+            f.write(content)
+        print(f"[RENDER] {os.path.basename(path)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
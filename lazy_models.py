@@ -0,0 +1,161 @@
+"""
+lazy_models.py
+==============
+Modo lazy: o boot baixa so os modelos "core" do catalogo e o resto e
+baixado sob demanda, quando um workflow enviado ao /prompt precisa dele.
+
+O LazyModelFetcher e instalado como hook do comfy_proxy:
+  1. Varre o workflow (formato API) atras de nomes de modelo nos inputs
+     (ckpt_name, lora_name, unet_name, clip_name, vae_name, ...).
+  2. Procura cada nome no catalogo (model_catalog) e baixa o que falta no
+     volume com o ModelDownloader, antes de repassar o prompt ao ComfyUI.
+  3. Enquanto espera, loga o progresso; GET /kythours/models mostra o que
+     esta pendente.
+  4. Se o download passar de LAZY_WAIT segundos, o prompt e recusado
+     (PromptRejected, 400) e o download segue; basta reenviar depois.
+
+Varios prompts pedindo o mesmo arquivo esperam o mesmo download.
+"""
+
+import os
+import threading
+import time
+
+from comfy_proxy import PromptRejected
+from model_catalog import COMFYUI_DIR, build_catalog, index_by_name
+from model_downloader import MB, ModelDownloader
+from model_store import ModelStore
+
+# Inputs dos loaders do ComfyUI que recebem nome de arquivo de modelo.
+# Qualquer outro input terminado em "_name" tambem e considerado.
+MODEL_INPUT_KEYS = {
+    "ckpt_name", "lora_name", "unet_name", "clip_name", "clip_name1", "clip_name2",
+    "clip_name3", "vae_name", "control_net_name", "model_name", "upscale_model",
+    "name", "model", "bbox_model",
+}
+PROGRESS_INTERVAL = 10  # segundos entre logs de progresso
+STATUS_PATH = "/kythours/models"
+LAZY_WAIT = int(os.environ.get("LAZY_WAIT", "120"))  # segundos que um /prompt segura esperando modelos
+
+
+def workflow_model_refs(prompt):
+    """Conjunto de valores string dos inputs de modelo de um workflow API."""
+    refs = set()
+    if not isinstance(prompt, dict):
+        return refs
+    for node in prompt.values():
+        inputs = node.get("inputs") if isinstance(node, dict) else None
+        if not isinstance(inputs, dict):
+            continue
+        for key, value in inputs.items():
+            if isinstance(value, str) and (key in MODEL_INPUT_KEYS or key.endswith("_name")):
+                refs.add(value.replace("\\", "/"))
+    return refs
+
+
+class LazyModelFetcher:
+    """
+    Baixa sob demanda as entradas do catalogo referenciadas por um workflow.
+
+    comfyui_dir: raiz do ComfyUI (o volume fica em <comfyui_dir>/models).
+    catalog:     lista {"url", "path"}; por padrao model_catalog.build_catalog.
+    wait:        teto (s) de espera do /prompt antes de recusar com "tente de novo".
+    """
+
+    def __init__(self, comfyui_dir=COMFYUI_DIR, catalog=None, downloader=None, wait=LAZY_WAIT):
+        self.comfyui_dir = comfyui_dir
+        self.wait = wait
+        self.catalog = catalog if catalog is not None else build_catalog(comfyui_dir)
+        self.index = index_by_name(self.catalog, comfyui_dir)
+        self.downloader = downloader or ModelDownloader(hf_token=os.environ.get("HF_TOKEN", ""))
+        self.store = ModelStore(os.path.join(comfyui_dir, "models"))
+        self._lock = threading.Lock()
+        self._inflight = {}  # path -> threading.Event
+        self.failed = {}     # path -> erro do ultimo download
+
+    def missing_for(self, prompt):
+        """Entradas do catalogo que o workflow usa e que nao estao no volume."""
+        missing = {}
+        for ref in workflow_model_refs(prompt):
+            model = self.index.get(ref) or self.index.get(os.path.basename(ref))
+            if model and not os.path.exists(model["path"]):
+                missing[model["path"]] = model
+        return list(missing.values())
+
+    def ensure(self, models):
+        """Baixa (ou espera quem ja esta baixando) cada modelo; retorna os resultados."""
+        mine, waiting = [], []
+        with self._lock:
+            for model in models:
+                event = self._inflight.get(model["path"])
+                if event:
+                    waiting.append(event)
+                else:
+                    self._inflight[model["path"]] = threading.Event()
+                    mine.append(model)
+
+        results = []
+        if mine:
+            names = ", ".join(os.path.basename(m["path"]) for m in mine)
+            print(f"[LAZY] Workflow precisa de {len(mine)} arquivo(s): {names}", flush=True)
+            done = threading.Event()
+            reporter = threading.Thread(target=self._report, args=(mine, done), daemon=True)
+            reporter.start()
+            try:
+                results = self.store.download_all(self.downloader, mine)
+            finally:
+                done.set()
+                with self._lock:
+                    for model in mine:
+                        self._inflight.pop(model["path"]).set()
+            for result in results:
+                if result["status"] == "ok":
+                    self.failed.pop(result["path"], None)
+                else:
+                    self.failed[result["path"]] = result.get("error")
+        for event in waiting:
+            event.wait()
+        return results
+
+    def _report(self, models, done):
+        names = {self.store.blob_path(m["url"]): os.path.basename(m["path"]) for m in models}
+        while not done.wait(PROGRESS_INTERVAL):
+            for blob, (got, total) in self.downloader.progress().items():
+                if blob in names:
+                    pct = 100.0 * got / total if total else 0.0
+                    print(f"[LAZY] {names[blob]}: {got / MB:.0f}/{total / MB:.0f} MB ({pct:.0f}%)", flush=True)
+
+    def on_prompt(self, payload):
+        """Hook do comfy_proxy: garante os modelos antes de enfileirar."""
+        missing = self.missing_for(payload.get("prompt"))
+        if missing:
+            started = time.monotonic()
+            # O download roda fora do request: se passar do teto, o prompt volta
+            # com erro e o proximo envio reaproveita o download em andamento.
+            worker = threading.Thread(target=self.ensure, args=(missing,), daemon=True)
+            worker.start()
+            worker.join(self.wait)
+            if worker.is_alive():
+                names = ", ".join(os.path.basename(m["path"]) for m in missing)
+                raise PromptRejected(f"baixando modelos ({names}); tente de novo em instantes "
+                                     f"(progresso em {STATUS_PATH})")
+            print(f"[LAZY] Modelos prontos em {time.monotonic() - started:.1f}s. Enfileirando prompt.", flush=True)
+        # Se algo falhou, o proprio ComfyUI devolve o erro de validacao do node
+        return payload
+
+    def status(self):
+        progress = self.downloader.progress()
+        by_path = {m["path"]: m for m in self.catalog}
+        with self._lock:
+            pending = []
+            for path in self._inflight:
+                model = by_path.get(path)
+                got, total = progress.get(self.store.blob_path(model["url"]), (0, None)) if model else (0, None)
+                pending.append({"name": os.path.basename(path), "bytes": got, "total": total})
+        failed = [{"name": os.path.basename(p), "error": e} for p, e in self.failed.items()]
+        return 200, {"pending": pending, "failed": failed}
+
+    def install(self, proxy):
+        proxy.prompt_hooks.append(self.on_prompt)
+        proxy.routes[STATUS_PATH] = self.status
+        return self
@@ -0,0 +1,285 @@
+"""
+lora_sweep.py
+=============
+Comparacao de checkpoints de LoRA: grade prompt x seed x checkpoint com o
+modelo base carregado uma vez so.
+
+O catalogo baixa todos os checkpoints intermediarios (ohwxphoto_000000100..,
+FERPHOTO v5/v7 de 250 a 3000 steps), mas compara-los era um prompt da UI por
+checkpoint. O sweep:
+  - Expande um glob de LoRA relativo a models/loras (ex: "FERPHOTO/*_v7_*"),
+    ordenado por treino e step (o LoRA final por ultimo), sobre os LoRAs do
+    catalogo (model_catalog: LORA_RUNS + listagem do HF) e os do volume. Os
+    que ainda nao estao no volume sao baixados (LazyModelFetcher) antes de
+    enfileirar; os que falharem saem do sweep.
+  - Com model_only (padrao), troca LoraLoader por LoraLoaderModelOnly e liga
+    os consumidores do CLIP direto no CLIP de antes do LoRA: o text encoder
+    fica fora do patch e a conditioning de cada prompt e a mesma para todos
+    os checkpoints.
+  - Enfileira na ordem prompt -> seed -> checkpoint. Entre dois jobs
+    seguidos so mudam o lora_name e o sampler, entao o cache de execucao do
+    ComfyUI reaproveita o diffusion model, o text encoder e a conditioning
+    (nodes em "execution_cached"); so o patch do LoRA e a amostragem rodam.
+  - Monta um contact sheet (linhas = prompt/seed, colunas = checkpoint) com
+    legendas e grava os tempos de cada run (execucao no ComfyUI, nodes em
+    cache) em JSON.
+
+Formato do sweep (JSON):
+  {
+    "workflow": {...workflow API com um LoraLoader...},
+    "loras": "FERPHOTO/*_v7_*",
+    "prompts": ["ohwx woman, portrait", "..."],
+    "seeds": [1, 2],
+    "strength": 1.0,          # opcional
+    "model_only": true        # opcional
+  }
+
+USO:
+  python -m lora_sweep sweep.json --url http://127.0.0.1:8188 --models-dir /root/ComfyUI/models
+  modal run comfyui_modal.py --sweep sweep.json --out sweep_outputs
+"""
+
+import argparse
+import copy
+import fnmatch
+import io
+import json
+import os
+import sys
+
+from comfy_batch import LORA_CLASSES, BatchRunner, apply_overrides
+from comfy_client import ComfyClient
+from lazy_models import LazyModelFetcher
+from model_catalog import CHECKPOINT_FILE, build_catalog
+from model_staging import model_files
+
+SHEET_NAME = "contact_sheet.png"
+TIMINGS_NAME = "timings.json"
+THUMB_SIZE = 384       # lado maior de cada imagem no contact sheet
+LABEL_HEIGHT = 28
+SWEEP_IN_FLIGHT = 2    # a fila do ComfyUI executa em ordem; 2 mantem a GPU ocupada
+
+
+def _checkpoint_order(rel):
+    match = CHECKPOINT_FILE.match(os.path.basename(rel))
+    name, step = (match.group("name"), match.group("step")) if match else (rel, None)
+    return os.path.dirname(rel), name, int(step) if step else float("inf")
+
+
+def checkpoint_label(rel):
+    """"FERPHOTO_..._v7_..._000000250.safetensors" -> "..._v7_... @250" (final: "final")."""
+    _, name, step = _checkpoint_order(rel)
+    return f"{name} @{step}" if step != float("inf") else f"{name} final"
+
+
+def catalog_loras(models_dir, catalog=None):
+    """{nome relativo a models/loras: entrada do catalogo} (padrao: build_catalog do volume)."""
+    if catalog is None:
+        catalog = build_catalog(os.path.dirname(os.path.abspath(models_dir)))
+    loras_dir = os.path.join(os.path.abspath(models_dir), "loras")
+    entries = {}
+    for model in catalog:
+        rel = os.path.relpath(os.path.abspath(model["path"]), loras_dir)
+        if not rel.startswith(os.pardir) and rel.endswith(".safetensors"):
+            entries[rel.replace(os.sep, "/")] = model
+    return entries
+
+
+def expand_loras(models_dir, pattern, catalog=None):
+    """LoRAs (relativos a models/loras, do catalogo ou do volume) que casam com o glob, por treino e step."""
+    loras_dir = os.path.join(models_dir, "loras")
+    names = {os.path.relpath(os.path.join(models_dir, rel), loras_dir).replace(os.sep, "/")
+             for rel in model_files(models_dir) if rel.startswith("loras" + os.sep)}
+    names.update(catalog_loras(models_dir, catalog))
+    matched = [n for n in names if fnmatch.fnmatch(n, pattern) or fnmatch.fnmatch(os.path.basename(n), pattern)]
+    return sorted(matched, key=_checkpoint_order)
+
+
+def fetch_loras(models_dir, loras, catalog=None, fetcher=None):
+    """
+    Baixa os LoRAs do sweep que ainda nao estao no volume (mesmo mecanismo do
+    modo lazy). Retorna os que estao disponiveis, na mesma ordem.
+    """
+    entries = catalog_loras(models_dir, catalog)
+    missing = [entries[n] for n in loras if n in entries and not os.path.exists(entries[n]["path"])]
+    if missing:
+        print(f"[SWEEP] Baixando {len(missing)} checkpoint(s) que faltam no volume...", flush=True)
+        fetcher = fetcher or LazyModelFetcher(os.path.dirname(os.path.abspath(models_dir)),
+                                              catalog=list(entries.values()))
+        fetcher.ensure(missing)
+    available = [n for n in loras if os.path.exists(os.path.join(models_dir, "loras", *n.split("/")))]
+    for name in sorted(set(loras) - set(available)):
+        print(f"[SWEEP] {name} indisponivel; fora do sweep", flush=True)
+    return available
+
+
+def model_only(workflow):
+    """
+    Copia do workflow com cada LoraLoader trocado por LoraLoaderModelOnly; quem
+    usava o CLIP do LoRA (saida 1) passa a usar o CLIP de entrada dele.
+    """
+    workflow = copy.deepcopy(workflow)
+    clip_source = {}
+    for nid, node in workflow.items():
+        if node.get("class_type") == "LoraLoader":
+            clip_source[nid] = node["inputs"].pop("clip")
+            node["inputs"].pop("strength_clip", None)
+            node["class_type"] = "LoraLoaderModelOnly"
+    for node in workflow.values():
+        for key, value in node.get("inputs", {}).items():
+            # Cadeia de LoRAs: segue ate o CLIP que nao passa por nenhum LoRA
+            while isinstance(value, list) and len(value) == 2 and value[0] in clip_source and value[1] == 1:
+                value = clip_source[value[0]]
+            node["inputs"][key] = value
+    return workflow
+
+
+def sweep_jobs(spec, loras):
+    """Jobs do comfy_batch na ordem prompt -> seed -> checkpoint (maximo de cache entre jobs)."""
+    base = spec["workflow"]
+    if not any(n.get("class_type") in LORA_CLASSES for n in base.values()):
+        raise ValueError("workflow do sweep precisa de um LoraLoader")
+    if spec.get("model_only", True):
+        base = model_only(base)
+    prompts = spec.get("prompts") or [None]
+    seeds = spec.get("seeds") or [None]
+    jobs = []
+    for p, prompt in enumerate(prompts):
+        for s, seed in enumerate(seeds):
+            for c, lora in enumerate(loras):
+                overrides = {"lora": {"name": lora, **({"strength": spec["strength"]} if "strength" in spec else {})}}
+                if prompt is not None:
+                    overrides["prompt"] = prompt
+                if seed is not None:
+                    overrides["seed"] = seed
+                jobs.append({"id": len(jobs), "name": "sweep", "workflow": apply_overrides(base, overrides),
+                             "overrides": overrides, "cell": {"row": p * len(seeds) + s, "col": c}})
+    return jobs
+
+
+def run_sweep(client, spec, loras, max_in_flight=SWEEP_IN_FLIGHT):
+    """Gerador: resultados do BatchRunner (com "cell") conforme cada run termina."""
+    jobs = sweep_jobs(spec, loras)
+    cells = {job["id"]: job["cell"] for job in jobs}
+    for result in BatchRunner(client, max_in_flight=max_in_flight).run(jobs):
+        result["cell"] = cells[result["id"]]
+        result["label"] = checkpoint_label(result["overrides"]["lora"]["name"])
+        yield result
+
+
+def timings(results):
+    """Tempos por run (ordem da grade) para o JSON do sweep."""
+    rows = []
+    for r in sorted(results, key=lambda r: r["id"]):
+        rows.append({"id": r["id"], "lora": r["overrides"]["lora"]["name"], "label": r["label"],
+                     "prompt": r["overrides"].get("prompt"), "seed": r["overrides"].get("seed"),
+                     "status": r["status"], "seconds": r["seconds"],
+                     "execution_seconds": r.get("execution_seconds"), "cached_nodes": r.get("cached_nodes"),
+                     "error": r.get("error")})
+    return rows
+
+
+def contact_sheet(results):
+    """PNG (bytes) da grade: colunas = checkpoints, linhas = prompt/seed. Precisa de Pillow."""
+    from PIL import Image, ImageDraw, ImageFont  # dependencia do ComfyUI (imagem)
+
+    try:
+        font = ImageFont.load_default(size=14)
+    except TypeError:  # Pillow < 10.1
+        font = ImageFont.load_default()
+    thumbs, labels, row_labels = {}, {}, {}
+    for r in results:
+        cell = (r["cell"]["row"], r["cell"]["col"])
+        exec_s = r.get("execution_seconds")
+        labels[cell[1]] = r["label"]
+        row_labels[cell[0]] = f"seed {r['overrides'].get('seed')} | {(r['overrides'].get('prompt') or '')[:60]}"
+        data = next((img["data"] for img in r["images"] if "data" in img), None)
+        if data:
+            thumb = Image.open(io.BytesIO(data)).convert("RGB")
+            thumb.thumbnail((THUMB_SIZE, THUMB_SIZE))
+        else:
+            thumb = Image.new("RGB", (THUMB_SIZE, THUMB_SIZE), (40, 0, 0))
+        thumbs[cell] = (thumb, f"{exec_s:.1f}s" if exec_s is not None else r["status"])
+    if not thumbs:
+        return None
+    rows = max(c[0] for c in thumbs) + 1
+    cols = max(c[1] for c in thumbs) + 1
+    cell_w = max(t.width for t, _ in thumbs.values())
+    cell_h = max(t.height for t, _ in thumbs.values()) + LABEL_HEIGHT
+    sheet = Image.new("RGB", (cols * cell_w, LABEL_HEIGHT + rows * cell_h), (20, 20, 20))
+    draw = ImageDraw.Draw(sheet)
+    for col, label in labels.items():
+        draw.text((col * cell_w + 6, 6), label, fill=(255, 255, 255), font=font)
+    for (row, col), (thumb, caption) in thumbs.items():
+        x, y = col * cell_w, LABEL_HEIGHT + row * cell_h
+        sheet.paste(thumb, (x, y))
+        text = f"{caption} | {row_labels[row]}" if col == 0 else caption
+        draw.text((x + 6, y + thumb.height + 6), text, fill=(200, 200, 200), font=font)
+    out = io.BytesIO()
+    sheet.save(out, format="PNG")
+    return out.getvalue()
+
+
+def write_sweep(sheet, rows, out_dir):
+    """Grava contact sheet (bytes PNG ou None) + tempos em out_dir. Retorna os caminhos."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    path = os.path.join(out_dir, TIMINGS_NAME)
+    with open(path, "w") as f:
+        json.dump(rows, f, indent=1)
+    paths.append(path)
+    if sheet:
+        path = os.path.join(out_dir, SHEET_NAME)
+        with open(path, "wb") as f:
+            f.write(sheet)
+        paths.append(path)
+    return paths
+
+
+def describe(result):
+    """Linha de log de um run."""
+    return (f"{result['label']} seed={result['overrides'].get('seed')}: {result['status']} "
+            f"exec={result.get('execution_seconds')}s cache={result.get('cached_nodes')} node(s)")
+
+
+def load_spec(path):
+    with open(path) as f:
+        spec = json.load(f)
+    if isinstance(spec.get("workflow"), str):
+        # Caminho do workflow relativo ao arquivo do sweep
+        with open(os.path.join(os.path.dirname(os.path.abspath(path)), spec["workflow"])) as f:
+            spec["workflow"] = json.load(f)
+    return spec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep de checkpoints de LoRA num ComfyUI rodando.")
+    parser.add_argument("spec", help="JSON do sweep (workflow, loras, prompts, seeds)")
+    parser.add_argument("--url", default="http://127.0.0.1:8188")
+    parser.add_argument("--models-dir", default="/root/ComfyUI/models")
+    parser.add_argument("--out", default="sweep_outputs")
+    parser.add_argument("--max-in-flight", type=int, default=SWEEP_IN_FLIGHT)
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    catalog = build_catalog(os.path.dirname(os.path.abspath(args.models_dir)))
+    loras = expand_loras(args.models_dir, spec["loras"], catalog)
+    if not loras:
+        print(f"[SWEEP] Nenhum LoRA casa com {spec['loras']}")
+        return 1
+    loras = fetch_loras(args.models_dir, loras, catalog)
+    if not loras:
+        print("[SWEEP] Nenhum checkpoint disponivel")
+        return 1
+    print(f"[SWEEP] {len(loras)} checkpoint(s) x {len(spec.get('prompts') or [None])} prompt(s) "
+          f"x {len(spec.get('seeds') or [None])} seed(s)", flush=True)
+    results = []
+    for result in run_sweep(ComfyClient(args.url), spec, loras, args.max_in_flight):
+        results.append(result)
+        print(f"[SWEEP] {describe(result)}", flush=True)
+    print(f"[SWEEP] Salvo: {write_sweep(contact_sheet(results), timings(results), args.out)}")
+    return 1 if any(r["status"] != "ok" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
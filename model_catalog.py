@@ -0,0 +1,295 @@
+"""
+model_catalog.py
+================
+Catalogo dos modelos do volume do ComfyUI (url -> caminho no volume).
+
+Antes vivia dentro do run_comfyui; agora e compartilhado pelo start, pelo
+modo lazy (que baixa sob demanda o que o workflow pede) e por quem mais
+precisar saber "de onde vem cada arquivo".
+
+Cada entrada e {"url", "path"} e pode ter "core": True para os arquivos
+baixados ja no boot mesmo no modo lazy (CORE_FILES).
+
+USO:
+  catalog = build_catalog("/root/ComfyUI")
+  boot = core_models(catalog)
+  entry = index_by_name(catalog).get("FERPHOTO/arquivo.safetensors")
+"""
+
+import json
+import os
+import re
+
+COMFYUI_DIR = "/root/ComfyUI"
+
+# Minimo para o Z-Image-Turbo funcionar (diffusion model, text encoder, VAE)
+CORE_FILES = {
+    "z_image_turbo_bf16.safetensors",
+    "qwen_3_4b.safetensors",
+    "ae.safetensors",
+    "z_image_turbo_workflow.json",
+}
+
+# Ordem da fila de background (menor = antes). Pastas fora da tabela vao por
+# ultimo; checkpoints intermediarios de LoRA (_000000250...) ficam atras dos
+# finais.
+FOLDER_PRIORITY = {
+    "diffusion_models": 1,
+    "text_encoders": 1,
+    "vae": 1,
+    "unet": 2,
+    "controlnet": 2,
+    "model_patches": 2,
+    "loras": 3,
+    "upscale_models": 3,
+    "checkpoints": 4,
+    "ultralytics": 4,
+}
+INTERMEDIATE_STEP = re.compile(r"_\d{9,}\.safetensors$")
+
+# Treinos de LoRA: o final tem nome fixo; os checkpoints intermediarios saem
+# da listagem do repo (remote_sync.discover_checkpoints), cacheada no volume.
+# Sem listagem (primeiro boot com REMOTE_CHECK=0, API do HF fora), valem os
+# steps conhecidos ("steps", com o nome remoto em "remote_step").
+LORA_RUNS = [
+    {"repo": "kythours/kitoalro", "dir": "", "name": "ohwxphoto", "dest": "loras",
+     "steps": list(range(100, 1000, 100))},
+    {"repo": "kythours/FERGIRL", "dir": "FERPHOTO_zturbo_HF_OPTIMIZED_v5",
+     "name": "FERPHOTO_zturbo_HF_OPTIMIZED_v5", "dest": "loras/FERPHOTO",
+     "steps": list(range(250, 3001, 250)), "remote_step": "_000000{step:03d}"},
+    {"repo": "kythours/FERGIRL", "dir": "FERPHOTO_zturbo_HF_OPTIMIZED_v7_H100_3000_copy",
+     "name": "FERPHOTO_zturbo_HF_OPTIMIZED_v7_H100_3000_copy", "dest": "loras/FERPHOTO",
+     "steps": list(range(250, 2751, 250))},
+]
+CHECKPOINT_FILE = re.compile(r"^(?P<name>.+?)(?:_(?P<step>\d+))?\.safetensors$")
+LISTINGS_NAME = ".kythours_listings.json"
+
+
+def run_key(run):
+    return f"{run['repo']}:{run['dir']}"
+
+
+def load_listings(models_dir):
+    """Listagens dos treinos salvas no volume (remote_sync.save_listings)."""
+    try:
+        with open(os.path.join(models_dir, LISTINGS_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def known_checkpoint_files(run):
+    """Nomes remotos dos checkpoints conhecidos de um treino (sem listagem)."""
+    fmt = run.get("remote_step", "_{step:09d}")
+    return [f"{run['name']}{fmt.format(step=step)}.safetensors" for step in run.get("steps", [])]
+
+
+def lora_checkpoints(run, files=None, comfyui_dir=COMFYUI_DIR):
+    """
+    Entradas de um treino: o LoRA final (sempre) e os checkpoints
+    intermediarios presentes em `files` (nomes da pasta do treino no repo;
+    None = sem listagem, usa known_checkpoint_files).
+    O step vira 9 digitos no nome local (_000000250), seja qual for o remoto.
+    """
+    name, folder = run["name"], f"{comfyui_dir}/models/{run['dest']}"
+    if files is None:
+        files = known_checkpoint_files(run)
+    base = f"https://huggingface.co/{run['repo']}/resolve/main/" + (f"{run['dir']}/" if run["dir"] else "")
+    entries = [{"url": f"{base}{name}.safetensors", "path": f"{folder}/{name}.safetensors"}]
+    steps = {}
+    for filename in files:
+        match = CHECKPOINT_FILE.match(filename)
+        if match and match.group("name") == name and match.group("step"):
+            steps.setdefault(int(match.group("step")), filename)
+    for step, filename in sorted(steps.items()):
+        entries.append({"url": f"{base}{filename}", "path": f"{folder}/{name}_{step:09d}.safetensors"})
+    return entries
+
+
+def build_catalog(comfyui_dir=COMFYUI_DIR, listings=None):
+    """
+    Lista completa de {"url", "path"[, "core"]} do volume.
+
+    listings: {run_key: [arquivos]} dos treinos de LoRA; por padrao o cache
+    do volume. Treino sem listagem: final + steps conhecidos (LORA_RUNS).
+    """
+    # --- Modelos Z-Image-Turbo (Official) ---
+    models_to_download = [
+        # Z-Image-Turbo BF16 (High VRAM)
+        {
+            "url": "https://huggingface.co/Comfy-Org/z_image_turbo/resolve/main/split_files/diffusion_models/z_image_turbo_bf16.safetensors",
+            "path": f"{comfyui_dir}/models/diffusion_models/z_image_turbo_bf16.safetensors"
+        },
+        # Z-Image-Turbo FP8 (Low VRAM) - Opcional, mas util para A10G se quiser economizar
+        {
+            "url": "https://huggingface.co/Kijai/Z-Image_comfy_fp8_scaled/resolve/main/z-image-turbo_fp8_scaled_e4m3fn_KJ.safetensors",
+            "path": f"{comfyui_dir}/models/diffusion_models/z-image-turbo_fp8_scaled_e4m3fn_KJ.safetensors"
+        },
+        # Text Encoder (Required)
+        {
+            "url": "https://huggingface.co/Comfy-Org/z_image_turbo/resolve/main/split_files/text_encoders/qwen_3_4b.safetensors",
+            "path": f"{comfyui_dir}/models/text_encoders/qwen_3_4b.safetensors"
+        },
+        # VAE (Required)
+        {
+            "url": "https://huggingface.co/Comfy-Org/z_image_turbo/resolve/main/split_files/vae/ae.safetensors",
+            "path": f"{comfyui_dir}/models/vae/ae.safetensors"
+        },
+        # Qwen 3.4B GGUF Text Encoder (para uso com CLIPLoaderGGUF)
+        # IQ4_XS - Recomendado (qualidade/tamanho balanceados)
+        {
+            "url": "https://huggingface.co/worstplayer/Z-Image_Qwen_3_4b_text_encoder_GGUF/resolve/main/Qwen_3_4b-imatrix-IQ4_XS.gguf",
+            "path": f"{comfyui_dir}/models/text_encoders/Qwen_3_4b-imatrix-IQ4_XS.gguf"
+        },
+        # Q8_0 - Maxima qualidade (quase identico ao FP16)
+        {
+            "url": "https://huggingface.co/worstplayer/Z-Image_Qwen_3_4b_text_encoder_GGUF/resolve/main/Qwen_3_4b-Q8_0.gguf",
+            "path": f"{comfyui_dir}/models/text_encoders/Qwen_3_4b-Q8_0.gguf"
+        },
+        # Qwen3-4b-Z-Image-Engineer-V4-F16
+        {
+            "url": "https://huggingface.co/BennyDaBall/Qwen3-4b-Z-Image-Engineer-V4/resolve/main/Qwen3-4b-Z-Image-Engineer-V4-F16.gguf",
+            "path": f"{comfyui_dir}/models/text_encoders/Qwen3-4b-Z-Image-Engineer-V4-F16.gguf"
+        },
+        # Upscale Model
+        {
+            "url": "https://huggingface.co/Thelocallab/2xLexicaRRDBNet_Sharp/resolve/main/2xLexicaRRDBNet_Sharp.pth",
+            "path": f"{comfyui_dir}/models/upscale_models/2xLexicaRRDBNet_Sharp.pth"
+        },
+        # Upscale Model for Amazing Z-Image WF
+        {
+            "url": "https://huggingface.co/martin-rizzo/ESRGAN-4x/resolve/main/4x_foolhardy_Remacri.safetensors",
+            "path": f"{comfyui_dir}/models/upscale_models/4x_foolhardy_Remacri.safetensors"
+        },
+        # Amazing Z-Image WF v4.0 Diffusion Model
+        {
+            "url": "https://huggingface.co/jayn7/Z-Image-Turbo-GGUF/resolve/main/z_image_turbo-Q5_K_S.gguf",
+            "path": f"{comfyui_dir}/models/diffusion_models/z_image_turbo-Q5_K_S.gguf"
+        },
+        # Amazing Z-Image WF v4.0 Text Encoder
+        {
+            "url": "https://huggingface.co/mradermacher/Qwen3-4B-i1-GGUF/resolve/main/Qwen3-4B.i1-Q5_K_S.gguf",
+            "path": f"{comfyui_dir}/models/text_encoders/Qwen3-4B.i1-Q5_K_S.gguf"
+        },
+        # Workflow JSON (Exemplo)
+        {
+            "url": "https://huggingface.co/jayn7/Z-Image-Turbo-GGUF/resolve/main/example_workflow.json",
+            "path": f"{comfyui_dir}/user/default/workflows/z_image_turbo_workflow.json"
+        },
+        # Qwen-Image-Edit-2511-Lightning
+        {
+            "url": "https://huggingface.co/lightx2v/Qwen-Image-Edit-2511-Lightning/resolve/main/Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors",
+            "path": f"{comfyui_dir}/models/loras/Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors"
+        },
+        # Qwen 2.5 Text Encoder FP8
+        {
+            "url": "https://huggingface.co/Comfy-Org/HunyuanVideo_1.5_repackaged/resolve/main/split_files/text_encoders/qwen_2.5_vl_7b_fp8_scaled.safetensors",
+            "path": f"{comfyui_dir}/models/text_encoders/qwen_2.5_vl_7b_fp8_scaled.safetensors"
+        },
+        # Qwen Image VAE
+        {
+            "url": "https://huggingface.co/Comfy-Org/Qwen-Image_ComfyUI/resolve/main/split_files/vae/qwen_image_vae.safetensors",
+            "path": f"{comfyui_dir}/models/vae/qwen_image_vae.safetensors"
+        },
+        # ControlNet Union 2.1 (in controlnet folder)
+        {
+            "url": "https://huggingface.co/alibaba-pai/Z-Image-Turbo-Fun-Controlnet-Union-2.0/resolve/main/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors",
+            "path": f"{comfyui_dir}/models/controlnet/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors"
+        },
+        # ControlNet Union 2.1 (in model_patches folder)
+        {
+            "url": "https://huggingface.co/alibaba-pai/Z-Image-Turbo-Fun-Controlnet-Union-2.0/resolve/main/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors",
+            "path": f"{comfyui_dir}/models/model_patches/Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors"
+        },
+        # ControlNet Union Original (in model_patches folder) - Requested by User
+        {
+            "url": "https://huggingface.co/alibaba-pai/Z-Image-Turbo-Fun-Controlnet-Union/resolve/main/Z-Image-Turbo-Fun-Controlnet-Union.safetensors",
+            "path": f"{comfyui_dir}/models/model_patches/Z-Image-Turbo-Fun-Controlnet-Union.safetensors"
+        },
+        # Flux Model
+        {
+            "url": "https://huggingface.co/Comfy-Org/vae-text-encorder-for-flux-klein-4b/resolve/main/split_files/diffusion_models/flux-2-klein-4b.safetensors",
+            "path": f"{comfyui_dir}/models/diffusion_models/flux-2-klein-4b.safetensors"
+        },
+        # Flux VAE
+        {
+            "url": "https://huggingface.co/Comfy-Org/vae-text-encorder-for-flux-klein-4b/resolve/main/split_files/vae/flux2-vae.safetensors",
+            "path": f"{comfyui_dir}/models/vae/flux2-vae.safetensors"
+        },
+        # Qwen-Image-Edit-2511-Q5_K_M GGUF
+        {
+            "url": "https://huggingface.co/unsloth/Qwen-Image-Edit-2511-GGUF/resolve/main/qwen-image-edit-2511-Q5_K_M.gguf",
+            "path": f"{comfyui_dir}/models/unet/qwen-image-edit-2511-Q5_K_M.gguf"
+        },
+        # SDXL CivitAI Model
+        {
+            "url": "https://civitai.com/api/download/models/2043971",
+            "path": f"{comfyui_dir}/models/checkpoints/SDXL_v2043971.safetensors"
+        },
+        # Ultralytics Female Breast Detection
+        {
+            "url": "https://huggingface.co/ashllay/YOLO_Models/resolve/e07b01219ff1807e1885015f439d788b038f49bd/bbox/female-breast-v4.0-fantasy.pt",
+            "path": f"{comfyui_dir}/models/ultralytics/bbox/female-breast-v4.0-fantasy.pt"
+        },
+        # Ultralytics Female Body Detection
+        {
+            "url": "https://civitai.com/api/download/models/2056142",
+            "path": f"{comfyui_dir}/models/ultralytics/bbox/female-body-v2056142.pt"
+        }
+    ]
+
+
+    # LoRAs treinados: final + checkpoints intermediarios descobertos na
+    # listagem do repo (kythours/FERGIRL e privado)
+    if listings is None:
+        listings = load_listings(os.path.join(comfyui_dir, "models"))
+    for run in LORA_RUNS:
+        models_to_download += lora_checkpoints(run, listings.get(run_key(run)), comfyui_dir)
+
+    for model in models_to_download:
+        if os.path.basename(model["path"]) in CORE_FILES:
+            model["core"] = True
+    return models_to_download
+
+
+def core_models(catalog):
+    return [m for m in catalog if m.get("core")]
+
+
+def priority(model, comfyui_dir=COMFYUI_DIR):
+    """Prioridade de download (0 = core). Uma entrada pode forcar "priority"."""
+    if "priority" in model:
+        return model["priority"]
+    if model.get("core"):
+        return 0
+    rel = os.path.relpath(model["path"], os.path.join(comfyui_dir, "models"))
+    value = FOLDER_PRIORITY.get(rel.split(os.sep)[0], 5)
+    if INTERMEDIATE_STEP.search(model["path"]):
+        value += 3
+    return value
+
+
+def model_names(model, comfyui_dir=COMFYUI_DIR):
+    """
+    Nomes pelos quais um workflow pode referenciar o arquivo: o caminho
+    relativo a pasta do tipo (ex: "FERPHOTO/x.safetensors" em models/loras)
+    e o nome base.
+    """
+    path = model["path"]
+    names = {os.path.basename(path)}
+    models_dir = os.path.join(comfyui_dir, "models")
+    rel = os.path.relpath(path, models_dir)
+    if not rel.startswith(os.pardir):
+        parts = rel.split(os.sep)
+        if len(parts) > 1:
+            names.add("/".join(parts[1:]))
+    return names
+
+
+def index_by_name(catalog, comfyui_dir=COMFYUI_DIR):
+    """nome (relativo ou base) -> entrada do catalogo."""
+    index = {}
+    for model in catalog:
+        for name in model_names(model, comfyui_dir):
+            index.setdefault(name, model)
+    return index
@@ -0,0 +1,331 @@
+"""
+model_downloader.py
+===================
+Motor de download paralelo para os modelos do volume do ComfyUI.
+
+Substitui o loop serial de `wget` do comfyui_modal.py:
+  - Pool limitado de workers entre arquivos (varios arquivos ao mesmo tempo).
+  - Arquivos grandes (ex: qwen_3_4b.safetensors, z_image_turbo_bf16.safetensors)
+    sao divididos em segmentos HTTP Range baixados em varias conexoes.
+  - Limite global de conexoes simultaneas, compartilhado por todos os arquivos.
+  - Mantem o header `Authorization: Bearer <HF_TOKEN>` para o huggingface.co.
+  - Download vai para `<arquivo>.part` e e retomado com Range no proximo
+    start. O rename para o nome final so acontece quando o tamanho bate com o
+    Content-Length (e o sha256, se conhecido).
+
+Usa apenas a stdlib (urllib), entao pode ser testado contra qualquer servidor
+HTTP local que responda a requests com Range.
+
+USO:
+  downloader = ModelDownloader(hf_token=os.environ.get("HF_TOKEN", ""))
+  results = downloader.download_all([{"url": ..., "path": ...}, ...])
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MB = 1024 * 1024
+
+# Concorrencia (pode ser ajustada via env no Modal)
+MAX_PARALLEL_FILES = int(os.environ.get("DOWNLOAD_MAX_FILES", "4"))
+CONNECTIONS_PER_FILE = int(os.environ.get("DOWNLOAD_CONNECTIONS_PER_FILE", "8"))
+MAX_CONNECTIONS = int(os.environ.get("DOWNLOAD_MAX_CONNECTIONS", "16"))
+
+MIN_SPLIT_SIZE = 64 * MB   # Abaixo disso, uma conexao so ja basta
+READ_CHUNK = 1 * MB
+REQUEST_TIMEOUT = 60       # segundos sem dados antes de desistir da conexao
+SEGMENT_RETRIES = 3
+STATE_FLUSH_BYTES = 32 * MB  # frequencia de gravacao do progresso (.part.json)
+USER_AGENT = "kythours-comfyui-downloader/1.0"
+
+
+class DownloadError(Exception):
+    """Falha definitiva ao baixar um arquivo (apos as tentativas)."""
+
+
+def _build_headers(url, hf_token, extra=None):
+    headers = {"User-Agent": USER_AGENT}
+    # Token HF para repos privados (mesma regra do wget antigo)
+    if hf_token and "huggingface.co" in url:
+        headers["Authorization"] = f"Bearer {hf_token}"
+    if extra:
+        headers.update(extra)
+    return headers
+
+
+def _parse_total(content_range):
+    # "bytes 0-0/123456" -> 123456 ("*" = tamanho desconhecido)
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * MB), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remove_partial(tmp_path):
+    for path in (tmp_path, tmp_path + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class _PartState:
+    """
+    Progresso de um `.part`: lista de segmentos [inicio, fim, posicao]
+    gravada em `.part.json` para permitir retomar apos o container morrer.
+    O `.part` (data_path) recebe fsync antes de cada gravacao do JSON, entao
+    o offset salvo nunca passa do que ja esta no disco.
+    """
+
+    def __init__(self, path, total, etag, segments, data_path=None):
+        self.path = path
+        self.data_path = data_path
+        self.total = total
+        self.etag = etag
+        self.segments = segments
+        self._lock = threading.Lock()       # segments / _unsaved
+        self._save_lock = threading.Lock()  # um save por vez (fsync fora do _lock)
+        self._unsaved = 0
+
+    @classmethod
+    def load(cls, path, total, etag, data_path=None):
+        """Retorna o estado salvo, ou None se nao existir ou o remoto mudou."""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("total") != total:
+            return None
+        if etag and data.get("etag") and data["etag"] != etag:
+            return None
+        return cls(path, total, etag, [list(seg) for seg in data["segments"]], data_path)
+
+    def done(self):
+        return sum(pos - start for start, _, pos in self.segments)
+
+    def advance(self, index, pos):
+        with self._lock:
+            self._unsaved += pos - self.segments[index][2]
+            self.segments[index][2] = pos
+            if self._unsaved < STATE_FLUSH_BYTES:
+                return
+        self.save()
+
+    def save(self):
+        with self._save_lock:
+            # Posicoes antes do fsync: tudo ate elas ja foi escrito (write + flush)
+            with self._lock:
+                data = {"total": self.total, "etag": self.etag, "segments": [list(seg) for seg in self.segments]}
+                self._unsaved = 0
+            if self.data_path and os.path.exists(self.data_path):
+                fd = os.open(self.data_path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+
+class ModelDownloader:
+    """
+    Baixa listas de modelos ({"url", "path"}) em paralelo.
+
+    max_files:            quantos arquivos sao baixados ao mesmo tempo.
+    connections_per_file: maximo de segmentos Range por arquivo.
+    max_connections:      teto global de conexoes HTTP abertas.
+    """
+
+    def __init__(
+        self,
+        hf_token="",
+        max_files=MAX_PARALLEL_FILES,
+        connections_per_file=CONNECTIONS_PER_FILE,
+        max_connections=MAX_CONNECTIONS,
+        min_split_size=MIN_SPLIT_SIZE,
+    ):
+        self.hf_token = hf_token or ""
+        self.max_files = max(1, max_files)
+        self.connections_per_file = max(1, connections_per_file)
+        self.min_split_size = min_split_size
+        self._connections = threading.BoundedSemaphore(max(1, max_connections))
+        self._print_lock = threading.Lock()
+        self._active = {}  # dest -> _PartState dos downloads em andamento
+
+    def _log(self, msg):
+        with self._print_lock:
+            print(msg, flush=True)
+
+    def progress(self):
+        """{dest: (bytes_baixados, total)} dos downloads com Range em andamento."""
+        return {dest: (state.done(), state.total) for dest, state in list(self._active.items())}
+
+    def _open(self, url, extra_headers=None):
+        req = urllib.request.Request(url, headers=_build_headers(url, self.hf_token, extra_headers))
+        return urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT)
+
+    # ------------------------------------------------------------------
+    # Probe: descobre URL final (apos redirects), tamanho, ETag e suporte a Range
+    # ------------------------------------------------------------------
+    def _probe(self, url):
+        resp = self._open(url, {"Range": "bytes=0-0"})
+        final_url = resp.geturl()
+        etag = resp.headers.get("ETag")
+        if resp.status == 206:
+            total = _parse_total(resp.headers.get("Content-Range"))
+            resp.close()
+            if total is not None:
+                return final_url, total, True, etag
+            return final_url, None, False, etag
+        # Servidor ignorou o Range (200): tamanho vem do Content-Length
+        length = resp.headers.get("Content-Length")
+        resp.close()
+        return final_url, int(length) if length and length.isdigit() else None, False, etag
+
+    # ------------------------------------------------------------------
+    # Transferencias
+    # ------------------------------------------------------------------
+    def _fetch_range(self, url, tmp_path, state, index):
+        """Baixa o segmento `index` do state para a mesma posicao em tmp_path."""
+        start, end, pos = state.segments[index]
+        last_error = None
+        for _ in range(SEGMENT_RETRIES):
+            try:
+                with self._connections:
+                    with self._open(url, {"Range": f"bytes={pos}-{end}"}) as resp:
+                        if resp.status != 206:
+                            raise DownloadError(f"servidor respondeu {resp.status} para Range")
+                        with open(tmp_path, "r+b") as f:
+                            f.seek(pos)
+                            while pos <= end:
+                                chunk = resp.read(min(READ_CHUNK, end - pos + 1))
+                                if not chunk:
+                                    break
+                                f.write(chunk)
+                                f.flush()  # no SO antes de contar no state (save faz o fsync)
+                                pos += len(chunk)
+                                state.advance(index, pos)
+                if pos > end:
+                    return
+                last_error = DownloadError(f"segmento truncado em {pos}/{end + 1}")
+            except (OSError, urllib.error.URLError) as e:
+                last_error = e
+        raise DownloadError(f"segmento {start}-{end} falhou: {last_error}")
+
+    def _fetch_stream(self, url, tmp_path):
+        """Download em uma conexao so (servidor sem Range: nao da para retomar)."""
+        written = 0
+        with self._connections:
+            with self._open(url) as resp, open(tmp_path, "wb") as f:
+                while True:
+                    chunk = resp.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    written += len(chunk)
+        return written
+
+    def _segments(self, total):
+        count = min(self.connections_per_file, max(1, total // self.min_split_size))
+        size = -(-total // count)  # ceil
+        return [[s, min(s + size, total) - 1, s] for s in range(0, total, size)]
+
+    def download(self, url, dest, sha256=None, name=None):
+        """
+        Baixa url -> dest. Retorna dict com status, bytes e segundos.
+
+        O conteudo vai para `dest.part` (progresso em `dest.part.json`) e so e
+        renomeado para `dest` quando o tamanho bate com o do servidor (e o
+        sha256, se informado). Se falhar, o .part fica e e retomado com Range
+        na proxima chamada. `name` so muda o nome usado nos logs.
+        """
+        name = name or os.path.basename(dest)
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp_path = dest + ".part"
+        state_path = tmp_path + ".json"
+        started = time.monotonic()
+        resumed = 0
+        state = None
+        try:
+            with self._connections:
+                final_url, total, ranged, etag = self._probe(url)
+
+            if ranged and total:
+                if os.path.exists(tmp_path):
+                    state = _PartState.load(state_path, total, etag, tmp_path)
+                if state:
+                    resumed = state.done()
+                    self._log(f"[INFO] Retomando {name} ({resumed / MB:.0f}/{total / MB:.0f} MB)...")
+                else:
+                    state = _PartState(state_path, total, etag, self._segments(total), tmp_path)
+                    with open(tmp_path, "wb") as f:
+                        f.truncate(total)
+                    state.save()
+                    self._log(f"[INFO] Baixando {name} ({total / MB:.0f} MB, {len(state.segments)} conexoes)...")
+                pending = [i for i, (_, end, pos) in enumerate(state.segments) if pos <= end]
+                self._active[dest] = state
+                try:
+                    with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+                        futures = [pool.submit(self._fetch_range, final_url, tmp_path, state, i) for i in pending]
+                        for fut in as_completed(futures):
+                            fut.result()
+                finally:
+                    self._active.pop(dest, None)
+                    state.save()
+            else:
+                # Sem Range nao existe retomada: recomeca do zero
+                _remove_partial(tmp_path)
+                self._log(f"[INFO] Baixando {name}...")
+                self._fetch_stream(final_url, tmp_path)
+
+            size = os.path.getsize(tmp_path)
+            if total is not None and size != total:
+                raise DownloadError(f"tamanho {size} difere do Content-Length {total}")
+            if sha256 and _sha256_file(tmp_path) != sha256.lower():
+                _remove_partial(tmp_path)
+                raise DownloadError("checksum sha256 nao confere (parcial descartado)")
+
+            # Rename atomico: ComfyUI nunca ve um arquivo pela metade
+            os.replace(tmp_path, dest)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+        except (DownloadError, OSError, urllib.error.URLError) as e:
+            kept = " (parcial mantido para retomar)" if os.path.exists(state_path) else ""
+            if not kept and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._log(f"[ERRO] {name}: {e}{kept}")
+            return {"name": name, "path": dest, "status": "failed", "bytes": 0, "resumed": resumed,
+                    "seconds": time.monotonic() - started, "error": str(e)}
+
+        written = size - resumed
+        seconds = time.monotonic() - started
+        rate = written / MB / seconds if seconds > 0 else 0.0
+        self._log(f"[OK] {name} baixado! ({size / MB:.1f} MB em {seconds:.1f}s, {rate:.1f} MB/s)")
+        return {"name": name, "path": dest, "status": "ok", "bytes": written, "resumed": resumed,
+                "seconds": seconds, "sha256": sha256.lower() if sha256 else None, "etag": etag}
+
+    def download_all(self, models):
+        """Baixa uma lista de {"url", "path"[, "sha256", "name"]} com no maximo `max_files` em paralelo."""
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_files) as pool:
+            futures = [pool.submit(self.download, m["url"], m["path"], m.get("sha256"), m.get("name")) for m in models]
+            for fut in as_completed(futures):
+                results.append(fut.result())
+        return results
@@ -0,0 +1,412 @@
+"""
+model_staging.py
+================
+Copia local (disco do container) dos modelos mais usados do volume.
+
+Todo load de modelo le direto do volume `comfyui-storage` (rede). Um
+z_image_turbo_bf16.safetensors de 6 GB ou o text encoder de 7 GB demoram bem
+mais para carregar do volume do que do disco local, e isso se repete a cada
+troca de modelo. O staging:
+  - Escolhe um "hot set" pelo uso recente (`<volume>/.kythours_usage.json`,
+    atualizado a cada prompt executado) ou, sem historico, o core do catalogo.
+  - Copia em background, um arquivo por vez, com leituras sequenciais grandes
+    (COPY_CHUNK) para `STAGING_DIR/<mesmo caminho relativo>.part` e faz rename
+    so quando a copia esta completa.
+  - O ComfyUI sobe por `python -m model_staging --launch ...`: o
+    folder_paths.get_full_path devolve a copia local quando ela existe e o
+    caminho do volume quando nao (ainda nao copiada ou removida). As pastas
+    padrao continuam sendo as do volume: listagens e tudo que grava modelos
+    (ComfyUI-Manager, nodes que baixam pesos) vao para o volume, nao para o
+    disco efemero.
+  - So entra no staging arquivo de modelo (MODEL_EXTENSIONS) dentro de
+    models/; o resto do catalogo (workflows em user/) fica de fora.
+  - Eviction LRU (pelo ultimo uso) para caber no disco livre menos
+    STAGING_RESERVE_GB (e em STAGING_MAX_GB, se definido).
+  - Modelos de prompts executados (polling do /history) sao marcados como
+    usados e entram na fila se ainda nao estao no disco local. Hit = o
+    arquivo ja estava copiado quando o prompt comecou a executar.
+
+USO:
+  staging = ModelStaging(f"{COMFYUI_DIR}/models")
+  cmd = staging.launch_command(["--listen", "0.0.0.0", "--port", "8188"])  # em vez de main.py
+  staging.start(staging.hot_set(core))     # copia em background
+  staging.watch_history(client)            # thread: uso, hit/miss, novos stages
+  staging.stats()
+
+  python -m model_staging --models-dir /root/ComfyUI/models --staging-dir /tmp/s [rel ...]
+  cd /root/ComfyUI && python -m model_staging --models-dir models --staging-dir /tmp/s --launch --port 8188
+"""
+
+import argparse
+import json
+import os
+import runpy
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+
+from compile_cache import CACHE_DIRNAME
+from lazy_models import workflow_model_refs
+from model_downloader import MB
+from volume_manifest import MODEL_EXTENSIONS
+
+STAGING_DIR = os.environ.get("STAGING_DIR", "/root/.kythours_staging")
+STAGING_MAX_GB = float(os.environ.get("STAGING_MAX_GB", "0"))       # 0 = so o disco livre limita
+STAGING_RESERVE_GB = float(os.environ.get("STAGING_RESERVE_GB", "20"))
+STAGING_HOT_FILES = int(os.environ.get("STAGING_HOT_FILES", "8"))
+USAGE_NAME = ".kythours_usage.json"
+COPY_CHUNK = 64 * MB
+HISTORY_POLL = 15  # segundos entre leituras do /history
+INDEX_TTL = 5 * 60  # segundos ate reler a lista de modelos do volume
+
+
+def model_files(models_dir):
+    """Caminhos relativos de todos os modelos do volume (sem pastas internas)."""
+    rels = []
+    for root, dirs, files in os.walk(models_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".") and d != CACHE_DIRNAME]
+        for name in files:
+            if name.endswith(MODEL_EXTENSIONS):
+                rels.append(os.path.relpath(os.path.join(root, name), models_dir))
+    return rels
+
+
+def name_index(rels):
+    """Nome usado num workflow ("FER/x.safetensors" ou "x.safetensors") -> caminho relativo ao volume."""
+    index = {}
+    for rel in rels:
+        parts = rel.split(os.sep)
+        index.setdefault("/".join(parts[1:]), rel)
+        index.setdefault(parts[-1], rel)
+    return index
+
+
+def resolve_refs(index, refs):
+    """Refs de um workflow (lazy_models.workflow_model_refs) -> caminhos relativos conhecidos."""
+    return sorted({index.get(ref) or index.get(os.path.basename(ref)) for ref in refs} - {None})
+
+
+def stageable(rel):
+    """Arquivo de modelo dentro de models/ (nada absoluto, com "..", ou fora de MODEL_EXTENSIONS)."""
+    rel = os.path.normpath(rel)
+    return not os.path.isabs(rel) and rel.split(os.sep)[0] != ".." and rel.endswith(MODEL_EXTENSIONS)
+
+
+def launch(models_dir, staging_dir, argv):
+    """
+    Roda o main.py do ComfyUI (pasta atual) com get_full_path preferindo a
+    copia local. Nao volta (o ComfyUI roda ate o processo acabar).
+    """
+    sys.argv = ["main.py", *argv]
+    sys.path.insert(0, os.getcwd())
+    # Mesma ordem do main.py: cli_args so le o argv com o parsing habilitado
+    import comfy.options
+    comfy.options.enable_args_parsing()
+    import folder_paths
+
+    models_dir, staging_dir = os.path.abspath(models_dir), os.path.abspath(staging_dir)
+    original = folder_paths.get_full_path
+
+    def get_full_path(folder_name, filename):
+        path = original(folder_name, filename)
+        if path:
+            rel = os.path.relpath(path, models_dir)
+            local = os.path.join(staging_dir, rel)
+            if stageable(rel) and os.path.isfile(local):
+                return local
+        return path
+
+    folder_paths.get_full_path = get_full_path
+    runpy.run_path("main.py", run_name="__main__")
+
+
+def _exec_started(entry):
+    """Timestamp (s) do inicio da execucao de uma entrada do /history, ou None."""
+    for kind, data in entry.get("status", {}).get("messages", []):
+        if kind == "execution_start" and "timestamp" in data:
+            return data["timestamp"] / 1000
+    return None
+
+
+class ModelStaging:
+    """
+    models_dir:  pasta dos modelos no volume.
+    staging_dir: pasta no disco local do container.
+    max_bytes:   teto opcional das copias locais (0 = so o disco livre).
+    reserve_bytes: espaco que sempre fica livre no disco local.
+    persist_usage: grava o uso no volume; False em quem so le o volume (backends do roteador).
+    """
+
+    def __init__(self, models_dir, staging_dir=STAGING_DIR, max_bytes=int(STAGING_MAX_GB * 1024 * MB),
+                 reserve_bytes=int(STAGING_RESERVE_GB * 1024 * MB), persist_usage=True):
+        self.models_dir = models_dir
+        self.persist_usage = persist_usage
+        self.staging_dir = staging_dir
+        self.max_bytes = max_bytes
+        self.reserve_bytes = reserve_bytes
+        self.usage_path = os.path.join(models_dir, USAGE_NAME)
+        self.usage = self._load_usage()
+        self.staged = {}  # rel -> (bytes, time.time() do fim da copia)
+        self._queue = deque()
+        self._queued = set()
+        self._active = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._seen = set()  # prompt_ids do /history ja contabilizados
+        self._index, self._index_at = None, 0.0
+        self.on_idle = None
+        self.counters = {"hits": 0, "misses": 0, "copied": 0, "copied_bytes": 0, "copy_seconds": 0.0,
+                         "evicted": 0, "evicted_bytes": 0, "failed": 0, "skipped": 0}
+        os.makedirs(staging_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Uso (persistido no volume)
+    # ------------------------------------------------------------------
+    def _load_usage(self):
+        try:
+            with open(self.usage_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_usage(self):
+        if not self.persist_usage:
+            return
+        tmp = self.usage_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.usage, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.usage_path)
+
+    def touch(self, rels, when=None):
+        """Marca modelos como usados (ordem do LRU e do hot set)."""
+        when = when or time.time()
+        with self._cond:
+            for rel in rels:
+                entry = self.usage.setdefault(rel, {"count": 0})
+                entry["count"] += 1
+                entry["last_used"] = max(when, entry.get("last_used", 0))
+            self._save_usage()
+
+    def hot_set(self, fallback=(), limit=STAGING_HOT_FILES):
+        """Os `limit` modelos usados mais recentemente (ou `fallback`, relativos ao volume)."""
+        def usable(rel):
+            return stageable(rel) and os.path.isfile(os.path.join(self.models_dir, rel))
+
+        existing = [rel for rel in self.usage if usable(rel)]
+        existing.sort(key=lambda rel: self.usage[rel].get("last_used", 0), reverse=True)
+        return existing[:limit] or [rel for rel in fallback if usable(rel)][:limit]
+
+    # ------------------------------------------------------------------
+    # ComfyUI
+    # ------------------------------------------------------------------
+    def local_path(self, rel):
+        return os.path.join(self.staging_dir, rel)
+
+    def launch_command(self, comfy_args):
+        """Comando (cwd = pasta do ComfyUI) que sobe o main.py lendo as copias locais primeiro."""
+        return ["python", "-m", "model_staging", "--models-dir", self.models_dir,
+                "--staging-dir", self.staging_dir, "--launch", *comfy_args]
+
+    # ------------------------------------------------------------------
+    # Copia
+    # ------------------------------------------------------------------
+    def _staged_bytes(self):
+        with self._cond:
+            return sum(size for size, _ in self.staged.values())
+
+    def _make_room(self, size, keep):
+        """Remove copias menos usadas ate `size` caber. Retorna False se nao couber."""
+        while True:
+            free = shutil.disk_usage(self.staging_dir).free - self.reserve_bytes
+            fits = size <= free and (not self.max_bytes or self._staged_bytes() + size <= self.max_bytes)
+            if fits:
+                return True
+            with self._cond:
+                staged = [rel for rel in self.staged if rel != keep]
+            victims = sorted(staged,
+                             key=lambda rel: self.usage.get(rel, {}).get("last_used", 0))
+            if not victims:
+                return False
+            self.evict(victims[0])
+
+    def evict(self, rel):
+        """Remove a copia local (o ComfyUI volta a ler do volume)."""
+        with self._cond:
+            size, _ = self.staged.pop(rel, (0, None))
+        try:
+            os.remove(self.local_path(rel))
+        except FileNotFoundError:
+            pass
+        self.counters["evicted"] += 1
+        self.counters["evicted_bytes"] += size
+        print(f"[STAGING] Removido do disco local: {rel} ({size / MB:.0f} MB)", flush=True)
+
+    def _copy(self, rel):
+        src, dest = os.path.join(self.models_dir, rel), self.local_path(rel)
+        size = os.path.getsize(src)
+        if not self._make_room(size, rel):
+            self.counters["skipped"] += 1
+            print(f"[STAGING] Sem espaco local para {rel} ({size / MB:.0f} MB)", flush=True)
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".part"
+        started = time.monotonic()
+        buf = bytearray(COPY_CHUNK)
+        view = memoryview(buf)
+        with open(src, "rb", buffering=0) as fin, open(tmp, "wb", buffering=0) as fout:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fin.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            while True:
+                n = fin.readinto(buf)
+                if not n:
+                    break
+                fout.write(view[:n])
+        copied = os.path.getsize(tmp)
+        if copied != size:
+            os.remove(tmp)
+            raise OSError(f"copia truncada ({copied}/{size} bytes)")
+        os.replace(tmp, dest)
+        seconds = time.monotonic() - started
+        with self._cond:
+            self.staged[rel] = (size, time.time())
+        self.counters["copied"] += 1
+        self.counters["copied_bytes"] += size
+        self.counters["copy_seconds"] += seconds
+        rate = size / MB / seconds if seconds > 0 else 0.0
+        print(f"[STAGING] {rel} no disco local ({size / MB:.0f} MB em {seconds:.1f}s, {rate:.0f} MB/s)", flush=True)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    if self.on_idle:
+                        threading.Thread(target=self.on_idle, args=(self.stats(),), daemon=True).start()
+                    self._cond.wait()
+                rel = self._queue.popleft()
+                self._queued.discard(rel)
+                self._active = rel
+            try:
+                if rel not in self.staged:
+                    self._copy(rel)
+            except OSError as e:
+                self.counters["failed"] += 1
+                print(f"[STAGING] Falha ao copiar {rel}: {e}", flush=True)
+            finally:
+                with self._cond:
+                    self._active = None
+
+    def stage(self, rels):
+        """Coloca modelos (relativos ao volume) na fila de copia."""
+        with self._cond:
+            for rel in rels:
+                if not stageable(rel):
+                    continue
+                if rel not in self.staged and rel not in self._queued and rel != self._active:
+                    self._queue.append(rel)
+                    self._queued.add(rel)
+            self._cond.notify()
+
+    def start(self, rels=()):
+        """Limpa copias incompletas, adota as completas e comeca a copiar `rels`."""
+        for rel in model_files(self.staging_dir):
+            src = os.path.join(self.models_dir, rel)
+            local = self.local_path(rel)
+            if os.path.isfile(src) and os.path.getsize(src) == os.path.getsize(local):
+                self.staged[rel] = (os.path.getsize(local), os.path.getmtime(local))
+            else:
+                os.remove(local)
+        for root, _, files in os.walk(self.staging_dir):
+            for name in files:
+                if name.endswith(".part"):
+                    os.remove(os.path.join(root, name))
+        self.stage(rels)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, daemon=True)
+            self._thread.start()
+        if rels:
+            print(f"[STAGING] Hot set: {len(rels)} arquivo(s) -> {self.staging_dir}", flush=True)
+        return self
+
+    # ------------------------------------------------------------------
+    # Uso pelo ComfyUI (hit/miss)
+    # ------------------------------------------------------------------
+    def resolve(self, refs):
+        """Nomes usados num workflow -> caminhos relativos ao volume."""
+        if self._index is None or time.monotonic() - self._index_at > INDEX_TTL:
+            self._index, self._index_at = name_index(model_files(self.models_dir)), time.monotonic()
+        return resolve_refs(self._index, refs)
+
+    def observe(self, prompt, started=None):
+        """Contabiliza hit/miss dos modelos de um prompt executado e agenda os misses."""
+        rels = self.resolve(workflow_model_refs(prompt))
+        if not rels:
+            return
+        started = started or time.time()
+        misses = []
+        with self._cond:
+            for rel in rels:
+                staged = self.staged.get(rel)
+                if staged and staged[1] <= started:
+                    self.counters["hits"] += 1
+                else:
+                    self.counters["misses"] += 1
+                    misses.append(rel)
+        self.touch(rels, started)
+        self.stage(misses)
+
+    def watch_history(self, client, interval=HISTORY_POLL):
+        """Loop (rodar em thread): le o /history e chama observe para cada prompt novo."""
+        while True:
+            try:
+                history = client.history() or {}
+            except Exception as e:
+                print(f"[STAGING] /history indisponivel: {e}", flush=True)
+                history = {}
+            for prompt_id, entry in history.items():
+                if prompt_id in self._seen:
+                    continue
+                self._seen.add(prompt_id)
+                prompt = entry.get("prompt", [None, None, None])[2]
+                self.observe(prompt, _exec_started(entry))
+            time.sleep(interval)
+
+    def stats(self):
+        c = dict(self.counters)
+        lookups = c["hits"] + c["misses"]
+        c["copy_seconds"] = round(c["copy_seconds"], 3)
+        c["mb_per_s"] = round(c["copied_bytes"] / MB / c["copy_seconds"], 1) if c["copy_seconds"] else None
+        c["hit_rate"] = round(c["hits"] / lookups, 3) if lookups else None
+        c["staged_files"] = len(self.staged)
+        c["staged_bytes"] = self._staged_bytes()
+        c["pending"] = len(self._queue) + (self._active is not None)
+        return c
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Copia modelos do volume para o disco local.")
+    parser.add_argument("--models-dir", default="/root/ComfyUI/models")
+    parser.add_argument("--staging-dir", default=STAGING_DIR)
+    parser.add_argument("--max-gb", type=float, default=STAGING_MAX_GB)
+    parser.add_argument("--reserve-gb", type=float, default=STAGING_RESERVE_GB)
+    parser.add_argument("rels", nargs="*", help="modelos relativos ao volume (padrao: hot set)")
+    parser.add_argument("--launch", nargs=argparse.REMAINDER,
+                        help="roda o main.py da pasta atual com estes argumentos (copias locais primeiro)")
+    args = parser.parse_args(argv)
+
+    if args.launch is not None:
+        return launch(args.models_dir, args.staging_dir, args.launch)
+
+    staging = ModelStaging(args.models_dir, args.staging_dir, int(args.max_gb * 1024 * MB),
+                           int(args.reserve_gb * 1024 * MB))
+    done = threading.Event()
+    staging.on_idle = lambda stats: done.set()
+    staging.start(args.rels or staging.hot_set())
+    done.wait()
+    print(json.dumps(staging.stats(), indent=1))
+    return 1 if staging.counters["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
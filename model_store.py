@@ -0,0 +1,142 @@
+"""
+model_store.py
+==============
+Store enderecado por URL para os modelos do volume do ComfyUI.
+
+Alguns arquivos aparecem em mais de uma pasta do ComfyUI (ex:
+Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors em models/controlnet e
+models/model_patches). Em vez de baixar cada copia:
+  - Cada URL e baixada uma vez so para `<volume>/.blobs/<xx>/<sha256(url)>`
+    (o `.part` tambem fica la, entao a retomada continua funcionando).
+  - Cada caminho visivel ao ComfyUI vira um hardlink para o blob (ou symlink
+    relativo, se o volume nao suportar hardlink).
+  - Arquivos que ja existiam no volume sao "adotados": movidos para o blob e
+    religados, o que tambem desfaz duplicatas antigas.
+
+Adicionar um novo alias de um arquivo ja baixado e so criar um link.
+
+USO:
+  store = ModelStore(f"{COMFYUI_DIR}/models")
+  results = store.download_all(downloader, [{"url": ..., "path": ...}, ...])
+"""
+
+import hashlib
+import os
+
+BLOBS_DIR = ".blobs"
+
+
+def _same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+class ModelStore:
+    """
+    root: pasta dos modelos (o volume). Os blobs ficam em `<root>/.blobs`.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.blobs = os.path.join(root, BLOBS_DIR)
+
+    def blob_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.blobs, key[:2], key)
+
+    def _link(self, blob, dest):
+        """Substitui dest por um link para o blob (rename atomico)."""
+        os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+        tmp = dest + ".link"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(blob, tmp)
+        except OSError:
+            # Volume sem hardlink (ou outro device): symlink relativo
+            os.symlink(os.path.relpath(blob, os.path.dirname(dest)), tmp)
+        os.replace(tmp, dest)
+
+    def materialize(self, model):
+        """Se o blob da URL ja existe, liga o caminho a ele. Retorna True se ligou."""
+        blob = self.blob_path(model["url"])
+        if not os.path.exists(blob):
+            return False
+        if not _same_file(blob, model["path"]):
+            self._link(blob, model["path"])
+        return True
+
+    def _blob_for(self, path):
+        if os.path.islink(path):
+            target = os.path.realpath(path)
+            return target if target.startswith(os.path.realpath(self.blobs) + os.sep) else None
+        if os.stat(path).st_nlink < 2 or not os.path.isdir(self.blobs):
+            return None
+        for shard in os.scandir(self.blobs):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if _same_file(entry.path, path):
+                        return entry.path
+        return None
+
+    def remove(self, path):
+        """Remove um arquivo invalido e o blob por tras dele (para nao religar)."""
+        blob = self._blob_for(path)
+        os.remove(path)
+        if blob and os.path.exists(blob):
+            os.remove(blob)
+
+    def adopt(self, model):
+        """
+        Traz um arquivo ja existente em `path` para o store.
+
+        Sem blob: o arquivo vira o blob e o caminho e religado. Com blob de
+        mesmo tamanho: a copia duplicada e trocada por um link.
+        """
+        dest, blob = model["path"], self.blob_path(model["url"])
+        if os.path.islink(dest) or _same_file(blob, dest):
+            return
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            os.replace(dest, blob)
+            self._link(blob, dest)
+        elif os.path.getsize(blob) == os.path.getsize(dest):
+            self._link(blob, dest)
+
+    def download_all(self, downloader, models):
+        """
+        Baixa cada URL distinta uma vez (para o blob) e liga todos os caminhos.
+
+        Retorna um resultado do ModelDownloader por modelo pedido, com
+        "path"/"name" do caminho visivel ao ComfyUI e "linked": True para os
+        que reaproveitaram um blob. Modelos com "refresh": True sao baixados
+        de novo: o blob novo substitui o antigo (rename) e os links sao
+        trocados, sem o ComfyUI ver arquivo pela metade.
+        """
+        results = []
+        by_url = {}
+        for model in models:
+            # "refresh": o remoto mudou; baixa de novo mesmo com blob existente
+            if not model.get("refresh") and self.materialize(model):
+                results.append({"name": os.path.basename(model["path"]), "path": model["path"],
+                                "status": "ok", "bytes": 0, "resumed": 0, "seconds": 0.0,
+                                "blob": self.blob_path(model["url"]), "linked": True})
+            else:
+                by_url.setdefault(model["url"], []).append(model)
+
+        jobs = [{"url": url, "path": self.blob_path(url), "sha256": group[0].get("sha256"),
+                 "name": os.path.basename(group[0]["path"])}
+                for url, group in by_url.items()]
+        for result in downloader.download_all(jobs):
+            group = by_url[next(j["url"] for j in jobs if j["path"] == result["path"])]
+            for i, model in enumerate(group):
+                linked = result["status"] == "ok"
+                if linked:
+                    self._link(result["path"], model["path"])
+                # Aliases nao contam bytes de novo: o download foi um so
+                results.append(dict(result, name=os.path.basename(model["path"]), path=model["path"],
+                                    blob=result["path"], linked=linked and i > 0,
+                                    bytes=result["bytes"] if i == 0 else 0))
+        return results
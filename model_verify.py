@@ -0,0 +1,250 @@
+"""
+model_verify.py
+===============
+Verificador de integridade por formato, lendo so header e cauda dos arquivos.
+
+  - .safetensors: header JSON valido e o fim do ultimo tensor (data_offsets)
+    tem que bater exatamente com o tamanho do arquivo. Pega truncamento que
+    um `safe_open` (que so le o header) nao percebe.
+  - .gguf: magic, versao, metadados e tensor infos; o fim do maior tensor
+    (offset + tamanho pelo tipo ggml) tem que caber no arquivo.
+  - .pt/.pth/.ckpt (torch zip): central directory do zip (EOCD na cauda) e
+    cada entrada dentro do arquivo. Pickles legados (nao-zip) so tem o
+    cabecalho conferido.
+
+Roda em pool de threads (I/O de rede do volume) e funciona tanto no start
+(volume_sync) quanto como comando:
+
+  python -m model_verify /root/ComfyUI/models --workers 16 [--delete]
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Mudar as verificacoes? Incremente: o manifesto do volume e reconstruido
+VERIFY_VERSION = 1
+VERIFY_WORKERS = int(os.environ.get("VERIFY_WORKERS", "8"))
+MAX_SAFETENSORS_HEADER = 100 * 1024 * 1024
+GGUF_MAGIC = b"GGUF"
+GGUF_DEFAULT_ALIGNMENT = 32
+
+# ggml type -> (elementos por bloco, bytes por bloco)
+GGML_TYPE_SIZES = {
+    0: (1, 4), 1: (1, 2), 2: (32, 18), 3: (32, 20), 6: (32, 22), 7: (32, 24),
+    8: (32, 34), 9: (32, 36), 10: (256, 84), 11: (256, 110), 12: (256, 144),
+    13: (256, 176), 14: (256, 210), 15: (256, 292), 16: (256, 66), 17: (256, 74),
+    18: (256, 98), 19: (256, 50), 20: (32, 18), 21: (256, 110), 22: (256, 82),
+    23: (256, 136), 24: (1, 1), 25: (1, 2), 26: (1, 4), 27: (1, 8), 28: (1, 8),
+    29: (256, 56), 30: (1, 2), 34: (256, 54), 35: (256, 66),
+}
+
+# Tipos de valor dos metadados GGUF -> tamanho fixo (None = string/array)
+_GGUF_SCALARS = {0: 1, 1: 1, 2: 2, 3: 2, 4: 4, 5: 4, 6: 4, 7: 1, 10: 8, 11: 8, 12: 8}
+_GGUF_STRING, _GGUF_ARRAY = 8, 9
+
+
+class VerifyError(Exception):
+    pass
+
+
+def _read_exact(f, n):
+    data = f.read(n)
+    if len(data) != n:
+        raise VerifyError("header truncado")
+    return data
+
+
+# --------------------------------------------------------------------------
+# safetensors
+# --------------------------------------------------------------------------
+def verify_safetensors(path, size):
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", _read_exact(f, 8))
+        if header_len == 0 or header_len > min(MAX_SAFETENSORS_HEADER, size - 8):
+            raise VerifyError(f"tamanho de header invalido ({header_len})")
+        try:
+            header = json.loads(_read_exact(f, header_len))
+        except ValueError as e:
+            raise VerifyError(f"header JSON invalido: {e}")
+    end = 0
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        start, stop = info["data_offsets"]
+        if not 0 <= start <= stop:
+            raise VerifyError(f"data_offsets invalidos em {name}")
+        end = max(end, stop)
+    expected = 8 + header_len + end
+    if expected != size:
+        kind = "truncado" if expected > size else "com bytes sobrando"
+        raise VerifyError(f"{kind} ({size} bytes, header indica {expected})")
+
+
+# --------------------------------------------------------------------------
+# GGUF
+# --------------------------------------------------------------------------
+class _GGUFReader:
+    def __init__(self, f, version):
+        self.f = f
+        self.version = version
+
+    def u32(self):
+        return struct.unpack("<I", _read_exact(self.f, 4))[0]
+
+    def u64(self):
+        return struct.unpack("<Q", _read_exact(self.f, 8))[0]
+
+    def count(self):
+        # GGUF v1 usava uint32 para contagens e tamanhos de string
+        return self.u32() if self.version == 1 else self.u64()
+
+    def string(self):
+        return _read_exact(self.f, self.count())
+
+    def skip_value(self, vtype):
+        if vtype in _GGUF_SCALARS:
+            _read_exact(self.f, _GGUF_SCALARS[vtype])
+        elif vtype == _GGUF_STRING:
+            self.f.seek(self.count(), os.SEEK_CUR)
+        elif vtype == _GGUF_ARRAY:
+            item_type, n = self.u32(), self.count()
+            if item_type in _GGUF_SCALARS:
+                self.f.seek(_GGUF_SCALARS[item_type] * n, os.SEEK_CUR)
+            else:
+                for _ in range(n):
+                    self.skip_value(item_type)
+        else:
+            raise VerifyError(f"tipo de metadado desconhecido ({vtype})")
+
+
+def verify_gguf(path, size):
+    with open(path, "rb") as f:
+        if _read_exact(f, 4) != GGUF_MAGIC:
+            raise VerifyError("magic GGUF ausente")
+        version = struct.unpack("<I", _read_exact(f, 4))[0]
+        if version not in (1, 2, 3):
+            raise VerifyError(f"versao GGUF nao suportada ({version})")
+        r = _GGUFReader(f, version)
+        n_tensors, n_kv = r.count(), r.count()
+
+        alignment = GGUF_DEFAULT_ALIGNMENT
+        for _ in range(n_kv):
+            key = r.string()
+            vtype = r.u32()
+            if key == b"general.alignment" and vtype == 4:
+                alignment = r.u32() or GGUF_DEFAULT_ALIGNMENT
+            else:
+                r.skip_value(vtype)
+            if f.tell() > size:
+                raise VerifyError("metadados passam do fim do arquivo")
+
+        end = 0
+        for _ in range(n_tensors):
+            r.string()
+            n_dims = r.u32()
+            dims = [r.count() for _ in range(n_dims)]
+            ggml_type = r.u32()
+            offset = r.u64()
+            elements = 1
+            for d in dims:
+                elements *= d
+            block, block_bytes = GGML_TYPE_SIZES.get(ggml_type, (0, 0))
+            nbytes = -(-elements // block) * block_bytes if block else 0
+            end = max(end, offset + nbytes)
+
+        data_start = -(-f.tell() // alignment) * alignment
+    expected = data_start + end
+    if expected > size:
+        raise VerifyError(f"truncado ({size} bytes, tensores vao ate {expected})")
+
+
+# --------------------------------------------------------------------------
+# torch (.pt/.pth/.ckpt)
+# --------------------------------------------------------------------------
+def verify_torch(path, size):
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    if magic[:1] == b"\x80":
+        return  # pickle legado (torch < 1.6): sem indice para conferir
+    if magic != b"PK\x03\x04":
+        raise VerifyError("nao e um zip do torch nem pickle")
+    try:
+        # zipfile so le o EOCD e o central directory (cauda do arquivo)
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+    except (zipfile.BadZipFile, OSError) as e:
+        raise VerifyError(f"central directory invalido: {e}")
+    if not any(i.filename.endswith("data.pkl") for i in infos):
+        raise VerifyError("zip sem data.pkl")
+    for info in infos:
+        if info.header_offset + info.compress_size > size:
+            raise VerifyError(f"entrada {info.filename} passa do fim do arquivo")
+
+
+VERIFIERS = {
+    ".safetensors": verify_safetensors,
+    ".gguf": verify_gguf,
+    ".pt": verify_torch,
+    ".pth": verify_torch,
+    ".ckpt": verify_torch,
+}
+
+
+def verify_file(path):
+    """Retorna None se o arquivo passa na verificacao do formato, ou o motivo."""
+    verifier = VERIFIERS.get(os.path.splitext(path)[1].lower())
+    if verifier is None:
+        return None
+    try:
+        verifier(path, os.path.getsize(path))
+    except VerifyError as e:
+        return f"corrompido ({e})"
+    except (OSError, KeyError, TypeError, ValueError, struct.error) as e:
+        return f"corrompido ({type(e).__name__}: {e})"
+    return None
+
+
+def verify_many(paths, check=verify_file, workers=VERIFY_WORKERS):
+    """Roda `check` em paralelo. Retorna {path: motivo ou None}."""
+    paths = list(paths)
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        return dict(zip(paths, pool.map(check, paths)))
+
+
+def _expand(targets):
+    for target in targets:
+        if os.path.isdir(target):
+            for root, _, files in os.walk(target):
+                for name in files:
+                    if name.endswith(tuple(VERIFIERS)):
+                        yield os.path.join(root, name)
+        else:
+            yield target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verifica integridade de modelos (safetensors/gguf/torch)")
+    parser.add_argument("targets", nargs="+", help="arquivos ou pastas")
+    parser.add_argument("--workers", type=int, default=VERIFY_WORKERS)
+    parser.add_argument("--delete", action="store_true", help="remove os arquivos invalidos")
+    args = parser.parse_args(argv)
+
+    results = verify_many(_expand(args.targets), workers=args.workers)
+    bad = {p: r for p, r in results.items() if r}
+    for path, reason in sorted(bad.items()):
+        print(f"[BAD] {path}: {reason}")
+        if args.delete:
+            os.remove(path)
+    print(f"[VERIFY] {len(results)} arquivo(s), {len(bad)} invalido(s)")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+node_profile.py
+===============
+Perfis de custom nodes e profiling de import por pack.
+
+A imagem tem ~40 packs de custom nodes e o ComfyUI importa todos a cada boot,
+mesmo numa sessao que so roda Z-Image-Turbo. Os perfis ("profiles" do
+custom_nodes.json, ex: zimage-minimal, edit, full) escolhem quais packs o
+ComfyUI carrega:
+  - comfyui_args(perfil) -> ["--disable-all-custom-nodes",
+    "--whitelist-custom-nodes", <packs...>] (vazio para "full"), passado ao
+    main.py. Os packs fora do perfil continuam na imagem, so nao sao importados
+    (nem os prestartup_script.py deles).
+
+Profiling: cada pack e carregado num subprocesso Python dentro da pasta do
+ComfyUI (mesmo caminho do main.py: prestartup_script + nodes.load_custom_node)
+medindo o tempo de import e o crescimento do RSS (VmRSS). O relatorio
+ranqueado vai para `<volume>/.kythours_reports/node-imports-<perfil>-*.json`.
+Em modo sequencial (padrao) os packs sao carregados no mesmo processo, como
+no boot real: uma dependencia compartilhada (ex: transformers) conta para o
+primeiro pack que a importa. Com --isolated, cada pack roda num processo
+proprio (custo total de cada um, mais lento).
+
+USO:
+  args = comfyui_args("zimage-minimal")
+  report = profile_packs("/root/ComfyUI", packs)
+  write_report(report, reports_dir, "full")
+
+  python -m node_profile --comfyui-dir /root/ComfyUI --profile full [--isolated]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from image_spec import DEFAULT_PROFILE, MANIFEST_PATH, load_manifest, profile_nodes
+from startup_report import REPORTS_DIRNAME
+
+PROBE_TIMEOUT = 15 * 60  # import de todos os packs (SeedVR2, SAM3, etc. sao lentos)
+
+
+def comfyui_args(profile=DEFAULT_PROFILE, manifest_path=MANIFEST_PATH):
+    """Argumentos do main.py que restringem o ComfyUI aos packs do perfil."""
+    manifest = load_manifest(manifest_path)
+    packs = profile_nodes(manifest, profile)
+    if len(packs) == len(manifest["nodes"]):
+        return []
+    return ["--disable-all-custom-nodes", "--whitelist-custom-nodes", *packs]
+
+
+def _rss_mb():
+    """RSS atual do processo em MB (Linux), ou None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _delta(after, before):
+    return round(after - before, 1) if after is not None and before is not None else None
+
+
+# ----------------------------------------------------------------------
+# Probe: roda dentro da pasta do ComfyUI (subprocesso)
+# ----------------------------------------------------------------------
+def _prestartup(path):
+    # Mesmo esquema do execute_prestartup_script do main.py
+    script = os.path.join(path, "prestartup_script.py")
+    if not os.path.exists(script):
+        return
+    spec = importlib.util.spec_from_file_location(os.path.basename(path) + ".prestartup", script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+
+def _probe(packs, out_path):
+    """Carrega os packs no processo atual e grava os tempos/RSS em out_path."""
+    sys.path.insert(0, os.getcwd())
+    started, rss_start = time.perf_counter(), _rss_mb()
+    import asyncio
+
+    import nodes
+    import server
+
+    # Packs registram rotas no PromptServer.instance durante o import
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server.PromptServer(loop)
+    result = {"baseline": {"seconds": round(time.perf_counter() - started, 3),
+                           "rss_mb": _delta(_rss_mb(), rss_start)}, "packs": []}
+
+    for name in packs:
+        path = os.path.join(os.getcwd(), "custom_nodes", name)
+        entry = {"name": name, "status": "ok", "error": None}
+        t0, rss0 = time.perf_counter(), _rss_mb()
+        if not os.path.isdir(path):
+            entry.update(status="missing", error="pasta nao existe")
+        else:
+            try:
+                _prestartup(path)
+                ok = nodes.load_custom_node(path, module_parent="custom_nodes")
+                if asyncio.iscoroutine(ok):
+                    ok = loop.run_until_complete(ok)
+                if not ok:
+                    entry.update(status="failed", error="load_custom_node falhou (ver log acima)")
+            except Exception as e:
+                entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+        entry["seconds"] = round(time.perf_counter() - t0, 3)
+        entry["rss_mb"] = _delta(_rss_mb(), rss0)
+        result["packs"].append(entry)
+
+    with open(out_path, "w") as f:
+        json.dump(result, f)
+
+
+def _run_probe(comfyui_dir, packs, python):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+        out_path = tmp.name
+    try:
+        subprocess.run([python, os.path.abspath(__file__), "--probe", "--out", out_path, *packs],
+                       cwd=comfyui_dir, timeout=PROBE_TIMEOUT, check=True)
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(out_path)
+
+
+def profile_packs(comfyui_dir, packs, isolated=False, python=sys.executable):
+    """
+    Mede import (s) e RSS (MB) de cada pack. Retorna {"baseline", "packs",
+    "totals", "isolated"} com os packs ordenados do mais caro ao mais barato.
+    """
+    if isolated:
+        runs = [_run_probe(comfyui_dir, [name], python) for name in packs]
+        baseline = runs[0]["baseline"] if runs else {"seconds": 0.0, "rss_mb": None}
+        entries = [run["packs"][0] for run in runs]
+    else:
+        run = _run_probe(comfyui_dir, packs, python)
+        baseline, entries = run["baseline"], run["packs"]
+    entries.sort(key=lambda e: e["seconds"], reverse=True)
+    return {
+        "isolated": isolated,
+        "baseline": baseline,
+        "packs": entries,
+        "totals": {
+            "packs": len(entries),
+            "failed": sum(e["status"] != "ok" for e in entries),
+            "seconds": round(sum(e["seconds"] for e in entries), 3),
+            "rss_mb": round(sum(e["rss_mb"] or 0 for e in entries), 1),
+        },
+    }
+
+
+def format_report(report):
+    lines = [f"{'#':>3}  {'pack':<40} {'import':>8} {'RSS':>9}  status"]
+    for i, e in enumerate(report["packs"], 1):
+        rss = f"{e['rss_mb']:.0f} MB" if e["rss_mb"] is not None else "n/a"
+        lines.append(f"{i:>3}  {e['name']:<40} {e['seconds']:>7.2f}s {rss:>9}  "
+                     + (e["status"] if e["status"] == "ok" else f"{e['status']}: {e['error']}"))
+    base, totals = report["baseline"], report["totals"]
+    base_rss = f"{base['rss_mb']:.0f} MB" if base["rss_mb"] is not None else "n/a"
+    lines.append(f"[PROFILE] ComfyUI base: {base['seconds']:.1f}s, {base_rss} | "
+                 f"{totals['packs']} pack(s): {totals['seconds']:.1f}s, {totals['rss_mb']:.0f} MB, "
+                 f"{totals['failed']} falha(s)")
+    return "\n".join(lines)
+
+
+def write_report(report, reports_dir, profile):
+    """Grava o JSON ranqueado (+ node-imports-latest.json) e imprime a tabela."""
+    os.makedirs(reports_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+    path = os.path.join(reports_dir, f"node-imports-{profile}-{stamp}.json")
+    data = dict(report, profile=profile, created_at=time.time())
+    for target in (path, os.path.join(reports_dir, "node-imports-latest.json")):
+        tmp = target + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, target)
+    print(format_report(report), flush=True)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perfis de custom nodes e profiling de import por pack.")
+    parser.add_argument("--comfyui-dir", default="/root/ComfyUI")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="perfil do custom_nodes.json")
+    parser.add_argument("--manifest", default=MANIFEST_PATH)
+    parser.add_argument("--isolated", action="store_true", help="um processo por pack")
+    parser.add_argument("--reports-dir", help="padrao: <comfyui-dir>/models/" + REPORTS_DIRNAME)
+    parser.add_argument("--args", action="store_true", help="so imprime os argumentos do main.py")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    parser.add_argument("packs", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        _probe(args.packs, args.out)
+        return 0
+    if args.args:
+        print(" ".join(comfyui_args(args.profile, args.manifest)))
+        return 0
+
+    packs = profile_nodes(load_manifest(args.manifest), args.profile)
+    report = profile_packs(args.comfyui_dir, packs, isolated=args.isolated)
+    write_report(report, args.reports_dir or os.path.join(args.comfyui_dir, "models", REPORTS_DIRNAME),
+                 args.profile)
+    return 1 if report["totals"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,489 @@
+"""
+output_offload.py
+=================
+Copia assincrona das saidas do ComfyUI para armazenamento persistente.
+
+O ComfyUI grava em /root/ComfyUI/output, no disco efemero do container; so
+models/ e volume, entao tudo some no scaledown se ninguem baixou pela UI.
+O offload:
+  - Varre a pasta de saida a cada SCAN_INTERVAL (so stat) e pega os arquivos
+    que pararam de mudar (mesmo tamanho/mtime por OFFLOAD_SETTLE segundos):
+    o ComfyUI escreve o PNG direto no nome final.
+  - Opcionalmente re-encoda imagens (OFFLOAD_FORMAT=webp/jpeg, qualidade
+    OFFLOAD_QUALITY) com o Pillow; o prompt/workflow embutido no PNG vai
+    para um `.json` ao lado, para nao perder o grafo.
+  - Grava em `<destino>/<data>/<sessao>/<caminho relativo>`: uma pasta (o
+    volume, `<volume>/.kythours_outputs`) ou um object store por HTTP PUT
+    (`python -m output_offload serve` e um stand-in local).
+  - Junta os arquivos em lotes (OFFLOAD_BATCH arquivos ou OFFLOAD_INTERVAL
+    segundos): por lote, um append so com as linhas novas no indice da
+    sessao (`index/<sessao>.jsonl`, uma linha por arquivo; no object store,
+    um objeto por lote) e um on_commit (no Modal, model_volume.commit()).
+    Cada container escreve so no seu indice, entao varios escritores no
+    mesmo volume nao perdem linhas; a leitura junta todos.
+  - Roda numa thread do processo do Modal, fora do processo do ComfyUI: a
+    amostragem nunca espera por I/O de persistencia. As copias locais ficam
+    (o /view da UI continua funcionando).
+
+A sessao (data + id aleatorio) evita colisao entre containers: o contador do
+ComfyUI (ComfyUI_00001_.png) recomeca em cada container novo.
+
+USO:
+  offload = OutputOffload(f"{COMFYUI_DIR}/output", sink_for(dest), on_commit=model_volume.commit)
+  offload.start()
+  offload.stats()
+
+  python -m output_offload watch --output-dir /root/ComfyUI/output --dest /root/ComfyUI/models/.kythours_outputs
+  python -m output_offload watch --output-dir /tmp/out --dest http://127.0.0.1:9000 --format webp
+  python -m output_offload list --dest /root/ComfyUI/models/.kythours_outputs --limit 20
+  python -m output_offload serve --root /tmp/store --port 9000
+"""
+
+import argparse
+import hashlib
+import http.server
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+OUTPUTS_DIRNAME = ".kythours_outputs"
+INDEX_NAME = "index.jsonl"  # indice unico antigo (so leitura)
+INDEX_DIR = "index"         # um indice por sessao (container)
+OFFLOAD_FORMAT = os.environ.get("OFFLOAD_FORMAT", "")      # "" = copia sem re-encodar
+OFFLOAD_QUALITY = int(os.environ.get("OFFLOAD_QUALITY", "90"))
+OFFLOAD_BATCH = int(os.environ.get("OFFLOAD_BATCH", "16"))            # arquivos por commit
+OFFLOAD_INTERVAL = float(os.environ.get("OFFLOAD_INTERVAL", "30"))    # segundos ate commitar um lote parcial
+OFFLOAD_SETTLE = float(os.environ.get("OFFLOAD_SETTLE", "2"))         # segundos sem mudar = escrita terminou
+SCAN_INTERVAL = 2
+REQUEST_TIMEOUT = 60
+REENCODE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+FORMAT_EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg", "png": ".png"}
+PNG_METADATA_KEYS = ("prompt", "workflow")
+
+
+def reencode(data, fmt, quality=OFFLOAD_QUALITY):
+    """Imagem re-encodada em fmt. Retorna (bytes, metadados do PNG de origem). Precisa de Pillow."""
+    from PIL import Image  # dependencia do ComfyUI (imagem)
+
+    image = Image.open(io.BytesIO(data))
+    metadata = {k: image.info[k] for k in PNG_METADATA_KEYS if isinstance(image.info.get(k), str)}
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    out = io.BytesIO()
+    if fmt == "png":
+        image.save(out, format="PNG", optimize=True)
+    else:
+        image.save(out, format=fmt.upper(), quality=quality)
+    return out.getvalue(), metadata
+
+
+# ----------------------------------------------------------------------
+# Destinos
+# ----------------------------------------------------------------------
+class DirectorySink:
+    """Pasta de destino (ex: `<volume>/.kythours_outputs`)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def __str__(self):
+        return self.root
+
+    def put(self, key, data):
+        path = os.path.join(self.root, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".part"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def append_index(self, name, data):
+        """Acrescenta linhas ao indice da sessao `name` (O(lote), sem reescrever nada)."""
+        path = os.path.join(self.root, INDEX_DIR, name + ".jsonl")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "ab") as f:
+            f.write(data)
+
+    def read_index(self):
+        """Indice antigo + o de todas as sessoes, concatenados."""
+        index_dir = os.path.join(self.root, INDEX_DIR)
+        try:
+            names = sorted(os.listdir(index_dir))
+        except FileNotFoundError:
+            names = []
+        chunks = []
+        for path in [os.path.join(self.root, INDEX_NAME)] + [os.path.join(index_dir, n) for n in names]:
+            try:
+                with open(path, "rb") as f:
+                    chunks.append(f.read())
+            except (FileNotFoundError, IsADirectoryError):
+                continue
+        return b"".join(chunk if chunk.endswith(b"\n") or not chunk else chunk + b"\n" for chunk in chunks)
+
+
+class HTTPSink:
+    """Object store por HTTP: PUT/GET em `<base_url>/<chave>`."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self._parts = 0
+
+    def __str__(self):
+        return self.base_url
+
+    def _url(self, key):
+        return f"{self.base_url}/{urllib.parse.quote(key)}"
+
+    def put(self, key, data):
+        req = urllib.request.Request(self._url(key), data=data, method="PUT",
+                                     headers={"Content-Type": "application/octet-stream"})
+        with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+            resp.read()
+
+    def _get(self, key):
+        try:
+            with urllib.request.urlopen(self._url(key), timeout=REQUEST_TIMEOUT) as resp:
+                return resp.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return b""
+            raise
+
+    def append_index(self, name, data):
+        """PUT nao tem append: cada lote vira um objeto `index/<sessao>/<n>.jsonl`."""
+        self._parts += 1
+        self.put(f"{INDEX_DIR}/{name}/{self._parts:06d}.jsonl", data)
+
+    def read_index(self):
+        """Indice antigo + todas as partes listadas em `index/` (GET com barra no fim = listagem)."""
+        keys = json.loads(self._get(INDEX_DIR + "/") or b"[]")
+        chunks = [self._get(INDEX_NAME)] + [self._get(f"{INDEX_DIR}/{key}") for key in sorted(keys)]
+        return b"".join(chunk if chunk.endswith(b"\n") or not chunk else chunk + b"\n" for chunk in chunks)
+
+
+def sink_for(dest):
+    """URL http(s) -> HTTPSink; qualquer outra coisa e uma pasta."""
+    return HTTPSink(dest) if dest.startswith(("http://", "https://")) else DirectorySink(dest)
+
+
+def parse_index(data):
+    """Linhas dos indices, do arquivo mais antigo ao mais novo (linhas quebradas sao ignoradas)."""
+    entries = []
+    for line in data.decode("utf-8", "replace").splitlines():
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            continue
+    return sorted(entries, key=lambda e: e.get("created", 0))
+
+
+# ----------------------------------------------------------------------
+# Offload
+# ----------------------------------------------------------------------
+class OutputOffload:
+    """
+    output_dir: pasta de saida do ComfyUI.
+    sink:       DirectorySink/HTTPSink.
+    fmt:        "" (copia), "webp", "jpeg" ou "png" para re-encodar imagens.
+    on_commit:  chamado depois de cada lote gravado (ex: model_volume.commit).
+    """
+
+    def __init__(self, output_dir, sink, fmt=OFFLOAD_FORMAT, quality=OFFLOAD_QUALITY,
+                 batch_size=OFFLOAD_BATCH, interval=OFFLOAD_INTERVAL, settle=OFFLOAD_SETTLE, on_commit=None):
+        if fmt and fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"formato de offload invalido: {fmt} (use {', '.join(FORMAT_EXTENSIONS)})")
+        self.output_dir = output_dir
+        self.sink = sink
+        self.fmt = fmt
+        self.quality = quality
+        self.batch_size = batch_size
+        self.interval = interval
+        self.settle = settle
+        self.on_commit = on_commit
+        self.session = time.strftime("%Y-%m-%d/%H%M%S-") + uuid.uuid4().hex[:6]
+        self.index_name = self.session.replace("/", "_")
+        self._seen = {}       # caminho relativo -> (tamanho, mtime_ns) ja enviado
+        self._pending = []    # linhas do indice do lote atual
+        self._batch_started = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {"files": 0, "bytes": 0, "source_bytes": 0, "batches": 0, "failed": 0,
+                         "commit_failed": 0, "upload_seconds": 0.0}
+
+    # ------------------------------------------------------------------
+    # Varredura
+    # ------------------------------------------------------------------
+    def _scan(self):
+        """Arquivos da pasta de saida: {relativo: (tamanho, mtime_ns)}."""
+        found = {}
+        stack = [self.output_dir]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.name.startswith("."):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat()
+                            rel = os.path.relpath(entry.path, self.output_dir).replace(os.sep, "/")
+                            found[rel] = (st.st_size, st.st_mtime_ns)
+            except FileNotFoundError:
+                continue
+        return found
+
+    def ready(self, now=None):
+        """Arquivos novos ou alterados que ja pararam de mudar."""
+        now = time.time() if now is None else now
+        ready = []
+        for rel, sig in sorted(self._scan().items()):
+            if self._seen.get(rel) == sig:
+                continue
+            if now - sig[1] / 1e9 >= self.settle:
+                ready.append((rel, sig))
+        return ready
+
+    # ------------------------------------------------------------------
+    # Envio
+    # ------------------------------------------------------------------
+    def key_for(self, rel):
+        base, ext = os.path.splitext(rel)
+        if self.fmt and ext.lower() in REENCODE_EXTENSIONS:
+            ext = FORMAT_EXTENSIONS[self.fmt]
+        return f"{self.session}/{base}{ext}"
+
+    def upload(self, rel, sig):
+        """Envia um arquivo (re-encodado se for o caso) e adiciona a linha no lote."""
+        started = time.monotonic()
+        with open(os.path.join(self.output_dir, rel), "rb") as f:
+            data = f.read()
+        source_bytes = len(data)
+        key = self.key_for(rel)
+        fmt = None
+        if key != f"{self.session}/{rel}":
+            try:
+                data, metadata = reencode(data, self.fmt, self.quality)
+                fmt = self.fmt
+                if metadata:
+                    self.sink.put(os.path.splitext(key)[0] + ".json", json.dumps(metadata).encode())
+            except Exception as e:
+                # Pillow ausente ou imagem que ele nao abre: guarda o original
+                print(f"[OFFLOAD] Sem re-encode de {rel} ({e}); copiando o original", flush=True)
+                key = f"{self.session}/{rel}"
+        self.sink.put(key, data)
+        with self._lock:
+            if not self._pending:
+                self._batch_started = time.monotonic()
+            self._pending.append({"key": key, "source": rel, "bytes": len(data), "source_bytes": source_bytes,
+                                  "format": fmt, "sha256": hashlib.sha256(data).hexdigest(),
+                                  "created": round(sig[1] / 1e9, 3)})
+            self._seen[rel] = sig
+            self.counters["files"] += 1
+            self.counters["bytes"] += len(data)
+            self.counters["source_bytes"] += source_bytes
+            self.counters["upload_seconds"] += time.monotonic() - started
+
+    def flush(self):
+        """Acrescenta o lote atual ao indice da sessao e chama on_commit (um commit por lote)."""
+        with self._lock:
+            batch = list(self._pending)
+        if not batch:
+            return 0
+        # Se a gravacao falhar, o lote continua pendente e entra no proximo commit
+        self.sink.append_index(self.index_name,
+                               b"".join(json.dumps(e, separators=(",", ":")).encode() + b"\n" for e in batch))
+        with self._lock:
+            del self._pending[:len(batch)]
+            self._batch_started = time.monotonic() if self._pending else None
+        self.counters["batches"] += 1
+        if self.on_commit:
+            try:
+                self.on_commit()
+            except Exception as e:
+                self.counters["commit_failed"] += 1
+                print(f"[OFFLOAD] Commit falhou: {e}", flush=True)
+        print(f"[OFFLOAD] Lote {self.counters['batches']}: {len(batch)} arquivo(s) -> {self.sink}", flush=True)
+        return len(batch)
+
+    def _batch_due(self):
+        with self._lock:
+            if not self._pending:
+                return False
+            return (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._batch_started >= self.interval)
+
+    def run_once(self, now=None):
+        """Uma varredura: envia o que esta pronto e commita os lotes que fecharam."""
+        for rel, sig in self.ready(now):
+            try:
+                self.upload(rel, sig)
+            except OSError as e:
+                # Tenta de novo na proxima varredura (arquivo removido, destino fora do ar)
+                self.counters["failed"] += 1
+                print(f"[OFFLOAD] Falha ao enviar {rel}: {e}", flush=True)
+            if self._batch_due():
+                self._flush_safe()
+        if self._batch_due():
+            self._flush_safe()
+
+    def _flush_safe(self):
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"[OFFLOAD] Falha ao gravar o indice: {e}", flush=True)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(SCAN_INTERVAL)
+
+    def start(self):
+        """Ja existentes na pasta tambem sao enviados (container reaproveitado)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+            print(f"[OFFLOAD] {self.output_dir} -> {self.sink} (sessao {self.session}, "
+                  f"formato {self.fmt or 'original'}, lotes de {self.batch_size})", flush=True)
+        return self
+
+    def stop(self):
+        """Para a thread, envia o que ja terminou de ser escrito e commita o resto."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=REQUEST_TIMEOUT)
+        self.run_once(now=float("inf"))
+        self._flush_safe()
+
+    def stats(self):
+        c = dict(self.counters)
+        c["upload_seconds"] = round(c["upload_seconds"], 3)
+        c["pending"] = len(self._pending)
+        c["ratio"] = round(c["bytes"] / c["source_bytes"], 3) if c["source_bytes"] else None
+        return c
+
+
+# ----------------------------------------------------------------------
+# Stand-in local de object store (PUT/GET em arquivos)
+# ----------------------------------------------------------------------
+class _StoreHandler(http.server.BaseHTTPRequestHandler):
+    root = "."
+
+    def _path(self):
+        key = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path).lstrip("/")
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not key or not path.startswith(os.path.realpath(self.root) + os.sep):
+            return None
+        return path
+
+    def do_PUT(self):
+        path = self._path()
+        if path is None:
+            self.send_error(400)
+            return
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".part", "wb") as f:
+            f.write(data)
+        os.replace(path + ".part", path)
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0].endswith("/"):
+            return self._list()
+        path = self._path()
+        if path is None or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _list(self):
+        """GET <prefixo>/: JSON com as chaves (relativas ao prefixo) dos arquivos abaixo dele."""
+        path = self._path()
+        keys = []
+        if path and os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                keys += [os.path.relpath(os.path.join(root, n), path).replace(os.sep, "/")
+                         for n in files if not n.endswith(".part")]
+        data = json.dumps(sorted(keys)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve(root, port, host="127.0.0.1"):
+    os.makedirs(root, exist_ok=True)
+    handler = type("StoreHandler", (_StoreHandler,), {"root": root})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    print(f"[OFFLOAD] Object store local em http://{host}:{port} -> {root}", flush=True)
+    server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offload das saidas do ComfyUI para volume/object store.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    watch = sub.add_parser("watch", help="observa a pasta de saida e envia em lotes")
+    watch.add_argument("--output-dir", default="/root/ComfyUI/output")
+    watch.add_argument("--dest", default=f"/root/ComfyUI/models/{OUTPUTS_DIRNAME}", help="pasta ou URL http(s)")
+    watch.add_argument("--format", default=OFFLOAD_FORMAT, choices=["", *FORMAT_EXTENSIONS])
+    watch.add_argument("--quality", type=int, default=OFFLOAD_QUALITY)
+    watch.add_argument("--batch", type=int, default=OFFLOAD_BATCH)
+    watch.add_argument("--interval", type=float, default=OFFLOAD_INTERVAL)
+    watch.add_argument("--once", action="store_true", help="envia o que existe, commita e sai")
+    listing = sub.add_parser("list", help="lista o indice do destino")
+    listing.add_argument("--dest", default=f"/root/ComfyUI/models/{OUTPUTS_DIRNAME}")
+    listing.add_argument("--limit", type=int, default=20)
+    store = sub.add_parser("serve", help="object store local (PUT/GET) para testes")
+    store.add_argument("--root", required=True)
+    store.add_argument("--port", type=int, default=9000)
+    store.add_argument("--host", default="127.0.0.1")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "serve":
+        serve(args.root, args.port, args.host)
+        return 0
+    if args.cmd == "list":
+        entries = parse_index(sink_for(args.dest).read_index())
+        for e in entries[-args.limit:] if args.limit else entries:
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(e['created']))}  "
+                  f"{e['bytes'] / 1024:9.1f} KB  {e['key']}")
+        print(f"{len(entries)} arquivo(s)")
+        return 0
+
+    offload = OutputOffload(args.output_dir, sink_for(args.dest), args.format, args.quality,
+                            args.batch, args.interval)
+    if args.once:
+        offload.stop()
+    else:
+        offload.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            offload.stop()
+    print(json.dumps(offload.stats(), indent=1))
+    return 1 if offload.counters["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
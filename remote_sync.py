@@ -0,0 +1,197 @@
+"""
+remote_sync.py
+==============
+Revalidacao condicional dos modelos do volume contra o remoto + descoberta
+dos checkpoints de LoRA pela listagem do repo no Hugging Face.
+
+A regra antiga ("existe e tem > 1MB, pula") nunca percebia quando um LoRA era
+re-enviado com o mesmo nome. Agora:
+  - O manifesto do volume guarda o ETag de cada arquivo baixado.
+  - RemoteCheck faz HEAD com `If-None-Match: <etag>` (em paralelo, com limite
+    de requests/s). 304 ou mesmo ETag = nada a fazer; ETag diferente = o
+    arquivo e baixado de novo (o store troca o link de forma atomica).
+  - Arquivos antigos sem ETag registrado adotam o ETag atual se o tamanho
+    remoto bate com o local (senao sao baixados de novo).
+
+discover_checkpoints lista as pastas dos treinos (model_catalog.LORA_RUNS) na
+API do HF e grava o resultado em `<volume>/.kythours_listings.json`, que o
+build_catalog usa no lugar das listas fixas de steps.
+
+USO:
+  checker = RemoteCheck(hf_token=os.environ.get("HF_TOKEN", ""))
+  results = checker.check([{"url": ..., "etag": ..., "size": ...}, ...])
+
+  listings = discover_checkpoints(hf_token)
+  save_listings(models_dir, listings)
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from model_catalog import LISTINGS_NAME, LORA_RUNS, run_key
+from model_downloader import _build_headers
+
+REMOTE_CHECK_WORKERS = int(os.environ.get("REMOTE_CHECK_WORKERS", "8"))
+REMOTE_CHECK_RPS = float(os.environ.get("REMOTE_CHECK_RPS", "10"))
+REQUEST_TIMEOUT = 30
+RATE_LIMIT_RETRIES = 2
+HF_API = "https://huggingface.co/api"
+
+
+def normalize_etag(etag):
+    """ETag sem o prefixo fraco (W/) e sem aspas, para comparar."""
+    if not etag:
+        return None
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    return etag.strip('"') or None
+
+
+class RateLimiter:
+    """Espacamento minimo entre requests, compartilhado entre threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+class RemoteCheck:
+    """
+    hf_token: token para repos privados (mesma regra do downloader).
+    workers:  HEADs simultaneos.
+    rps:      teto de requests por segundo (somando todas as threads).
+    """
+
+    def __init__(self, hf_token="", workers=REMOTE_CHECK_WORKERS, rps=REMOTE_CHECK_RPS):
+        self.hf_token = hf_token or ""
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rps)
+
+    def _request(self, url, method="GET", extra=None):
+        """(status, headers, body) seguindo redirects; erros HTTP viram status."""
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            self.limiter.wait()
+            req = urllib.request.Request(url, method=method, headers=_build_headers(url, self.hf_token, extra))
+            try:
+                with urllib.request.urlopen(req, timeout=REQUEST_TIMEOUT) as resp:
+                    return resp.status, resp.headers, resp.read() if method == "GET" else b""
+            except urllib.error.HTTPError as e:
+                if e.code == 429 and attempt < RATE_LIMIT_RETRIES:
+                    retry = e.headers.get("Retry-After", "")
+                    time.sleep(min(int(retry) if retry.isdigit() else 5, 30))
+                    continue
+                return e.code, e.headers, b""
+
+    def head(self, url, etag=None):
+        """
+        HEAD condicional. Retorna {"status": "unchanged"|"changed"|"unknown"|"error",
+        "etag", "size", "error"}; "unknown" = respondeu 200 mas sem ETag.
+        """
+        extra = {"If-None-Match": f'"{normalize_etag(etag)}"'} if etag else None
+        try:
+            code, headers, _ = self._request(url, "HEAD", extra)
+        except (OSError, urllib.error.URLError) as e:
+            return {"status": "error", "etag": None, "size": None, "error": str(e)}
+        if code == 304:
+            return {"status": "unchanged", "etag": normalize_etag(etag), "size": None, "error": None}
+        if code >= 400:
+            return {"status": "error", "etag": None, "size": None, "error": f"HTTP {code}"}
+        remote = normalize_etag(headers.get("ETag"))
+        length = headers.get("Content-Length")
+        size = int(length) if length and length.isdigit() else None
+        if remote is None:
+            status = "unknown"
+        else:
+            status = "unchanged" if etag and remote == normalize_etag(etag) else "changed"
+        return {"status": status, "etag": remote, "size": size, "error": None}
+
+    def check(self, entries):
+        """
+        entries: [{"url", "etag" (registrado ou None), "size" (local)}].
+        Retorna a mesma lista com "result" (o dict do head) e "changed" (bool).
+        Sem ETag registrado, so e "changed" se o tamanho remoto for diferente.
+        """
+        def one(entry):
+            result = self.head(entry["url"], entry.get("etag"))
+            changed = result["status"] == "changed"
+            if changed and not entry.get("etag"):
+                changed = result["size"] is not None and result["size"] != entry.get("size")
+            return dict(entry, result=result, changed=changed)
+
+        entries = list(entries)
+        if not entries:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(entries))) as pool:
+            return list(pool.map(one, entries))
+
+    # ------------------------------------------------------------------
+    # Listagem de repos do HF
+    # ------------------------------------------------------------------
+    def list_repo_files(self, repo, path="", revision="main", api=HF_API):
+        """Arquivos (caminho relativo ao repo) de uma pasta do repo, com paginacao."""
+        url = f"{api}/models/{repo}/tree/{revision}/{urllib.parse.quote(path)}".rstrip("/")
+        files = []
+        while url:
+            code, headers, body = self._request(url)
+            if code != 200:
+                raise OSError(f"listagem de {repo}/{path}: HTTP {code}")
+            files += [item["path"] for item in json.loads(body) if item.get("type") == "file"]
+            url = _next_link(headers.get("Link"))
+        return files
+
+
+def _next_link(link):
+    # Link: <https://...&cursor=...>; rel="next"
+    for part in (link or "").split(","):
+        if 'rel="next"' in part and "<" in part:
+            return part[part.index("<") + 1:part.index(">")]
+    return None
+
+
+def discover_checkpoints(hf_token="", runs=LORA_RUNS, api=HF_API, checker=None):
+    """
+    Lista a pasta de cada treino no HF. Retorna {run_key: [nomes de arquivo]}
+    so dos treinos que responderam (os outros ficam com a listagem anterior).
+    """
+    checker = checker or RemoteCheck(hf_token)
+    listings = {}
+    for run in runs:
+        try:
+            files = checker.list_repo_files(run["repo"], run["dir"], api=api)
+        except (OSError, ValueError) as e:
+            print(f"[REMOTE] Listagem de {run['repo']}/{run['dir']} falhou: {e}", flush=True)
+            continue
+        listings[run_key(run)] = sorted(os.path.basename(f) for f in files)
+    return listings
+
+
+def save_listings(models_dir, listings):
+    """Mescla as listagens novas no cache do volume (atomico)."""
+    path = os.path.join(models_dir, LISTINGS_NAME)
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data.update(listings)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+    return data
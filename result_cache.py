@@ -0,0 +1,387 @@
+"""
+result_cache.py
+===============
+Cache deterministico de resultados na frente do /prompt (hook do comfy_proxy).
+
+Workflows API identicos (mesma seed, modelos, forca de LoRA...) reenviados
+por scripts e retries pagavam a amostragem inteira na GPU de novo. Aqui:
+  - A chave e o sha256 do workflow normalizado (so class_type + inputs de
+    cada node, chaves ordenadas, campos de UI como "_meta" ignorados) + a
+    identidade do conteudo de cada modelo referenciado (ETag/sha256 do
+    manifesto do volume, ou tamanho + mtime) + tamanho + mtime de cada
+    arquivo de entrada (LoadImage & cia, pasta input/) + o BUILD_ID (versao
+    dos nodes). Entrada que nao existe = sem cache para aquele prompt.
+  - Miss: o prompt segue para o ComfyUI com a chave em extra_data; um coletor
+    le o /history e copia as saidas dos prompts marcados que terminaram com
+    sucesso para `<volume>/.kythours_results/<xx>/<chave>/`.
+  - Hit: as saidas sao recolocadas nas pastas output/temp do ComfyUI (o /view
+    continua servido por ele) e o /prompt responde na hora com um prompt_id
+    proprio; GET /history/<esse id> devolve a entrada guardada.
+  - Eviction LRU por tamanho (RESULT_CACHE_MAX_GB); contadores em
+    GET /kythours/result_cache.
+
+Bypass: `"extra_data": {"result_cache": false}` no /prompt (workflows nao
+deterministicos), prompts vindos da UI (extra_pnginfo), que esperam os
+eventos do websocket em vez de consultar o /history, e prompts com arquivo de
+entrada que nao existe.
+
+USO:
+  python -m comfy_proxy --port 8188 --upstream-port 8189 --result-cache
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from comfy_client import ComfyClient, ComfyError, output_files
+from comfy_proxy import PromptAnswered
+from lazy_models import workflow_model_refs
+from model_downloader import MB
+from model_staging import model_files, name_index, resolve_refs
+from volume_manifest import MANIFEST_NAME
+
+RESULTS_DIRNAME = ".kythours_results"
+INDEX_NAME = "index.json"
+ENTRY_NAME = "entry.json"
+RESULT_CACHE_MAX_GB = float(os.environ.get("RESULT_CACHE_MAX_GB", "20"))
+KEY_VERSION = 1
+BYPASS_FIELD = "result_cache"         # extra_data: false = nao usa o cache
+KEY_FIELD = "kythours_result_key"     # extra_data: marca o prompt para o coletor
+STATUS_PATH = "/kythours/result_cache"
+HISTORY_PREFIXES = ("/history/", "/api/history/")
+COLLECT_INTERVAL = 5   # segundos entre leituras do /history
+HISTORY_ITEMS = 64
+INDEX_TTL = 5 * 60     # segundos ate reler a lista de modelos do volume
+MAX_ANSWERS = 256      # prompt_ids de hits guardados para o /history
+# Inputs string que nomeiam arquivos de input/ (LoadImage, LoadImageMask, loaders de video/audio)
+INPUT_FILE_KEYS = ("image", "video", "audio", "file")
+ANNOTATIONS = {"[input]": "input", "[output]": "output", "[temp]": "temp"}
+
+
+def normalize_workflow(prompt):
+    """Grafo so com o que influencia a saida: {node_id: {"class_type", "inputs"}}."""
+    return {str(node_id): {"class_type": node.get("class_type"), "inputs": node.get("inputs", {})}
+            for node_id, node in prompt.items() if isinstance(node, dict)}
+
+
+def input_file_refs(prompt):
+    """Conjunto de (pasta, nome) dos arquivos de entrada citados no workflow ("x.png [output]" -> output)."""
+    refs = set()
+    for node in prompt.values():
+        inputs = node.get("inputs") if isinstance(node, dict) else None
+        for key, value in (inputs or {}).items():
+            if key not in INPUT_FILE_KEYS or not isinstance(value, str):
+                continue
+            name, folder = value.strip(), "input"
+            for suffix, annotated in ANNOTATIONS.items():
+                if name.endswith(suffix):
+                    name, folder = name[:-len(suffix)].strip(), annotated
+            refs.add((folder, name))
+    return refs
+
+
+def workflow_key(prompt, identities, code_version=""):
+    """sha256 do workflow normalizado + identidade dos modelos + versao do codigo."""
+    data = {"v": KEY_VERSION, "code": code_version, "prompt": normalize_workflow(prompt), "models": identities}
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    comfyui_dir: raiz do ComfyUI (volume em <comfyui_dir>/models, saidas em output/ e temp/).
+    upstream:    URL do ComfyUI atras do proxy (para o coletor ler o /history).
+    max_bytes:   teto do cache no volume.
+    """
+
+    def __init__(self, comfyui_dir, upstream, max_bytes=int(RESULT_CACHE_MAX_GB * 1024 * MB),
+                 code_version=None):
+        self.models_dir = os.path.join(comfyui_dir, "models")
+        self.root = os.path.join(self.models_dir, RESULTS_DIRNAME)
+        self.dirs = {"output": os.path.join(comfyui_dir, "output"), "temp": os.path.join(comfyui_dir, "temp")}
+        self.input_dir = os.path.join(comfyui_dir, "input")
+        self.client = ComfyClient(upstream)
+        self.max_bytes = max_bytes
+        self.code_version = code_version if code_version is not None else os.environ.get("FORCE_REBUILD_ID", "")
+        self.index_path = os.path.join(self.root, INDEX_NAME)
+        self._lock = threading.Lock()
+        self._answers = OrderedDict()  # prompt_id de hit -> entrada do /history
+        self._names, self._names_at = None, 0.0
+        self._manifest, self._manifest_mtime = {}, None
+        self._failed = set()  # chaves que falharam ao guardar (nao tenta de novo)
+        self.counters = {"hits": 0, "misses": 0, "bypassed": 0, "stored": 0, "store_failed": 0,
+                         "evicted": 0, "evicted_bytes": 0}
+        os.makedirs(self.root, exist_ok=True)
+        self.index = self._load_index()
+
+    # ------------------------------------------------------------------
+    # Indice (volume)
+    # ------------------------------------------------------------------
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    # ------------------------------------------------------------------
+    # Chave
+    # ------------------------------------------------------------------
+    def _manifest_files(self):
+        path = os.path.join(self.models_dir, MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime != self._manifest_mtime:
+                with open(path) as f:
+                    self._manifest, self._manifest_mtime = json.load(f).get("files", {}), mtime
+        except (OSError, ValueError):
+            self._manifest = {}
+        return self._manifest
+
+    def identities(self, prompt):
+        """{caminho relativo: identidade do conteudo} dos modelos usados no workflow."""
+        if self._names is None or time.monotonic() - self._names_at > INDEX_TTL:
+            self._names, self._names_at = name_index(model_files(self.models_dir)), time.monotonic()
+        manifest = self._manifest_files()
+        result = {}
+        for rel in resolve_refs(self._names, workflow_model_refs(prompt)):
+            try:
+                st = os.stat(os.path.join(self.models_dir, rel))
+            except FileNotFoundError:
+                continue
+            entry = manifest.get(rel) or {}
+            current = entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+            result[rel] = (current and (entry.get("etag") or entry.get("sha256"))) or f"{st.st_size}:{st.st_mtime_ns}"
+        return result
+
+    def input_identities(self, prompt):
+        """
+        {"<pasta>:<nome>": "tamanho:mtime_ns"} dos arquivos de entrada, ou None
+        se algum nao existe (ou sai da pasta): sem identidade, sem cache.
+        """
+        roots = dict(self.dirs, input=self.input_dir)
+        result = {}
+        for folder, name in input_file_refs(prompt):
+            root = os.path.realpath(roots[folder])
+            path = os.path.realpath(os.path.join(root, name))
+            if not path.startswith(root + os.sep):
+                return None
+            try:
+                st = os.stat(path)
+            except OSError:
+                return None
+            result[f"{folder}:{name}"] = f"{st.st_size}:{st.st_mtime_ns}"
+        return result
+
+    def key_for(self, payload):
+        """Chave do payload do /prompt, ou None se o prompt nao deve usar o cache."""
+        extra = payload.get("extra_data") or {}
+        prompt = payload.get("prompt")
+        if not isinstance(prompt, dict) or extra.get(BYPASS_FIELD) is False or "extra_pnginfo" in extra:
+            return None
+        inputs = self.input_identities(prompt)
+        if inputs is None:
+            return None
+        return workflow_key(prompt, dict(self.identities(prompt), **inputs), self.code_version)
+
+    # ------------------------------------------------------------------
+    # Hook do /prompt
+    # ------------------------------------------------------------------
+    def on_prompt(self, payload):
+        key = self.key_for(payload)
+        if key is None:
+            with self._lock:
+                self.counters["bypassed"] += 1
+            return payload
+        entry = self._load_entry(key)
+        if entry is not None:
+            try:
+                self._restore(key, entry)
+            except OSError as e:
+                # Entrada removida/incompleta (eviction de outro container): vira miss e e regravada
+                print(f"[RESULT_CACHE] Entrada {key[:12]} ilegivel ({e}); executando", flush=True)
+                entry = None
+        if entry is None:
+            with self._lock:
+                self.counters["misses"] += 1
+            payload.setdefault("extra_data", {})[KEY_FIELD] = key
+            return payload
+
+        prompt_id = str(uuid.uuid4())
+        now = int(time.time() * 1000)
+        nodes = list(payload["prompt"])
+        history = {
+            "prompt": [0, prompt_id, payload["prompt"], payload.get("extra_data") or {}, entry["output_nodes"]],
+            "outputs": entry["outputs"],
+            "status": {"status_str": "success", "completed": True, "messages": [
+                ["execution_start", {"prompt_id": prompt_id, "timestamp": now}],
+                ["execution_cached", {"nodes": nodes, "prompt_id": prompt_id, "timestamp": now}],
+                ["execution_success", {"prompt_id": prompt_id, "timestamp": now}],
+            ]},
+            "meta": {},
+        }
+        with self._lock:
+            self.counters["hits"] += 1
+            self._answers[prompt_id] = history
+            while len(self._answers) > MAX_ANSWERS:
+                self._answers.popitem(last=False)
+            info = self.index.get(key)
+            if info is None:
+                # Entrada gravada por outro container: tamanho real para o teto do LRU
+                info = self.index[key] = {"bytes": self._entry_bytes(key), "created": entry.get("created", time.time())}
+            info["last_used"] = time.time()
+            info["hits"] = info.get("hits", 0) + 1
+            self._save_index()
+        print(f"[RESULT_CACHE] Hit {key[:12]} -> {prompt_id} (sem GPU)", flush=True)
+        raise PromptAnswered({"prompt_id": prompt_id, "number": 0, "node_errors": {}, "cached": True})
+
+    def _load_entry(self, key):
+        try:
+            with open(os.path.join(self.entry_dir(key), ENTRY_NAME)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _entry_bytes(self, key):
+        total = 0
+        for root, _, files in os.walk(os.path.join(self.entry_dir(key), "files")):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _restore(self, key, entry):
+        """Recoloca os arquivos guardados em output/temp (se nao estiverem la)."""
+        src_root = os.path.join(self.entry_dir(key), "files")
+        for item in entry["files"]:
+            dest = os.path.join(self.dirs[item["type"]], item.get("subfolder", ""), item["filename"])
+            src = os.path.join(src_root, item["type"], item.get("subfolder", ""), item["filename"])
+            if os.path.exists(dest) and os.path.getsize(dest) == os.path.getsize(src):
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(src, dest + ".tmp")
+            os.replace(dest + ".tmp", dest)
+
+    def intercept(self, method, path):
+        """GET /history/<id> dos hits (o ComfyUI nao conhece esses ids)."""
+        if method != "GET":
+            return None
+        path = path.split("?", 1)[0]
+        for prefix in HISTORY_PREFIXES:
+            if path.startswith(prefix):
+                prompt_id = path[len(prefix):]
+                with self._lock:
+                    entry = self._answers.get(prompt_id)
+                return (200, {prompt_id: entry}) if entry else None
+        return None
+
+    # ------------------------------------------------------------------
+    # Coletor: guarda as saidas dos misses
+    # ------------------------------------------------------------------
+    def store(self, key, entry):
+        """Copia as saidas de uma entrada do /history para o cache. Retorna os bytes."""
+        final = self.entry_dir(key)
+        tmp = f"{final}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        files, size = [], 0
+        for item in output_files(entry):
+            if item.get("type") not in self.dirs:
+                continue
+            sub = item.get("subfolder", "")
+            src = os.path.join(self.dirs[item["type"]], sub, item["filename"])
+            dest = os.path.join(tmp, "files", item["type"], sub, item["filename"])
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(src, dest)
+            size += os.path.getsize(dest)
+            files.append({k: item[k] for k in ("filename", "subfolder", "type") if k in item})
+        prompt = entry.get("prompt") or []
+        data = {"key": key, "outputs": entry.get("outputs", {}), "files": files,
+                "output_nodes": prompt[4] if len(prompt) > 4 else [], "created": time.time()}
+        os.makedirs(tmp, exist_ok=True)
+        with open(os.path.join(tmp, ENTRY_NAME), "w") as f:
+            json.dump(data, f)
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+        with self._lock:
+            self.index[key] = {"bytes": size, "created": data["created"], "last_used": data["created"], "hits": 0}
+            self.counters["stored"] += 1
+            self._save_index()
+        return size
+
+    def collect_once(self):
+        """Le o /history e guarda os prompts marcados que terminaram com sucesso."""
+        try:
+            history = self.client.get_json(f"/history?max_items={HISTORY_ITEMS}") or {}
+        except (OSError, ComfyError, ValueError):
+            return 0
+        stored = 0
+        for prompt_id, entry in history.items():
+            prompt = entry.get("prompt") or []
+            key = (prompt[3] or {}).get(KEY_FIELD) if len(prompt) > 3 else None
+            status = entry.get("status") or {}
+            if not key or key in self.index or key in self._failed or status.get("status_str", "success") != "success" \
+                    or not status.get("completed", True):
+                continue
+            try:
+                size = self.store(key, entry)
+                stored += 1
+                print(f"[RESULT_CACHE] Guardado {key[:12]} ({size / MB:.1f} MB)", flush=True)
+            except OSError as e:
+                with self._lock:
+                    self.counters["store_failed"] += 1
+                    self._failed.add(key)
+                print(f"[RESULT_CACHE] Falha ao guardar {key[:12]}: {e}", flush=True)
+        if stored:
+            self.evict()
+        return stored
+
+    def evict(self):
+        """LRU por tamanho: remove as entradas menos usadas ate caber em max_bytes."""
+        with self._lock:
+            total = sum(info.get("bytes", 0) for info in self.index.values())
+            for key in sorted(self.index, key=lambda k: self.index[k].get("last_used", 0)):
+                if total <= self.max_bytes:
+                    break
+                info = self.index.pop(key)
+                shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+                total -= info.get("bytes", 0)
+                self.counters["evicted"] += 1
+                self.counters["evicted_bytes"] += info.get("bytes", 0)
+            self._save_index()
+        return total
+
+    def run_collector(self, interval=COLLECT_INTERVAL):
+        while True:
+            self.collect_once()
+            time.sleep(interval)
+
+    def status(self):
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return 200, dict(self.counters,
+                             hit_rate=round(self.counters["hits"] / lookups, 3) if lookups else None,
+                             entries=len(self.index),
+                             bytes=sum(info.get("bytes", 0) for info in self.index.values()),
+                             max_bytes=self.max_bytes)
+
+    def install(self, proxy):
+        proxy.prompt_hooks.append(self.on_prompt)
+        proxy.intercepts.append(self.intercept)
+        proxy.routes[STATUS_PATH] = self.status
+        threading.Thread(target=self.run_collector, daemon=True).start()
+        return self
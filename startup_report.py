@@ -0,0 +1,160 @@
+"""
+startup_report.py
+=================
+Tempos do cold start do run_comfyui em JSON, para comparar entre BUILD_IDs.
+
+  - Fases com cronometro (`with report.phase("validate"): ...`).
+  - Cada download: bytes, segundos e MB/s (resultados do ModelDownloader).
+  - Time-to-ready: do inicio ate o primeiro HTTP 200 na porta da UI,
+    medido por polling (wait_until_ready).
+
+O relatorio vai para `<volume>/.kythours_reports/` (um arquivo por start +
+`latest.json`, mantendo os MAX_REPORTS mais recentes) e um resumo vai para
+o log.
+
+USO:
+  report = StartupReport(BUILD_ID, reports_dir)
+  with report.phase("validate"):
+      ...
+  report.add_downloads(results)
+  report.wait_until_ready(f"http://127.0.0.1:{UI_PORT}/")   # em thread
+  report.write()
+"""
+
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+
+from model_downloader import MB
+
+REPORTS_DIRNAME = ".kythours_reports"
+MAX_REPORTS = 50
+READY_POLL_INTERVAL = 0.5
+READY_TIMEOUT = 10 * 60
+
+
+class StartupReport:
+    """
+    build_id:    BUILD_ID do app (vai no nome do arquivo e no JSON).
+    reports_dir: pasta dos relatorios (normalmente no volume).
+    """
+
+    def __init__(self, build_id, reports_dir):
+        self.build_id = build_id
+        self.reports_dir = reports_dir
+        self.started_at = time.time()
+        self._t0 = time.monotonic()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # ready e fim do background gravam
+        self.phases = {}
+        self.downloads = []
+        self.extra = {}
+        self.ready_seconds = None
+        self._path = None
+
+    def elapsed(self):
+        return time.monotonic() - self._t0
+
+    @contextmanager
+    def phase(self, name):
+        """Cronometra um bloco; fases repetidas acumulam."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            seconds = time.monotonic() - started
+            with self._lock:
+                entry = self.phases.setdefault(name, {"seconds": 0.0, "start": started - self._t0})
+                entry["seconds"] += seconds
+            print(f"[TIMING] {name}: {seconds:.1f}s", flush=True)
+
+    def set(self, key, value):
+        """Informacao extra no relatorio (ex: stats da validacao)."""
+        with self._lock:
+            self.extra[key] = value
+
+    def add_downloads(self, results, stage="boot"):
+        with self._lock:
+            for r in results:
+                seconds = r.get("seconds") or 0.0
+                self.downloads.append({
+                    "name": r["name"],
+                    "stage": stage,
+                    "status": r["status"],
+                    "bytes": r.get("bytes", 0),
+                    "resumed": r.get("resumed", 0),
+                    "seconds": round(seconds, 3),
+                    "mb_per_s": round(r.get("bytes", 0) / MB / seconds, 2) if seconds > 0 else None,
+                    "linked": r.get("linked", False),
+                })
+
+    def wait_until_ready(self, url, timeout=READY_TIMEOUT):
+        """Faz polling ate `url` responder 200. Retorna os segundos desde o inicio (ou None)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with urllib.request.urlopen(url, timeout=5) as resp:
+                    if resp.status == 200:
+                        self.ready_seconds = self.elapsed()
+                        print(f"[TIMING] ComfyUI pronto (HTTP 200) em {self.ready_seconds:.1f}s", flush=True)
+                        return self.ready_seconds
+            except (OSError, urllib.error.URLError):
+                pass
+            time.sleep(READY_POLL_INTERVAL)
+        print(f"[TIMING] ComfyUI nao respondeu em {timeout}s", flush=True)
+        return None
+
+    def to_dict(self):
+        with self._lock:
+            ok = [d for d in self.downloads if d["status"] == "ok"]
+            total_bytes = sum(d["bytes"] for d in ok)
+            return {
+                "build_id": self.build_id,
+                "started_at": self.started_at,
+                "ready_seconds": self.ready_seconds,
+                "phases": {k: dict(v, seconds=round(v["seconds"], 3), start=round(v["start"], 3))
+                           for k, v in self.phases.items()},
+                "downloads": list(self.downloads),
+                "download_totals": {
+                    "files": len(ok),
+                    "failed": len(self.downloads) - len(ok),
+                    "bytes": total_bytes,
+                },
+                **self.extra,
+            }
+
+    def summary(self):
+        data = self.to_dict()
+        phases = ", ".join(f"{k}={v['seconds']:.1f}s" for k, v in data["phases"].items())
+        totals = data["download_totals"]
+        ready = f"{data['ready_seconds']:.1f}s" if data["ready_seconds"] is not None else "n/a"
+        return (f"[REPORT] Build {self.build_id}: pronto em {ready} | {phases} | "
+                f"{totals['files']} download(s), {totals['bytes'] / MB:.0f} MB, {totals['failed']} falha(s)")
+
+    def write(self):
+        """Grava o JSON (mesmo arquivo a cada chamada) + latest.json e loga o resumo."""
+        with self._write_lock:
+            os.makedirs(self.reports_dir, exist_ok=True)
+            if self._path is None:
+                stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(self.started_at))
+                self._path = os.path.join(self.reports_dir, f"startup-{self.build_id}-{stamp}.json")
+            data = self.to_dict()
+            for path in (self._path, os.path.join(self.reports_dir, "latest.json")):
+                tmp = path + ".tmp"
+                with open(tmp, "w") as f:
+                    json.dump(data, f, indent=1)
+                os.replace(tmp, path)
+            self._prune()
+        print(self.summary(), flush=True)
+        return self._path
+
+    def _prune(self):
+        reports = [os.path.join(self.reports_dir, f) for f in os.listdir(self.reports_dir)
+                   if f.startswith("startup-") and f.endswith(".json")]
+        reports.sort(key=os.path.getmtime)
+        for path in reports[:-MAX_REPORTS]:
+            os.remove(path)
@@ -0,0 +1,47 @@
+"""
+Fixtures compartilhadas dos testes: espelho HTTP local dos hosts do catalogo
+(bench_startup.MirrorServer) e ComfyUI falso (comfy_router.FakeComfyUI).
+Nada sai para a internet nem precisa de GPU.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_startup import MirrorServer  # noqa: E402
+from comfy_router import FakeComfyUI  # noqa: E402
+from volume_sync import mirror_catalog  # noqa: E402
+
+
+@pytest.fixture
+def mirror():
+    """mirror(catalog) -> (MirrorServer, catalogo com as URLs do espelho)."""
+    servers = []
+
+    def start(catalog, **kwargs):
+        server = MirrorServer(catalog, **kwargs)
+        url = server.start()
+        servers.append(server)
+        return server, mirror_catalog(catalog, url)
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def fake_comfy():
+    """fake_comfy(seconds=0.05) -> FakeComfyUI rodando (fila com um worker)."""
+    fakes = []
+
+    def start(seconds=0.05, **kwargs):
+        fake = FakeComfyUI(seconds=seconds, **kwargs).start()
+        fakes.append(fake)
+        return fake
+
+    yield start
+    for fake in fakes:
+        fake.shutdown()
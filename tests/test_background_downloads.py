@@ -0,0 +1,82 @@
+import os
+
+from background_downloads import BackgroundDownloads, read_status
+from model_downloader import ModelDownloader
+from model_store import ModelStore
+
+
+def _catalog(tmp_path, names):
+    return [{"url": f"https://huggingface.co/org/repo/resolve/main/{name}",
+             "path": str(tmp_path / "models" / "loras" / name)} for name in names]
+
+
+def _queue(tmp_path, **kwargs):
+    store = ModelStore(str(tmp_path / "models"))
+    return BackgroundDownloads(store, ModelDownloader(), workers=1,
+                               status_path=str(tmp_path / "status.json"), **kwargs)
+
+
+def test_lower_priority_downloads_first(tmp_path, mirror):
+    _, catalog = mirror(_catalog(tmp_path, ["c.safetensors", "a.safetensors", "b.safetensors"]))
+    order = []
+    queue = _queue(tmp_path, on_result=lambda r: order.append(r["name"]))
+    for model, priority in zip(catalog, (3, 1, 2)):
+        queue.put(model, priority)
+
+    assert queue.status()["pending"] == ["a.safetensors", "b.safetensors", "c.safetensors"]
+    queue.start()
+    assert queue.wait(30)
+
+    assert order == ["a.safetensors", "b.safetensors", "c.safetensors"]
+    assert all(os.path.exists(m["path"]) for m in catalog)
+
+
+def test_aliases_share_one_queue_item(tmp_path, mirror):
+    (model,) = _catalog(tmp_path, ["shared.safetensors"])
+    alias = dict(model, path=str(tmp_path / "models" / "controlnet" / "shared.safetensors"))
+    server, (model, alias) = mirror([model, alias])
+    results = []
+    queue = _queue(tmp_path, on_result=results.append)
+    queue.put(model, 1)
+    queue.put(alias, 1)
+
+    assert len(queue.status()["pending"]) == 1
+    queue.start()
+    assert queue.wait(30)
+
+    assert sorted(r["path"] for r in results) == sorted([model["path"], alias["path"]])
+    assert server.counters["requests"] == 2  # probe + GET
+
+
+def test_status_file_reports_failures_and_finish(tmp_path, mirror):
+    server, catalog = mirror(_catalog(tmp_path, ["ok.safetensors", "bad.safetensors"]))
+    server.faults["bad.safetensors"] = {"fail": 99}
+    finished = []
+    queue = _queue(tmp_path, on_finished=finished.append)
+    for model in catalog:
+        queue.put(model)
+    queue.start().join(30)  # reporter: on_finished roda depois do wait() liberar
+
+    status = read_status(queue.status_path)
+    assert status["finished"] and status["done"] == 1
+    assert [f["name"] for f in status["failed"]] == ["bad.safetensors"]
+    assert finished and finished[0]["done"] == 1
+
+
+def test_callback_errors_do_not_stop_the_queue(tmp_path, mirror):
+    _, catalog = mirror(_catalog(tmp_path, ["a.safetensors", "b.safetensors"]))
+
+    def explode(result):
+        raise RuntimeError("manifesto quebrado")
+
+    queue = _queue(tmp_path, on_result=explode)
+    for model in catalog:
+        queue.put(model)
+    queue.start()
+
+    assert queue.wait(30)
+    assert queue.status()["done"] == 2
+
+
+def test_missing_status_file_reads_as_finished(tmp_path):
+    assert read_status(str(tmp_path / "nada.json"))["finished"]
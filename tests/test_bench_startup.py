@@ -0,0 +1,42 @@
+import json
+
+from bench_startup import BASELINE_PATH, SCENARIOS, compare, format_table, metrics
+
+BASELINE = {"warm": {"ready_seconds": 10.0, "phase:validate": 1.0, "failed_downloads": 0}}
+
+
+def test_regression_needs_both_tolerance_and_min_delta():
+    # +20%: dentro da tolerancia
+    assert compare({"warm": {"ready_seconds": 12.0}}, BASELINE) == []
+    # +40% mas so 0.4s: ruido
+    assert compare({"warm": {"phase:validate": 1.4}}, BASELINE) == []
+    assert compare({"warm": {"ready_seconds": 13.0, "phase:validate": 2.0}}, BASELINE) == [
+        ("warm", "ready_seconds", 10.0, 13.0), ("warm", "phase:validate", 1.0, 2.0)]
+
+
+def test_any_extra_failed_download_is_a_regression():
+    assert compare({"warm": {"failed_downloads": 1}}, BASELINE) == [("warm", "failed_downloads", 0, 1)]
+    assert compare({"warm": {"failed_downloads": 0}}, BASELINE) == []
+
+
+def test_metrics_missing_from_baseline_are_ignored():
+    assert compare({"empty": {"ready_seconds": 99.0}, "warm": {"phase:new": 50.0}}, BASELINE) == []
+
+
+def test_metrics_flattens_report():
+    report = {"phases": {"validate": {"seconds": 0.12345}}, "ready_seconds": 1.5,
+              "background_seconds": None, "download_totals": {"failed": 2}}
+
+    values = metrics(report)
+
+    assert values == {"phase:validate": 0.123, "ready_seconds": 1.5, "failed_downloads": 2}
+    assert "phase:validate" in format_table({"warm": values})
+
+
+def test_committed_baseline_covers_every_scenario():
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+
+    assert sorted(baseline) == sorted(SCENARIOS)
+    for values in baseline.values():
+        assert {"ready_seconds", "failed_downloads", "phase:comfyui_boot"} <= set(values)
@@ -0,0 +1,70 @@
+import pytest
+
+from comfy_batch import BatchRunner, apply_overrides, build_jobs, save_result
+from comfy_client import ComfyClient
+
+WORKFLOW = {
+    "1": {"class_type": "LoraLoader", "inputs": {"lora_name": "a.safetensors", "strength_model": 1.0,
+                                                 "strength_clip": 1.0}},
+    "2": {"class_type": "CLIPTextEncode", "inputs": {"text": "positivo", "clip": ["1", 1]}},
+    "3": {"class_type": "CLIPTextEncode", "inputs": {"text": "negativo", "clip": ["1", 1]}},
+    "4": {"class_type": "KSampler", "inputs": {"seed": 1, "steps": 8, "positive": ["2", 0],
+                                               "negative": ["3", 0]}},
+    "5": {"class_type": "SaveImage", "inputs": {"images": ["4", 0]}},
+}
+
+
+def test_apply_overrides_targets_positive_prompt_seed_and_lora():
+    wf = apply_overrides(WORKFLOW, {"seed": 42, "prompt": "um gato", "set": {"4.steps": 4},
+                                    "lora": {"name": "FERPHOTO/b.safetensors", "strength": 0.7}})
+
+    assert wf["4"]["inputs"]["seed"] == 42 and wf["4"]["inputs"]["steps"] == 4
+    assert wf["2"]["inputs"]["text"] == "um gato"
+    assert wf["3"]["inputs"]["text"] == "negativo"
+    assert wf["1"]["inputs"] == {"lora_name": "FERPHOTO/b.safetensors", "strength_model": 0.7,
+                                 "strength_clip": 0.7}
+    assert WORKFLOW["4"]["inputs"]["seed"] == 1
+
+
+def test_apply_overrides_rejects_lora_without_loader():
+    with pytest.raises(ValueError):
+        apply_overrides({"1": {"class_type": "KSampler", "inputs": {}}}, {"lora": "x.safetensors"})
+
+
+def test_build_jobs_defaults_to_one_job_per_workflow():
+    jobs = build_jobs({"workflows": {"a": WORKFLOW, "b": WORKFLOW}})
+    assert [(job["id"], job["name"]) for job in jobs] == [(0, "a"), (1, "b")]
+
+
+def test_runner_keeps_in_flight_bound_and_fetches_images(fake_comfy, tmp_path):
+    fake = fake_comfy(seconds=0.1)
+    depths = []
+    enqueue = fake.enqueue
+
+    def tracking_enqueue(payload):
+        depths.append(len(fake.pending) + len(fake.running))
+        return enqueue(payload)
+
+    fake.enqueue = tracking_enqueue
+    jobs = build_jobs({"workflows": {"a": WORKFLOW}, "jobs": [{"seed": s} for s in range(5)]})
+
+    results = list(BatchRunner(ComfyClient(fake.url), max_in_flight=2).run(jobs))
+
+    assert sorted(r["id"] for r in results) == list(range(5))
+    assert all(r["status"] == "ok" for r in results)
+    assert max(depths) < 2
+    for result in results:
+        (image,) = result["images"]
+        assert image["data"] == f"{fake.name}:{image['filename']}".encode()
+        assert result["execution_seconds"] is not None
+    paths = save_result(results[0], str(tmp_path))
+    assert len(paths) == 1 and open(paths[0], "rb").read() == results[0]["images"][0]["data"]
+
+
+def test_runner_reports_unreachable_comfyui_per_job():
+    jobs = build_jobs({"workflows": {"a": WORKFLOW}, "jobs": [{"seed": 1}, {"seed": 2}]})
+
+    results = list(BatchRunner(ComfyClient("http://127.0.0.1:9", timeout=1)).run(jobs))
+
+    assert [r["status"] for r in results] == ["failed", "failed"]
+    assert all(r["prompt_id"] is None for r in results)
@@ -0,0 +1,86 @@
+import json
+import threading
+import urllib.request
+
+from comfy_client import ComfyClient
+from comfy_metrics import Histogram, MetricsCollector, serve
+
+WORKFLOW = {"1": {"class_type": "CheckpointLoaderSimple", "inputs": {}},
+            "2": {"class_type": "KSampler", "inputs": {}}}
+
+
+def test_poll_counts_finished_prompts_once(fake_comfy):
+    fake = fake_comfy()
+    client = ComfyClient(fake.url)
+    for _ in range(2):
+        client.wait_for(client.queue_prompt(WORKFLOW), timeout=10)
+    collector = MetricsCollector(client)
+
+    assert collector.poll_once()
+    assert collector.poll_once()
+
+    text = collector.render()
+    assert "comfyui_up 1" in text
+    assert "comfyui_queue_pending 0" in text
+    assert 'comfyui_prompts_total{status="success"} 2' in text
+    assert 'comfyui_prompt_execution_seconds_count{status="success"} 2' in text
+    assert len(collector.recent_json()) == 2
+    # sem websocket (prompts da UI): nada de serie por node vazia
+    assert "comfyui_node_execution_seconds" not in text
+    assert "comfyui_model_load_seconds" not in text
+
+
+def test_websocket_node_timings_are_labeled_by_class_type(fake_comfy):
+    fake = fake_comfy()
+    client = ComfyClient(fake.url)
+    prompt_id = client.queue_prompt(WORKFLOW)
+    collector = MetricsCollector(client)
+    for node, now in (("1", 0.0), ("2", 1.5), (None, 2.0)):
+        collector.on_message({"type": "executing", "data": {"node": node, "prompt_id": prompt_id}}, now=now)
+    client.wait_for(prompt_id, timeout=10)
+
+    collector.poll_once()
+
+    (record,) = collector.recent_json()
+    assert record["nodes"] == {"1": {"class_type": "CheckpointLoaderSimple", "seconds": 1.5},
+                               "2": {"class_type": "KSampler", "seconds": 0.5}}
+    text = collector.render()
+    assert 'comfyui_model_load_seconds_count{class_type="CheckpointLoaderSimple"} 1' in text
+    assert 'comfyui_node_execution_seconds_count{class_type="KSampler"} 1' in text
+
+
+def test_unreachable_comfyui_sets_up_to_zero():
+    collector = MetricsCollector(ComfyClient("http://127.0.0.1:9", timeout=1))
+
+    assert not collector.poll_once()
+    assert "comfyui_up 0" in collector.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("h", "doc", buckets=(1, 5))
+    for value in (0.5, 3, 10):
+        histogram.observe(value)
+
+    lines = histogram.render()
+    assert 'h_bucket{le="1"} 1' in lines
+    assert 'h_bucket{le="5"} 2' in lines
+    assert 'h_bucket{le="+Inf"} 3' in lines
+    assert "h_sum 13.500000" in lines
+
+
+def test_download_status_is_served_next_to_metrics(tmp_path):
+    status_path = tmp_path / "downloads.json"
+    server = serve(MetricsCollector(ComfyClient("http://127.0.0.1:9", timeout=1)), 0, "127.0.0.1",
+                   status_path=str(status_path))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/downloads"
+    try:
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            assert json.load(resp)["finished"] is True  # sem fila: status vazio
+        status_path.write_text(json.dumps({"pending": ["a"], "active": [], "done": 1, "failed": [],
+                                           "finished": False}))
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            assert json.load(resp)["pending"] == ["a"]
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,152 @@
+import json
+import urllib.request
+
+import pytest
+
+from comfy_client import ComfyClient, ComfyError
+from comfy_proxy import TOKEN_HEADER, ComfyProxy
+from comfy_router import COOKIE, STATUS_PATH, Autoscaler, ComfyRouter, fix_userdata_path, registry_backends
+
+
+@pytest.fixture
+def router():
+    """router(backends) -> ComfyRouter rodando (polling lento: a carga vem dos envios)."""
+    routers = []
+
+    def start(backends, poll=60):
+        r = ComfyRouter(0, backends, host="127.0.0.1", poll=poll)
+        r.start()
+        r.url = f"http://127.0.0.1:{r.port}"
+        routers.append(r)
+        return r
+
+    yield start
+    for r in routers:
+        r.shutdown()
+
+
+def _request(url, data=None, cookie=None, method=None):
+    req = urllib.request.Request(url, data=data, method=method)
+    if cookie:
+        req.add_header("Cookie", f"{COOKIE}={cookie}")
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return resp.headers, resp.read()
+
+
+def _name(fake):
+    return f"127.0.0.1:{fake.port}"
+
+
+def test_prompts_go_to_the_shortest_queue(fake_comfy, router):
+    fakes = [fake_comfy(seconds=0.2), fake_comfy(seconds=0.2)]
+    r = router([f.url for f in fakes])
+    client = ComfyClient(r.url)
+
+    ids = [client.queue_prompt({"1": {"class_type": "KSampler", "inputs": {"seed": i}}}) for i in range(4)]
+
+    assert [f._number for f in fakes] == [2, 2]
+    assert r.counters["dispatched"] == 4
+    for prompt_id in ids:
+        assert client.wait_for(prompt_id, timeout=10)["status"]["completed"]
+
+
+def test_history_is_merged_and_entries_routed_to_their_backend(fake_comfy, router):
+    fakes = [fake_comfy(), fake_comfy()]
+    for fake in fakes:
+        ComfyClient(fake.url).wait_for(ComfyClient(fake.url).queue_prompt({}), timeout=10)
+    ComfyClient(fakes[0].url).wait_for(ComfyClient(fakes[0].url).queue_prompt({}), timeout=10)
+    r = router([f.url for f in fakes])
+    client = ComfyClient(r.url)
+
+    history = client.history()
+
+    assert set(history) == set(fakes[0].history) | set(fakes[1].history)
+    assert len(client.get_json("/history?max_items=2")) == 2
+    only_second = next(iter(fakes[1].history))
+    assert list(client.history(only_second)) == [only_second]
+    # ComfyUI_00001_.png so existe no primeiro backend (o outro rodou um prompt)
+    assert client.view("ComfyUI_00001_.png") == f"{fakes[0].name}:ComfyUI_00001_.png".encode()
+
+
+def test_view_of_unknown_file_asks_every_backend(fake_comfy, router):
+    fakes = [fake_comfy(), fake_comfy()]
+    fakes[1].files["antigo.png"] = b"gerado antes do roteador subir"
+    r = router([f.url for f in fakes])
+
+    assert ComfyClient(r.url).view("antigo.png") == b"gerado antes do roteador subir"
+
+
+def test_ui_session_sticks_to_one_backend_and_fixes_userdata(fake_comfy, router):
+    fakes = [fake_comfy(), fake_comfy()]
+    r = router([f.url for f in fakes])
+
+    headers, _ = _request(r.url + "/")
+    backend = headers["Set-Cookie"].split(";")[0].split("=", 1)[1]
+    # Como chega pelo proxy do Modal: %2F ja decodificado
+    _request(r.url + "/api/userdata/workflows/a.json", data=b'{"nodes": []}', cookie=backend, method="POST")
+    _, body = _request(r.url + "/api/userdata/workflows/a.json", cookie=backend)
+
+    assert body == b'{"nodes": []}'
+    (owner,) = [f for f in fakes if _name(f) == backend]
+    assert owner.userdata == {"workflows/a.json": b'{"nodes": []}'}
+    assert r.counters["sessions"] == 1
+
+
+def test_dispatch_skips_a_backend_that_went_away(fake_comfy, router):
+    gone, alive = fake_comfy(), fake_comfy()
+    r = router([gone.url, alive.url])
+    gone.shutdown()
+
+    for _ in range(2):
+        ComfyClient(r.url).queue_prompt({})
+
+    assert alive._number == 2
+    status = json.loads(_request(r.url + STATUS_PATH)[1])
+    assert status["backends"][_name(gone)]["healthy"] is False
+
+
+def test_autoscaler_asks_for_one_more_backend_when_all_are_busy(fake_comfy, router):
+    r = router([fake_comfy().url])
+    spawned = []
+    scaler = Autoscaler(r, lambda: spawned.append(1), max_backends=3, scale_depth=2)
+
+    assert scaler.step() == 0
+    (backend,) = r.backends.values()
+    backend.depth = 2
+    assert scaler.step() == 1
+    assert scaler.step() == 0  # pedido anterior ainda dentro do grace
+    assert spawned == [1]
+
+
+def test_registry_drops_stale_backends():
+    registry = {"a": {"url": "http://a", "heartbeat": 100, "token": "t"}, "b": {"url": "http://b", "heartbeat": 10}}
+    assert registry_backends(registry, stale_after=60, now=120) == {"a": {"url": "http://a", "token": "t"}}
+
+
+def test_token_protected_backend_only_answers_the_router(fake_comfy, router):
+    fake = fake_comfy()
+    proxy = ComfyProxy(0, fake.port, host="127.0.0.1", token="segredo")
+    proxy.start()
+    backend_url = f"http://127.0.0.1:{proxy.port}"
+    try:
+        for headers in ({}, {TOKEN_HEADER: "errado"}):
+            with pytest.raises(ComfyError, match="HTTP 403"):
+                ComfyClient(backend_url, headers=headers).queue()
+        r = router(lambda: {"b": {"url": backend_url, "token": "segredo"}}, poll=0.1)
+        client = ComfyClient(r.url, headers={TOKEN_HEADER: "do-cliente"})
+
+        prompt_id = client.queue_prompt({"1": {"class_type": "KSampler", "inputs": {}}})
+
+        assert client.wait_for(prompt_id, timeout=10)["status"]["completed"]
+        assert r.status()["backends"]["b"]["healthy"]
+        assert prompt_id in client.history()
+    finally:
+        proxy.shutdown()
+
+
+def test_fix_userdata_path_is_idempotent():
+    fixed = "/api/userdata/workflows%2Fa.json?overwrite=true"
+    assert fix_userdata_path("/api/userdata/workflows/a.json?overwrite=true") == fixed
+    assert fix_userdata_path(fixed) == fixed
+    assert fix_userdata_path("/userdata/a/b.json/move/c/d.json") == "/userdata/a%2Fb.json/move/c%2Fd.json"
+    assert fix_userdata_path("/history") == "/history"
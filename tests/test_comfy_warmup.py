@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from comfy_client import ComfyClient
+from comfy_warmup import DEFAULT_WORKFLOW, WARMUP_SIZE, load_workflows, minimize, run_warmup
+
+
+def test_warmup_runs_default_workflow_until_done(fake_comfy):
+    fake = fake_comfy()
+
+    result = run_warmup(ComfyClient(fake.url), timeout=10)
+
+    assert [run["status"] for run in result["workflows"]] == ["ok"]
+    assert len(fake.history) == 1
+
+
+def test_warmup_minimizes_custom_workflows(fake_comfy):
+    fake = fake_comfy()
+    workflow = json.loads(json.dumps(DEFAULT_WORKFLOW))
+    workflow["7"]["inputs"]["steps"] = 30
+    workflow["6"]["inputs"].update(width=1024, height=1536)
+
+    run_warmup(ComfyClient(fake.url), [workflow], timeout=10)
+
+    (entry,) = fake.history.values()
+    sent = entry["prompt"][2]
+    assert sent["7"]["inputs"]["steps"] == 1
+    assert (sent["6"]["inputs"]["width"], sent["6"]["inputs"]["height"]) == (WARMUP_SIZE, WARMUP_SIZE)
+    assert workflow["7"]["inputs"]["steps"] == 30  # o original nao e alterado
+
+
+def test_warmup_failure_is_reported_not_raised(fake_comfy):
+    fake = fake_comfy(seconds=5)
+
+    result = run_warmup(ComfyClient(fake.url), timeout=0.5)
+
+    (run,) = result["workflows"]
+    assert run["status"] == "failed" and "nao terminou" in run["error"]
+
+
+def test_minimize_keeps_links_and_small_values():
+    workflow = {"1": {"inputs": {"steps": ["2", 0], "width": 128}}}
+    assert minimize(workflow) == workflow
+
+
+def test_load_workflows_rejects_ui_format(tmp_path):
+    ui = tmp_path / "ui.json"
+    ui.write_text(json.dumps({"nodes": [], "links": []}))
+    api = tmp_path / "api.json"
+    api.write_text(json.dumps({"prompt": DEFAULT_WORKFLOW}))
+
+    assert load_workflows([str(api)]) == [DEFAULT_WORKFLOW]
+    with pytest.raises(ValueError):
+        load_workflows([str(ui)])
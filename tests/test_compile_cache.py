@@ -0,0 +1,81 @@
+import json
+import os
+import time
+
+from compile_cache import CACHE_DIRNAME, CACHE_DIRS, INDEX_NAME, CompileCache, cache_key
+
+
+def _fill(cache_dir, rel, nbytes, age=0):
+    path = os.path.join(cache_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"k" * nbytes)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_key_changes_with_build_and_gpu():
+    key = cache_key("v36", gpu="NVIDIA A10G-sm86")
+
+    assert key.startswith("v36-torch") and key.endswith("NVIDIA_A10G-sm86")
+    assert cache_key("v37", gpu="NVIDIA A10G-sm86") != key
+    assert cache_key("v36", gpu="NVIDIA L4-sm89") != key
+    assert "/" not in cache_key("v/36", gpu="a b")
+
+
+def test_prepare_points_every_cache_at_the_key(tmp_path):
+    cache = CompileCache(str(tmp_path), "v36", key="k1")
+
+    env = cache.prepare()
+
+    assert cache.warm is False
+    for var, sub in CACHE_DIRS.items():
+        assert env[var] == os.path.join(str(tmp_path), CACHE_DIRNAME, "k1", sub)
+        assert os.path.isdir(env[var])
+    _fill(env["TRITON_CACHE_DIR"], "kernel.cubin", 10)
+    again = CompileCache(str(tmp_path), "v36", key="k1")
+    again.prepare()
+    assert again.warm is True
+
+
+def test_evict_drops_least_recently_used_keys_first(tmp_path):
+    base = os.path.join(str(tmp_path), CACHE_DIRNAME)
+    for key, used in (("velha", 1), ("media", 2)):
+        CompileCache(str(tmp_path), "", key=key).prepare()
+        _fill(os.path.join(base, key), "triton/a", 100)
+        with open(os.path.join(base, INDEX_NAME)) as f:
+            index = json.load(f)
+        index[key]["last_used"] = used
+        with open(os.path.join(base, INDEX_NAME), "w") as f:
+            json.dump(index, f)
+    current = CompileCache(str(tmp_path), "", max_bytes=250, key="atual")
+    current.prepare()
+    _fill(current.path, "triton/b", 100)
+
+    stats = current.evict()
+
+    assert stats["keys_removed"] == ["velha"] and stats["files_removed"] == 0
+    assert sorted(current.usage()) == ["atual", "media"]
+    with open(current.index_path) as f:
+        assert "velha" not in json.load(f)
+
+
+def test_evict_trims_oldest_files_of_current_key(tmp_path):
+    cache = CompileCache(str(tmp_path), "", max_bytes=150, key="atual")
+    cache.prepare()
+    old = _fill(cache.path, "inductor/velho", 100, age=3600)
+    new = _fill(cache.path, "inductor/novo", 100)
+
+    stats = cache.evict()
+
+    assert stats == {"bytes": 100, "freed": 100, "keys_removed": [], "files_removed": 1}
+    assert not os.path.exists(old) and os.path.exists(new)
+
+
+def test_evict_under_the_cap_removes_nothing(tmp_path):
+    cache = CompileCache(str(tmp_path), "", max_bytes=1000, key="atual")
+    cache.prepare()
+    _fill(cache.path, "cuda/x", 100)
+
+    assert cache.evict()["freed"] == 0
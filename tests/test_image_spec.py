@@ -0,0 +1,114 @@
+import hashlib
+import json
+
+import pytest
+
+import image_spec
+from image_spec import SHA_RE, layers, manifest_hash, pin, profile_nodes, render_dockerfile, unpinned
+
+SHA = "a" * 40
+
+
+def _manifest():
+    return {
+        "python": "3.11",
+        "apt": ["git"],
+        "torch": {"index_url": "https://download.pytorch.org/whl/cu121", "packages": ["torch==2.5.1"]},
+        "comfyui": {"repo": "https://github.com/comfyanonymous/ComfyUI.git", "ref": "master"},
+        "pip": ["gguf"],
+        "nodes": [
+            {"name": "pack-a", "repo": "https://github.com/x/pack-a.git"},
+            {"name": "pack-b", "repo": "https://github.com/x/pack-b.git", "ref": SHA, "requirements": False,
+             "post_install": ["touch {dir}/ok"]},
+        ],
+        "profiles": {"minimal": {"nodes": ["pack-a"]}, "full": {"nodes": "*"},
+                     "edit": {"nodes": ["pack-b"], "extends": "minimal"}},
+    }
+
+
+def _fake_resolver(repo, ref=None):
+    return hashlib.sha1(f"{repo}@{ref}".encode()).hexdigest()
+
+
+def _lock(manifest):
+    return {"manifest": manifest_hash(manifest), "requirements": ["gguf==0.10.0", "numpy==1.26.4"],
+            "comfyui": {"repo": manifest["comfyui"]["repo"], "ref": manifest["comfyui"]["ref"],
+                        "commit": manifest["comfyui"]["ref"]},
+            "nodes": {n["name"]: {"repo": n["repo"], "ref": n.get("ref"), "commit": n["ref"]}
+                      for n in manifest["nodes"]}}
+
+
+def test_pin_fixes_every_repo_and_keeps_what_to_track():
+    manifest = pin(_manifest(), resolver=_fake_resolver)
+
+    assert unpinned(manifest) == []
+    assert manifest["comfyui"]["track"] == "master" and SHA_RE.match(manifest["comfyui"]["ref"])
+    assert "track" not in manifest["nodes"][0]  # sem ref: HEAD
+    assert manifest["nodes"][1]["ref"] == SHA  # ja fixado: so muda com update
+
+    updated = pin(manifest, update=True, resolver=lambda repo, ref=None: "b" * 40)
+    assert {entry["ref"] for _, entry in image_spec.repo_entries(updated)} == {"b" * 40}
+
+
+def test_unlocked_render_is_tolerant_and_locked_render_is_not():
+    manifest = pin(_manifest(), resolver=_fake_resolver)
+
+    unlocked = render_dockerfile(manifest)
+    locked = render_dockerfile(manifest, _lock(manifest))
+
+    assert "|| echo '[WARN] deps de pack-a falharam'" in unlocked
+    assert "pack-b/requirements.txt" not in unlocked  # requirements: false
+    assert "|| echo" not in locked
+    assert "COPY requirements.lock.txt" in locked and "--no-deps -r" in locked
+    assert f"fetch -q --depth 1 origin {manifest['nodes'][0]['ref']}" in locked
+    assert "touch /root/ComfyUI/custom_nodes/pack-b/ok" in locked
+
+
+def test_stale_lock_renders_unlocked():
+    manifest = pin(_manifest(), resolver=_fake_resolver)
+    lock = _lock(manifest)
+    manifest["pip"].append("scipy")
+
+    titles = [layer["title"] for layer in layers(manifest, lock)]
+    assert "Deps python extras (sem lock)" in titles
+
+
+def test_profiles_resolve_extends_in_manifest_order():
+    manifest = _manifest()
+    assert profile_nodes(manifest, "edit") == ["pack-a", "pack-b"]
+    assert profile_nodes(manifest, "full") == ["pack-a", "pack-b"]
+    with pytest.raises(ValueError):
+        profile_nodes(manifest, "nao-existe")
+
+
+@pytest.fixture
+def spec_files(tmp_path, monkeypatch):
+    paths = {name: str(tmp_path / name) for name in
+             ("custom_nodes.json", "custom_nodes.lock.json", "Dockerfile.comfyui", "requirements.lock.txt")}
+    monkeypatch.setattr(image_spec, "MANIFEST_PATH", paths["custom_nodes.json"])
+    monkeypatch.setattr(image_spec, "LOCK_PATH", paths["custom_nodes.lock.json"])
+    monkeypatch.setattr(image_spec, "DOCKERFILE_PATH", paths["Dockerfile.comfyui"])
+    monkeypatch.setattr(image_spec, "REQUIREMENTS_LOCK_PATH", paths["requirements.lock.txt"])
+    monkeypatch.setattr(image_spec, "ls_remote", _fake_resolver)
+    with open(paths["custom_nodes.json"], "w") as f:
+        json.dump(_manifest(), f)
+    return paths
+
+
+def test_check_rejects_unpinned_and_unlocked_images(spec_files, capsys):
+    assert image_spec.main(["render"]) == 0
+    assert image_spec.main(["check"]) == 1
+    out = capsys.readouterr().out
+    assert "Sem commit fixo: comfyui, pack-a" in out and "lock.json ausente" in out
+
+    assert image_spec.main(["pin"]) == 0
+    with open(spec_files["custom_nodes.json"]) as f:
+        manifest = json.load(f)
+    with open(spec_files["custom_nodes.lock.json"], "w") as f:
+        json.dump(_lock(manifest), f)
+    assert image_spec.main(["check"]) == 1  # Dockerfile ainda e o sem trava
+
+    assert image_spec.main(["render"]) == 0
+    assert image_spec.main(["check"]) == 0
+    with open(spec_files["requirements.lock.txt"]) as f:
+        assert f.read().splitlines()[1:] == ["gguf==0.10.0", "numpy==1.26.4"]
@@ -0,0 +1,63 @@
+import os
+import threading
+
+import pytest
+
+from comfy_proxy import PromptRejected
+from lazy_models import LazyModelFetcher, workflow_model_refs
+from model_downloader import ModelDownloader
+
+HF = "https://huggingface.co/org/repo/resolve/main"
+
+
+def _catalog(comfyui_dir):
+    return [{"url": f"{HF}/a.safetensors", "path": f"{comfyui_dir}/models/loras/FERPHOTO/a.safetensors"},
+            {"url": f"{HF}/b.safetensors", "path": f"{comfyui_dir}/models/loras/b.safetensors"}]
+
+
+def _payload(*names):
+    return {"prompt": {str(i): {"class_type": "LoraLoader", "inputs": {"lora_name": name, "strength_model": 1}}
+                       for i, name in enumerate(names)}}
+
+
+def test_refs_come_from_model_inputs_only():
+    prompt = {"1": {"inputs": {"lora_name": "FERPHOTO\\a.safetensors", "text": "a.safetensors"}},
+              "2": {"inputs": {"vae_name": "ae.safetensors", "model": ["1", 0]}}}
+    assert workflow_model_refs(prompt) == {"FERPHOTO/a.safetensors", "ae.safetensors"}
+
+
+def test_missing_models_are_downloaded_before_the_prompt(tmp_path, mirror):
+    _, catalog = mirror(_catalog(tmp_path))
+    fetcher = LazyModelFetcher(str(tmp_path), catalog=catalog, downloader=ModelDownloader())
+    payload = _payload("FERPHOTO/a.safetensors", "b.safetensors")
+
+    assert len(fetcher.missing_for(payload["prompt"])) == 2
+    assert fetcher.on_prompt(payload) is payload
+    assert all(os.path.exists(m["path"]) for m in catalog)
+    assert fetcher.missing_for(payload["prompt"]) == []
+
+
+def test_slow_download_rejects_then_retry_reuses_it(tmp_path, mirror):
+    _, catalog = mirror(_catalog(tmp_path))
+    fetcher = LazyModelFetcher(str(tmp_path), catalog=catalog, downloader=ModelDownloader(), wait=0.2)
+    release = threading.Event()
+    calls = []
+    download_all = fetcher.store.download_all
+
+    def slow_download_all(downloader, models):
+        calls.append(len(models))
+        release.wait(10)
+        return download_all(downloader, models)
+
+    fetcher.store.download_all = slow_download_all
+    payload = _payload("b.safetensors")
+
+    with pytest.raises(PromptRejected, match="tente de novo"):
+        fetcher.on_prompt(payload)
+    assert [p["name"] for p in fetcher.status()[1]["pending"]] == ["b.safetensors"]
+
+    release.set()
+    fetcher.wait = 10
+    assert fetcher.on_prompt(payload) is payload
+    assert calls == [1]  # o reenvio esperou o download em andamento
+    assert os.path.exists(catalog[1]["path"])
@@ -0,0 +1,75 @@
+import os
+
+from lazy_models import LazyModelFetcher
+from lora_sweep import checkpoint_label, expand_loras, fetch_loras, model_only, sweep_jobs
+from model_catalog import lora_checkpoints
+from model_downloader import ModelDownloader
+
+RUN = {"repo": "org/treinos", "dir": "v7", "name": "FER_v7", "dest": "loras/FERPHOTO", "steps": [250, 500, 750]}
+WORKFLOW = {
+    "1": {"class_type": "UNETLoader", "inputs": {"unet_name": "z.safetensors"}},
+    "2": {"class_type": "CLIPLoader", "inputs": {"clip_name": "qwen.safetensors"}},
+    "3": {"class_type": "LoraLoader", "inputs": {"model": ["1", 0], "clip": ["2", 0], "lora_name": "x",
+                                                 "strength_model": 1.0, "strength_clip": 1.0}},
+    "4": {"class_type": "CLIPTextEncode", "inputs": {"clip": ["3", 1], "text": "ohwx"}},
+    "5": {"class_type": "KSampler", "inputs": {"model": ["3", 0], "positive": ["4", 0], "seed": 0}},
+}
+
+
+def _models_dir(tmp_path):
+    return str(tmp_path / "models")
+
+
+def _touch(models_dir, rel):
+    path = os.path.join(models_dir, "loras", rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def test_expansion_covers_catalog_checkpoints_not_yet_in_volume(tmp_path):
+    models_dir = _models_dir(tmp_path)
+    catalog = lora_checkpoints(RUN, comfyui_dir=str(tmp_path))
+    _touch(models_dir, "FERPHOTO/FER_v7_000000500.safetensors")
+    _touch(models_dir, "outro.safetensors")  # fora do glob
+
+    loras = expand_loras(models_dir, "FERPHOTO/FER_v7*", catalog)
+
+    assert loras == [f"FERPHOTO/FER_v7_{s:09d}.safetensors" for s in (250, 500, 750)] + ["FERPHOTO/FER_v7.safetensors"]
+    assert [checkpoint_label(n) for n in loras[-2:]] == ["FER_v7 @750", "FER_v7 final"]
+    # glob so no nome do arquivo tambem casa
+    assert expand_loras(models_dir, "FER_v7_*500*", catalog) == ["FERPHOTO/FER_v7_000000500.safetensors"]
+
+
+def test_missing_checkpoints_are_fetched_before_queueing(tmp_path, mirror):
+    models_dir = _models_dir(tmp_path)
+    server, catalog = mirror(lora_checkpoints(RUN, comfyui_dir=str(tmp_path)))
+    server.faults["FER_v7_000000750.safetensors"] = {"fail": 99}
+    fetcher = LazyModelFetcher(str(tmp_path), catalog=catalog, downloader=ModelDownloader())
+    loras = expand_loras(models_dir, "FERPHOTO/*", catalog)
+
+    available = fetch_loras(models_dir, loras, catalog, fetcher)
+
+    # O que falhou sai do sweep; o resto ja esta no volume antes do primeiro prompt
+    assert "FERPHOTO/FER_v7_000000750.safetensors" not in available
+    assert len(available) == len(loras) - 1
+    assert all(os.path.exists(os.path.join(models_dir, "loras", n)) for n in available)
+    assert fetch_loras(models_dir, available, catalog, fetcher) == available
+
+
+def test_model_only_routes_clip_around_the_lora():
+    workflow = model_only(WORKFLOW)
+
+    assert workflow["3"]["class_type"] == "LoraLoaderModelOnly"
+    assert "clip" not in workflow["3"]["inputs"] and "strength_clip" not in workflow["3"]["inputs"]
+    assert workflow["4"]["inputs"]["clip"] == ["2", 0]
+    assert WORKFLOW["3"]["class_type"] == "LoraLoader"  # original intacto
+
+
+def test_jobs_vary_checkpoint_fastest():
+    loras = ["FERPHOTO/FER_v7_000000250.safetensors", "FERPHOTO/FER_v7.safetensors"]
+    jobs = sweep_jobs({"workflow": WORKFLOW, "prompts": ["a", "b"], "seeds": [1, 2]}, loras)
+
+    assert len(jobs) == 8
+    assert [j["overrides"]["lora"]["name"] for j in jobs[:2]] == loras
+    assert [(j["cell"]["row"], j["cell"]["col"]) for j in jobs[:4]] == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert jobs[4]["overrides"]["prompt"] == "b"
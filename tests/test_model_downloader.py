@@ -0,0 +1,143 @@
+import json
+import os
+
+import model_downloader
+from model_downloader import MB, SEGMENT_RETRIES, ModelDownloader, _PartState
+
+
+def _catalog(tmp_path, name="model.safetensors"):
+    return [{"url": f"https://huggingface.co/org/repo/resolve/main/{name}",
+             "path": str(tmp_path / "models" / "loras" / name)}]
+
+
+def _expected(server):
+    """Bytes que o espelho serve para o (unico) arquivo do catalogo."""
+    (key,) = server.files
+    content = server.content(key)
+    return content.read(0, content.size - 1)
+
+
+def test_download_splits_in_ranges_and_renames_atomically(tmp_path, mirror):
+    server, catalog = mirror(_catalog(tmp_path))
+    model = catalog[0]
+    downloader = ModelDownloader(connections_per_file=4, min_split_size=MB // 4)
+
+    result = downloader.download(model["url"], model["path"])
+
+    assert result["status"] == "ok"
+    assert result["resumed"] == 0
+    with open(model["path"], "rb") as f:
+        assert f.read() == _expected(server)
+    assert not os.path.exists(model["path"] + ".part")
+    assert not os.path.exists(model["path"] + ".part.json")
+    # probe + 4 segmentos
+    assert server.counters["requests"] == 5
+
+
+def test_truncated_transfer_keeps_partial_and_resumes(tmp_path, mirror):
+    server, catalog = mirror(_catalog(tmp_path))
+    model = catalog[0]
+    downloader = ModelDownloader(connections_per_file=1)
+    server.faults["model.safetensors"] = {"truncate": SEGMENT_RETRIES}
+
+    failed = downloader.download(model["url"], model["path"])
+
+    assert failed["status"] == "failed"
+    assert not os.path.exists(model["path"])  # nunca um arquivo pela metade no nome final
+    assert os.path.exists(model["path"] + ".part")
+    assert os.path.exists(model["path"] + ".part.json")
+
+    result = downloader.download(model["url"], model["path"])
+
+    expected = _expected(server)
+    assert result["status"] == "ok"
+    assert 0 < result["resumed"] < len(expected)
+    assert result["bytes"] == len(expected) - result["resumed"]
+    with open(model["path"], "rb") as f:
+        assert f.read() == expected
+    assert not os.path.exists(model["path"] + ".part.json")
+
+
+def test_part_is_fsynced_before_offset_is_persisted(tmp_path, monkeypatch):
+    data_path = str(tmp_path / "model.safetensors.part")
+    with open(data_path, "wb") as f:
+        f.write(b"x" * 100)
+    state = _PartState(data_path + ".json", 100, '"e"', [[0, 99, 0]], data_path)
+    events = []
+    real_fsync, real_replace = os.fsync, os.replace
+    monkeypatch.setattr(model_downloader.os, "fsync",
+                        lambda fd: events.append(("fsync", os.readlink(f"/proc/self/fd/{fd}"))) or real_fsync(fd))
+    monkeypatch.setattr(model_downloader.os, "replace",
+                        lambda src, dst: events.append(("replace", dst)) or real_replace(src, dst))
+
+    state.advance(0, 60)
+    state.save()
+
+    assert events[0] == ("fsync", data_path)
+    assert events[-1] == ("replace", data_path + ".json")
+    with open(data_path + ".json") as f:
+        assert json.load(f)["segments"] == [[0, 99, 60]]
+    assert _PartState.load(data_path + ".json", 100, '"e"', data_path).done() == 60
+
+
+def test_saved_state_never_runs_ahead_of_written_bytes(tmp_path, mirror, monkeypatch):
+    server, catalog = mirror(_catalog(tmp_path))
+    model = catalog[0]
+    monkeypatch.setattr(model_downloader, "STATE_FLUSH_BYTES", 1)  # save a cada chunk
+    monkeypatch.setattr(model_downloader, "READ_CHUNK", 64 * 1024)
+    expected = _expected(server)
+    checked = []
+    real_save = _PartState.save
+
+    def save(self):
+        real_save(self)
+        with open(self.path) as f:
+            segments = json.load(f)["segments"]
+        with open(self.data_path, "rb") as f:
+            data = f.read()
+        for start, _, pos in segments:
+            assert data[start:pos] == expected[start:pos]
+        checked.append(len(segments))
+
+    monkeypatch.setattr(_PartState, "save", save)
+    result = ModelDownloader(connections_per_file=2, min_split_size=MB // 4).download(model["url"], model["path"])
+
+    assert result["status"] == "ok" and len(checked) > 2
+
+
+def test_partial_is_discarded_when_remote_changes(tmp_path, mirror):
+    server, catalog = mirror(_catalog(tmp_path))
+    model = catalog[0]
+    downloader = ModelDownloader(connections_per_file=1)
+    server.faults["model.safetensors"] = {"truncate": SEGMENT_RETRIES}
+    assert downloader.download(model["url"], model["path"])["status"] == "failed"
+
+    server.faults["model.safetensors"]["etag"] = "v2"
+    result = downloader.download(model["url"], model["path"])
+
+    assert result["status"] == "ok"
+    assert result["resumed"] == 0
+    with open(model["path"], "rb") as f:
+        assert f.read() == _expected(server)
+
+
+def test_checksum_mismatch_removes_partial(tmp_path, mirror):
+    server, catalog = mirror(_catalog(tmp_path))
+    model = catalog[0]
+
+    result = ModelDownloader().download(model["url"], model["path"], sha256="0" * 64)
+
+    assert result["status"] == "failed"
+    assert "sha256" in result["error"]
+    assert not os.path.exists(model["path"])
+    assert not os.path.exists(model["path"] + ".part")
+
+
+def test_download_all_fetches_every_model(tmp_path, mirror):
+    names = [f"lora_{i}.safetensors" for i in range(3)]
+    server, catalog = mirror([m for name in names for m in _catalog(tmp_path, name)])
+
+    results = ModelDownloader(max_files=2).download_all(catalog)
+
+    assert sorted(r["name"] for r in results) == names
+    assert all(r["status"] == "ok" and os.path.getsize(r["path"]) > MB for r in results)
@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+from model_staging import USAGE_NAME, ModelStaging, name_index, resolve_refs, stageable
+
+
+def _model(models_dir, rel, nbytes=100):
+    path = os.path.join(models_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"m" * nbytes)
+    return rel
+
+
+def _staging(tmp_path, **kwargs):
+    kwargs.setdefault("reserve_bytes", 0)
+    return ModelStaging(str(tmp_path / "models"), str(tmp_path / "staging"), **kwargs)
+
+
+def _drain(staging, timeout=10):
+    deadline = time.monotonic() + timeout
+    while staging.stats()["pending"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_only_model_files_inside_models_are_stageable():
+    assert stageable("loras/a.safetensors")
+    assert not stageable("../user/workflow.safetensors")
+    assert not stageable("/abs/a.safetensors")
+    assert not stageable("loras/notes.txt")
+
+
+def test_workflow_names_resolve_with_or_without_subfolder():
+    index = name_index([os.path.join("loras", "FER", "x.safetensors"), os.path.join("vae", "ae.safetensors")])
+
+    assert resolve_refs(index, ["FER/x.safetensors", "ae.safetensors", "nao-existe.safetensors"]) == [
+        os.path.join("loras", "FER", "x.safetensors"), os.path.join("vae", "ae.safetensors")]
+
+
+def test_hot_set_prefers_recent_usage_over_fallback(tmp_path):
+    models = str(tmp_path / "models")
+    a, b, c = (_model(models, f"loras/{n}.safetensors") for n in "abc")
+    staging = _staging(tmp_path)
+    assert staging.hot_set(fallback=[c, "loras/sumiu.safetensors"]) == [c]
+
+    staging.touch([a], when=1)
+    staging.touch([b], when=2)
+
+    assert staging.hot_set(fallback=[c], limit=2) == [b, a]
+    with open(os.path.join(models, USAGE_NAME)) as f:
+        assert json.load(f)[a]["count"] == 1
+
+
+def test_copies_are_evicted_least_recently_used_first(tmp_path):
+    models = str(tmp_path / "models")
+    a, b, c = (_model(models, f"loras/{n}.safetensors") for n in "abc")
+    staging = _staging(tmp_path, max_bytes=250)
+    staging.touch([a], when=1)
+    staging.touch([b], when=2)
+    staging.start([a, b])
+    _drain(staging)
+    assert sorted(staging.staged) == [a, b]
+
+    staging.touch([c], when=3)
+    staging.stage([c])
+    _drain(staging)
+
+    assert sorted(staging.staged) == [b, c]
+    assert not os.path.exists(staging.local_path(a))
+    assert staging.stats()["evicted"] == 1
+
+
+def test_file_larger_than_cap_is_skipped(tmp_path):
+    big = _model(str(tmp_path / "models"), "diffusion_models/big.safetensors", 500)
+    staging = _staging(tmp_path, max_bytes=100).start([big])
+    _drain(staging)
+
+    assert staging.staged == {} and staging.counters["skipped"] == 1
+
+
+def test_restart_adopts_complete_copies_and_drops_partials(tmp_path):
+    models = str(tmp_path / "models")
+    ok, changed = _model(models, "vae/ok.safetensors"), _model(models, "vae/changed.safetensors")
+    first = _staging(tmp_path).start([ok, changed])
+    _drain(first)
+    _model(models, changed, 120)  # volume mudou depois da copia
+    with open(first.local_path("vae/meio.safetensors.part"), "wb") as f:
+        f.write(b"x")
+
+    second = _staging(tmp_path).start()
+
+    assert list(second.staged) == [ok]
+    assert not os.path.exists(second.local_path(changed))
+    assert not os.path.exists(second.local_path("vae/meio.safetensors.part"))
+
+
+def test_observe_counts_hits_and_stages_misses(tmp_path):
+    models = str(tmp_path / "models")
+    hot, cold = _model(models, "vae/ae.safetensors"), _model(models, "loras/x.safetensors")
+    staging = _staging(tmp_path).start([hot])
+    _drain(staging)
+    prompt = {"1": {"class_type": "VAELoader", "inputs": {"vae_name": "ae.safetensors"}},
+              "2": {"class_type": "LoraLoader", "inputs": {"lora_name": "x.safetensors"}}}
+
+    staging.observe(prompt, started=time.time())
+    _drain(staging)
+
+    stats = staging.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert cold in staging.staged
@@ -0,0 +1,86 @@
+import os
+
+from model_downloader import ModelDownloader
+from model_store import ModelStore
+
+URL = "https://huggingface.co/org/repo/resolve/main/shared.safetensors"
+
+
+def _write(path, data=b"modelo"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_aliases_download_once_and_share_the_blob(tmp_path, mirror):
+    root = str(tmp_path / "models")
+    aliases = [{"url": URL, "path": os.path.join(root, folder, "shared.safetensors")}
+               for folder in ("controlnet", "model_patches")]
+    server, catalog = mirror(aliases)
+    store = ModelStore(root)
+
+    results = store.download_all(ModelDownloader(), catalog)
+
+    assert [r["status"] for r in results] == ["ok", "ok"]
+    assert [r["linked"] for r in results] == [False, True]
+    assert results[1]["bytes"] == 0
+    blob = store.blob_path(catalog[0]["url"])
+    assert all(os.path.samefile(m["path"], blob) for m in catalog)
+    # probe + GET de um arquivo so
+    assert server.counters["requests"] == 2
+
+
+def test_new_alias_of_existing_blob_is_only_linked(tmp_path):
+    root = str(tmp_path / "models")
+    store = ModelStore(root)
+    _write(store.blob_path(URL))
+    model = {"url": URL, "path": os.path.join(root, "loras", "shared.safetensors")}
+
+    (result,) = store.download_all(ModelDownloader(), [model])  # nada a baixar: so o link
+
+    assert result["linked"] and result["bytes"] == 0
+    assert os.path.samefile(model["path"], store.blob_path(URL))
+
+
+def test_adopt_moves_existing_file_and_dedupes_copies(tmp_path):
+    root = str(tmp_path / "models")
+    store = ModelStore(root)
+    first = {"url": URL, "path": os.path.join(root, "controlnet", "shared.safetensors")}
+    second = {"url": URL, "path": os.path.join(root, "model_patches", "shared.safetensors")}
+    _write(first["path"])
+    _write(second["path"])
+
+    store.adopt(first)
+    store.adopt(second)
+
+    blob = store.blob_path(URL)
+    with open(blob, "rb") as f:
+        assert f.read() == b"modelo"
+    assert os.path.samefile(first["path"], blob) and os.path.samefile(second["path"], blob)
+    assert os.stat(blob).st_nlink == 3
+
+
+def test_adopt_keeps_copy_that_differs_from_blob(tmp_path):
+    root = str(tmp_path / "models")
+    store = ModelStore(root)
+    _write(store.blob_path(URL))
+    model = {"url": URL, "path": os.path.join(root, "loras", "shared.safetensors")}
+    _write(model["path"], b"outro conteudo")
+
+    store.adopt(model)
+
+    assert not os.path.samefile(model["path"], store.blob_path(URL))
+
+
+def test_remove_drops_blob_so_it_is_not_relinked(tmp_path):
+    root = str(tmp_path / "models")
+    store = ModelStore(root)
+    model = {"url": URL, "path": os.path.join(root, "loras", "shared.safetensors")}
+    _write(model["path"])
+    store.adopt(model)
+
+    store.remove(model["path"])
+
+    assert not os.path.exists(model["path"])
+    assert not os.path.exists(store.blob_path(URL))
+    assert not store.materialize(model)
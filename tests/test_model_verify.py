@@ -0,0 +1,85 @@
+import json
+import os
+import struct
+import zipfile
+
+from model_verify import GGUF_DEFAULT_ALIGNMENT, GGUF_MAGIC, main, verify_file, verify_many
+
+
+def _safetensors(path, payload=64, extra=0):
+    header = json.dumps({"__metadata__": {"format": "pt"},
+                         "w": {"dtype": "F16", "shape": [payload // 2], "data_offsets": [0, payload]}}).encode()
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header)) + header + b"\0" * (payload + extra))
+    return str(path)
+
+
+def _gguf_string(s):
+    return struct.pack("<Q", len(s)) + s
+
+
+def _gguf(path, elements=64, data=None):
+    # v3, um metadado string + um tensor F32 (ggml type 0: 4 bytes por elemento)
+    body = GGUF_MAGIC + struct.pack("<IQQ", 3, 1, 1)
+    body += _gguf_string(b"general.name") + struct.pack("<I", 8) + _gguf_string(b"teste")
+    body += _gguf_string(b"w") + struct.pack("<I", 1) + struct.pack("<Q", elements)
+    body += struct.pack("<IQ", 0, 0)
+    body += b"\0" * (-len(body) % GGUF_DEFAULT_ALIGNMENT)
+    body += b"\0" * (elements * 4 if data is None else data)
+    with open(path, "wb") as f:
+        f.write(body)
+    return str(path)
+
+
+def _torch_zip(path, with_pickle=True):
+    with zipfile.ZipFile(path, "w") as zf:
+        if with_pickle:
+            zf.writestr("archive/data.pkl", b"\x80\x02}q\x00.")
+        zf.writestr("archive/data/0", b"\0" * 256)
+    return str(path)
+
+
+def _truncate(path, nbytes):
+    os.truncate(path, os.path.getsize(path) - nbytes)
+    return path
+
+
+def test_safetensors_must_end_exactly_at_last_tensor(tmp_path):
+    assert verify_file(_safetensors(tmp_path / "ok.safetensors")) is None
+    assert "truncado" in verify_file(_truncate(_safetensors(tmp_path / "cut.safetensors"), 1))
+    assert "sobrando" in verify_file(_safetensors(tmp_path / "extra.safetensors", extra=3))
+
+
+def test_safetensors_with_garbage_header_is_rejected(tmp_path):
+    path = tmp_path / "lixo.safetensors"
+    path.write_bytes(struct.pack("<Q", 10) + b"{nao json}" + b"\0" * 8)
+
+    assert "header JSON invalido" in verify_file(str(path))
+
+
+def test_gguf_tensors_must_fit_in_file(tmp_path):
+    assert verify_file(_gguf(tmp_path / "ok.gguf")) is None
+    assert "truncado" in verify_file(_gguf(tmp_path / "cut.gguf", data=100))
+    bad = tmp_path / "magic.gguf"
+    bad.write_bytes(b"GGUX" + b"\0" * 32)
+    assert "magic" in verify_file(str(bad))
+
+
+def test_torch_zip_central_directory_is_checked(tmp_path):
+    assert verify_file(_torch_zip(tmp_path / "ok.pt")) is None
+    assert "data.pkl" in verify_file(_torch_zip(tmp_path / "semdados.pth", with_pickle=False))
+    assert "central directory" in verify_file(_truncate(_torch_zip(tmp_path / "cut.ckpt"), 10))
+    legacy = tmp_path / "legado.pt"
+    legacy.write_bytes(b"\x80\x02" + b"\0" * 10)
+    assert verify_file(str(legacy)) is None
+
+
+def test_cli_reports_and_deletes_bad_files(tmp_path, capsys):
+    good = _safetensors(tmp_path / "ok.safetensors")
+    bad = _truncate(_safetensors(tmp_path / "cut.safetensors"), 5)
+
+    assert set(verify_many([good, bad])) == {good, bad}
+    assert main([str(tmp_path), "--workers", "2", "--delete"]) == 1
+
+    assert os.path.exists(good) and not os.path.exists(bad)
+    assert "1 invalido(s)" in capsys.readouterr().out
@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+from image_spec import MANIFEST_PATH, load_manifest, profile_nodes
+from node_profile import comfyui_args, format_report, main, profile_packs, write_report
+
+# ComfyUI minimo: o probe so usa nodes.load_custom_node e server.PromptServer
+FAKE_NODES = '''
+import importlib.util, os, sys
+
+def load_custom_node(path, module_parent="custom_nodes"):
+    spec = importlib.util.spec_from_file_location(os.path.basename(path), os.path.join(path, "__init__.py"))
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        print(f"falhou: {e}")
+        return False
+    return True
+'''
+FAKE_SERVER = '''
+class PromptServer:
+    instance = None
+
+    def __init__(self, loop):
+        PromptServer.instance = self
+'''
+
+
+@pytest.fixture
+def comfyui(tmp_path):
+    root = tmp_path / "ComfyUI"
+    (root / "custom_nodes").mkdir(parents=True)
+    (root / "nodes.py").write_text(FAKE_NODES)
+    (root / "server.py").write_text(FAKE_SERVER)
+    packs = {"pack-ok": "import time\ntime.sleep(0.2)\n", "pack-quebrado": "raise ImportError('sem dependencia')\n"}
+    for name, code in packs.items():
+        (root / "custom_nodes" / name).mkdir()
+        (root / "custom_nodes" / name / "__init__.py").write_text(code)
+    (root / "custom_nodes" / "pack-ok" / "prestartup_script.py").write_text(
+        "open('prestartup.ran', 'w').close()\n")
+    return str(root)
+
+
+def test_full_profile_loads_every_pack():
+    assert comfyui_args("full") == []
+
+
+def test_smaller_profiles_whitelist_their_packs():
+    manifest = load_manifest(MANIFEST_PATH)
+    minimal = comfyui_args("zimage-minimal")
+    edit = comfyui_args("edit")
+
+    assert minimal[:2] == ["--disable-all-custom-nodes", "--whitelist-custom-nodes"]
+    assert minimal[2:] == profile_nodes(manifest, "zimage-minimal")
+    # "extends": o perfil edit inclui todo o minimal
+    assert set(minimal[2:]) < set(edit[2:])
+    names = [n["name"] for n in manifest["nodes"]]
+    assert edit[2:] == [n for n in names if n in set(edit[2:])]  # ordem do manifesto
+
+
+def test_unknown_profile_is_an_error():
+    with pytest.raises(ValueError, match="perfil de nodes desconhecido"):
+        comfyui_args("nao-existe")
+
+
+def test_profile_packs_ranks_and_reports_failures(comfyui):
+    report = profile_packs(comfyui, ["pack-quebrado", "pack-ok", "pack-sumido"])
+
+    assert [e["name"] for e in report["packs"]][0] == "pack-ok"  # mais lento primeiro
+    status = {e["name"]: e["status"] for e in report["packs"]}
+    assert status == {"pack-ok": "ok", "pack-quebrado": "failed", "pack-sumido": "missing"}
+    assert report["totals"]["failed"] == 2 and not report["isolated"]
+    assert os.path.exists(os.path.join(comfyui, "prestartup.ran"))
+    assert "pack-sumido" in format_report(report)
+
+
+def test_isolated_mode_runs_one_process_per_pack(comfyui, tmp_path):
+    report = profile_packs(comfyui, ["pack-ok", "pack-quebrado"], isolated=True)
+
+    assert report["isolated"] and report["totals"]["packs"] == 2
+    path = write_report(report, str(tmp_path / "reports"), "teste")
+    with open(os.path.join(os.path.dirname(path), "node-imports-latest.json")) as f:
+        assert json.load(f)["profile"] == "teste"
+
+
+def test_cli_args_prints_main_py_flags(capsys):
+    assert main(["--profile", "zimage-minimal", "--args"]) == 0
+    assert capsys.readouterr().out.startswith("--disable-all-custom-nodes --whitelist-custom-nodes ")
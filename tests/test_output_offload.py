@@ -0,0 +1,172 @@
+import io
+import json
+import os
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from output_offload import DirectorySink, HTTPSink, OutputOffload, parse_index, serve
+
+SETTLED = float("inf")  # `now` de run_once: tudo ja parou de mudar
+
+
+def _write(output_dir, rel, data=b"png"):
+    path = os.path.join(output_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _offload(tmp_path, sink=None, **kwargs):
+    kwargs.setdefault("batch_size", 2)
+    kwargs.setdefault("interval", 3600)
+    return OutputOffload(str(tmp_path / "output"), sink or DirectorySink(str(tmp_path / "dest")), **kwargs)
+
+
+def test_files_are_committed_in_batches(tmp_path):
+    commits = []
+    offload = _offload(tmp_path, on_commit=lambda: commits.append(offload.counters["files"]))
+    for i in range(5):
+        _write(offload.output_dir, f"sub/ComfyUI_{i:05d}_.png", b"x" * (i + 1))
+
+    offload.run_once(now=SETTLED)
+
+    assert commits == [2, 4]  # o 5o espera o lote fechar
+    assert offload.stats()["pending"] == 1
+    offload.stop()
+    assert commits == [2, 4, 5]
+    entries = parse_index(offload.sink.read_index())
+    assert [e["source"] for e in entries] == [f"sub/ComfyUI_{i:05d}_.png" for i in range(5)]
+    for entry in entries:
+        assert entry["key"] == f"{offload.session}/{entry['source']}"
+        with open(os.path.join(offload.sink.root, *entry["key"].split("/")), "rb") as f:
+            assert len(f.read()) == entry["bytes"]
+
+
+def test_each_batch_only_appends_its_own_lines(tmp_path):
+    offload = _offload(tmp_path)
+    for i in range(4):
+        _write(offload.output_dir, f"ComfyUI_{i:05d}_.png")
+
+    offload.run_once(now=SETTLED)
+
+    index_path = os.path.join(offload.sink.root, "index", offload.index_name + ".jsonl")
+    with open(index_path, "rb") as f:
+        lines = f.read().splitlines()
+    assert offload.counters["batches"] == 2 and len(lines) == 4
+    assert not os.path.exists(os.path.join(offload.sink.root, "index.jsonl"))
+
+
+def test_concurrent_writers_keep_all_index_lines(tmp_path):
+    dest = DirectorySink(str(tmp_path / "dest"))
+    first = OutputOffload(str(tmp_path / "a"), dest, batch_size=1, interval=3600)
+    second = OutputOffload(str(tmp_path / "b"), dest, batch_size=1, interval=3600)
+    # indice antigo (de antes dos indices por sessao) continua sendo lido
+    dest.put("index.jsonl", b'{"key":"antigo/x.png","source":"x.png","created":0}\n')
+    for offload, name in ((first, "a.png"), (second, "b.png"), (first, "c.png"), (second, "d.png")):
+        _write(offload.output_dir, name)
+        offload.run_once(now=SETTLED)
+
+    assert first.session != second.session
+    sources = sorted(e["source"] for e in parse_index(dest.read_index()))
+    assert sources == ["a.png", "b.png", "c.png", "d.png", "x.png"]
+
+
+def test_files_still_being_written_wait_to_settle(tmp_path):
+    offload = _offload(tmp_path, settle=60)
+    _write(offload.output_dir, "ComfyUI_00001_.png")
+
+    assert offload.ready(now=time.time()) == []
+    assert [rel for rel, _ in offload.ready(now=time.time() + 61)] == ["ComfyUI_00001_.png"]
+
+
+def test_unchanged_files_are_sent_once(tmp_path):
+    offload = _offload(tmp_path, batch_size=1)
+    path = _write(offload.output_dir, "ComfyUI_00001_.png")
+    offload.run_once(now=SETTLED)
+    offload.run_once(now=SETTLED)
+    assert offload.counters["files"] == 1
+
+    with open(path, "ab") as f:
+        f.write(b" editado")
+    offload.run_once(now=SETTLED)
+    assert offload.counters["files"] == 2
+    assert offload.counters["batches"] == 2
+
+
+def test_failed_commit_is_counted_and_index_kept(tmp_path):
+    def fail():
+        raise RuntimeError("volume ocupado")
+
+    offload = _offload(tmp_path, batch_size=1, on_commit=fail)
+    _write(offload.output_dir, "ComfyUI_00001_.png")
+
+    offload.run_once(now=SETTLED)
+
+    assert offload.counters["commit_failed"] == 1
+    assert len(parse_index(offload.sink.read_index())) == 1
+
+
+def test_reencode_falls_back_to_original_bytes(tmp_path):
+    offload = _offload(tmp_path, fmt="webp", batch_size=1)
+    _write(offload.output_dir, "ComfyUI_00001_.png", b"nao e um png")
+
+    offload.run_once(now=SETTLED)
+
+    (entry,) = parse_index(offload.sink.read_index())
+    assert entry["key"].endswith("/ComfyUI_00001_.png") and entry["format"] is None
+
+
+def test_reencode_to_webp_keeps_png_metadata(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    PngImagePlugin = pytest.importorskip("PIL.PngImagePlugin")
+    info = PngImagePlugin.PngInfo()
+    info.add_text("prompt", json.dumps({"1": {"class_type": "KSampler"}}))
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buf, format="PNG", pnginfo=info)
+    offload = _offload(tmp_path, fmt="webp", batch_size=1)
+    _write(offload.output_dir, "ComfyUI_00001_.png", buf.getvalue())
+
+    offload.run_once(now=SETTLED)
+
+    (entry,) = parse_index(offload.sink.read_index())
+    assert entry["key"].endswith(".webp") and entry["format"] == "webp"
+    sidecar = os.path.join(offload.sink.root, *entry["key"][:-len(".webp")].split("/")) + ".json"
+    with open(sidecar) as f:
+        assert "prompt" in json.load(f)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_http_sink_against_local_object_store(tmp_path):
+    port = _free_port()
+    threading.Thread(target=serve, args=(str(tmp_path / "store"), port), daemon=True).start()
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    offload = _offload(tmp_path, sink=HTTPSink(base))
+    for i in range(2):
+        _write(offload.output_dir, f"ComfyUI_{i:05d}_.png", f"imagem {i}".encode())
+
+    offload.run_once(now=SETTLED)
+    _write(offload.output_dir, "ComfyUI_00002_.png", b"imagem 2")
+    offload.stop()
+
+    entries = parse_index(HTTPSink(base).read_index())
+    assert len(entries) == 3 and offload.counters["batches"] == 2
+    with urllib.request.urlopen(f"{base}/{entries[0]['key']}") as resp:
+        assert resp.read() == b"imagem 0"
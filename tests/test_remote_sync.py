@@ -0,0 +1,118 @@
+import http.server
+import json
+import os
+import threading
+import urllib.parse
+
+import pytest
+
+from model_catalog import known_checkpoint_files, load_listings, lora_checkpoints, run_key
+from remote_sync import RemoteCheck, discover_checkpoints, normalize_etag, save_listings
+
+URL = "https://huggingface.co/org/repo/resolve/main/lora.safetensors"
+RUN = {"name": "teste", "repo": "org/repo", "dir": "treino", "dest": "loras", "steps": [250, 500]}
+
+
+@pytest.fixture
+def hf_api():
+    """API de listagem do HF falsa: pages[path] = [paginas], com Link: rel="next"."""
+    pages = {}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urllib.parse.urlsplit(self.path)
+            page = int(urllib.parse.parse_qs(parts.query).get("cursor", ["0"])[0])
+            chunks = pages.get(parts.path)
+            if chunks is None:
+                self.send_error(404)
+                return
+            body = json.dumps(chunks[page]).encode()
+            self.send_response(200)
+            if page + 1 < len(chunks):
+                self.send_header("Link", f'<{api}{parts.path[len("/api"):]}?cursor={page + 1}>; rel="next"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    api = f"http://127.0.0.1:{server.server_address[1]}/api"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield api, pages
+    server.shutdown()
+    server.server_close()
+
+
+def test_normalize_etag_strips_weak_prefix_and_quotes():
+    assert normalize_etag('W/"abc"') == "abc"
+    assert normalize_etag('"abc"') == "abc"
+    assert normalize_etag("") is None
+
+
+def test_conditional_head_detects_reuploads(tmp_path, mirror):
+    server, (model,) = mirror([{"url": URL, "path": str(tmp_path / "lora.safetensors")}])
+    checker = RemoteCheck(rps=0)
+
+    first = checker.head(model["url"])
+    assert first["status"] == "changed" and first["etag"]
+    assert checker.head(model["url"], f'W/"{first["etag"]}"')["status"] == "unchanged"
+
+    server.faults["lora.safetensors"] = {"etag": "v2"}  # mesmo nome, conteudo novo
+    again = checker.head(model["url"], first["etag"])
+    assert again["status"] == "changed" and again["etag"] != first["etag"]
+
+
+def test_entries_without_etag_compare_size(tmp_path, mirror):
+    server, (model,) = mirror([{"url": URL, "path": str(tmp_path / "lora.safetensors")}])
+    size = server.content(next(iter(server.files))).size
+    checker = RemoteCheck(rps=0)
+
+    same, other = checker.check([{"url": model["url"], "etag": None, "size": size},
+                                 {"url": model["url"], "etag": None, "size": size + 1}])
+
+    assert not same["changed"] and same["result"]["etag"]
+    assert other["changed"]
+    (missing,) = checker.check([{"url": model["url"] + "x", "etag": "e", "size": 1}])
+    assert missing["result"]["status"] == "error" and not missing["changed"]
+
+
+def test_listing_follows_pagination(hf_api):
+    api, pages = hf_api
+    pages["/api/models/org/repo/tree/main/treino"] = [
+        [{"type": "file", "path": "treino/teste_000000250.safetensors"}, {"type": "directory", "path": "treino/x"}],
+        [{"type": "file", "path": "treino/teste_000000500.safetensors"}],
+    ]
+
+    files = RemoteCheck(rps=0).list_repo_files("org/repo", "treino", api=api)
+
+    assert files == ["treino/teste_000000250.safetensors", "treino/teste_000000500.safetensors"]
+
+
+def test_discovery_keeps_previous_listing_of_failed_runs(tmp_path, hf_api):
+    api, pages = hf_api
+    pages["/api/models/org/repo/tree/main/treino"] = [[{"type": "file", "path": "treino/teste_000000750.safetensors"}]]
+    broken = dict(RUN, dir="sumiu")
+    models_dir = str(tmp_path)
+    save_listings(models_dir, {run_key(broken): ["teste_000000250.safetensors"]})
+
+    listings = discover_checkpoints(runs=[RUN, broken], api=api, checker=RemoteCheck(rps=0))
+    saved = save_listings(models_dir, listings)
+
+    assert listings == {run_key(RUN): ["teste_000000750.safetensors"]}
+    assert saved == load_listings(models_dir)
+    assert saved[run_key(broken)] == ["teste_000000250.safetensors"]
+
+
+def test_known_steps_are_used_without_listing(tmp_path):
+    assert known_checkpoint_files(RUN) == ["teste_000000250.safetensors", "teste_000000500.safetensors"]
+    odd = dict(RUN, remote_step="_000000{step:03d}", steps=[250])
+    assert known_checkpoint_files(odd) == ["teste_000000250.safetensors"]
+
+    paths = [os.path.basename(e["path"]) for e in lora_checkpoints(RUN, comfyui_dir=str(tmp_path))]
+    listed = [os.path.basename(e["path"]) for e in
+              lora_checkpoints(RUN, ["teste_000000750.safetensors"], comfyui_dir=str(tmp_path))]
+
+    assert "teste.safetensors" in paths and "teste_000000500.safetensors" in paths
+    assert "teste_000000750.safetensors" in listed and "teste_000000250.safetensors" not in listed
@@ -0,0 +1,152 @@
+import copy
+import os
+import shutil
+
+import pytest
+
+from comfy_proxy import PromptAnswered
+from result_cache import INDEX_NAME, KEY_FIELD, ResultCache
+
+PROMPT = {
+    "1": {"class_type": "LoraLoader", "inputs": {"lora_name": "a.safetensors", "strength_model": 1.0}},
+    "2": {"class_type": "SaveImage", "inputs": {"images": ["1", 0]}, "_meta": {"title": "Salvar"}},
+}
+IMAGE = b"\x89PNG fake image"
+
+
+@pytest.fixture
+def comfyui_dir(tmp_path):
+    os.makedirs(tmp_path / "models" / "loras")
+    (tmp_path / "models" / "loras" / "a.safetensors").write_bytes(b"lora v1")
+    return tmp_path
+
+
+def _cache(comfyui_dir, fake, **kwargs):
+    return ResultCache(str(comfyui_dir), upstream=fake.url, code_version="test", **kwargs)
+
+
+def _payload(**extra):
+    return {"prompt": copy.deepcopy(PROMPT), "extra_data": dict(extra)}
+
+
+def _run_miss(cache, comfyui_dir, fake, prompt_id="p1"):
+    """Miss -> 'executa' (saida + entrada no /history do falso) -> coletor guarda."""
+    payload = cache.on_prompt(_payload())
+    key = payload["extra_data"][KEY_FIELD]
+    os.makedirs(comfyui_dir / "output", exist_ok=True)
+    (comfyui_dir / "output" / "ComfyUI_00001_.png").write_bytes(IMAGE)
+    fake.history[prompt_id] = {
+        "prompt": [0, prompt_id, payload["prompt"], payload["extra_data"], ["2"]],
+        "outputs": {"2": {"images": [{"filename": "ComfyUI_00001_.png", "subfolder": "", "type": "output"}]}},
+        "status": {"status_str": "success", "completed": True, "messages": []},
+    }
+    assert cache.collect_once() == 1
+    return key
+
+
+def test_miss_is_stored_and_hit_answers_without_upstream(comfyui_dir, fake_comfy):
+    fake = fake_comfy()
+    cache = _cache(comfyui_dir, fake)
+    key = _run_miss(cache, comfyui_dir, fake)
+    os.remove(comfyui_dir / "output" / "ComfyUI_00001_.png")
+
+    with pytest.raises(PromptAnswered) as answered:
+        cache.on_prompt(_payload())
+
+    assert answered.value.data["cached"] is True
+    assert (comfyui_dir / "output" / "ComfyUI_00001_.png").read_bytes() == IMAGE
+    prompt_id = answered.value.data["prompt_id"]
+    status, history = cache.intercept("GET", f"/history/{prompt_id}")
+    assert status == 200 and history[prompt_id]["outputs"] == fake.history["p1"]["outputs"]
+    assert cache.index[key]["hits"] == 1
+    assert cache.status()[1]["hit_rate"] == 0.5
+
+
+def test_ui_fields_do_not_change_the_key_but_models_do(comfyui_dir, fake_comfy):
+    cache = _cache(comfyui_dir, fake_comfy())
+    payload = _payload()
+    payload["prompt"]["2"]["_meta"]["title"] = "Outro titulo"
+
+    key = cache.key_for(_payload())
+    assert cache.key_for(payload) == key
+
+    (comfyui_dir / "models" / "loras" / "a.safetensors").write_bytes(b"lora v2 retreinado")
+    assert cache.key_for(_payload()) != key
+
+
+def test_bypass_and_ui_prompts_skip_the_cache(comfyui_dir, fake_comfy):
+    cache = _cache(comfyui_dir, fake_comfy())
+
+    for payload in (_payload(result_cache=False), _payload(extra_pnginfo={"workflow": {}})):
+        assert KEY_FIELD not in cache.on_prompt(payload)["extra_data"]
+
+    assert cache.counters["bypassed"] == 2 and cache.counters["misses"] == 0
+
+
+def test_unreadable_entry_becomes_a_miss(comfyui_dir, fake_comfy):
+    fake = fake_comfy()
+    cache = _cache(comfyui_dir, fake)
+    key = _run_miss(cache, comfyui_dir, fake)
+    os.remove(comfyui_dir / "output" / "ComfyUI_00001_.png")
+    shutil.rmtree(os.path.join(cache.entry_dir(key), "files"))
+
+    payload = cache.on_prompt(_payload())
+
+    assert payload["extra_data"][KEY_FIELD] == key
+    assert cache.counters["misses"] == 2
+
+
+def test_hit_on_entry_from_another_container_is_sized(comfyui_dir, fake_comfy):
+    fake = fake_comfy()
+    key = _run_miss(_cache(comfyui_dir, fake), comfyui_dir, fake)
+    os.remove(os.path.join(comfyui_dir, "models", ".kythours_results", INDEX_NAME))
+    cache = _cache(comfyui_dir, fake)
+
+    with pytest.raises(PromptAnswered):
+        cache.on_prompt(_payload())
+
+    assert cache.index[key]["bytes"] == len(IMAGE)
+
+
+def test_evict_drops_least_recently_used(comfyui_dir, fake_comfy):
+    fake = fake_comfy()
+    cache = _cache(comfyui_dir, fake, max_bytes=len(IMAGE))
+    old = _run_miss(cache, comfyui_dir, fake, "p1")
+    (comfyui_dir / "models" / "loras" / "a.safetensors").write_bytes(b"lora v2 retreinado")
+    new = _run_miss(cache, comfyui_dir, fake, "p2")
+
+    assert set(cache.index) == {new}
+    assert not os.path.exists(cache.entry_dir(old))
+    assert cache.counters["evicted"] == 1
+
+
+def _image_payload(image):
+    payload = _payload()
+    payload["prompt"]["3"] = {"class_type": "LoadImage", "inputs": {"image": image, "upload": "image"}}
+    return payload
+
+
+def test_reuploaded_input_image_is_a_miss(comfyui_dir, fake_comfy):
+    cache = _cache(comfyui_dir, fake_comfy())
+    os.makedirs(comfyui_dir / "input")
+    image = comfyui_dir / "input" / "image.png"
+    image.write_bytes(b"primeira foto")
+    key = cache.key_for(_image_payload("image.png"))
+    assert cache.key_for(_image_payload("image.png")) == key
+
+    image.write_bytes(b"outra foto, mesmo nome")
+    os.utime(image, ns=(1, 1))
+
+    assert cache.key_for(_image_payload("image.png")) != key
+
+
+def test_missing_or_escaping_input_skips_the_cache(comfyui_dir, fake_comfy):
+    cache = _cache(comfyui_dir, fake_comfy())
+    os.makedirs(comfyui_dir / "output")
+    (comfyui_dir / "output" / "prev.png").write_bytes(IMAGE)
+
+    assert cache.key_for(_image_payload("prev.png [output]")) is not None
+    for image in ("nao_existe.png", "../models/loras/a.safetensors"):
+        payload = _image_payload(image)
+        assert KEY_FIELD not in cache.on_prompt(payload)["extra_data"]
+    assert cache.counters["bypassed"] == 2
@@ -0,0 +1,75 @@
+import json
+import os
+
+import pytest
+
+import startup_report
+from model_downloader import MB
+from startup_report import StartupReport
+
+
+def test_phases_accumulate_and_survive_errors(tmp_path):
+    report = StartupReport("v1", str(tmp_path))
+    with report.phase("validate"):
+        pass
+    with pytest.raises(RuntimeError):
+        with report.phase("validate"):
+            raise RuntimeError("falhou no meio")
+
+    phases = report.to_dict()["phases"]
+    assert list(phases) == ["validate"]
+    assert phases["validate"]["seconds"] >= 0
+
+
+def test_download_totals_and_rates(tmp_path):
+    report = StartupReport("v1", str(tmp_path))
+    report.add_downloads([
+        {"name": "a", "status": "ok", "bytes": 4 * MB, "seconds": 2.0},
+        {"name": "b", "status": "ok", "bytes": 0, "seconds": 0.0, "linked": True},
+        {"name": "c", "status": "failed", "bytes": 0, "seconds": 1.0},
+    ])
+    report.add_downloads([{"name": "d", "status": "ok", "bytes": MB, "seconds": 1.0}], stage="background")
+
+    data = report.to_dict()
+    assert data["download_totals"] == {"files": 3, "failed": 1, "bytes": 5 * MB}
+    assert [d["mb_per_s"] for d in data["downloads"]] == [2.0, None, 0.0, 1.0]
+    assert data["downloads"][-1]["stage"] == "background"
+
+
+def test_ready_is_measured_against_a_live_server(tmp_path, fake_comfy):
+    fake = fake_comfy()
+    report = StartupReport("v1", str(tmp_path))
+
+    assert report.wait_until_ready(fake.url + "/", timeout=10) is not None
+    assert report.to_dict()["ready_seconds"] == report.ready_seconds
+
+
+def test_ready_gives_up_after_timeout(tmp_path, monkeypatch):
+    monkeypatch.setattr(startup_report, "READY_POLL_INTERVAL", 0.01)
+    report = StartupReport("v1", str(tmp_path))
+
+    assert report.wait_until_ready("http://127.0.0.1:9/", timeout=0.05) is None
+    assert "n/a" in report.summary()
+
+
+def test_write_keeps_one_file_per_start_plus_latest(tmp_path, monkeypatch):
+    monkeypatch.setattr(startup_report, "MAX_REPORTS", 2)
+    reports_dir = str(tmp_path / "reports")
+    old = []
+    for i in range(3):
+        os.makedirs(reports_dir, exist_ok=True)
+        path = os.path.join(reports_dir, f"startup-v0-2020010{i}-000000.json")
+        with open(path, "w") as f:
+            f.write("{}")
+        os.utime(path, (i, i))
+        old.append(path)
+    report = StartupReport("v1", reports_dir)
+    report.set("validation", {"checked": 3})
+
+    first = report.write()
+    assert report.write() == first  # a mesma start regrava o mesmo arquivo
+
+    with open(os.path.join(reports_dir, "latest.json")) as f:
+        assert json.load(f)["validation"] == {"checked": 3}
+    remaining = sorted(n for n in os.listdir(reports_dir) if n.startswith("startup-"))
+    assert remaining == sorted([os.path.basename(old[-1]), os.path.basename(first)])
@@ -0,0 +1,91 @@
+import json
+import os
+
+from volume_manifest import MANIFEST_NAME, VolumeManifest
+
+
+def _write(root, rel, data=b"x" * 16):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+class _Check:
+    """check(path) que conta as chamadas; `bad` = nomes invalidos."""
+
+    def __init__(self, bad=()):
+        self.bad, self.calls = set(bad), []
+
+    def __call__(self, path):
+        self.calls.append(os.path.basename(path))
+        return "corrompido" if os.path.basename(path) in self.bad else None
+
+
+def test_only_changed_files_are_revalidated(tmp_path):
+    root = str(tmp_path)
+    a = _write(root, "loras/a.safetensors")
+    _write(root, "vae/b.safetensors")
+    first = VolumeManifest(root, rules={"min": 1})
+    assert first.rebuilt
+    assert first.validate(_Check())["checked"] == 2
+    first.save()
+
+    _write(root, "loras/a.safetensors", b"y" * 32)  # tamanho mudou
+    check = _Check()
+    second = VolumeManifest(root, rules={"min": 1})
+    stats = second.validate(check)
+
+    assert not second.rebuilt
+    assert check.calls == ["a.safetensors"]
+    assert (stats["checked"], stats["skipped"]) == (1, 1)
+    assert second.is_current(a)
+
+
+def test_rule_change_rebuilds_manifest(tmp_path):
+    root = str(tmp_path)
+    _write(root, "loras/a.safetensors")
+    manifest = VolumeManifest(root, rules={"min": 1})
+    manifest.validate(_Check())
+    manifest.save()
+
+    changed = VolumeManifest(root, rules={"min": 2})
+    check = _Check()
+    changed.validate(check)
+
+    assert changed.rebuilt and check.calls == ["a.safetensors"]
+    changed.save()
+    with open(os.path.join(root, MANIFEST_NAME)) as f:
+        assert json.load(f)["rules"] == changed.rules_key
+
+
+def test_invalid_files_are_removed_and_missing_ones_forgotten(tmp_path):
+    root = str(tmp_path)
+    bad = _write(root, "loras/bad.safetensors")
+    gone = _write(root, "loras/gone.safetensors")
+    _write(root, "loras/notes.txt")  # nao e modelo: fora do manifesto
+    manifest = VolumeManifest(root)
+    manifest.validate(_Check())
+    manifest.record(bad, status="ok", sha256="abc", etag='"e1"')
+    os.remove(gone)
+    _write(root, "loras/bad.safetensors", b"z")  # mudou depois de registrado
+
+    stats = manifest.validate(_Check(bad={"bad.safetensors"}))
+
+    assert (stats["removed"], stats["missing"]) == (1, 1)
+    assert not os.path.exists(bad)
+    assert manifest.files == {}
+
+
+def test_record_keeps_known_hash_and_etag(tmp_path):
+    root = str(tmp_path)
+    path = _write(root, "loras/a.safetensors")
+    manifest = VolumeManifest(root)
+    manifest.record(path, sha256="abc", etag='"e1"')
+
+    manifest.record(path, etag='"e2"')
+
+    assert manifest.entry(path)["sha256"] == "abc"
+    assert manifest.entry(path)["etag"] == '"e2"'
+    assert not manifest.tracks(os.path.join(str(tmp_path.parent), "fora.safetensors"))
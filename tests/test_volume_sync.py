@@ -0,0 +1,72 @@
+import os
+
+from model_downloader import ModelDownloader
+from volume_sync import VolumeSync
+
+HF = "https://huggingface.co/org/repo/resolve/main"
+
+
+def _catalog(comfyui_dir):
+    models = f"{comfyui_dir}/models"
+    return [
+        {"url": f"{HF}/z.safetensors", "path": f"{models}/diffusion_models/z.safetensors"},
+        {"url": f"{HF}/enc.gguf", "path": f"{models}/text_encoders/enc.gguf"},
+        # Mesma URL em duas pastas: um download, dois links
+        {"url": f"{HF}/lora.safetensors", "path": f"{models}/loras/lora.safetensors"},
+        {"url": f"{HF}/lora.safetensors", "path": f"{models}/loras/FERPHOTO/lora.safetensors"},
+    ]
+
+
+def _sync(comfyui_dir, catalog):
+    return VolumeSync(str(comfyui_dir), catalog=catalog, downloader=ModelDownloader())
+
+
+def test_prefetch_downloads_each_url_once(tmp_path, mirror):
+    server, catalog = mirror(_catalog(tmp_path))
+
+    summary = _sync(tmp_path, catalog).run(remote=False)
+
+    assert summary["missing"] == [] and summary["failed"] == []
+    assert summary["downloaded"] == 4
+    lora, copy = (os.stat(m["path"]) for m in catalog[2:])
+    assert (lora.st_ino, lora.st_dev) == (copy.st_ino, copy.st_dev)
+    # 3 URLs distintas: um probe + um segmento (arquivos pequenos) cada
+    assert server.counters["requests"] == 6
+
+
+def test_warm_start_plans_nothing_and_skips_validation(tmp_path, mirror):
+    _, catalog = mirror(_catalog(tmp_path))
+    _sync(tmp_path, catalog).run(remote=False)
+
+    sync = _sync(tmp_path, catalog)
+    stats = sync.validate()
+
+    assert stats["checked"] == 0 and stats["removed"] == 0
+    assert stats["skipped"] >= len(catalog)
+    assert sync.plan() == []
+
+
+def test_corrupted_file_is_removed_and_downloaded_again(tmp_path, mirror):
+    _, catalog = mirror(_catalog(tmp_path))
+    _sync(tmp_path, catalog).run(remote=False)
+    target = catalog[1]["path"]
+    size = os.path.getsize(target)
+    with open(target, "r+b") as f:
+        f.truncate(size // 2)
+
+    summary = _sync(tmp_path, catalog).run(remote=False)
+
+    assert summary["validated"]["removed"] == 1
+    assert summary["downloaded"] == 1 and summary["missing"] == []
+    assert os.path.getsize(target) == size
+
+
+def test_check_remote_returns_only_changed_urls(tmp_path, mirror):
+    server, catalog = mirror(_catalog(tmp_path))
+    _sync(tmp_path, catalog).run(remote=False)
+    server.faults["lora.safetensors"] = {"etag": "v2"}
+
+    refresh = _sync(tmp_path, catalog).check_remote()
+
+    assert sorted(m["path"] for m in refresh) == sorted(m["path"] for m in catalog[2:])
+    assert all(m["refresh"] for m in refresh)
@@ -0,0 +1,179 @@
+"""
+volume_manifest.py
+==================
+Manifesto persistente dos modelos no volume do ComfyUI.
+
+No cold start o run_comfyui fazia `os.walk` + `getsize` em tudo e abria cada
+`.safetensors` com `safe_open` so para ler o header. Com o manifesto:
+  - `<volume>/.kythours_manifest.json` guarda, por caminho relativo:
+    tamanho, mtime, status da validacao, sha256 e ETag remoto (se conhecidos).
+  - So arquivos cujo stat (tamanho/mtime) mudou sao revalidados.
+  - Se as regras de validacao mudarem (`rules`), o manifesto e descartado e
+    reconstruido no start seguinte.
+
+USO:
+  manifest = VolumeManifest(f"{COMFYUI_DIR}/models", rules=EXPECTED_MIN_SIZES_MB)
+  stats = manifest.validate(check_file)   # check_file(path) -> None ou motivo
+  manifest.record(path)                    # apos baixar um arquivo
+  manifest.save()
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from compile_cache import CACHE_DIRNAME
+from model_verify import VERIFY_WORKERS, verify_many
+
+MANIFEST_NAME = ".kythours_manifest.json"
+MANIFEST_VERSION = 1
+MODEL_EXTENSIONS = (".safetensors", ".pt", ".pth", ".ckpt", ".gguf")
+
+
+def _rules_key(rules):
+    # Hash estavel das regras: mudar EXPECTED_MIN_SIZES_MB invalida o manifesto
+    blob = json.dumps([MANIFEST_VERSION, rules], sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+
+def _iter_model_files(root):
+    """os.scandir recursivo: so stat, sem abrir nenhum arquivo."""
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        # Cache de compilacao: milhares de arquivos pequenos, nenhum modelo
+                        if entry.name != CACHE_DIRNAME:
+                            stack.append(entry.path)
+                    elif entry.name.endswith(MODEL_EXTENSIONS):
+                        yield entry.path, entry.stat()
+        except FileNotFoundError:
+            continue
+
+
+class VolumeManifest:
+    """
+    Mapa caminho -> {"size", "mtime_ns", "status", "sha256", "etag"} salvo no volume.
+
+    root:  pasta dos modelos (o volume montado).
+    rules: qualquer valor serializavel que descreva as regras de validacao.
+    """
+
+    def __init__(self, root, rules=None, path=None):
+        self.root = root
+        self.path = path or os.path.join(root, MANIFEST_NAME)
+        self.rules_key = _rules_key(rules)
+        self.files = {}
+        self.rebuilt = False
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.rebuilt = True
+            return
+        if data.get("version") != MANIFEST_VERSION or data.get("rules") != self.rules_key:
+            print("[MANIFEST] Regras de validacao mudaram. Reconstruindo manifesto...")
+            self.rebuilt = True
+            return
+        self.files = data.get("files", {})
+
+    def _rel(self, path):
+        return os.path.relpath(path, self.root)
+
+    def tracks(self, path):
+        """True se o arquivo e um modelo dentro do volume (entra no manifesto)."""
+        rel = self._rel(path)
+        return not rel.startswith(os.pardir) and path.endswith(MODEL_EXTENSIONS)
+
+    def is_current(self, path, st=None):
+        """True se o arquivo ja foi validado e o stat nao mudou desde entao."""
+        entry = self.files.get(self._rel(path))
+        if not entry or entry.get("status") != "ok":
+            return False
+        try:
+            st = st or os.stat(path)
+        except FileNotFoundError:
+            return False
+        return entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns
+
+    def entry(self, path):
+        """Entrada registrada do arquivo (ou None)."""
+        return self.files.get(self._rel(path))
+
+    def record(self, path, status="ok", sha256=None, etag=None):
+        """Registra (ou atualiza) um arquivo ja validado/baixado."""
+        st = os.stat(path)
+        rel = self._rel(path)
+        entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "status": status}
+        previous = self.files.get(rel, {})
+        for key, value in (("sha256", sha256), ("etag", etag)):
+            value = value or previous.get(key)
+            if value:
+                entry[key] = value
+        self.files[rel] = entry
+        self._dirty = True
+
+    def forget(self, path):
+        if self.files.pop(self._rel(path), None) is not None:
+            self._dirty = True
+
+    def validate(self, check, remove_invalid=True, remove=os.remove, workers=VERIFY_WORKERS):
+        """
+        Percorre o volume e revalida so o que mudou.
+
+        check(path) deve retornar None se o arquivo for valido, ou uma string
+        com o motivo. Arquivos invalidos sao removidos com `remove(path)`
+        (se remove_invalid=True). Os arquivos que mudaram sao verificados em
+        paralelo (`workers` threads).
+        Retorna {"skipped", "checked", "removed", "missing", "seconds"}.
+        """
+        started = time.monotonic()
+        stats = {"skipped": 0, "checked": 0, "removed": 0, "missing": 0}
+        seen = set()
+        changed = []
+        for fpath, st in _iter_model_files(self.root):
+            seen.add(self._rel(fpath))
+            if self.is_current(fpath, st):
+                stats["skipped"] += 1
+            else:
+                changed.append(fpath)
+
+        stats["checked"] = len(changed)
+        for fpath, reason in verify_many(changed, check, workers=workers).items():
+            if reason is None:
+                self.record(fpath)
+                continue
+
+            print(f"[CLEAN] {os.path.basename(fpath)} {reason}. Removendo...")
+            self.forget(fpath)
+            if remove_invalid:
+                remove(fpath)
+            stats["removed"] += 1
+
+        # Entradas de arquivos que sumiram do volume
+        for rel in list(self.files):
+            if rel not in seen:
+                del self.files[rel]
+                self._dirty = True
+                stats["missing"] += 1
+
+        stats["seconds"] = time.monotonic() - started
+        return stats
+
+    def save(self):
+        if not self._dirty and not self.rebuilt:
+            return
+        data = {"version": MANIFEST_VERSION, "rules": self.rules_key, "files": self.files}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        self._dirty = False
+        self.rebuilt = False
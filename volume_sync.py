@@ -0,0 +1,291 @@
+"""
+volume_sync.py
+==============
+Validacao + download dos modelos do volume, sem depender de GPU nem do ComfyUI.
+
+E o mesmo caminho de codigo usado pelo run_comfyui (A10G) e pela funcao
+CPU-only `prefetch_models`, que aquece o volume antes de qualquer container
+com GPU subir:
+  1. Descobre os checkpoints de LoRA pela listagem dos repos no HF.
+  2. Valida o volume (manifesto: so revalida o que mudou).
+  3. Confere no remoto (HEAD + If-None-Match) o que ja existe; o que mudou
+     e baixado de novo.
+  4. Separa o que ja existe (e adota no store) do que falta.
+  5. Baixa o que falta (store + ModelDownloader) e registra no manifesto.
+
+Tambem roda localmente contra uma pasta qualquer e um servidor HTTP local
+que espelhe os hosts do catalogo (ver --mirror).
+
+USO:
+  sync = VolumeSync("/root/ComfyUI")
+  summary = sync.run()
+
+  python -m volume_sync --comfyui-dir /tmp/comfy --mirror http://127.0.0.1:8000
+"""
+
+import argparse
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+from model_catalog import COMFYUI_DIR, build_catalog
+from model_downloader import MB, ModelDownloader
+from model_store import ModelStore
+from model_verify import VERIFY_VERSION, verify_file
+from remote_sync import RemoteCheck, discover_checkpoints, normalize_etag, save_listings
+from volume_manifest import VolumeManifest
+
+# Tamanhos minimos esperados (em MB) para arquivos criticos grandes.
+# Se o arquivo existe mas e menor que o esperado, foi download incompleto
+# (sobra do wget antigo). Downloads interrompidos agora ficam em
+# `<arquivo>.part`, que esta validacao ignora e o downloader retoma.
+EXPECTED_MIN_SIZES_MB = {
+    "qwen_3_4b.safetensors": 6000,           # ~7GB text encoder
+    "Qwen_3_4b-Q8_0.gguf": 3000,             # ~3.6GB GGUF
+    "Qwen_3_4b-imatrix-IQ4_XS.gguf": 1500,   # ~2GB GGUF
+    "z_image_turbo_bf16.safetensors": 5000,   # ~6GB diffusion model
+    "z-image-turbo_fp8_scaled_e4m3fn_KJ.safetensors": 3000,  # ~3.5GB
+    "Z-Image-Turbo-Fun-Controlnet-Union-2.1.safetensors": 500,  # ~700MB
+}
+
+# Pastas que o ComfyUI espera encontrar no volume
+MODEL_DIRS = [
+    "loras", "loras/FERPHOTO", "checkpoints", "vae", "diffusion_models", "text_encoders",
+    "controlnet", "model_patches", "unet", "ultralytics/bbox",
+]
+
+
+def check_model_file(fpath, expected_min_sizes_mb=EXPECTED_MIN_SIZES_MB):
+    """Retorna None se o arquivo parece valido, ou o motivo da falha."""
+    fname = os.path.basename(fpath)
+    fsize = os.path.getsize(fpath)
+    fsize_mb = fsize / MB
+
+    # Check 1: Tamanho minimo especifico para arquivos criticos
+    expected_min = expected_min_sizes_mb.get(fname)
+    if expected_min and fsize_mb < expected_min:
+        return f"incompleto ({fsize_mb:.0f}MB < {expected_min}MB esperado)"
+
+    # Check 2: Arquivo muito pequeno (< 1MB = HTML de erro ou 404)
+    if fsize < 1 * MB:
+        return f"corrompido ({fsize} bytes)"
+
+    # Check 3: Estrutura do formato (safetensors/gguf/torch zip), lendo so
+    # header e cauda: pega truncamento que o safe_open nao percebia.
+    return verify_file(fpath)
+
+
+def mirror_catalog(catalog, mirror):
+    """
+    Reescreve as URLs para um espelho local: https://host/a/b -> <mirror>/host/a/b.
+    Usado para testar o sync sem sair para a internet.
+    """
+    mirrored = []
+    for model in catalog:
+        parts = urlsplit(model["url"])
+        url = f"{mirror.rstrip('/')}/{parts.netloc}{parts.path}"
+        if parts.query:
+            url += f"?{parts.query}"
+        mirrored.append(dict(model, url=url))
+    return mirrored
+
+
+class VolumeSync:
+    """
+    comfyui_dir: raiz do ComfyUI; o volume fica em <comfyui_dir>/models.
+    catalog:     lista {"url", "path"}; por padrao model_catalog.build_catalog
+                 (e ai discover() atualiza os checkpoints pela listagem do HF).
+    downloader:  ModelDownloader (padrao: token HF do ambiente).
+    remote:      RemoteCheck usado na revalidacao condicional e na listagem.
+    """
+
+    def __init__(self, comfyui_dir=COMFYUI_DIR, catalog=None, downloader=None, check=check_model_file,
+                 remote=None):
+        self.comfyui_dir = comfyui_dir
+        self.models_dir = os.path.join(comfyui_dir, "models")
+        self.discoverable = catalog is None
+        self.catalog = catalog if catalog is not None else build_catalog(comfyui_dir)
+        self.downloader = downloader or ModelDownloader(hf_token=os.environ.get("HF_TOKEN", ""))
+        self.remote = remote or RemoteCheck(hf_token=self.downloader.hf_token)
+        self.check = check
+        self.manifest = VolumeManifest(
+            self.models_dir, rules={"min_sizes": EXPECTED_MIN_SIZES_MB, "verify": VERIFY_VERSION})
+        # Store por URL: cada arquivo e baixado uma vez e ligado (hardlink) em
+        # todas as pastas do ComfyUI que o usam. Invalido remove tambem o blob.
+        self.store = ModelStore(self.models_dir)
+
+    def ensure_dirs(self):
+        for sub in MODEL_DIRS:
+            os.makedirs(os.path.join(self.models_dir, sub), exist_ok=True)
+        os.makedirs(os.path.join(self.comfyui_dir, "output"), exist_ok=True)
+
+    def discover(self):
+        """Atualiza a listagem dos treinos de LoRA no volume e reconstroi o catalogo."""
+        if not self.discoverable:
+            return self.catalog
+        listings = discover_checkpoints(checker=self.remote)
+        if listings:
+            listings = save_listings(self.models_dir, listings)
+            before = len(self.catalog)
+            self.catalog = build_catalog(self.comfyui_dir, listings=listings)
+            print(f"[REMOTE] Checkpoints descobertos pela listagem do HF: "
+                  f"{len(self.catalog)} entrada(s) no catalogo ({len(self.catalog) - before:+d})")
+        return self.catalog
+
+    def validate(self):
+        """Manifesto no volume: so revalida arquivos cujo tamanho/mtime mudou."""
+        print("[INFO] Verificando arquivos corrompidos no volume...")
+        rebuilt = self.manifest.rebuilt
+        stats = self.manifest.validate(self.check, remove=self.store.remove)
+        self.manifest.save()
+        print(
+            f"[MANIFEST] {stats['skipped']} arquivo(s) sem mudanca (pulados), "
+            f"{stats['checked']} re-verificado(s) em {stats['seconds']:.1f}s"
+            + (" (manifesto reconstruido)" if rebuilt else "")
+        )
+        if stats["removed"]:
+            print(f"[CLEAN] {stats['removed']} arquivo(s) corrompido(s) removido(s). Serao re-baixados.")
+        else:
+            print("[CLEAN] Todos os arquivos validos. ✅")
+        return stats
+
+    def check_remote(self, models=None):
+        """
+        HEAD condicional (If-None-Match com o ETag do manifesto) de cada URL
+        que ja esta no volume. Registra o ETag de quem nao mudou e retorna os
+        modelos que mudaram no remoto, com "refresh": True (para download()).
+        """
+        groups = {}
+        for model in self.catalog if models is None else models:
+            if os.path.exists(model["path"]) and self.manifest.tracks(model["path"]):
+                groups.setdefault(model["url"], []).append(model)
+        entries = []
+        for url, group in groups.items():
+            known = self.manifest.entry(group[0]["path"]) or {}
+            entries.append({"url": url, "etag": known.get("etag"), "size": os.path.getsize(group[0]["path"])})
+
+        started = time.monotonic()
+        refresh, errors = [], 0
+        for entry in self.remote.check(entries):
+            result, group = entry["result"], groups[entry["url"]]
+            if result["status"] == "error":
+                errors += 1
+            elif entry["changed"]:
+                print(f"[REMOTE] {os.path.basename(group[0]['path'])} mudou no remoto "
+                      f"(ETag {entry['etag']} -> {result['etag']}). Baixando de novo...")
+                refresh += [dict(m, refresh=True) for m in group]
+            elif result["etag"] and result["etag"] != entry["etag"]:
+                for model in group:
+                    self.manifest.record(model["path"], etag=result["etag"])
+        self.manifest.save()
+        changed = len({m["url"] for m in refresh})
+        print(f"[REMOTE] {len(entries)} arquivo(s) conferido(s) no remoto em {time.monotonic() - started:.1f}s: "
+              f"{changed} mudaram, {errors} sem resposta")
+        return refresh
+
+    def plan(self, models=None):
+        """Separa o que ja existe do que precisa ser baixado. Retorna os pendentes."""
+        pending = []
+        for model in self.catalog if models is None else models:
+            # Garantir que a pasta existe
+            os.makedirs(os.path.dirname(model["path"]), exist_ok=True)
+
+            dest = model["path"]
+            name = os.path.basename(dest)
+
+            # Se ja existe e e valido (> 1MB), pula
+            if os.path.exists(dest) and os.path.getsize(dest) > 1 * MB:
+                print(f"[OK] {name} ja existe!")
+                # Arquivos antigos (de antes do store) viram blob + link
+                try:
+                    self.store.adopt(model)
+                except OSError as e:
+                    print(f"[WARN] {name} nao pode ser movido para o store: {e}")
+                continue
+
+            # Nao apaga nada aqui: o downloader grava em `<blob>.part`, retoma o
+            # parcial com Range e so liga `dest` ao blob quando o tamanho confere
+            # com o Content-Length.
+            pending.append(model)
+        return pending
+
+    def handle_result(self, result):
+        """Valida um arquivo recem-baixado e registra no manifesto (sem salvar)."""
+        dest = result["path"]
+        name = result["name"]
+        # Validar arquivo apos download (deve ter > 1MB para ser valido)
+        if os.path.exists(dest) and os.path.getsize(dest) <= 1 * MB:
+            # Arquivo invalido (HTML de erro, 404, etc) — deletar
+            self.store.remove(dest)
+        if result["status"] == "ok" and os.path.exists(dest) and self.manifest.tracks(dest):
+            # Valida uma vez agora; nos proximos starts o manifesto pula
+            reason = self.check(dest)
+            if reason is None:
+                self.manifest.record(dest, sha256=result.get("sha256"), etag=normalize_etag(result.get("etag")))
+            else:
+                print(f"[CLEAN] {name} {reason}. Removendo...")
+                self.store.remove(dest)
+        if not os.path.exists(dest):
+            if result.get("resumed") or os.path.exists(result.get("blob", dest) + ".part.json"):
+                print(f"[SKIP] {name} incompleto (parcial mantido, retoma no proximo start)")
+            else:
+                print(f"[SKIP] {name} nao disponivel (ignorado)")
+
+    def download(self, models):
+        """Download paralelo (varios arquivos + Range multi-conexao nos grandes)."""
+        if not models:
+            return []
+        print(f"[INFO] Baixando {len(models)} arquivo(s) em paralelo...")
+        results = self.store.download_all(self.downloader, models)
+        for result in results:
+            self.handle_result(result)
+        self.manifest.save()
+        return results
+
+    def run(self, models=None, remote=True):
+        """
+        Valida, baixa/repara tudo o que falta e retorna um resumo. Com
+        remote=True tambem descobre checkpoints novos e baixa de novo o que
+        mudou no remoto.
+        """
+        started = time.monotonic()
+        self.ensure_dirs()
+        if remote and models is None:
+            self.discover()
+        stats = self.validate()
+        refresh = self.check_remote(models) if remote else []
+        results = self.download(self.plan(models) + refresh)
+        missing = [m for m in (self.catalog if models is None else models) if not os.path.exists(m["path"])]
+        summary = {
+            "validated": stats,
+            "downloaded": sum(1 for r in results if r["status"] == "ok" and os.path.exists(r["path"])),
+            "failed": [r["name"] for r in results if r["status"] != "ok" or not os.path.exists(r["path"])],
+            "refreshed": sorted({os.path.basename(m["path"]) for m in refresh}),
+            "missing": [os.path.basename(m["path"]) for m in missing],
+            "bytes": sum(r["bytes"] for r in results),
+            "seconds": time.monotonic() - started,
+        }
+        print(
+            f"[SYNC] {summary['downloaded']} baixado(s), {len(summary['failed'])} falha(s), "
+            f"{summary['bytes'] / MB:.0f} MB em {summary['seconds']:.0f}s"
+        )
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida e completa o volume de modelos do ComfyUI")
+    parser.add_argument("--comfyui-dir", default=COMFYUI_DIR)
+    parser.add_argument("--mirror", help="servidor local que espelha os hosts do catalogo")
+    parser.add_argument("--no-remote-check", action="store_true",
+                        help="nao confere ETags no remoto nem descobre checkpoints")
+    args = parser.parse_args(argv)
+
+    # Com espelho o catalogo e fixo (sem descoberta no HF)
+    catalog = mirror_catalog(build_catalog(args.comfyui_dir), args.mirror) if args.mirror else None
+    summary = VolumeSync(args.comfyui_dir, catalog=catalog).run(remote=not args.no_remote_check)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()